@@ -86,12 +86,15 @@ CreateFlowtable.py -p /path/to/project_dir
 or -i option must be specified. 
 """
 import argparse
+import time
 
 from ecohydrolib.grasslib import *
 
 from rhessysworkflows.context import Context
 from rhessysworkflows.metadata import RHESSysMetadata
 from rhessysworkflows.rhessys import RHESSysPaths
+from rhessysworkflows import resources
+from rhessysworkflows.resources import ProcessRecord
 
 # Handle command line options
 parser = argparse.ArgumentParser(description='Create RHESSys flowtable using GRASS GIS data and createflowpaths utility')
@@ -225,13 +228,14 @@ else:
 # Run CF
 sys.stdout.write('Running createflowpaths (this may take a few minutes)...')
 sys.stdout.flush()
+startTime = time.time()
 p = grassLib.script.pipe_command(cfPath, out=flowOutpath, template=templatePath,
                                  dem=demRast, 
                                  slope=grassMetadata['slope_rast'],
                                  stream=grassMetadata['streams_rast'],
                                  road=roads, roof=roofs, impervious=impervious,
                                  cellsize=demResX)
-(pStdout, pStderr) = p.communicate()
+(pStdout, pStderr, usage) = resources.communicate(p, startTime)
 
 if args.verbose:
     print("CF output:")
@@ -256,6 +260,11 @@ cfCmd = "%s out=%s template=%s dem=%s slope=%s stream=%s road=%s roof=%s impervi
 RHESSysMetadata.writeRHESSysEntry(context, 'flowtable_cmd', cfCmd)
 RHESSysMetadata.writeRHESSysEntry(context, 'surface_flowtable', paths.relpath(os.path.join(paths.RHESSYS_FLOW, surfaceFlowtable) ) )
 RHESSysMetadata.writeRHESSysEntry(context, 'subsurface_flowtable', paths.relpath(os.path.join(paths.RHESSYS_FLOW, subsurfaceFlowtable) ) )
+usage.outputSize = resources.outputSize(set([os.path.join(paths.RHESSYS_FLOW, surfaceFlowtable),
+                                             os.path.join(paths.RHESSYS_FLOW, subsurfaceFlowtable)]))
+ProcessRecord.writeToMetadata(context, [ProcessRecord('createflowpaths', 'Flow table', cfCmd,
+                                                      paths.relpath(os.path.join(paths.RHESSYS_FLOW, subsurfaceFlowtable)),
+                                                      usage)])
 
 sys.stdout.write('\nFinished creating flowtable\n')
 
@@ -58,6 +58,8 @@ if __name__ == "__main__":
                         help='Run createflowpaths even if DEM x resolution does not match y resolution')
     parser.add_argument('--ignoreBurnedDEM', dest='ignoreBurnedDEM', action='store_true', required=False,
                         help='Ignore stream burned DEM, if present. Default DEM raster will be used for all operations. If not specified and if stream burned raster is present, stream burned DEM will be used for generating the flow table.')
+    parser.add_argument('-j', '--jobs', dest='jobs', required=False, type=int, default=1,
+                        help='Number of sub-basins for which to run createflowpaths at once, each in a temporary GRASS mapset of its own.  Default: 1')
     parser.add_argument('-v', '--verbose', dest='verbose', action='store_true',
                         help='Print detailed information about what the program is doing')
     args = parser.parse_args()
@@ -74,6 +76,7 @@ if __name__ == "__main__":
                     routeRoofs=args.routeRoofs,
                     ignoreBurnedDEM=args.ignoreBurnedDEM,
                     force=args.force,
+                    jobs=args.jobs,
                     verbose=args.verbose)
     except CommandException as e:
         print(str(e))
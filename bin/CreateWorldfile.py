@@ -66,6 +66,7 @@ or -i option must be specified.
 import string
 import re
 import argparse
+import time
 from subprocess import *
 
 from ecohydrolib.grasslib import *
@@ -76,6 +77,8 @@ from rhessysworkflows.context import Context
 from rhessysworkflows.metadata import RHESSysMetadata
 from rhessysworkflows.rhessys import RHESSysPaths
 from rhessysworkflows.rhessys import readParameterFile
+from rhessysworkflows import resources
+from rhessysworkflows.resources import ProcessRecord
 
 # Handle command line options
 parser = argparse.ArgumentParser(description='Create RHESSys worldfile using GRASS GIS data and grass2world utility')
@@ -158,9 +161,10 @@ if args.verbose:
 sys.stdout.write("\nRunning grass2world from %s..." % (paths.RHESSYS_BIN,) )
 sys.stdout.flush()
 cmdArgs = g2wCommand.split()
+startTime = time.time()
 process = Popen(cmdArgs, cwd=paths.RHESSYS_BIN, env=g2wEnv, 
                 stdout=PIPE, stderr=PIPE)
-(process_stdout, process_stderr) = process.communicate()
+(process_stdout, process_stderr, usage) = resources.communicate(process, startTime)
 if args.verbose:
     sys.stdout.write(process_stdout)
     sys.stderr.write(process_stderr)
@@ -168,6 +172,9 @@ if process.returncode != 0:
     sys.exit("\n\ngrass2world failed, returning %s" % (process.returncode,) )    
 
 RHESSysMetadata.writeRHESSysEntry(context, 'worldfile_zero', paths.relpath(worldfilePath) )
+usage.outputSize = resources.outputSize([worldfilePath])
+ProcessRecord.writeToMetadata(context, [ProcessRecord('grass2world', 'Worldfile', g2wCommand,
+                                                      paths.relpath(worldfilePath), usage)])
 
 sys.stdout.write('\n\nFinished creating worldfile\n')
 
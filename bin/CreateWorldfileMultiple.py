@@ -52,6 +52,8 @@ if __name__ == "__main__":
                         help='The configuration file. Must define section "GRASS" and option "GISBASE"')
     parser.add_argument('-p', '--projectDir', dest='projectDir', required=True,
                         help='The directory to which metadata, intermediate, and final files should be saved')
+    parser.add_argument('-j', '--jobs', dest='jobs', required=False, type=int, default=1,
+                        help='Number of sub-basins for which to run grass2world at once, each in a temporary GRASS mapset of its own.  Default: 1')
     parser.add_argument('-v', '--verbose', dest='verbose', action='store_true',
                         help='Print detailed information about what the program is doing')
     args = parser.parse_args()
@@ -64,7 +66,7 @@ if __name__ == "__main__":
     
     exitCode = os.EX_OK
     try: 
-        command.run(verbose=args.verbose)
+        command.run(jobs=args.jobs, verbose=args.verbose)
     except CommandException as e:
         print(str(e))
         exitCode = os.EX_DATAERR
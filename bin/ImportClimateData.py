@@ -61,8 +61,7 @@ import textwrap
 from rhessysworkflows.context import Context
 from rhessysworkflows.metadata import RHESSysMetadata
 from rhessysworkflows.rhessys import RHESSysPaths
-
-STATION_FILE_EXTENSION = 'base'
+from rhessysworkflows.climateio import STATION_FILE_EXTENSION
 
 # Handle command line options
 parser = argparse.ArgumentParser(description='Import RHESSys climate data into project directory')
@@ -68,9 +68,11 @@ from rhessysworkflows.metadata import RHESSysMetadata
 from ecohydrolib.grasslib import *
 
 from rhessysworkflows.rhessys import RHESSysOutput
+from rhessysworkflows.expression import VariableExpression, ExpressionError
+from rhessysworkflows.patchmap import PatchRasterMap
+from rhessysworkflows.outputstats import OutputStatistics
 
 PATCH_DAILY_RE = re.compile('^(.+_patch.daily)$')
-VARIABLE_EXPR_RE = re.compile(r'\b([a-zA-z][a-zA-Z0-9_\.]+)\b') # variable names can have "." in them
 RECLASS_MAP_TMP = "patchtomovietmp_%d" % (random.randint(100000, 999999),)
 
 # Handle command line options
@@ -99,6 +101,12 @@ parser.add_argument('-v', '--outputVariable', required=True,
                     help='Name of RHESSys variable to be mapped.  Can be an expression such as "trans_sat + trans_unsat"')
 parser.add_argument('-t' ,'--mapTitle', required=False,
                     help='Text to use for title.  If not supplied, variable name will be used')
+parser.add_argument('--normalizeQuantile', required=False, type=float, default=1.0,
+                    help='Quantile of cumulative values of all patches in all output files by which to normalize maps; values above this quantile are drawn using the color of the maximum.  Default: 1 (i.e. the maximum)')
+parser.add_argument('--cache', required=False, action='store_true',
+                    help='Build (or refresh) a binary cache of RHESSys output alongside the output file so that subsequent reads do not need to parse the output file.')
+parser.add_argument('--jobs', required=False, type=int, default=1,
+                    help='Number of processes to use to read RHESSys output.  Default: 1')
 args = parser.parse_args()
 
 configFile = None
@@ -107,6 +115,9 @@ if args.configfile:
 
 context = Context(args.projectDir, configFile)
 
+if not 0 < args.normalizeQuantile <= 1:
+    sys.exit("Normalization quantile must be greater than 0 and less than or equal to 1")
+
 if len(args.rhessysOutFile) != len(args.outputFile):
     sys.exit("Number of data files %d does not match number of output filenames %d" % \
              (len(args.rhessysOutFile), len(args.outputFile)) )
@@ -137,22 +148,20 @@ for outfile in args.outputFile:
 cdfFilepath = os.path.join(outputDir, args.cdfOutputfile)
 
 # Determine output variables
-variables = ['patchID']
-m = VARIABLE_EXPR_RE.findall(args.outputVariable)
-if m:
-    variables += m
-else:
-    sys.exit("No output variables specified")
+try:
+    expr = VariableExpression(args.outputVariable)
+except ExpressionError as e:
+    sys.exit(str(e))
+variables = expr.variables
 
 if args.mapTitle:
     title = args.mapTitle
 else:
     title = args.outputVariable
 
-# 1. Get tmp folder for temprarily storing rules
+# 1. Get tmp folder for temprarily storing color rules
 tmpDir = tempfile.mkdtemp()
 print("Temp dir: %s" % (tmpDir,) )
-reclassRule = os.path.join(tmpDir, 'reclass.rule')
 colorTable = os.path.join(tmpDir, 'color.rule')
 # Create our own color ramp  
 with open(colorTable, 'w') as colorsOut:
@@ -194,76 +203,88 @@ os.environ['GRASS_TRUECOLOR'] = 'TRUE'
 os.environ['GRASS_WIDTH'] = '960'
 os.environ['GRASS_HEIGHT'] = '720'
 
+# Read patch map
+patchRasterMap = PatchRasterMap.fromGRASS(args.patchMap)
+
 # 3. For each rhessys output file ...
+patchIDsList = []
 variablesList = []
+stats = OutputStatistics()
 for (i, patchDailyFilepath) in enumerate(patchDailyFilepaths):
     print("\nReading RHESSys output %s from %s  (this may take a while)...\n" \
           % (os.path.basename(patchDailyFilepath), os.path.dirname(patchDailyFilepath)) )
+    if args.cache:
+        RHESSysOutput.cacheOutputFile(patchDailyFilepath)
     f = open(patchDailyFilepath)
-    data = RHESSysOutput.readColumnsFromPatchDailyFile(f, variables)
-    f.close()
-    if len(data) < 1:
-        sys.exit("No data found for variable in RHESSys output file '%s'" % \
-                 (patchDailyFilepath,) )
+    try:
+        expr.validate( RHESSysOutput.readHeader(patchDailyFilepath) )
+    except ExpressionError as e:
+        sys.exit("%s in RHESSys output file '%s'" % (e, patchDailyFilepath) )
     
-    # For each day
+    # For each day (read one day at a time), sum values for each patch
     patchIDs = None
     variable = None
-    for (i, key) in enumerate(data):
-        dataForDate = data[key]
-        expr = VARIABLE_EXPR_RE.sub(r'np.array(dataForDate["\1"])', args.outputVariable)
+    days = RHESSysOutput.iterPatchDailyFile(f, variables, jobs=args.jobs)
+    for (date, patchIDsForDate, dataForDate) in days:
+        valuesForDate = expr.evaluate(dataForDate)
         if variable is None:
-            variable = eval(expr)
+            patchIDs = patchIDsForDate
+            variable = np.array(valuesForDate, dtype=float)
+        elif np.array_equal(patchIDs, patchIDsForDate):
+            variable += valuesForDate
         else:
-            variable += eval(expr)
-        if patchIDs is None:
-            patchIDs = [ int(f) for f in dataForDate['patchID'] ]
+            # Patches differ from previous days, widen to include all patches
+            allPatchIDs = np.union1d(patchIDs, patchIDsForDate)
+            tmp = np.zeros(len(allPatchIDs))
+            tmp[np.searchsorted(allPatchIDs, patchIDs)] = variable
+            tmp[np.searchsorted(allPatchIDs, patchIDsForDate)] += valuesForDate
+            (patchIDs, variable) = (allPatchIDs, tmp)
+    f.close()
+    if variable is None:
+        sys.exit("No data found for variable in RHESSys output file '%s'" % \
+                 (patchDailyFilepath,) )
     
-    print("Sum of cumulative %s = %.2f" % (args.outputVariable, variable.sum()) )
-    print("Mean of cumulative %s = %.2f" % (args.outputVariable, variable.mean()) )
-    print("Max of cumulative %s = %.2f" % (args.outputVariable, variable.max()) )
-    print("Min of cumulative %s = %.2f\n" % (args.outputVariable, variable.min()) )
+    fileStats = OutputStatistics()
+    fileStats.update(variable)
+    print("Sum of cumulative %s = %.2f" % (args.outputVariable, fileStats.sum) )
+    print("Mean of cumulative %s = %.2f" % (args.outputVariable, fileStats.mean) )
+    print("Max of cumulative %s = %.2f" % (args.outputVariable, fileStats.max) )
+    print("Min of cumulative %s = %.2f\n" % (args.outputVariable, fileStats.min) )
+    stats.merge(fileStats)
+    patchIDsList.append(patchIDs)
     variablesList.append(variable)
         
-# 4. Normalize values to maximum  
-max_val = 0
-for var in variablesList:
-    max_val = max( max_val, np.max(var) )
-    
+# 4. Normalize values to maximum (or quantile) of all output files
+max_val = stats.max
 print("\nMax cumulative %s = %.2f\n" % (args.outputVariable, max_val) )
+norm_val = stats.quantile(args.normalizeQuantile)
+if args.normalizeQuantile < 1:
+    print("Quantile %g of cumulative %s = %.2f\n" % \
+          (args.normalizeQuantile, args.outputVariable, norm_val) )
 max_idx = None
 max_patchID = None
 # Find the max value
-for var in variablesList:
+for (patchIDs, var) in zip(patchIDsList, variablesList):
     max_idx = np.where(var == max_val)
     # Could be multiple indices
     if len(max_idx[0]) == 1 and max_idx[0] >= 0: 
-        max_patchID = patchIDs[max_idx[0]]
+        max_patchID = patchIDs[max_idx[0][0]]
         break;
 if max_patchID:
     print("\nPatchID of max value: %d" % (max_patchID,) )
  
 normalizedVariables = []
 for var in variablesList:
-    normalizedVariables.append( var / max_val )
+    normalizedVariables.append( np.minimum(var / norm_val, 1.0) )
         
 # Write normalized maps for each input file
 for (i, variable) in enumerate(normalizedVariables):
     outputFilePath = outputFilePaths[i]
-    # 5. Write reclass rule to temp file
-    reclass = open(reclassRule, 'w') 
-    for (j, var) in enumerate(variable):
-        reclass.write("%d:%d:%f:%f\n" % (patchIDs[j], patchIDs[j], var, var) )
-    reclass.close()
+    # 5. Map variable to patches
+    raster = patchRasterMap.render(patchIDsList[i], variable)
         
-    # 6. Generate map for variable
-    result = grassLib.script.run_command('r.recode', 
-                                         input=args.patchMap, 
-                                         output=RECLASS_MAP_TMP,
-                                         rules=reclassRule,
-                                         overwrite=True)
-    if result != 0:
-        sys.exit("Failed to create reclass map while rendering image %s" % (outputFilePath,) )
+    # 6. Write map for variable
+    patchRasterMap.writeToGRASS(raster, RECLASS_MAP_TMP)
     
     # Set color table
     result = grassLib.script.run_command('r.colors', 
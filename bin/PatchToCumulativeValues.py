@@ -85,6 +85,10 @@ parser.add_argument('--startdate', type=int, nargs=4,
                     help='Date on which to begin output, of format YYYY M D H')
 parser.add_argument('--enddate', type=int, nargs=4,
                     help='Date on which to end output, of format YYYY M D H')
+parser.add_argument('--cache', required=False, action='store_true',
+                    help='Build (or refresh) a binary cache of RHESSys output alongside the output file so that subsequent reads do not need to parse the output file.')
+parser.add_argument('--jobs', required=False, type=int, default=1,
+                    help='Number of processes to use to read RHESSys output.  Default: 1')
 args = parser.parse_args()
 
 startDate = None
@@ -107,10 +111,15 @@ patchDailyFilepaths = []
 for outfile in args.rhessysOutFile:
     if not os.path.isfile(outfile) or not os.access(outfile, os.R_OK):
         sys.exit("Unable to read RHESSys output file %s" % (outfile,))
+    headers = RHESSysOutput.readHeader(outfile)
+    for var in args.outputVariables:
+        if not var in headers:
+            sys.exit("Variable '%s' not found in RHESSys output file '%s'" % \
+                     (var, outfile) )
     patchDailyFilepaths.append( os.path.abspath(outfile) ) 
 
 # Determine output variables
-variables = ['patchID'] + args.outputVariables
+variables = args.outputVariables
 
 sys.stdout.write('scenario,patchid')
 for var in args.outputVariables:
@@ -122,53 +131,36 @@ for (i, patchDailyFilepath) in enumerate(patchDailyFilepaths):
     
     scenario = os.path.basename( os.path.dirname(patchDailyFilepath) )
     
+    if args.cache:
+        RHESSysOutput.cacheOutputFile(patchDailyFilepath)
     f = open(patchDailyFilepath)
-    data = RHESSysOutput.readColumnsFromPatchDailyFile(f, variables)
+    (dates, patchIDs, cube) = RHESSysOutput.readPatchDailyCube(f, variables,
+                                                               startDate=startDate,
+                                                               endDate=endDate,
+                                                               patchIDs=args.patchIDs,
+                                                               jobs=args.jobs)
     f.close()
-    if len(data) < 1:
+    if not len(dates):
         sys.exit("No data found for variable in RHESSys output file '%s'" % \
                  (patchDailyFilepath,) )
     
-    # For each day
-    variablesDict = {}
-    patchIDs = None
-    variable = None
-    for (i, key) in enumerate(data):
-        if startDate and key < startDate:
-            continue
-        if endDate and key > endDate:
-            break
-        #import pdb; pdb.set_trace()
-        dataForDate = data[key]
-        vars = {}
-        for var in args.outputVariables:
-            vars[var] = np.array( dataForDate[var] )
-        patchIDs = np.array( [ int(f) for f in dataForDate['patchID'] ] )
-        
-        # Store value for each selected patchID
-        for p in args.patchIDs:
-            try:
-                dataForPatch = variablesDict[p]
-            except KeyError:
-                dataForPatch = {}
-                variablesDict[p] = dataForPatch
-            patchIdx = np.where( patchIDs == p )
-            
-            for var in args.outputVariables:
-                variable = vars[var]
-                try:
-                    tmp_data = dataForPatch[var]
-                except KeyError:
-                    tmp_data = []
-                    dataForPatch[var] = tmp_data
-                tmp_data.append( variable[patchIdx] )
+    # Locate selected patches; patches not in output sum to zero
+    selected = np.array(args.patchIDs)
+    patchIdx = np.minimum( np.searchsorted(patchIDs, selected), max(len(patchIDs) - 1, 0) )
+    patchFound = np.zeros(len(selected), dtype=bool)
+    if len(patchIDs):
+        patchFound = patchIDs[patchIdx] == selected
+    
+    sums = {}
+    for var in args.outputVariables:
+        sums[var] = np.zeros(len(selected))
+        if len(patchIDs):
+            sums[var] = np.nansum(cube[var][:, patchIdx], axis=0)
+            sums[var][~patchFound] = 0.0
     
     # Print summary for each patch
-    for p in args.patchIDs:
-        dataForPatch = variablesDict[p]
+    for (j, p) in enumerate(args.patchIDs):
         sys.stdout.write("%s,%d" % (scenario, p) )
         for var in args.outputVariables:
-            p_tmp = np.array( dataForPatch[var] )
-            sys.stdout.write(",%f" % (  p_tmp.sum() ) )
+            sys.stdout.write(",%f" % ( sums[var][j] ) )
         sys.stdout.write('\n')
-    
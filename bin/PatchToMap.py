@@ -51,7 +51,7 @@ Post conditions
 None
 
 """
-import os, sys, shutil, tempfile, re
+import os, sys
 import subprocess, shlex
 import time, random
 import argparse
@@ -68,11 +68,14 @@ from rhessysworkflows.metadata import RHESSysMetadata
 from ecohydrolib.grasslib import *
 
 from rhessysworkflows.rhessys import RHESSysOutput
+from rhessysworkflows.expression import VariableExpression, ExpressionError
+from rhessysworkflows.aggregate import TemporalAggregator, aggregatePatchDailyFile
+from rhessysworkflows.compression import openOutputFile
+from rhessysworkflows.patchmap import PatchRasterMap
 
 
 
 INT_RESCALE = 100
-VARIABLE_EXPR_RE = re.compile(r'\b([a-zA-z][a-zA-Z0-9_\.]+)\b') # variable names can have "." in them
 RANDOM = random.randint(100000, 999999)
 RECLASS_MAP_TMP = "patchzonalstats_cover_{0}".format(RANDOM)
 STATS_MAP_TMP = "patchzonalstats_output_{0}".format(RANDOM)
@@ -88,7 +91,8 @@ parser.add_argument('-p', '--projectDir', dest='projectDir', required=True,
                     help='The directory to which metadata, intermediate, and final files should be saved')
 parser.add_argument('-d', '--rhessysOutFile', required=True, nargs='+',
                     help='Directory containing RHESSys patch output, ' +\
-                         'specificically patch yearly output in a file ending in "_patch.yearly".')
+                         'specificically patch yearly output in a file ending in "_patch.yearly", ' +\
+                         'or patch daily output in a file ending in "_patch.daily" if --aggregate is specified.')
 parser.add_argument('--mask', required=False, default=None,
                     help='Name of raster to use as a mask')
 parser.add_argument('--patchMap', required=False, default='patch',
@@ -101,6 +105,14 @@ parser.add_argument('-n', '--mapNames', required=True, nargs='+',
                     help='Names of maps to be created.')
 parser.add_argument('--mapcolorstyle', required=False, default='grey1.0',
                     help='Color map style to pass to r.colors, used for zonal stats map.')
+parser.add_argument('--aggregate', required=False, choices=TemporalAggregator.ANNUAL_PERIODS,
+                    help='Read patch daily output (rather than patch yearly output), aggregating daily values to this period.  ' +\
+                         'Periods are identified by calendar year (yearly), water year (wateryear), or the year in which the season ends (season).')
+parser.add_argument('--aggregateMethod', required=False, default=TemporalAggregator.SUM,
+                    choices=TemporalAggregator.METHODS,
+                    help='Method used to aggregate daily values.  Default: %s' % (TemporalAggregator.SUM,) )
+parser.add_argument('--season', required=False, nargs='+', type=int,
+                    help='Months of season, in order (e.g. 12 1 2), for use with "--aggregate season"')
 args = parser.parse_args()
 
 configFile = None
@@ -128,19 +140,20 @@ for outfile in args.rhessysOutFile:
     patchFilepaths.append( os.path.abspath(outfile) ) 
 
 # Determine output variables
-variables = ['patchID']
-m = VARIABLE_EXPR_RE.findall(args.outputVariable)
-if m:
-    variables += m
-else:
-    sys.exit("No output variables specified")
-
-# 1. Get tmp folder for temprarily storing rules
-tmpDir = tempfile.mkdtemp()
-print("Temp dir: %s" % (tmpDir,) )
-reclassRule = os.path.join(tmpDir, 'reclass.rule')
-
-# 2. Initialize GRASS
+try:
+    expr = VariableExpression(args.outputVariable)
+except ExpressionError as e:
+    sys.exit(str(e))
+variables = ['patchID'] + expr.variables
+
+aggregator = None
+if args.aggregate:
+    try:
+        aggregator = TemporalAggregator(args.aggregate, args.aggregateMethod, args.season)
+    except ValueError as e:
+        sys.exit(str(e))
+
+# 1. Initialize GRASS
 grassDbase = os.path.join(context.projectDir, metadata['grass_dbase'])
 grassConfig = GRASSConfig(context, grassDbase, metadata['grass_location'], metadata['grass_mapset'])
 grassLib = GRASSLib(grassConfig=grassConfig)
@@ -161,12 +174,19 @@ if args.mask:
         sys.exit("Failed to set region to layer %s" % \
                  (args.mask,) )
 
+# 2. Read patch map
+patchRasterMap = PatchRasterMap.fromGRASS(args.patchMap)
+
 # 3. For each rhessys output file read variable(s) of interest...
 variablesList = []
 for (i, patchFilepath) in enumerate(patchFilepaths):
     print("\nReading RHESSys output %s from %s  (this may take a while)...\n" \
           % (os.path.basename(patchFilepath), os.path.dirname(patchFilepath)) )
-    data = np.genfromtxt(patchFilepath, names=True)
+    if aggregator:
+        data = aggregatePatchDailyFile(patchFilepath, expr.variables, aggregator, year=args.year)
+    else:
+        with openOutputFile(patchFilepath) as f:
+            data = np.genfromtxt(f, names=True)
     if len(data) < 1:
         sys.exit("No data found for variable in RHESSys output file '%s'" % \
                  (patchFilepath,) )
@@ -175,30 +195,21 @@ for (i, patchFilepath) in enumerate(patchFilepaths):
         data = data[data['year'] == float(args.year)]
     
     patchIDs = [ int(p) for p in data['patchID'] ]
-    expr = VARIABLE_EXPR_RE.sub(r'data["\1"]', args.outputVariable)
-    variablesList.append(eval(expr))
+    try:
+        expr.validate(data.dtype.names)
+    except ExpressionError as e:
+        sys.exit("%s in RHESSys output file '%s'" % (e, patchFilepath) )
+    variablesList.append( (patchIDs, expr.evaluate(data)) )
         
 # 4. Write maps for each input file
-for (i, variable) in enumerate(variablesList):
+for (i, (patchIDs, variable)) in enumerate(variablesList):
     reclass_map = args.mapNames[i]
-    # Write reclass rule to temp file
-    reclass = open(reclassRule, 'w') 
-    for (j, var) in enumerate(variable):
-        reclass.write("%d:%d:%f:%f\n" % (patchIDs[j], patchIDs[j], var, var) )
-    reclass.close()
         
     # Generate map for variable
     print("\nMapping variable: {0} for input {1} to map named {2}...".format(args.outputVariable, 
                                                                               patchFilepaths[i],
                                                                               reclass_map))
-    result = grassLib.script.run_command('r.recode', 
-                                         input=args.patchMap, 
-                                         output=reclass_map,
-                                         rules=reclassRule,
-                                         flags='d',
-                                         overwrite=True)
-    if result != 0:
-        sys.exit("Failed to create reclass map {0}".format(reclass_map) )
+    patchRasterMap.writeToGRASS(patchRasterMap.render(patchIDs, variable), reclass_map)
         
     # Set color table
     if args.mapcolorstyle:
@@ -208,6 +219,3 @@ for (i, variable) in enumerate(variablesList):
         if result != 0:
             sys.exit("Failed to modify color map")
 
-# Cleanup
-shutil.rmtree(tmpDir)
-
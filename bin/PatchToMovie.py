@@ -52,9 +52,8 @@ Post conditions
 None
    
 """
-import os, sys, shutil, tempfile, re
-import subprocess, shlex
-import time, random
+import os, sys, re
+import time
 import argparse
 import operator
 
@@ -65,10 +64,16 @@ from rhessysworkflows.metadata import RHESSysMetadata
 from ecohydrolib.grasslib import *
 
 from rhessysworkflows.rhessys import RHESSysOutput
+from rhessysworkflows.expression import VariableExpression, ExpressionError
+from rhessysworkflows.patchmap import PatchRasterMap
+from rhessysworkflows.movie import FrameRenderer, Overlay, writeMovie, DEFAULT_COLORMAP
+from rhessysworkflows.outputstats import patchDailyStatistics
 
 PATCH_DAILY_RE = re.compile('^(.+_patch.daily)$')
-VARIABLE_EXPR_RE = re.compile(r'\b([a-zA-z]\w+)\b')
-RECLASS_MAP_TMP = "patchtomovietmp_%d" % (random.randint(100000, 999999),)
+
+COLOR_SCALE_FRAME = 'frame'
+COLOR_SCALE_GLOBAL = 'global'
+COLOR_SCALES = [COLOR_SCALE_FRAME, COLOR_SCALE_GLOBAL]
 
 MPEG4_CODEC = 'mpeg4'
 H264_CODEC = 'libx264'
@@ -107,6 +112,18 @@ parser.add_argument('--codec', required=False, default=DEFAULT_CODEC, choices=CO
                     help="Video codec to use. Default: %s" % (DEFAULT_CODEC,) )
 parser.add_argument('--rescale', required=False, type=float,
                     help='Rescale raster values of 0 to args.resample to 0 to 255 in output images.')
+parser.add_argument('--colormap', required=False, default=DEFAULT_COLORMAP,
+                    help="Name of matplotlib color map to use for variable. Default: %s" % (DEFAULT_COLORMAP,) )
+parser.add_argument('--colorScale', required=False, default=COLOR_SCALE_FRAME, choices=COLOR_SCALES,
+                    help="How to map values to colors: '%s' scales colors to the range of values of each frame; '%s' uses the same scale for all frames, from the --colorQuantiles of all values.  Ignored if --rescale is specified.  Default: %s" % \
+                    (COLOR_SCALE_FRAME, COLOR_SCALE_GLOBAL, COLOR_SCALE_FRAME) )
+parser.add_argument('--colorQuantiles', required=False, type=float, nargs=2, default=[0.0, 1.0],
+                    metavar=('LOW', 'HIGH'),
+                    help='Quantiles of all values of the variable to map to the ends of the color scale when using the global color scale, e.g. "0.02 0.98".  Default: 0 1 (i.e. the minimum and maximum)')
+parser.add_argument('--cache', required=False, action='store_true',
+                    help='Build (or refresh) a binary cache of RHESSys output alongside the output file so that subsequent reads do not need to parse the output file.')
+parser.add_argument('--jobs', required=False, type=int, default=1,
+                    help='Number of processes to use to read RHESSys output, and to render frames of the movie.  Default: 1')
 args = parser.parse_args()
 
 configFile = None
@@ -137,12 +154,15 @@ outputFile = "%s.mp4" % (args.outputFile)
 outputFilePath = os.path.join(outputDir, outputFile)
 
 # Determine output variables
-variables = ['patchID']
-m = VARIABLE_EXPR_RE.findall(args.outputVariable)
-if m:
-    variables += m
-else:
-    sys.exit("No output variables specified")
+try:
+    expr = VariableExpression(args.outputVariable)
+except ExpressionError as e:
+    sys.exit(str(e))
+variables = expr.variables
+
+(lowQuantile, highQuantile) = args.colorQuantiles
+if not 0 <= lowQuantile < highQuantile <= 1:
+    sys.exit("Color quantiles must be between 0 and 1, and the first must be less than the second")
 
 title = args.outputVariable
 if args.mapTitle:
@@ -153,12 +173,7 @@ if not args.rescale:
 if not os.path.isfile(patchDailyFilepath) or not os.access(patchDailyFilepath, os.R_OK):
     sys.exit("Unable to read RHESSys patch daily output file %s" % (patchDailyFilepath,))
 
-# 1. Get tmp folder for temprarily storing images 
-tmpDir = tempfile.mkdtemp()
-print("Temp dir: %s" % (tmpDir,) )
-reclassRule = os.path.join(tmpDir, 'reclass.rule')
-
-# 2. Initialize GRASS
+# 1. Initialize GRASS
 grassDbase = os.path.join(context.projectDir, metadata['grass_dbase'])
 grassConfig = GRASSConfig(context, grassDbase, metadata['grass_location'], metadata['grass_mapset'])
 grassLib = GRASSLib(grassConfig=grassConfig)
@@ -179,187 +194,58 @@ if args.mask:
         sys.exit("Failed to set region to layer %s" % \
                  (args.mask,) )
         
-# Set environment variables for GRASS PNG output driver
-os.environ['GRASS_RENDER_IMMEDIATE'] = 'FALSE'
-os.environ['GRASS_TRUECOLOR'] = 'TRUE'
-os.environ['GRASS_WIDTH'] = '960'
-os.environ['GRASS_HEIGHT'] = '720'
+# 2. Read patch map and overlays, which are drawn over each frame
+patchRasterMap = PatchRasterMap.fromGRASS(args.patchMap)
+overlays = [Overlay.fromGRASS(overlay) for overlay in (args.overlay or [])]
+
+valueRange = legendLabels = None
+if args.rescale:
+    valueRange = (0, args.rescale)
+    legendLabels = ('Low', 'High')
 
 # 3. Open file ending in "patch.daily" in rhessys output dir
+if args.cache:
+    print("Caching RHESSys output data (this may take a while)...")
+    RHESSysOutput.cacheOutputFile(patchDailyFilepath)
 print("Reading RHESSys output data (this may take a while)...")
 f = open(patchDailyFilepath)
-data = RHESSysOutput.readColumnsFromPatchDailyFile(f, variables)
+try:
+    expr.validate( RHESSysOutput.readHeader(patchDailyFilepath) )
+except ExpressionError as e:
+    sys.exit("%s in RHESSys output file '%s'" % (e, patchDailyFilepath) )
+
+if not args.rescale and args.colorScale == COLOR_SCALE_GLOBAL:
+    # Statistics are cached alongside the output file, so are only computed once
+    print("Computing statistics of RHESSys output data...")
+    stats = patchDailyStatistics(patchDailyFilepath, expr, jobs=args.jobs)
+    if not stats.count:
+        sys.exit("No data found for variable in RHESSys output file '%s'" % \
+                 (patchDailyFilepath,) )
+    valueRange = (stats.quantile(lowQuantile), stats.quantile(highQuantile))
+    print("Color scale: %f to %f" % valueRange)
+renderer = FrameRenderer(patchRasterMap, title, cmap=args.colormap, valueRange=valueRange,
+                         legendLabels=legendLabels, overlays=overlays,
+                         overlayLegend=args.overlayLegend)
+
+# 4. For each day (read one day at a time), render a frame
+def frames():
+    days = RHESSysOutput.iterPatchDailyFile(f, variables, jobs=args.jobs)
+    for (date, patchIDs, dataForDate) in days:
+        key = date.astype(object)
+        dateStr = "%d/%d/%d" % (key.month, key.day, key.year)
+        variable = np.asarray(expr.evaluate(dataForDate), dtype=float)
+        if args.rescale:
+            # Values outside of the range 0 to rescale are not drawn
+            variable[(variable < 0) | (variable > args.rescale)] = np.nan
+        yield (dateStr, patchIDs, variable)
+
+# 5. Stream frames to ffmpeg movie of specified name in specified location
+try:
+    numDays = writeMovie(renderer, frames(), outputFilePath, ffmpegPath=ffmpegPath,
+                         fps=args.fps, codec=args.codec, jobs=args.jobs)
+except (IOError, OSError) as e:
+    sys.exit(str(e))
 f.close()
-if len(data) < 1:
+if numDays < 1:
     sys.exit("No data found for variable in RHESSys output file '%s'" % \
              (patchDailyFilepath,) )
-
-# 4. For each day
-for (i, key) in enumerate(data):
-    dateStr = "%d/%d/%d" % (key.month, key.day, key.year)
-    # Set filename env for PNG driver
-    imageFilename = "%s%04d.png" % (RECLASS_MAP_TMP, i+1 )
-    reclassImagePath = os.path.join(tmpDir, imageFilename)
-    os.environ['GRASS_PNGFILE'] = reclassImagePath
-    
-    dataForDate = data[key]
-    # a. Write reclass rule to temp file
-    reclass = open(reclassRule, 'w')
-    
-    patchIDs = [ int(f) for f in dataForDate['patchID'] ]
-    # Could do this outside the loop, but want to make sure it's near declaration of 
-    # dataForDate
-    expr = VARIABLE_EXPR_RE.sub(r'np.array(dataForDate["\1"])', args.outputVariable)
-    variable = eval(expr)
-      
-    for (j, var) in enumerate(variable):
-        #reclass.write("%d = %f\n" % (patchIDs[j], var) )
-        reclass.write("%d:%d:%f:%f\n" % (patchIDs[j], patchIDs[j], var, var) )
-    reclass.close()
-    
-    # b. Generate temporary map for variable
-    result = grassLib.script.run_command('r.recode', 
-                                         input=args.patchMap, 
-                                         output=RECLASS_MAP_TMP,
-                                         rules=reclassRule,
-                                         overwrite=True)
-    if result != 0:
-        sys.exit("Failed to create reclass map for date %s" % (dateStr,) )
-        
-    tmpMap = RECLASS_MAP_TMP
-    if args.rescale:
-        tmpMap = "%s_rescale" % (RECLASS_MAP_TMP,)
-        fromScale = "0,%d" % (args.rescale,)
-        rRescaleOptions = {'input': RECLASS_MAP_TMP,
-                           'output': tmpMap,
-                           'from': fromScale,
-                           'to': '0,255',
-                           'overwrite': True}
-        result = grassLib.script.run_command('r.rescale', 
-                                             **rRescaleOptions)
-        if result != 0:
-            sys.exit("Failed to rescale map when rendering image %s" % (imageFilename,) )
-    # c. Render map with annotations to PNG image
-
-    # Start a new PNG driver
-    result = grassLib.script.run_command('d.mon', start='PNG')
-    if result != 0:
-        sys.exit("Failed to start PNG driver while rendering image %s" % \
-                 (imageFilename,) )
-    
-    # Render image
-    result = grassLib.script.run_command('d.rast',
-                                         map=tmpMap)
-    if result != 0:
-        sys.exit("Failed to render map %s while rendering image %s" % \
-                 (tmpMap, imageFilename) )
-       
-    # Draw overlays 
-    if args.overlay:
-        for (i, overlay) in enumerate(args.overlay):
-            result = grassLib.script.run_command('d.rast',
-                                                 map=overlay,
-                                                 flags='o')
-            if result != 0:
-                sys.exit("Failed to draw overlay map %s while rendering image %s" % \
-                         (overlay, imageFilename) )
-            if i == 0 and args.overlayLegend:
-                # Add legend for overlay
-                result = grassLib.script.run_command('d.legend',
-                                                 map=overlay,
-                                                 at='15,50,10,15')
-                if result != 0:
-                    sys.exit("Failed to add legend for overlay map %s while rendering image %s" % \
-                             (args.overlay, imageFilename) )
-                # Write name of overlay layer
-                result = grassLib.script.run_command('d.text',
-                                                 text=overlay,
-                                                 size=2.5,
-                                                 color='black',
-                                                 at='12, 12',
-                                                 align='cc')
-                if result != 0:
-                    sys.exit("Failed to add overlay annotation to map while rendering image %s" % \
-                             (imageFilename,) )
-            
-    # Add annotations
-    result = grassLib.script.run_command('d.legend',
-                                         map=tmpMap,
-                                         at='63,88,77,87')
-    if result != 0:
-        sys.exit("Failed to add legend to map while rendering image %s" % \
-                 (imageFilename,) )
-    
-    # Set high
-    if args.rescale:
-        result = grassLib.script.run_command('d.text',
-                                             text='High',
-                                             size=5,
-                                             color='black',
-                                             at='90,61',
-                                             align='cc')
-        if result != 0:
-            sys.exit("Failed to high scale legend to map while rendering image %s" % \
-                     (imageFilename,) )
-        
-    # Set low
-    if args.rescale:
-        result = grassLib.script.run_command('d.text',
-                                             text='Low',
-                                             size=5,
-                                             color='black',
-                                             at='88,91',
-                                             align='cc')
-        if result != 0:
-            sys.exit("Failed to add low scale legend to map while rendering image %s" % \
-                     (imageFilename,) )
-    
-    # Set title
-    result = grassLib.script.run_command('d.text',
-                                         text=title,
-                                         size=5,
-                                         color='black',
-                                         at='73,98',
-                                         align='cc')
-    if result != 0:
-        sys.exit("Failed to add title to map while rendering image %s" % \
-                 (imageFilename,) )
-    
-    # Write date
-    result = grassLib.script.run_command('d.text',
-                                         text=dateStr,
-                                         size=5,
-                                         color='black',
-                                         at='12,98',
-                                         align='cc')
-    if result != 0:
-        sys.exit("Failed to add date to map while rendering image %s" % \
-                 (imageFilename,) )
-        
-    # Close the PNG driver, writing PNG image
-    result = grassLib.script.run_command('d.mon', stop='PNG')
-    if result != 0:
-        sys.exit("Error occured when closing PNG driver for image %s" % \
-                 (imageFilename,) )
-    
-# 5. Combine images to ffmpeg movie of specified name in specified location  
-# Documentation: https://trac.ffmpeg.org/wiki/Create%20a%20video%20slideshow%20from%20images
-# e.g. ffmpeg -r 1/5 -i img%03d.png -vcodec libx264 -r 30 -pix_fmt yuv420p out.mp4
-cmd = "%s -y -r %d -i %s%%04d.png -vcodec %s -pix_fmt yuv420p %s" % (ffmpegPath, args.fps, RECLASS_MAP_TMP, args.codec, outputFilePath)
-# print(cmd)
-cmdArray = shlex.split(cmd)
-p = subprocess.Popen(cmdArray, cwd=tmpDir)
-result = p.wait()
-if result != 0:
-    sys.exit("Error %d encountered when creating movie using ffmpeg.  Command line was:\n%s\n" % \
-             (result, cmd) )
-
-# Cleanup
-shutil.rmtree(tmpDir)
-if args.rescale:
-    result = grassLib.script.run_command('g.remove', rast=tmpMap)
-    if result != 0:
-        sys.exit("Failed to remove temporary map %s" % (tmpMap,) )
-result = grassLib.script.run_command('g.remove', rast=RECLASS_MAP_TMP)
-if result != 0:
-    sys.exit("Failed to remove temporary map %s" % (RECLASS_MAP_TMP,) )
@@ -51,9 +51,7 @@ Post conditions
 None
 
 """
-import os, sys, shutil, tempfile, re
-import subprocess, shlex
-import time, random
+import os, sys
 import argparse
 import operator
 import math
@@ -68,6 +66,11 @@ from rhessysworkflows.metadata import RHESSysMetadata
 from ecohydrolib.grasslib import *
 
 from rhessysworkflows.rhessys import RHESSysOutput
+from rhessysworkflows.expression import VariableExpression, ExpressionError
+from rhessysworkflows.aggregate import TemporalAggregator, aggregatePatchDailyFile
+from rhessysworkflows.compression import openOutputFile
+from rhessysworkflows.patchmap import PatchRasterMap
+from rhessysworkflows.zonalstats import ZonalStatistics
 
 LINE_TYPES = ['solid', 'dashed', 'dashdot', 'dotted']
 NUM_LINE_TYPES = len(LINE_TYPES)
@@ -158,14 +161,7 @@ def plot_cdf(ax, data, legend_items, legend_loc='lower right',
     plt.setp(ax.get_xticklabels(), fontsize=ticklabel_fontsize)
     plt.setp(ax.get_yticklabels(), fontsize=ticklabel_fontsize)
 
-INT_RESCALE = 100
-VARIABLE_EXPR_RE = re.compile(r'\b([a-zA-z][a-zA-Z0-9_\.]+)\b') # variable names can have "." in them
-RANDOM = random.randint(100000, 999999)
-RECLASS_MAP_TMP = "patchzonalstats_cover_{0}".format(RANDOM)
-STATS_MAP_TMP = "patchzonalstats_output_{0}".format(RANDOM)
-
-methods = ['average', 'mode', 'median', 'avedev', 'stddev', 'variance',
-           'skewness', 'kurtosis', 'min', 'max', 'sum']
+methods = ZonalStatistics.METHODS
 
 # Handle command line options
 parser = argparse.ArgumentParser(description='Generate cummulative map of patch-scale RHESSys output variables')
@@ -175,7 +171,8 @@ parser.add_argument('-p', '--projectDir', dest='projectDir', required=True,
                     help='The directory to which metadata, intermediate, and final files should be saved')
 parser.add_argument('-d', '--rhessysOutFile', required=True, nargs='+',
                     help='Directory containing RHESSys patch output, ' +\
-                         'specificically patch yearly output in a file ending in "_patch.yearly".')
+                         'specificically patch yearly output in a file ending in "_patch.yearly", ' +\
+                         'or patch daily output in a file ending in "_patch.daily" if --aggregate is specified.')
 parser.add_argument('--mask', required=False, default=None,
                     help='Name of raster to use as a mask')
 parser.add_argument('-z', '--zones', required=True, nargs='+',
@@ -226,6 +223,14 @@ parser.add_argument('--mapcolorstyle', required=False, default='grey1.0',
                     help='Color map style to pass to r.colors, used for zonal stats map.')
 parser.add_argument('--log', required=False, action='store_true',
                     help='Plot CDF/histogram with log-scaled bins')
+parser.add_argument('--aggregate', required=False, choices=TemporalAggregator.ANNUAL_PERIODS,
+                    help='Read patch daily output (rather than patch yearly output), aggregating daily values to this period.  ' +\
+                         'Periods are identified by calendar year (yearly), water year (wateryear), or the year in which the season ends (season).')
+parser.add_argument('--aggregateMethod', required=False, default=TemporalAggregator.SUM,
+                    choices=TemporalAggregator.METHODS,
+                    help='Method used to aggregate daily values.  Default: %s' % (TemporalAggregator.SUM,) )
+parser.add_argument('--season', required=False, nargs='+', type=int,
+                    help='Months of season, in order (e.g. 12 1 2), for use with "--aggregate season"')
 args = parser.parse_args()
 
 configFile = None
@@ -287,19 +292,20 @@ else:
     variableLabels = [args.outputVariable] * len(args.zones)
 
 # Determine output variables
-variables = ['patchID']
-m = VARIABLE_EXPR_RE.findall(args.outputVariable)
-if m:
-    variables += m
-else:
-    sys.exit("No output variables specified")
-
-# 1. Get tmp folder for temprarily storing rules
-tmpDir = tempfile.mkdtemp()
-print("Temp dir: %s" % (tmpDir,) )
-reclassRule = os.path.join(tmpDir, 'reclass.rule')
-
-# 2. Initialize GRASS
+try:
+    expr = VariableExpression(args.outputVariable)
+except ExpressionError as e:
+    sys.exit(str(e))
+variables = ['patchID'] + expr.variables
+
+aggregator = None
+if args.aggregate:
+    try:
+        aggregator = TemporalAggregator(args.aggregate, args.aggregateMethod, args.season)
+    except ValueError as e:
+        sys.exit(str(e))
+
+# 1. Initialize GRASS
 grassDbase = os.path.join(context.projectDir, metadata['grass_dbase'])
 grassConfig = GRASSConfig(context, grassDbase, metadata['grass_location'], metadata['grass_mapset'])
 grassLib = GRASSLib(grassConfig=grassConfig)
@@ -320,12 +326,16 @@ if args.mask:
         sys.exit("Failed to set region to layer %s" % \
                  (args.mask,) )
 
-# 3. For each rhessys output file ...
+# 2. For each rhessys output file ...
 variablesList = []
 for (i, patchFilepath) in enumerate(patchFilepaths):
     print("\nReading RHESSys output %s from %s  (this may take a while)...\n" \
           % (os.path.basename(patchFilepath), os.path.dirname(patchFilepath)) )
-    data = np.genfromtxt(patchFilepath, names=True)
+    if aggregator:
+        data = aggregatePatchDailyFile(patchFilepath, expr.variables, aggregator, year=args.year)
+    else:
+        with openOutputFile(patchFilepath) as f:
+            data = np.genfromtxt(f, names=True)
     if len(data) < 1:
         sys.exit("No data found for variable in RHESSys output file '%s'" % \
                  (patchFilepath,) )
@@ -334,63 +344,45 @@ for (i, patchFilepath) in enumerate(patchFilepaths):
         data = data[data['year'] == float(args.year)]
     
     patchIDs = [ int(p) for p in data['patchID'] ]
-    expr = VARIABLE_EXPR_RE.sub(r'data["\1"]', args.outputVariable)
-    var = eval(expr)
+    try:
+        expr.validate(data.dtype.names)
+    except ExpressionError as e:
+        sys.exit("%s in RHESSys output file '%s'" % (e, patchFilepath) )
+    var = expr.evaluate(data)
     if args.constant:
         var += args.constant[i]
-    variablesList.append(var)
+    variablesList.append( (patchIDs, var) )
         
-# Write normalized maps for each input file, for each zone
+# 3. Read patch map and zones
+print("\nReading patch map {0} ...".format(args.patchMap))
+patchMap = PatchRasterMap.fromGRASS(args.patchMap)
 zones = args.zones
+print("Reading normalization map {0} ...".format(args.normalizeMap))
+# grass.script is importable only once GRASS has been initialized
+from grass.script import array as garray
+normalizeRaster = garray.array()
+normalizeRaster.read(args.normalizeMap)
+normalizeRaster = np.array(normalizeRaster, dtype=float)
 data = {}
-maps_to_delete = set()
-maps_to_delete.add(STATS_MAP_TMP)
 for zone in zones:
-    for (i, variable) in enumerate(variablesList):
-        reclass_map = "{0}_{1}".format(RECLASS_MAP_TMP, outputFileNames[i])
-        # 4. Write reclass rule to temp file
-        reclass = open(reclassRule, 'w') 
-        for (j, var) in enumerate(variable):
-            reclass.write("%d:%d:%d:%d\n" % (patchIDs[j], patchIDs[j], var, var) )
-        reclass.close()
-            
-        # 5. Generate map for variable (only do it once per variable)
-        if not reclass_map in maps_to_delete:
-            print("\nMapping variable: {0} for intput {1} ...".format(args.outputVariable, outputFileNames[i]))
-            result = grassLib.script.run_command('r.recode', 
-                                                 input=args.patchMap, 
-                                                 output=reclass_map,
-                                                 rules=reclassRule,
-                                                 overwrite=True)
-            if result != 0:
-                sys.exit("Failed to create reclass map for output: {0}".format(outputFilePath) )
-            
-            print("Normalizing {0} map by {1}".format(reclass_map, args.normalizeMap))
-            # Normalize (Rescale to integer in the process)
-            rMapcalcExpr = '$reclass=int(($reclass/$norm)*$scale)'
-            grassLib.script.raster.mapcalc(rMapcalcExpr, reclass=reclass_map, norm=args.normalizeMap,
-                                           scale=INT_RESCALE, verbose=True)
-            
-            maps_to_delete.add(reclass_map)
-        
-        # 6. Calculate zonal statistics
-        print("Calculating zonal statistics...")
-        result = grassLib.script.run_command('r.statistics',
-                                             base=zone,
-                                             cover=reclass_map,
-                                             method=args.statistic,
-                                             output=STATS_MAP_TMP,
-                                             overwrite=True)
-        if result != 0:
-            sys.exit("Failed to create zonal statisitcs for output: {0}".format(outputFilePath) )
-        
-        # Keep map (if applicable), re-scaling
+    print("\nCalculating zonal statistics for zone {0} ...".format(zone))
+    zonalStats = ZonalStatistics.fromGRASS(zone)
+    # 4. Get value of each cell in a zone for each input file
+    cellValues = [zonalStats.patchValues(patchMap, patchIDs, variable) \
+                  for (patchIDs, variable) in variablesList]
+    # Normalize (cells where the normalization map is zero or null are ignored)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cellValues = np.array(cellValues) / zonalStats.cellValues(normalizeRaster)
+    cellValues[~np.isfinite(cellValues)] = np.nan
+    # 5. Calculate zonal statistics for all input files at once
+    zoneStats = zonalStats.compute(cellValues, [args.statistic])[args.statistic]
+    
+    for i in range(len(variablesList)):
+        # 6. Keep map (if applicable)
         if args.keepmap:
             permrast = "{0}_{1}_{2}".format(args.outputFile, zone, outputFileNames[i])
             print("Saving zonal stats to permanent map {0}".format(permrast))
-            rMapcalcExpr = '$permrast=@$tmprast/float($scale)'
-            grassLib.script.raster.mapcalc(rMapcalcExpr, permrast=permrast, tmprast=STATS_MAP_TMP,
-                                           scale=INT_RESCALE, verbose=True)
+            patchMap.writeToGRASS(zonalStats.render(zoneStats[i]), permrast)
             # Set color table
             if args.mapcolorstyle:
                 result = grassLib.script.run_command('r.colors', 
@@ -399,14 +391,8 @@ for zone in zones:
                 if result != 0:
                     sys.exit("Failed to modify color map")
             
-        # 7. Read zonal statistics
-        pipe = grassLib.script.pipe_command('r.stats', flags='ln', input=STATS_MAP_TMP)
-        stats_scaled = []
-        for line in pipe.stdout:
-            (parcel, stat) = line.strip().split()
-            stats_scaled.append(float(stat))
-        stats = np.array(stats_scaled)
-        stats = stats / INT_RESCALE
+        # 7. Collect zonal statistics
+        stats = zoneStats[i][~np.isnan(zoneStats[i])]
         print("Median for {0} for zone {1} = {2}".format(outputFileNames[i], zone, np.median(stats)))
         print("Mean for {0} for zone {1} = {2}".format(outputFileNames[i], zone, stats.mean()))
         print("Standard dev. for {0} for zone {1} = {2}".format(outputFileNames[i], zone, np.std(stats)))
@@ -446,10 +432,3 @@ for (i, zone) in enumerate(zones):
 fig.savefig(outputFilePath, bbox_inches='tight', pad_inches=0.125)
 
 # Make
-
-# Cleanup
-shutil.rmtree(tmpDir)
-for map in maps_to_delete:
-    result = grassLib.script.run_command('g.remove', rast=map)
-    if result != 0:
-        sys.exit("Failed to remove temporary map %s" % (map,) )
@@ -251,12 +251,13 @@ def plotGraph(args, obs, data, sizeX=1, sizeY=1, dpi=80):
     # Plot secondary data (if specified)
     if args.secondaryData and \
        (args.plottype == PLOT_TYPE_STD or args.plottype == PLOT_TYPE_LOGY):
-        sec_file = open(args.secondaryData, 'r')
-        (sec_datetime, sec_data) = RHESSysOutput.readColumnFromFile(sec_file,
-                                                                    args.secondaryColumn,
-                                                                    startHour=0)
-        sec_file.close()
-        sec = pd.Series(sec_data, index=sec_datetime)
+        (sec_datetime, sec_data) = RHESSysOutput.readColumnsFromFiles([args.secondaryData],
+                                                                      [args.secondaryColumn],
+                                                                      startHour=0)
+        if not args.secondaryColumn in sec_data[0]:
+            sys.exit("Column %s not found in data file %s" % \
+                     (args.secondaryColumn, args.secondaryData) )
+        sec = pd.Series(sec_data[0][args.secondaryColumn], index=pd.DatetimeIndex(sec_datetime))
         # Align timeseries
         (sec_align, obs_align) = sec.align(obs, join='inner')
         # Plot
@@ -380,10 +381,14 @@ if __name__ == "__main__":
         obs_file.close()
         obs = pd.Series(obs_data, index=obs_datetime)
         
-        for d in args.data:
-            mod_file = open(d, 'r')
-            (tmp_datetime, tmp_data) = RHESSysOutput.readColumnFromFile(mod_file, args.column, startHour=0)
-            tmp_mod = pd.Series(tmp_data, index=tmp_datetime)
+        # Read column from all data files, one pass per file.  Each file is aligned
+        # to observed data on its own, not to the dates common to all files
+        (mod_datetime, mod_data) = RHESSysOutput.readColumnsFromFiles(args.data, [args.column],
+                                                                      startHour=0, align=False)
+        for (d, tmp_datetime, tmp_data) in zip(args.data, mod_datetime, mod_data):
+            if not args.column in tmp_data:
+                sys.exit("Column %s not found in data file %s" % (args.column, d) )
+            tmp_mod = pd.Series(tmp_data[args.column], index=pd.DatetimeIndex(tmp_datetime))
             # Align timeseries
             (mod_align, obs_align) = tmp_mod.align(obs, join='inner')
             tmp_max_x = max(mod_align.max(), obs_align.max())
@@ -391,7 +396,6 @@ if __name__ == "__main__":
                 max_x = tmp_max_x
             min_x = max(min_x, mod_align.min())
         
-            mod_file.close()
             data.append( mod_align )
     elif args.behavioralData:
         
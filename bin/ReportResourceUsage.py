@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""@package ReportResourceUsage
+
+@brief Report resource usage of RHESSys model runs and other subprocesses, ranked by cost
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+  
+  
+Pre conditions
+--------------
+1. Resource usage must have been recorded in the model run or resources sections of the
+   metadata associated with the project directory (e.g. by RunModel.py, RunModelEnsemble.py,
+   RunLAIRead.py, CreateWorldfile.py, or CreateFlowtable.py)
+
+Post conditions
+---------------
+None
+
+Model runs (and, if --processes is specified, other subprocesses such as lairead, grass2world,
+and createflowpaths) are ranked by wall time, CPU time (user plus system), peak resident set
+size, bytes written, or size of output (see --sortBy).  Sizes are in bytes, times in seconds.
+
+Usage:
+@code
+ReportResourceUsage.py -p /path/to/project_dir [--sortBy {wall,cpu,rss,written,output}] [--processes] [-n NUMBER] [--csv]
+@endcode
+"""
+import os
+import sys
+import csv
+import argparse
+
+from rhessysworkflows.context import Context
+from rhessysworkflows.metadata import RHESSysMetadata
+from rhessysworkflows.metadata import ModelRun
+from rhessysworkflows.resources import ProcessRecord, rankByCost, COSTS, WALL
+
+# Handle command line options
+parser = argparse.ArgumentParser(description='Report resource usage of RHESSys model runs, ranked by cost')
+parser.add_argument('-i', '--configfile', dest='configfile', required=False,
+                    help='The configuration file')
+parser.add_argument('-p', '--projectDir', dest='projectDir', required=True,
+                    help='The directory to which metadata, intermediate, and final files should be saved')
+parser.add_argument('--sortBy', dest='sortBy', required=False, choices=COSTS, default=WALL,
+                    help='Measure of cost by which to rank model runs: wall time, CPU time, peak resident set size, bytes written, or size of output.  Default: wall')
+parser.add_argument('--processes', dest='processes', action='store_true', required=False,
+                    help='Also report subprocesses other than model runs (e.g. lairead, grass2world, createflowpaths)')
+parser.add_argument('-n', dest='number', required=False, type=int,
+                    help='Report only the NUMBER most costly model runs')
+parser.add_argument('--csv', dest='csv', action='store_true', required=False,
+                    help='Write the report to standard output as CSV')
+args = parser.parse_args()
+
+configFile = None
+if args.configfile:
+    configFile = args.configfile
+
+context = Context(args.projectDir, configFile)
+
+items = []
+modelRunEntries = RHESSysMetadata.readModelRunEntries(context)
+for fqId in [r for r in modelRunEntries.get('runs', '').split(RHESSysMetadata.VALUE_DELIM) if r]:
+    run = ModelRun.readFromMetadata(context, fqId)
+    items.append( (fqId, run.description, run.output, run.resources) )
+if args.processes:
+    for record in ProcessRecord.readFromMetadata(context):
+        items.append( ("%s (%s)" % (record.id, record.name), record.description, record.output, record.usage) )
+if not items:
+    sys.exit("No model runs recorded in metadata of project directory %s" % (context.projectDir,) )
+
+ranked = rankByCost(items, args.sortBy)
+if args.number is not None:
+    ranked = ranked[:args.number]
+
+header = ['id', 'description', 'output', 'wall_time', 'cpu_time', 'max_rss', 'bytes_written', 'output_size']
+rows = []
+for (runId, description, output, usage) in ranked:
+    if usage is None:
+        values = [None] * 5
+    else:
+        values = [usage.wallTime, usage.cpuTime, usage.maxRSS, usage.bytesWritten, usage.outputSize]
+    rows.append([runId, description, output] + \
+                ['' if v is None else ("%.2f" % (v,) if isinstance(v, float) else str(v)) for v in values])
+
+if args.csv:
+    writer = csv.writer(sys.stdout)
+    writer.writerow(header)
+    writer.writerows(rows)
+else:
+    widths = [max([len(str(r[i])) for r in rows + [header]]) for i in range(len(header))]
+    for row in [header] + rows:
+        sys.stdout.write('  '.join([str(v).ljust(w) for (v, w) in zip(row, widths)]).rstrip() + '\n')
+
+sys.exit(os.EX_OK)
@@ -77,6 +77,7 @@ or -i option must be specified.
 """
 import argparse
 import datetime
+import time
 from subprocess import *
 import shutil
 
@@ -89,6 +90,8 @@ from rhessysworkflows.rhessys import datetimeToString
 from rhessysworkflows.rhessys import generateCommandString
 from rhessysworkflows.worldfileio import getClimateBaseStationFilenames
 from rhessysworkflows.climateio import getStartAndEndDateForClimateStation
+from rhessysworkflows import resources
+from rhessysworkflows.resources import ProcessRecord
 
 # Handle command line options
 parser = argparse.ArgumentParser(description='Run lairead utility to initializes vegetation carbon stores. Will: (1) run lairead to ' +
@@ -202,6 +205,7 @@ allomPath = os.path.join(context.projectDir, metadata['allometric_table'])
 
 if args.verbose:
     sys.stdout.write("Running lairead to generate redefine worldfile...\n")
+laireadStartTime = time.time()
 p = grassLib.script.pipe_command(laireadPath, old=oldWorldPath, redef=redefWorldPath,
                                       allom=allomPath, lai=grassMetadata['lai_rast'],
                                       vegid=grassMetadata['stratum_rast'],
@@ -209,7 +213,7 @@ p = grassLib.script.pipe_command(laireadPath, old=oldWorldPath, redef=redefWorld
                                       hill=grassMetadata['hillslope_rast'],
                                       patch=grassMetadata['patch_rast'],
                                       mask=grassMetadata['basin_rast'])
-(stdoutStr, stderrStr) = p.communicate() 
+(stdoutStr, stderrStr, laireadUsage) = resources.communicate(p, laireadStartTime)
 result = p.returncode
 if result != 0:
     sys.stdout.write(stdoutStr)
@@ -254,8 +258,9 @@ sys.stdout.write('\nRunning RHESSys to redefine worldfile with vegetation carbon
 sys.stdout.flush()
 
 cmdArgs = rhessysCmd.split()
+startTime = time.time()
 process = Popen(cmdArgs, cwd=paths.RHESSYS_DIR, stdout=PIPE, stderr=PIPE)
-(process_stdout, process_stderr) = process.communicate()
+(process_stdout, process_stderr, usage) = resources.communicate(process, startTime)
 if args.verbose:
     sys.stdout.write(process_stdout)
     sys.stderr.write(process_stderr)
@@ -285,6 +290,14 @@ header = "%s.hdr" % (newWorldName,)
 headerPath = os.path.join(paths.RHESSYS_WORLD, header)
 shutil.copyfile(headerZeroPath, headerPath)
 
+laireadUsage.outputSize = resources.outputSize([redefWorldPath])
+usage.outputSize = resources.outputSize([newWorldPath])
+ProcessRecord.writeToMetadata(context, [ProcessRecord('lairead', 'Redefine worldfile',
+                                                      "%s old=%s redef=%s" % (laireadPath, oldWorldPath, redefWorldPath),
+                                                      paths.relpath(redefWorldPath), laireadUsage),
+                                        ProcessRecord(RHESSysMetadata.MODEL_NAME, 'Redefine worldfile',
+                                                      rhessysCmd, paths.relpath(newWorldPath), usage)])
+
 sys.stdout.write('\n\nSuccessfully used lairead to initialize vegetation carbon stores.\n')
 
 # Write processing history
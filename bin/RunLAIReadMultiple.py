@@ -55,6 +55,8 @@ if __name__ == "__main__":
                         help='The directory to which metadata, intermediate, and final files should be saved')
     parser.add_argument('--topmodel', dest='topmodel', required=False, action='store_true',
                         help='Run RHESSys in topmodel mode when running lairead')
+    parser.add_argument('-j', '--jobs', dest='jobs', required=False, type=int, default=1,
+                        help='Number of worldfiles for which to run lairead at once, each in a temporary GRASS mapset of its own, and number of RHESSys runs to run at once.  Default: 1')
     parser.add_argument('-v', '--verbose', dest='verbose', action='store_true',
                         help='Print detailed information about what the program is doing')
     args = parser.parse_args()
@@ -67,7 +69,7 @@ if __name__ == "__main__":
     
     exitCode = os.EX_OK
     try: 
-        command.run(verbose=args.verbose, topmodel=args.topmodel)
+        command.run(verbose=args.verbose, topmodel=args.topmodel, jobs=args.jobs)
     except CommandException as e:
         print(str(e))
         exitCode = os.EX_DATAERR
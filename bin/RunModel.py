@@ -43,13 +43,38 @@ Pre conditions
 
 Post conditions
 ---------------
-1. Will write an entry to the model run section of the project metadata
+1. Will write an entry to the model run section of the project metadata, including resource usage
+   (wall time, CPU time, peak memory use, bytes written, and output size) of RHESSys
 
 2. Will write an entry to the history section of the project metadata when the model run sucessfully completes
 
+3. Will write the progress of the model run (simulated date, simulated days per second, and
+   estimated time remaining) to a status file, rhessys.status, in the output directory while
+   RHESSys is running (see rhessysworkflows.progress)
+
+4. If --compressOutput is specified, RHESSys output files will be compressed once the model run 
+   completes, with the extension for the compression method (e.g. '.gz') appended to their names.
+   RHESSys output readers and visualization tools read compressed output files directly.
+
+If an earlier model run used the same command line (other than the output prefix) and inputs
+with the same content (RHESSys binary, worldfile, worldfile header and the default files and
+climate base stations it names, climate time series, flow tables, and TEC file), its output
+will be hard linked into the output directory rather than running RHESSys again
+(see rhessysworkflows.runcache).  Use --noRunCache to always run RHESSys.
+
+If --checkpointInterval is specified, RHESSys will write the state of the model run to a worldfile
+every CHECKPOINT_INTERVAL days.  These checkpoints are stored in worldfiles/checkpoints/OUTPUT_PREFIX
+and recorded in the RHESSys section of the project metadata.  If --warmStart is specified, the
+model run will start from the latest checkpoint, on or before the start date, of an earlier model
+run of the same worldfile and flow tables (the model run will then start on the date of the
+checkpoint).  Checkpoints are scheduled in a copy of the TEC file in tecfiles/active, named by
+its content so that identical model runs share it and have the same command line (and can thus be
+found in the run cache).  These copies are not removed, as the command recorded in metadata for
+each model run refers to them.  See rhessysworkflows.checkpoint.
+
 Usage:
 @code
-RunModel.py -p /path/to/project_dir -d "Scenario 1" (--basin | --hillslope | --zone | --patch | --canopy) -pre OUTPUT_PREFIX -st YYYY M D H -ed YYYY M D H -w WORLDFILE -t TECFILE -r FLOWTABLE [SURFACE_FLOWTABLE] [-- RHESSYS_ARG_1 ... RHESSYS_ARG_N]
+RunModel.py -p /path/to/project_dir -d "Scenario 1" (--basin | --hillslope | --zone | --patch | --canopy) -pre OUTPUT_PREFIX -st YYYY M D H -ed YYYY M D H -w WORLDFILE -t TECFILE -r FLOWTABLE [SURFACE_FLOWTABLE] [--compressOutput {gzip,bz2,xz,zstd}] [--noRunCache] [--checkpointInterval DAYS] [--warmStart] [--statusInterval SECONDS] [-- RHESSYS_ARG_1 ... RHESSYS_ARG_N]
 @endcode
 """
 import os
@@ -59,6 +84,9 @@ import argparse
 import textwrap
 import datetime
 import subprocess
+import glob
+import time
+from multiprocessing.pool import ThreadPool
 
 import ecohydrolib.util
 
@@ -67,6 +95,12 @@ from rhessysworkflows.metadata import RHESSysMetadata
 from rhessysworkflows.metadata import ModelRun
 from rhessysworkflows.rhessys import RHESSysPaths
 from rhessysworkflows.rhessys import generateCommandString
+from rhessysworkflows.rhessys import datetimeToString
+from rhessysworkflows.compression import METHODS, compressFile, detectCompression
+from rhessysworkflows.runcache import RunCache, findInputs, hashFile
+from rhessysworkflows import resources
+from rhessysworkflows.progress import ProgressTracker, STATUS_FILE
+from rhessysworkflows.checkpoint import checkpointDates, writeCheckpointTECFile, collectCheckpoints, findCheckpoint
 
 # Handle command line options
 parser = argparse.ArgumentParser(description='Run RHESSys, recording information about the run in metadata')
@@ -103,6 +137,16 @@ outputType.add_argument('--patch', dest='outputType', action='store_const', cons
                         help='Tell RHESSys to output at the patch spatial level')
 outputType.add_argument('--canopy', dest='outputType', action='store_const', const='-c',
                         help='Tell RHESSys to output at the canopy stratum spatial level')
+parser.add_argument('--compressOutput', dest='compressOutput', required=False, choices=METHODS,
+                    help='Compress RHESSys output files using the specified method once the model run completes')
+parser.add_argument('--noRunCache', dest='noRunCache', action='store_true', required=False,
+                    help='Run RHESSys even if an earlier model run used the same command and inputs')
+parser.add_argument('--checkpointInterval', dest='checkpointInterval', required=False, type=int,
+                    help='Write the state of the model run to a worldfile every CHECKPOINT_INTERVAL days, recording each in metadata')
+parser.add_argument('--warmStart', dest='warmStart', action='store_true', required=False,
+                    help='Start from the latest checkpoint, on or before the start date, of an earlier model run of the same worldfile and flow tables')
+parser.add_argument('--statusInterval', dest='statusInterval', required=False, type=float, default=5.0,
+                    help='Number of seconds between updates of the status file (%s) written to the output directory while RHESSys is running.  Default: 5' % (STATUS_FILE,) )
 parser.add_argument('args', nargs=argparse.REMAINDER)
 args = parser.parse_args()
 cmdline = RHESSysMetadata.getCommandLine()
@@ -135,6 +179,10 @@ if args.outputPrefix.count(os.sep) > 1:
     sys.exit("Output prefix cannot contain a path separator ('%s')" % (args.outputPrefix,) )
 if not os.access(paths.RHESSYS_OUT, os.W_OK):
     sys.exit("RHESSys output directory '%s' is not writable" % (paths.RHESSYS_OUT,) )
+if args.checkpointInterval is not None and args.checkpointInterval <= 0:
+    sys.exit("Checkpoint interval must be a positive number of days")
+if args.statusInterval <= 0:
+    sys.exit("Status interval must be a positive number of seconds")
 outputDir = os.path.join(paths.RHESSYS_OUT, args.outputPrefix)
 # Append path separator and 'rhessys' so that RHESSys will write output into a subdirectory
 outputPrefix = os.path.join(outputDir, RHESSysMetadata.MODEL_NAME)
@@ -171,6 +219,7 @@ if args.flowtables:
     subsurfaceFlowRel = paths.relpath(subsurfaceFlow)
     flowtables = subsurfaceFlow
     flowtablesRel = subsurfaceFlowRel
+    flowtablePaths = [subsurfaceFlow]
         
     if len(args.flowtables) == 2:
         surfaceFlow = args.flowtables[1]
@@ -182,14 +231,48 @@ if args.flowtables:
         surfaceFlowRel = paths.relpath(surfaceFlow)
         flowtables += ' ' + surfaceFlow
         flowtablesRel += ' ' + surfaceFlowRel
+        flowtablePaths.append(surfaceFlow)
 else:
     # We are running in topmodel mode
     cmd_proto = "{bin} -st {startDate} -ed {endDate} {outputType} -pre {outputPrefix} -t {tecfile} -w {worldfile} {remainders}"
     flowtables = flowtablesRel = None
+    flowtablePaths = None
+
+# Worldfile the model run, or the run that wrote the checkpoint it starts from, started from
+sourceWorldfileRel = worldfileRel
+startDatetime = datetime.datetime(*args.startDate)
+endDatetime = datetime.datetime(*args.endDate)
+if args.warmStart:
+    checkpoint = findCheckpoint(context, worldfileRel, flowtablesRel, startDatetime)
+    if checkpoint:
+        print("Starting from checkpoint %s of %s\n" % (checkpoint.worldfile, checkpoint.date) )
+        sourceWorldfileRel = checkpoint.source
+        worldfileRel = checkpoint.worldfile
+        worldfile = os.path.join(context.projectDir, worldfileRel)
+        startDatetime = checkpoint.date
+    else:
+        print("No checkpoint found on or before start date, starting from worldfile %s\n" % (worldfileRel,) )
+
+dates = []
+if args.checkpointInterval:
+    dates = checkpointDates(startDatetime, endDatetime, datetime.timedelta(days=args.checkpointInterval))
+    # Schedule checkpoints in a copy of the TEC file.  The copy is named by its content
+    # so that the command line, and hence the run cache key, is the same for identical runs
+    tmpTecfile = os.path.join(paths.RHESSYS_TEC_ACTIVE, "%s.checkpoint_%s.tmp%d" % \
+                              (os.path.basename(tecfile), os.path.basename(outputDir), os.getpid()) )
+    try:
+        writeCheckpointTECFile(tecfile, tmpTecfile, dates)
+    except ValueError as e:
+        sys.exit(str(e))
+    checkpointTecfile = os.path.join(paths.RHESSYS_TEC_ACTIVE, "%s.checkpoint_%s" % \
+                                     (os.path.basename(tecfile), hashFile(tmpTecfile)[:12]) )
+    os.rename(tmpTecfile, checkpointTecfile)
+    tecfile = checkpointTecfile
+    tecfileRel = paths.relpath(tecfile)
 
 remainders = ' '.join(args.args[1:])
-startDate = ' '.join([str(d) for d in args.startDate])
-endDate = ' '.join([str(d) for d in args.endDate])
+startDate = datetimeToString(startDatetime)
+endDate = datetimeToString(endDatetime)
 
 # Build command string for running (i.e. with absolute paths)
 cmd = cmd_proto.format(bin=rhessysBinPath, startDate=startDate, endDate=endDate,
@@ -200,31 +283,82 @@ cmdRel = cmd_proto.format(bin=rhessysBinPathRel, startDate=startDate, endDate=en
                        outputType=args.outputType, outputPrefix=outputPrefixRel,
                        tecfile=tecfileRel, worldfile=worldfileRel, flowtables=flowtablesRel, remainders=remainders)
 
-# Run RHESSys
-sys.stdout.write("Running RHESSys...")
-
-cmdArgs = cmd.split()
-process = subprocess.Popen(cmdArgs, cwd=paths.RHESSYS_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-
-# Create output directory so we can store RHESSys output there
-os.makedirs(outputDir)
-rhessysOutPath = os.path.join(outputDir, 'rhessys.out')
-rhessysOut = open(rhessysOutPath, 'w')
-
-# Get output
-while True:
-    line = process.stdout.readline()
-    if not line:
-        break
-    rhessysOut.write(line)
-    if args.verbose:
-        sys.stdout.write(line)
-
-if process.wait() != 0:
-    sys.exit("\n\nRHESSys failed, returning %s" % (process.returncode,) )
-
-rhessysOut.close() 
-print('\n\nRHESSys model run successfully completed\n')
+# Look for an earlier run with the same command and inputs
+runCache = runKey = cachedDir = None
+if not args.noRunCache:
+    runCache = RunCache(paths)
+    try:
+        inputs = findInputs(paths, rhessysBinPath, worldfile, tecfile, flowtablePaths)
+    except IOError as e:
+        sys.exit(str(e))
+    runKey = runCache.key(cmdRel, outputPrefixRel, runCache.hashInputs(inputs))
+    cachedDir = runCache.lookup(runKey)
+
+if cachedDir:
+    print("Output of identical model run found in %s, linking output into %s\n" % \
+          (paths.relpath(cachedDir), outputDirRel) )
+    RunCache.linkOutput(cachedDir, outputDir)
+    usage = None
+else:
+    # Run RHESSys
+    sys.stdout.write("Running RHESSys...")
+    
+    cmdArgs = cmd.split()
+    startTime = time.time()
+    process = subprocess.Popen(cmdArgs, cwd=paths.RHESSYS_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    
+    # Create output directory so we can store RHESSys output there
+    os.makedirs(outputDir)
+    rhessysOutPath = os.path.join(outputDir, 'rhessys.out')
+    rhessysOut = open(rhessysOutPath, 'w')
+    
+    # Track progress in a background thread, showing it in place of RHESSys output
+    # when not verbose
+    progress = ProgressTracker(startDatetime, endDatetime, outputPrefix,
+                               os.path.join(outputDir, STATUS_FILE), interval=args.statusInterval,
+                               outfp=sys.stdout if not args.verbose and sys.stdout.isatty() else None)
+    progress.start()
+    
+    # Get output
+    while True:
+        line = process.stdout.readline()
+        if not line:
+            break
+        rhessysOut.write(line)
+        progress.update(line)
+        if args.verbose:
+            sys.stdout.write(line)
+    
+    # Measure resource usage of RHESSys while waiting for it
+    usage = resources.wait(process, startTime)
+    progress.stop(process.returncode)
+    if process.returncode != 0:
+        sys.exit("\n\nRHESSys failed, returning %s" % (process.returncode,) )
+    
+    rhessysOut.close() 
+    print('\n\nRHESSys model run successfully completed\n')
+
+if args.compressOutput:
+    sys.stdout.write("Compressing RHESSys output...")
+    sys.stdout.flush()
+    # Output linked from an earlier run may already be compressed
+    outputFiles = [f for f in glob.glob(outputPrefix + '_*') if os.path.isfile(f) and not detectCompression(f)]
+    # Compress files concurrently; compression libraries release the GIL while compressing
+    pool = ThreadPool( max(1, min(len(outputFiles), 4)) )
+    try:
+        pool.map(lambda f: compressFile(f, args.compressOutput), outputFiles)
+    finally:
+        pool.close()
+        pool.join()
+    sys.stdout.write('done\n')
+
+if runCache and not cachedDir:
+    runCache.record(runKey, outputDir)
+
+if dates and not cachedDir:
+    checkpoints = collectCheckpoints(context, paths, worldfile, sourceWorldfileRel, flowtablesRel,
+                                     dates, outputDir)
+    print("Recorded %d checkpoints\n" % (len(checkpoints),) )
 
 # Write metadata about run
 run = ModelRun()
@@ -232,6 +366,9 @@ run.description = args.description
 run.date = datetime.datetime.utcnow()
 run.command = cmdRel
 run.output = outputDirRel
+if usage:
+    usage.outputSize = resources.outputSize([outputDir])
+    run.resources = usage
 run.writeToMetadata(context)
 
 # Write processing history
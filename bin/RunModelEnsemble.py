@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""@package RunModelEnsemble
+
+@brief Run an ensemble of RHESSys model runs, one for each of a table of calibration parameter sets
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+  
+  
+Pre conditions
+--------------
+1. The following metadata entry(ies) must be present in the RHESSys section of the metadata associated with the project directory:
+   rhessys_dir
+   rhessys_bin
+
+Post conditions
+---------------
+1. Will write an entry to the model run section of the project metadata for each model run that completes
+
+2. Will write an entry to the history section of the project metadata
+
+Runs that have already completed (e.g. when re-running an ensemble that was interrupted) are
+not run again.
+Runs whose command line (other than the output prefix) and input files are the same as those of
+an earlier model run link the output of the earlier run rather than running RHESSys again (see
+rhessysworkflows.runcache); use --noRunCache to always run RHESSys.
+
+If --warmStart is specified, model runs start from the latest checkpoint (see RunModel.py
+--checkpointInterval), on or before the start date, of an earlier model run of the same worldfile
+and flow tables, so that model runs of an ensemble share one spin-up.
+
+If behavioral criteria are given (e.g. --behavioral "nse>=0.5" "|bias|<=20"), each run's basin
+streamflow is scored against observed data (--obs) as soon as the run completes.  Simulated
+streamflow of behavioral runs is kept in the behavioral directory of the ensemble output directory
+(and written to behavioral.csv in that directory, for use with RHESSysPlot.py --behavioralData);
+output of runs that are not behavioral is deleted (or compressed or kept, see --nonBehavioral).
+
+Usage:
+@code
+RunModelEnsemble.py -p /path/to/project_dir -d "Calibration 1" --parameters PARAMETER_SETS.csv (--basin | --hillslope | --zone | --patch | --canopy) -pre OUTPUT_PREFIX -st YYYY M D H -ed YYYY M D H -w WORLDFILE -t TECFILE -r FLOWTABLE [SURFACE_FLOWTABLE] [-j JOBS] [--compressOutput {gzip,bz2,xz,zstd}] [--obs OBSERVED_DATA --behavioral CRITERION_1 ... CRITERION_N [--nonBehavioral {delete,compress,keep}]] [--noRunCache] [--warmStart] [-- RHESSYS_ARG_1 ... RHESSYS_ARG_N]
+@endcode
+"""
+import os
+import sys
+import argparse
+import datetime
+
+from rhessysworkflows.command.exceptions import *
+from rhessysworkflows.command.ensemble import ModelEnsemble, readParameterSets
+from rhessysworkflows.compression import METHODS
+from rhessysworkflows.rhessys import RHESSysOutput
+from rhessysworkflows.metrics import METRICS, LIKELIHOODS, NSE
+from rhessysworkflows.glue import NON_BEHAVIORAL_ACTIONS, DELETE
+
+if __name__ == "__main__":
+    # Handle command line options
+    parser = argparse.ArgumentParser(description='Run an ensemble of RHESSys model runs, one for each parameter set, recording information about each run in metadata')
+    parser.add_argument('-i', '--configfile', dest='configfile', required=False,
+                        help='The configuration file')
+    parser.add_argument('-p', '--projectDir', dest='projectDir', required=True,
+                        help='The directory to which metadata, intermediate, and final files should be saved')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='store_true',
+                        help='Print detailed information about what the program is doing')
+    parser.add_argument('-d', '--description', dest='description', required=True,
+                        help='Description of the ensemble; each model run will be described by this followed by the name of its parameter set')
+    parser.add_argument('--parameters', dest='parameters', required=True,
+                        help='CSV file of parameter sets.  The first row names RHESSys options (e.g. s, sv, gw), and optionally a "name" column; ' +
+                             'each following row is a parameter set, with space separated option values (e.g. "0.5 10 1")')
+    parser.add_argument('-pre', dest='outputPrefix', required=True,
+                        help='Name of the directory, relative to output directory in the RHESSys directory of the project, to which output of each run will be written, in a directory named for its parameter set')
+    parser.add_argument('-st', dest='startDate', required=True, nargs=4, type=int,
+                        help='Start date and time of the model runs, of the form "YYYY M D H"')
+    parser.add_argument('-ed', dest='endDate', required=True, nargs=4, type=int,
+                        help='Date date and time of the model runs, of the form "YYYY M D H"')
+    parser.add_argument('-w', dest='worldfile', required=True,
+                        help='Filename of the worldfile to use for the model runs, specified relative to the worldfiles directory in the RHESSys directory of the project')
+    parser.add_argument('-t', dest='tecfile', required=True,
+                        help='Filename of the tecfile to use for the model runs, specified relative to the tec directory in the RHESSys directory of the project')
+    parser.add_argument('-r', dest='flowtables', required=False, nargs='*',
+                        help='Filename(s) of the flow table(s) to use for the model runs, specified relative to the flowtable directory in the RHESSys directory of the project. ' +
+                             'If one flow table is supplied, it will be used for subsurface and surface routing.  ' +
+                             'If two flow tables are supplied the first will be use for subsurface routing, the second for surface.')
+    outputType = parser.add_mutually_exclusive_group(required=True)
+    outputType.add_argument('--basin', dest='outputType', action='store_const', const='b',
+                            help='Tell RHESSys to output at the basin spatial level')
+    outputType.add_argument('--hillslope', dest='outputType', action='store_const', const='h',
+                            help='Tell RHESSys to output at the hillslope spatial level')
+    outputType.add_argument('--zone', dest='outputType', action='store_const', const='z',
+                            help='Tell RHESSys to output at the zone spatial level')
+    outputType.add_argument('--patch', dest='outputType', action='store_const', const='p',
+                            help='Tell RHESSys to output at the patch spatial level')
+    outputType.add_argument('--canopy', dest='outputType', action='store_const', const='c',
+                            help='Tell RHESSys to output at the canopy stratum spatial level')
+    parser.add_argument('-j', '--jobs', dest='jobs', required=False, type=int, default=1,
+                        help='Number of model runs to run at once.  Default: 1')
+    parser.add_argument('--compressOutput', dest='compressOutput', required=False, choices=METHODS,
+                        help='Compress RHESSys output files of each model run using the specified method once the run completes')
+    parser.add_argument('--obs', dest='obs', required=False,
+                        help='File containing observed data against which model runs are to be scored; the first line of the file is its start date, of the form "YYYY M D H"')
+    parser.add_argument('--behavioral', dest='behavioral', required=False, nargs='+',
+                        help='Criteria a model run must meet to be behavioral, of the form METRIC OP THRESHOLD, e.g. "nse>=0.5" "|bias|<=20". ' +
+                             'METRIC is one of: %s' % (', '.join(METRICS),) )
+    parser.add_argument('--behavioralVariable', dest='behavioralVariable', required=False, default='streamflow',
+                        help='Basin daily output variable to score against observed data.  Default: streamflow')
+    parser.add_argument('--nonBehavioral', dest='nonBehavioral', required=False, choices=NON_BEHAVIORAL_ACTIONS, default=DELETE,
+                        help='What to do with output of model runs that are not behavioral.  Default: delete')
+    parser.add_argument('--likelihood', dest='likelihood', required=False, choices=LIKELIHOODS, default=NSE,
+                        help='Metric used as the likelihood of behavioral runs when computing prediction bounds.  Default: nse')
+    parser.add_argument('--noRunCache', dest='noRunCache', action='store_true', required=False,
+                        help='Run RHESSys even if an earlier model run used the same command and inputs')
+    parser.add_argument('--warmStart', dest='warmStart', action='store_true', required=False,
+                        help='Start model runs from the latest checkpoint (see RunModel.py --checkpointInterval), on or before the start date, of an earlier model run of the same worldfile and flow tables')
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    
+    configFile = None
+    if args.configfile:
+        configFile = args.configfile
+    
+    try:
+        parameterSets = readParameterSets(args.parameters)
+    except (IOError, ValueError) as e:
+        sys.exit(str(e))
+    
+    observed = None
+    if args.behavioral:
+        if not args.obs:
+            sys.exit('Observed data must be specified (--obs) to score model runs against behavioral criteria')
+        if not os.access(args.obs, os.R_OK):
+            sys.exit("Observed data file %s is not readable" % (args.obs,) )
+        with open(args.obs, 'r') as f:
+            observed = RHESSysOutput.readObservedDataFromFile(f, readHour=True)
+    
+    command = ModelEnsemble(args.projectDir, configFile)
+    
+    exitCode = os.EX_OK
+    try: 
+        command.run(description=args.description,
+                    outputPrefix=args.outputPrefix,
+                    startDate=datetime.datetime(*args.startDate),
+                    endDate=datetime.datetime(*args.endDate),
+                    worldfile=args.worldfile,
+                    tecfile=args.tecfile,
+                    flowtables=args.flowtables,
+                    outputFlags=args.outputType,
+                    parameterSets=parameterSets,
+                    args=args.args[1:],
+                    jobs=args.jobs,
+                    compressOutput=args.compressOutput,
+                    observed=observed,
+                    behavioralCriteria=args.behavioral,
+                    behavioralVariable=args.behavioralVariable,
+                    nonBehavioral=args.nonBehavioral,
+                    likelihood=args.likelihood,
+                    useRunCache=not args.noRunCache,
+                    warmStart=args.warmStart,
+                    verbose=args.verbose)
+    except CommandException as e:
+        print(str(e))
+        exitCode = os.EX_DATAERR
+    
+    sys.exit(exitCode)
@@ -0,0 +1,274 @@
+"""@package rhessysworkflows.aggregate
+
+@brief Temporal aggregation of daily patch-scale RHESSys output
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+Aggregates daily output, one day at a time as returned by 
+rhessysworkflows.rhessys.RHESSysOutput.iterPatchDailyFile, into monthly, yearly,
+water year, or seasonal sums, means, minimums, or maximums for each patch.  Only
+the running statistics for the current period are held in memory, so daily output
+can be used in place of yearly output, which RHESSys would otherwise have to write
+in addition to daily output.
+
+Usage:
+@code
+aggregator = TemporalAggregator(TemporalAggregator.WATER_YEAR, TemporalAggregator.MEAN)
+with open('rhessys_patch.daily') as f:
+    for (period, patchIDs, data) in aggregator.aggregate(RHESSysOutput.iterPatchDailyFile(f, ['lai'])):
+        ...
+@endcode
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from rhessysworkflows.rhessys import RHESSysOutput
+
+
+class TemporalAggregator(object):
+    
+    MONTHLY = 'monthly'
+    YEARLY = 'yearly'
+    WATER_YEAR = 'wateryear'
+    SEASON = 'season'
+    PERIODS = [MONTHLY, YEARLY, WATER_YEAR, SEASON]
+    # Periods that can be identified by a year alone
+    ANNUAL_PERIODS = [YEARLY, WATER_YEAR, SEASON]
+    
+    SUM = 'sum'
+    MEAN = 'mean'
+    MIN = 'min'
+    MAX = 'max'
+    METHODS = [SUM, MEAN, MIN, MAX]
+    
+    WATER_YEAR_START_MONTH = 10
+    
+    def __init__(self, period=YEARLY, method=SUM, months=None):
+        """ @param period String, one of TemporalAggregator.PERIODS
+            @param method String, one of TemporalAggregator.METHODS
+            @param months List of months (1-12) of the season, in order, for the 
+            SEASON period, e.g. [12, 1, 2] for winter.  A season that spans the 
+            end of a calendar year is labelled by the year in which it ends.
+            
+            @raise ValueError if period, method, or months are not valid
+        """
+        if not period in TemporalAggregator.PERIODS:
+            raise ValueError("Unknown aggregation period %s" % (period,) )
+        if not method in TemporalAggregator.METHODS:
+            raise ValueError("Unknown aggregation method %s" % (method,) )
+        self.period = period
+        self.method = method
+        
+        self.months = None
+        self.startMonth = 1
+        if period == TemporalAggregator.WATER_YEAR:
+            self.startMonth = TemporalAggregator.WATER_YEAR_START_MONTH
+        elif period == TemporalAggregator.SEASON:
+            if not months:
+                raise ValueError("Months of season must be specified")
+            for month in months:
+                if month < 1 or month > 12:
+                    raise ValueError("Invalid month %d in season" % (month,) )
+            if len(set(months)) != len(months):
+                raise ValueError("Months of season must not repeat")
+            self.months = set(months)
+            self.startMonth = months[0]
+            self._endMonth = months[-1]
+    
+    def periodOf(self, date):
+        """ Determine the period a date falls in
+        
+            @param date datetime.datetime
+            
+            @return Tuple (year, month) for the MONTHLY period; tuple (year,) 
+            otherwise, where year is the calendar year, water year, or year in which the
+            season ends.  None if the date is not in the season.
+        """
+        if self.period == TemporalAggregator.MONTHLY:
+            return (date.year, date.month)
+        if self.months is not None and not date.month in self.months:
+            return None
+        if self.startMonth > 1 and date.month >= self.startMonth and \
+           (self.months is None or self.startMonth > self._endMonth):
+            return (date.year + 1,)
+        return (date.year,)
+    
+    def dateRange(self, year):
+        """ Determine the range of dates spanned by the period identified by a year.
+            Not supported for the MONTHLY period.
+            
+            @param year Integer representing calendar year, water year, or year in
+            which the season ends
+            
+            @return Tuple (datetime.datetime, datetime.datetime) representing the
+            first and last dates that may fall in the period
+        """
+        assert(self.period in TemporalAggregator.ANNUAL_PERIODS)
+        if self.startMonth == 1 or (self.months is not None and self.startMonth <= self._endMonth):
+            return (datetime(year, 1, 1), datetime(year, 12, 31, 23))
+        return (datetime(year - 1, self.startMonth, 1), 
+                datetime(year, self.startMonth, 1) - timedelta(hours=1))
+    
+    def aggregate(self, days):
+        """ Aggregate daily output
+        
+            @param days Iterable of tuples (date, patchIDs, data) as yielded by
+            RHESSysOutput.iterPatchDailyFile, in chronological order
+            
+            @return Generator yielding tuples (period, patchIDs, data) for each period, 
+            where period is as returned by periodOf, patchIDs is a sorted 
+            numpy.ndarray<int> of patches with output during the period, and data 
+            maps each column name to a numpy.ndarray of the aggregated value for 
+            each patch
+        """
+        current = None
+        accumulator = None
+        for (date, patchIDs, data) in days:
+            if isinstance(date, np.datetime64):
+                date = date.astype(object)
+            period = self.periodOf(date)
+            if period is None:
+                continue
+            if period != current:
+                if accumulator is not None:
+                    yield (current, ) + accumulator.result()
+                current = period
+                accumulator = _Accumulator(self.method)
+            accumulator.add(patchIDs, data)
+        if accumulator is not None:
+            yield (current, ) + accumulator.result()
+    
+    def aggregateToArray(self, days, column_names):
+        """ Aggregate daily output into a table of the form of RHESSys patch
+            yearly output (or patch monthly output for the MONTHLY period), 
+            as would be read using numpy.genfromtxt(filename, names=True)
+            
+            @param days Iterable of tuples (date, patchIDs, data) as yielded by
+            RHESSysOutput.iterPatchDailyFile, in chronological order
+            @param column_names List of the names of the columns to aggregate
+            
+            @return numpy structured array with fields 'year', 'month' (MONTHLY period
+            only), 'patchID', and one for each of column_names, with one record for
+            each patch in each period
+        """
+        dateFields = ['year']
+        if self.period == TemporalAggregator.MONTHLY:
+            dateFields.append('month')
+        fields = dateFields + ['patchID'] + list(column_names)
+        dtype = [(str(name), float) for name in fields]
+        
+        tables = []
+        for (period, patchIDs, data) in self.aggregate(days):
+            table = np.empty(len(patchIDs), dtype=dtype)
+            for (name, value) in zip(dateFields, period):
+                table[name] = value
+            table['patchID'] = patchIDs
+            for col in column_names:
+                table[col] = data[col]
+            tables.append(table)
+        if not len(tables):
+            return np.empty(0, dtype=dtype)
+        return np.concatenate(tables)
+
+
+class _Accumulator(object):
+    """ Running statistic, per patch, of each column of daily output """
+    def __init__(self, method):
+        self.method = method
+        self.patchIDs = None
+        self.values = {}
+        self.counts = None
+    
+    def _expand(self, patchIDs):
+        """ Expand arrays to include additional patches """
+        allPatchIDs = np.union1d(self.patchIDs, patchIDs)
+        idx = np.searchsorted(allPatchIDs, self.patchIDs)
+        fill = {TemporalAggregator.MIN: np.inf, TemporalAggregator.MAX: -np.inf}.get(self.method, 0.0)
+        for (col, values) in self.values.items():
+            expanded = np.empty(len(allPatchIDs))
+            expanded.fill(fill)
+            expanded[idx] = values
+            self.values[col] = expanded
+        counts = np.zeros(len(allPatchIDs), dtype=np.int64)
+        counts[idx] = self.counts
+        self.counts = counts
+        self.patchIDs = allPatchIDs
+    
+    def add(self, patchIDs, data):
+        if self.patchIDs is None:
+            self.patchIDs = np.asarray(patchIDs)
+            self.values = dict( [(col, np.array(values, dtype=float)) for (col, values) in data.items()] )
+            self.counts = np.ones(len(patchIDs), dtype=np.int64)
+            return
+        
+        idx = slice(None)
+        if not np.array_equal(self.patchIDs, patchIDs):
+            if not np.all(np.in1d(patchIDs, self.patchIDs)):
+                self._expand(patchIDs)
+            idx = np.searchsorted(self.patchIDs, patchIDs)
+        self.counts[idx] += 1
+        for (col, values) in data.items():
+            if self.method == TemporalAggregator.MIN:
+                self.values[col][idx] = np.minimum(self.values[col][idx], values)
+            elif self.method == TemporalAggregator.MAX:
+                self.values[col][idx] = np.maximum(self.values[col][idx], values)
+            else:
+                self.values[col][idx] += values
+    
+    def result(self):
+        values = self.values
+        if self.method == TemporalAggregator.MEAN:
+            values = dict( [(col, v / self.counts) for (col, v) in values.items()] )
+        return (self.patchIDs, values)
+
+
+def aggregatePatchDailyFile(filepath, column_names, aggregator, year=None, jobs=1):
+    """ Aggregate a RHESSys patch daily output file.  When year is specified, only
+        output for the period of that year is read from the file.
+        
+        @param filepath String representing path of patch daily output file
+        @param column_names List of the names of the columns to aggregate
+        @param aggregator TemporalAggregator
+        @param year If not None, only aggregate output for the period of this year
+        (see TemporalAggregator.dateRange)
+        @param jobs Number of processes to use to parse the file
+        
+        @return numpy structured array as returned by TemporalAggregator.aggregateToArray
+    """
+    (startDate, endDate) = (None, None)
+    if year is not None:
+        (startDate, endDate) = aggregator.dateRange(year)
+    with open(filepath, 'r') as f:
+        days = RHESSysOutput.iterPatchDailyFile(f, column_names, startDate=startDate,
+                                                endDate=endDate, jobs=jobs)
+        return aggregator.aggregateToArray(days, column_names)
@@ -0,0 +1,256 @@
+"""@package rhessysworkflows.checkpoint
+
+@brief Warm-start checkpoints from RHESSys output_current_state worldfiles
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+A checkpoint is a worldfile written by RHESSys, in response to an
+output_current_state TEC event, holding the state of a model run on a given
+date.  RunModel can schedule output_current_state events at regular intervals
+(see writeCheckpointTECFile); once the run completes, each state worldfile is
+moved to a directory named after the run in the checkpoints directory of the
+worldfiles directory, alongside a copy of the header of the worldfile the run
+started from, and recorded in the RHESSys section of project metadata (see
+Checkpoint).  A later run using the same worldfile and flow tables can then
+start from the latest checkpoint on or before its start date (see
+findCheckpoint) rather than spinning up from the original worldfile.
+"""
+import os
+import re
+import shutil
+import datetime
+
+from rhessysworkflows.metadata import RHESSysMetadata
+from rhessysworkflows.rhessys import datetimeToString
+
+OUTPUT_CURRENT_STATE = 'output_current_state'
+CHECKPOINT_DIR = 'checkpoints'
+HEADER_SUFFIX = '.hdr'
+TEC_EVENT_RE = re.compile(r"^\s*(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\S+)\s*$")
+
+
+def checkpointDates(startDate, endDate, interval):
+    """ Compute dates of checkpoints at regular intervals during a model run
+
+        @param startDate datetime.datetime representing start date of the model run
+        @param endDate datetime.datetime representing end date of the model run
+        @param interval datetime.timedelta between checkpoints
+
+        @return List of datetime.datetime, after startDate and before endDate
+    """
+    if interval <= datetime.timedelta(0):
+        raise ValueError("Checkpoint interval must be positive")
+    dates = []
+    date = startDate + interval
+    while date < endDate:
+        dates.append(date)
+        date += interval
+    return dates
+
+
+def readTECFile(tecPath):
+    """ Read events from a TEC file
+
+        @param tecPath String representing the path of the TEC file
+
+        @return List of tuple (datetime.datetime, string representing event)
+
+        @raise ValueError if a line of the TEC file is not an event
+    """
+    events = []
+    with open(tecPath, 'r') as f:
+        for (i, line) in enumerate(f):
+            if not line.strip():
+                continue
+            m = TEC_EVENT_RE.match(line)
+            if not m:
+                raise ValueError("Line %d of TEC file %s is not a TEC event: %s" % (i + 1, tecPath, line.strip()) )
+            (year, month, day, hour) = [int(g) for g in m.groups()[:4]]
+            events.append( (datetime.datetime(year, month, day, hour), m.group(5)) )
+    return events
+
+
+def writeCheckpointTECFile(tecPath, outPath, dates):
+    """ Write a TEC file with the events of an existing TEC file, and with
+        output_current_state events on checkpoint dates, in date order
+
+        @param tecPath String representing the path of the existing TEC file
+        @param outPath String representing the path of the TEC file to write
+        @param dates List of datetime.datetime of checkpoints
+
+        @raise ValueError if the existing TEC file cannot be parsed
+    """
+    events = readTECFile(tecPath)
+    scheduled = set([date for (date, event) in events if event == OUTPUT_CURRENT_STATE])
+    events += [(date, OUTPUT_CURRENT_STATE) for date in dates if not date in scheduled]
+    # Sort is stable, so events on the same date keep their order
+    events.sort(key=lambda e: e[0])
+    with open(outPath, 'w') as f:
+        for (date, event) in events:
+            f.write("%s %s%s" % (datetimeToString(date), event, os.linesep) )
+
+
+def stateWorldfilePath(worldfile, date):
+    """ @return String representing the path of the worldfile RHESSys writes
+        for an output_current_state event on date, for a run of worldfile
+    """
+    return "%s.Y%dM%dD%dH%d.state" % (worldfile, date.year, date.month, date.day, date.hour)
+
+
+class Checkpoint(object):
+    """ A state worldfile recorded in the RHESSys section of project metadata """
+
+    CHECKPOINTS = 'checkpoints'
+    PREFIX = 'checkpoint'
+    FMT_DATE = '%Y-%m-%d %H'
+
+    def __init__(self):
+        self.id = None
+        self.date = None
+        # Paths relative to the project directory
+        self.worldfile = None
+        self.source = None
+        self.flowtables = None
+        self.output = None
+
+    def writeToMetadata(self, context):
+        """ Record the checkpoint in metadata, setting its ID
+
+            @param context Context object containing projectDir, the path of the project whose
+            metadata store is to be written to
+        """
+        entries = RHESSysMetadata.readRHESSysEntries(context)
+        ids = [i for i in entries.get(Checkpoint.CHECKPOINTS, '').split(RHESSysMetadata.VALUE_DELIM) if i]
+        number = 1
+        while "%s_%d" % (Checkpoint.PREFIX, number) in ids:
+            number += 1
+        self.id = "%s_%d" % (Checkpoint.PREFIX, number)
+        keyProto = self.id + RHESSysMetadata.KEY_SEP
+        RHESSysMetadata.writeRHESSysEntry(context, keyProto + 'date', self.date.strftime(Checkpoint.FMT_DATE))
+        RHESSysMetadata.writeRHESSysEntry(context, keyProto + 'worldfile', self.worldfile)
+        RHESSysMetadata.writeRHESSysEntry(context, keyProto + 'source', self.source)
+        RHESSysMetadata.writeRHESSysEntry(context, keyProto + 'flowtables', self.flowtables or '')
+        RHESSysMetadata.writeRHESSysEntry(context, keyProto + 'output', self.output)
+        # Write list of checkpoints last, so that it only names complete entries
+        ids.append(self.id)
+        RHESSysMetadata.writeRHESSysEntry(context, Checkpoint.CHECKPOINTS,
+                                          RHESSysMetadata.VALUE_DELIM.join(ids))
+
+    @classmethod
+    def readFromMetadata(cls, context):
+        """ Read all checkpoints recorded in metadata
+
+            @param context Context object containing projectDir, the path of the project whose
+            metadata store is to be read from
+
+            @return List of Checkpoint, in the order they were recorded
+        """
+        entries = RHESSysMetadata.readRHESSysEntries(context)
+        checkpoints = []
+        for i in entries.get(Checkpoint.CHECKPOINTS, '').split(RHESSysMetadata.VALUE_DELIM):
+            if not i:
+                continue
+            keyProto = i + RHESSysMetadata.KEY_SEP
+            checkpoint = cls()
+            checkpoint.id = i
+            checkpoint.date = datetime.datetime.strptime(entries[keyProto + 'date'], Checkpoint.FMT_DATE)
+            checkpoint.worldfile = entries[keyProto + 'worldfile']
+            checkpoint.source = entries[keyProto + 'source']
+            checkpoint.flowtables = entries[keyProto + 'flowtables'] or None
+            checkpoint.output = entries[keyProto + 'output']
+            checkpoints.append(checkpoint)
+        return checkpoints
+
+
+def findCheckpoint(context, source, flowtables, startDate):
+    """ Find the latest checkpoint on or before a date of runs of a worldfile
+
+        @param context Context object of the project
+        @param source String representing the path, relative to the project directory,
+        of the worldfile runs started from
+        @param flowtables String representing the paths, relative to the project directory
+        and separated by spaces, of the flow tables used by runs, or None
+        @param startDate datetime.datetime
+
+        @return Checkpoint, or None if there is no such checkpoint whose worldfile still exists
+    """
+    found = None
+    for checkpoint in Checkpoint.readFromMetadata(context):
+        if checkpoint.source != source or checkpoint.flowtables != (flowtables or None):
+            continue
+        if checkpoint.date > startDate:
+            continue
+        if not os.path.isfile(os.path.join(context.projectDir, checkpoint.worldfile)):
+            continue
+        if found is None or checkpoint.date >= found.date:
+            found = checkpoint
+    return found
+
+
+def collectCheckpoints(context, paths, worldfile, source, flowtables, dates, outputDir):
+    """ Move state worldfiles written by a model run to the checkpoints
+        directory, and record them in metadata
+
+        @param context Context object of the project
+        @param paths rhessysworkflows.rhessys.RHESSysPaths
+        @param worldfile String representing the path of the worldfile the run used
+        @param source String representing the path, relative to the project directory, of
+        the worldfile the run, or the run that wrote the checkpoint it started from, started from
+        @param flowtables String representing the paths, relative to the project directory
+        and separated by spaces, of the flow tables used by the run, or None
+        @param dates List of datetime.datetime of checkpoints scheduled for the run
+        @param outputDir String representing the path of the output directory of the run
+
+        @return List of Checkpoint recorded
+    """
+    checkpointDir = os.path.join(paths.RHESSYS_WORLD, CHECKPOINT_DIR, os.path.basename(outputDir))
+    header = worldfile + HEADER_SUFFIX
+    checkpoints = []
+    for date in dates:
+        statePath = stateWorldfilePath(worldfile, date)
+        if not os.path.isfile(statePath):
+            continue
+        if not os.path.isdir(checkpointDir):
+            os.makedirs(checkpointDir)
+        checkpointPath = os.path.join(checkpointDir, os.path.basename(statePath))
+        shutil.move(statePath, checkpointPath)
+        if os.path.isfile(header):
+            shutil.copyfile(header, checkpointPath + HEADER_SUFFIX)
+        checkpoint = Checkpoint()
+        checkpoint.date = date
+        checkpoint.worldfile = paths.relpath(checkpointPath)
+        checkpoint.source = source
+        checkpoint.flowtables = flowtables
+        checkpoint.output = paths.relpath(outputDir)
+        checkpoint.writeToMetadata(context)
+        checkpoints.append(checkpoint)
+    return checkpoints
@@ -33,21 +33,162 @@ OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 @author Brian Miles <brian_miles@unc.edu>
 
+The extent (start and end date) of a daily climate time-series is determined
+from the date on its first line and the number of lines in the file, which are
+counted without parsing them.  Extents are cached, keyed by the size and
+modification time of the time-series, in memory and in a file (see
+EXTENT_CACHE) in the directory of the time-series, so that each time-series is
+only read once for as long as it is not modified.
 """
 import os, errno
 import re
+import json
 import datetime
+import threading
 
 from rhessysworkflows.rhessys import readParameterFile
+from rhessysworkflows.metadata import RHESSysMetadata
 
+STATION_FILE_EXTENSION = 'base'
+EXTENT_CACHE = '.extents.json'
 
-def getStartAndEndDateForClimateStation(climateStation, paths):
+FMT_DATE = '%Y-%m-%d %H:%M:%S'
+
+# Number of bytes read at a time when counting lines
+_BLOCK_SIZE = 1024 * 1024
+_START_DATE_RE = re.compile('^(?P<year>\d+)\s(?P<month>\d+)\s(?P<day>\d+)\s(?P<hour>\d+)\s*$')
+
+# Extents of time-series read by this process, by path
+_extents = {}
+_extentsLock = threading.Lock()
+
+
+def countLines(path):
+    """ Count the lines in a file, without splitting the file into lines
+
+        @param path String representing the path of the file
+
+        @return int representing the number of lines, including a last line
+        not terminated by a newline
+    """
+    numLines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        block = f.read(_BLOCK_SIZE)
+        while block:
+            numLines += block.count(b'\n')
+            last = block[-1:]
+            block = f.read(_BLOCK_SIZE)
+    if last != b'\n':
+        numLines += 1
+    return numLines
+
+
+def readStartAndEndDateForTimeseries(timeseriesPath):
+    """ Determine start and end date of a daily climate time-series from the
+        date on its first line and the number of lines that follow it.
+        Does not use or update cached extents.
+
+        @param timeseriesPath String representing the path of the time-series
+
+        @return Tuple of datetime.datetime representing start and end date of the
+        time-series; (None, None) if the time-series lacks a start date
+    """
+    startDate = None
+    with open(timeseriesPath, 'r') as f:
+        for line in f:
+            result = _START_DATE_RE.match(line.strip())
+            if result:
+                startDate = datetime.datetime(year=int( result.group('year') ),
+                                              month=int( result.group('month') ),
+                                              day=int( result.group('day') ),
+                                              hour=int( result.group('hour') ) )
+                break
+    if not startDate:
+        return (None, None)
+    # Every line other than the start date is a day
+    numDays = countLines(timeseriesPath) - 1
+    return (startDate, startDate + datetime.timedelta(days=numDays))
+
+
+def _readExtentCache(cachePath):
+    try:
+        with open(cachePath, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        # Missing or corrupt cache
+        return {}
+
+
+def _writeExtentCache(cachePath, extents):
+    tmpPath = "%s.tmp%d_%d" % (cachePath, os.getpid(), threading.current_thread().ident)
+    try:
+        with open(tmpPath, 'w') as f:
+            json.dump(extents, f, sort_keys=True)
+        os.rename(tmpPath, cachePath)
+    except (IOError, OSError):
+        # Extents are only cached if the climate directory is writable
+        if os.path.exists(tmpPath):
+            os.unlink(tmpPath)
+
+
+def _formatDate(date):
+    return date.strftime(FMT_DATE) if date else None
+
+
+def _parseDate(text):
+    return datetime.datetime.strptime(text, FMT_DATE) if text else None
+
+
+def getStartAndEndDateForTimeseries(timeseriesPath, useCache=True):
+    """ Determine start and end date of a daily climate time-series, using
+        cached extents if the time-series has not been modified since they
+        were cached
+
+        @param timeseriesPath String representing the path of the time-series
+        @param useCache Boolean  If False, read the time-series, and do not cache its extent
+
+        @return Tuple of datetime.datetime representing start and end date of the
+        time-series; (None, None) if the time-series lacks a start date
+    """
+    if not useCache:
+        return readStartAndEndDateForTimeseries(timeseriesPath)
+
+    timeseriesPath = os.path.abspath(timeseriesPath)
+    stat = os.stat(timeseriesPath)
+    key = [stat.st_size, stat.st_mtime]
+    with _extentsLock:
+        cached = _extents.get(timeseriesPath)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    cachePath = os.path.join(os.path.dirname(timeseriesPath), EXTENT_CACHE)
+    name = os.path.basename(timeseriesPath)
+    entry = _readExtentCache(cachePath).get(name)
+    if entry and [entry['size'], entry['mtime']] == key:
+        extent = (_parseDate(entry['start']), _parseDate(entry['end']))
+    else:
+        extent = readStartAndEndDateForTimeseries(timeseriesPath)
+        # Re-read the cache so as not to discard extents cached by others meanwhile
+        extents = _readExtentCache(cachePath)
+        extents[name] = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                         'start': _formatDate(extent[0]), 'end': _formatDate(extent[1])}
+        _writeExtentCache(cachePath, extents)
+
+    with _extentsLock:
+        _extents[timeseriesPath] = (key, extent)
+    return extent
+
+
+def getStartAndEndDateForClimateStation(climateStation, paths, useCache=True):
     """ Determine start and end date for the climate time-series associated
         with a climate station.  Supports only point time-series.  Does so
-        by reading in the daily rain climate file.
+        by counting days in the daily rain climate file (see
+        getStartAndEndDateForTimeseries).
     
         @param climateStation String representing path to climate station file
         @param paths rhessysworkflows.rhessys.RHESSysPaths
+        @param useCache Boolean  If False, read the daily rain time-series, and do not cache its extent
         
         @return Tuple of datetime.datetime representing start and end date of the climate
         time series; None is returned if the time-series lacks a start date
@@ -64,33 +205,30 @@ def getStartAndEndDateForClimateStation(climateStation, paths):
     if not os.access(rainTimeseriesPath, os.R_OK):
         raise IOError("Unable to read daily rain time-series %s" % (rainTimeseriesPath,), errno.EACCES)
     
-    # Read daily rain timeseries to determine start and end date
-    startDate = None
-    endDate = None
-    numDays = 0
-    startDateRe = re.compile('^(?P<year>\d+)\s(?P<month>\d+)\s(?P<day>\d+)\s(?P<hour>\d+)\s*$')
-    countDays = False
-    
-    f = open(rainTimeseriesPath, 'r')
-    for line in f:
-        if not countDays:
-            line = line.strip()
-            result = startDateRe.match(line)
-            if result:
-                startDate = datetime.datetime(year=int( result.group('year') ),
-                                              month=int( result.group('month') ),
-                                              day=int( result.group('day') ),
-                                              hour=int( result.group('hour') ) )
-                countDays = True
-                continue
-        # Count days
-        numDays += 1
-    
-    if startDate:
-        timeDelta = datetime.timedelta(days=numDays)
-        endDate = startDate + timeDelta
-    
-    return (startDate, endDate)
-    
+    return getStartAndEndDateForTimeseries(rainTimeseriesPath, useCache)
+
+
+def getStartAndEndDatesForClimateStations(context, paths, useCache=True):
+    """ Determine start and end date for the climate time-series of each of
+        the climate stations imported into a project (i.e. those listed in the
+        climate_stations entry of the RHESSys section of project metadata)
     
-    
\ No newline at end of file
+        @param context Context object containing projectDir, the path of the project whose 
+        metadata store is to be read from
+        @param paths rhessysworkflows.rhessys.RHESSysPaths
+        @param useCache Boolean  If False, read the daily rain time-series, and do not cache their extents
+        
+        @return dict mapping climate station name to tuple of datetime.datetime representing
+        start and end date of its climate time series
+        
+        @raise IOError if unable to read a climate station file or daily rain 
+        time-series
+    """
+    metadata = RHESSysMetadata.readRHESSysEntries(context)
+    extents = {}
+    for station in metadata.get('climate_stations', '').split(RHESSysMetadata.VALUE_DELIM):
+        if not station:
+            continue
+        stationPath = os.path.join(paths.RHESSYS_CLIM, "%s%s%s" % (station, os.extsep, STATION_FILE_EXTENSION) )
+        extents[station] = getStartAndEndDateForClimateStation(stationPath, paths, useCache)
+    return extents
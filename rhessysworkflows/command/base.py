@@ -38,6 +38,7 @@ import sys
 from ecohydrolib.grasslib import *
 
 from rhessysworkflows.command.exceptions import MetadataException
+from rhessysworkflows.command.session import GrassSession
 from rhessysworkflows.context import Context
 from rhessysworkflows.metadata import RHESSysMetadata
 
@@ -113,6 +114,8 @@ class GrassCommand(Command):
         self.grassDbase = os.path.join(self.context.projectDir, self.metadata['grass_dbase'])
         self.grassConfig = GRASSConfig(self.context, self.grassDbase, self.metadata['grass_location'], self.metadata['grass_mapset'])
         self.grassLib = GRASSLib(grassConfig=self.grassConfig)
+        # Run GRASS modules through a session so r.mapcalc expressions can be batched
+        self.grassSession = GrassSession(self.grassLib)
         
     def run(self, *args, **kwargs):
         """ Run the command
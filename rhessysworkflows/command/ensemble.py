@@ -0,0 +1,495 @@
+"""@package rhessysworkflows.command.ensemble
+    
+@brief RHESSysWorkflows command for running ensembles of RHESSys model runs
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+An ensemble is a set of RHESSys model runs that share a worldfile, flow
+tables, TEC file, and simulation period, but that differ in their calibration
+parameters (e.g. -s, -sv, -gw).  Parameter sets are read from a CSV table
+(see readParameterSets).  Each run writes its output to a directory of its
+own within the ensemble output directory, and is recorded as a ModelRun in
+project metadata once it completes.  An ensemble can be resumed: runs that
+have already completed are not run again.
+
+If behavioral criteria are given, each run is scored against observed data as
+soon as it completes, and the output of runs that are not behavioral is
+deleted or compressed (see rhessysworkflows.glue).
+
+Runs whose command and inputs are the same as those of an earlier run (of
+this or another ensemble, or of RunModel) link the output of the earlier run
+rather than running RHESSys again (see rhessysworkflows.runcache).
+
+Runs can share a spin-up by starting from the latest checkpoint, on or before
+the start date of the ensemble, of an earlier run of the same worldfile and
+flow tables (see rhessysworkflows.checkpoint).
+"""
+import os
+import sys
+import csv
+import shutil
+import datetime
+import glob
+import re
+import time
+from subprocess import Popen, STDOUT
+from multiprocessing.pool import ThreadPool
+
+from rhessysworkflows.command.base import Command
+from rhessysworkflows.command.exceptions import MetadataException
+from rhessysworkflows.command.exceptions import RunException
+
+from rhessysworkflows.rhessys import RHESSysPaths
+from rhessysworkflows.rhessys import generateCommandString
+from rhessysworkflows.metadata import RHESSysMetadata
+from rhessysworkflows.metadata import ModelRun
+from rhessysworkflows import resources
+from rhessysworkflows.compression import compressFile
+from rhessysworkflows.compression import detectCompression
+from rhessysworkflows.compression import GZIP
+from rhessysworkflows.runcache import RunCache
+from rhessysworkflows.runcache import findInputs
+from rhessysworkflows.checkpoint import findCheckpoint
+from rhessysworkflows.glue import Criterion
+from rhessysworkflows.glue import BehavioralStore
+from rhessysworkflows.glue import BehavioralFilter
+from rhessysworkflows.glue import DELETE
+
+NAME_COLUMN = 'name'
+# RHESSys options set by the ensemble itself, which cannot be parameters
+RESERVED_OPTIONS = ['st', 'ed', 't', 'w', 'r', 'pre', 'b', 'h', 'z', 'p', 'c']
+# Directory, within the ensemble output directory, of the behavioral store
+BEHAVIORAL_DIR = 'behavioral'
+BEHAVIORAL_CSV = 'behavioral.csv'
+OPTION_RE = re.compile(r"^[A-Za-z]\w*$")
+
+
+def readParameterSets(path):
+    """ Read a table of calibration parameter sets from a CSV file.  The first
+        row names RHESSys command line options (with or without their leading
+        dash, e.g. s, sv, gw); each following row is a parameter set, each cell
+        holding the space separated values of an option, e.g.:
+        
+        @code
+        name,s,sv,gw
+        run1,0.5 10 1,0.5 10,0.1 0.2
+        run2,1.5 20 1,1.5 20,0.2 0.4
+        @endcode
+        
+        The optional name column names each parameter set; sets without a name
+        are named by their position in the table (e.g. run001).  Empty cells
+        mean the option is not passed for that parameter set.
+        
+        @param path String representing the path of the CSV file
+        
+        @return List of tuples (name, dict<string, list<string>>) mapping option
+        names to option values, one per parameter set, in the order of the table
+        
+        @raise ValueError if the table is not a valid parameter set table
+    """
+    with open(path, 'r') as f:
+        rows = [row for row in csv.reader(f) if any([cell.strip() for cell in row])]
+    if len(rows) < 2:
+        raise ValueError("Parameter set table {0} contains no parameter sets".format(path))
+    header = [h.strip().lstrip('-') for h in rows[0]]
+    for option in header:
+        if option == NAME_COLUMN:
+            continue
+        if not OPTION_RE.match(option):
+            raise ValueError("Invalid RHESSys option '{0}' in parameter set table {1}".format(option, path))
+        if option in RESERVED_OPTIONS:
+            raise ValueError("RHESSys option '{0}' cannot be used in parameter set table {1}".format(option, path))
+    if len(set(header)) != len(header):
+        raise ValueError("Duplicate column in parameter set table {0}".format(path))
+    
+    numSets = len(rows) - 1
+    nameProto = "run{{0:0{0}d}}".format(len(str(numSets)))
+    parameterSets = []
+    names = set()
+    for (i, row) in enumerate(rows[1:]):
+        if len(row) != len(header):
+            raise ValueError("Row {0} of parameter set table {1} has {2} columns, expected {3}".format(i + 2, path,
+                                                                                                     len(row), len(header)))
+        name = nameProto.format(i + 1)
+        parameters = {}
+        for (option, cell) in zip(header, row):
+            cell = cell.strip()
+            if option == NAME_COLUMN:
+                if cell:
+                    name = cell
+                continue
+            values = cell.split()
+            if not values:
+                continue
+            for value in values:
+                try:
+                    float(value)
+                except ValueError:
+                    raise ValueError("Value '{0}' of option {1} in row {2} of parameter set table {3} is not a number".format(value, option, i + 2, path))
+            parameters[option] = values
+        if os.sep in name or name in (os.curdir, os.pardir):
+            raise ValueError("Invalid parameter set name '{0}' in parameter set table {1}".format(name, path))
+        if name in names:
+            raise ValueError("Duplicate parameter set name '{0}' in parameter set table {1}".format(name, path))
+        names.add(name)
+        parameterSets.append( (name, parameters) )
+    return parameterSets
+
+
+class EnsembleRun(object):
+    """ One RHESSys model run of an ensemble """
+    
+    RUN_COMPLETE = 'rhessys.complete'
+    
+    def __init__(self, name, parameters, outputDir):
+        """ @param name String representing the name of the run's parameter set
+            @param parameters dict<string, list<string>> mapping RHESSys options
+            to option values
+            @param outputDir String representing the path of the directory to
+            which the run's output is to be written
+        """
+        self.name = name
+        self.parameters = parameters
+        self.outputDir = outputDir
+        # Append 'rhessys' so that RHESSys will write output into outputDir
+        self.outputPrefix = os.path.join(outputDir, RHESSysMetadata.MODEL_NAME)
+        self.command = None
+        self.commandRel = None
+        self.returncode = None
+        self.key = None
+        self.cached = False
+        # rhessysworkflows.resources.ResourceUsage of RHESSys
+        self.usage = None
+    
+    @property
+    def completePath(self):
+        return os.path.join(self.outputDir, EnsembleRun.RUN_COMPLETE)
+    
+    def isComplete(self):
+        """ @return True if the run has already completed successfully """
+        return os.path.isfile(self.completePath)
+    
+    def markComplete(self):
+        # Output linked from an earlier run shares its files, so replace
+        # rather than overwrite
+        if os.path.exists(self.completePath):
+            os.unlink(self.completePath)
+        with open(self.completePath, 'w') as f:
+            f.write("{0}\n".format(self.commandRel))
+
+
+class ModelEnsemble(Command):
+    
+    def __init__(self, projectDir, configFile=None, outfp=sys.stdout):
+        """ Construct a ModelEnsemble command.
+        Arguments:
+        projectDir -- string    The path to the project directory
+        configFile -- string    The path to an EcohydroLib configuration file
+        outfp -- file-like object    Where output should be written to
+        
+        """
+        super(ModelEnsemble, self).__init__(projectDir, configFile, outfp)
+    
+    def checkMetadata(self, *args, **kwargs):
+        """ Check to make sure the project directory has the necessary metadata to run this command.
+        """
+        super(ModelEnsemble, self).checkMetadata()
+        
+        if not 'rhessys_dir' in self.metadata:
+            raise MetadataException("Metadata in project directory %s does not contain a RHESSys directory" % (self.context.projectDir,))
+        if not 'rhessys_bin' in self.metadata:
+            raise MetadataException("Metadata in project directory %s does not contain a RHESSys binary" % (self.context.projectDir,))
+    
+    def _projectFile(self, directory, filename, description):
+        """ Get the path of a file in a directory of the RHESSys directory of the project
+        
+            @raise RunException if the file is not readable
+        """
+        if filename.count(os.sep) > 1:
+            raise RunException("%s cannot contain a path separator ('%s')" % (description, filename) )
+        path = os.path.join(directory, filename)
+        if not os.path.isfile(path) or not os.access(path, os.R_OK):
+            raise RunException("%s '%s' is not a readable file" % (description, path) )
+        return path
+    
+    def run(self, *args, **kwargs):
+        """ Run an ensemble of RHESSys model runs, several at once
+        
+        Arguments:
+        description -- string    Description of the ensemble; each run is described by this
+                                 followed by the name of its parameter set
+        outputPrefix -- string    Name of the ensemble output directory, within the output directory of
+                                  the RHESSys directory of the project.  Each run writes its output to
+                                  a directory, named after its parameter set, in this directory.
+        startDate -- datetime    Start date and time of the model runs
+        endDate -- datetime    End date and time of the model runs
+        worldfile -- string    Filename of the worldfile, relative to the worldfiles directory
+        tecfile -- string    Filename of the TEC file, relative to the tecfiles directory
+        flowtables -- list<string>    Filenames of the subsurface flow table and (optionally) surface
+                                      flow table, relative to the flow directory.  If None, RHESSys will
+                                      be run in TOPMODEL mode.
+        outputFlags -- string    RHESSys output flags (e.g. 'b' for basin output). Default: 'b'.
+        parameterSets -- list<tuple<string, dict>>    Parameter sets, as returned by readParameterSets
+        args -- list<string>    Additional arguments to pass to RHESSys. Default: None.
+        jobs -- int    Number of RHESSys runs to run at once. Default: 1.
+        compressOutput -- string    If not None, compress output files of each run using this method
+                                    (see rhessysworkflows.compression) once the run completes. Default: None.
+        observed -- tuple<list<datetime>, list<float>>    Observed data, as returned by
+                                                          RHESSysOutput.readObservedDataFromFile, against
+                                                          which runs are scored.  Required if behavioralCriteria
+                                                          is given.
+        behavioralCriteria -- list<string>    Criteria (e.g. "nse>=0.5", "|bias|<=10"; see
+                                              rhessysworkflows.glue.Criterion) a run must meet to be
+                                              behavioral.  If None, runs are not scored. Default: None.
+        behavioralVariable -- string    Basin daily output variable to score. Default: streamflow.
+        nonBehavioral -- string    What to do with output of runs that are not behavioral: one of
+                                   rhessysworkflows.glue.NON_BEHAVIORAL_ACTIONS. Default: delete.
+        likelihood -- string    Metric used to weight behavioral runs when computing prediction
+                                bounds. Default: nse.
+        useRunCache -- boolean    Link output of earlier runs with the same command and inputs rather
+                                  than running RHESSys again. Default: True.
+        warmStart -- boolean    Start runs from the latest checkpoint, on or before startDate, of an
+                                earlier run of the same worldfile and flow tables; runs then start on the
+                                date of the checkpoint. Default: False.
+        verbose -- boolean    Produce verbose output. Default: False.
+        
+        Scores of runs, and simulated timeseries of behavioral runs, are stored in the
+        behavioral directory of the ensemble output directory, and simulated timeseries
+        of behavioral runs are written to behavioral.csv in that directory, for use with
+        RHESSysPlot.
+        
+        @return List of EnsembleRun, one per parameter set, in the order of parameterSets
+        
+        @raise RunException if any run fails; runs that completed are recorded in metadata
+        """
+        description = kwargs['description']
+        outputPrefix = kwargs['outputPrefix']
+        startDate = kwargs['startDate']
+        endDate = kwargs['endDate']
+        flowtables = kwargs.get('flowtables', None)
+        outputFlags = kwargs.get('outputFlags', 'b')
+        parameterSets = kwargs['parameterSets']
+        extraArgs = kwargs.get('args', None) or []
+        jobs = kwargs.get('jobs', 1)
+        compressOutput = kwargs.get('compressOutput', None)
+        observed = kwargs.get('observed', None)
+        behavioralCriteria = kwargs.get('behavioralCriteria', None)
+        behavioralVariable = kwargs.get('behavioralVariable', 'streamflow')
+        nonBehavioral = kwargs.get('nonBehavioral', DELETE)
+        likelihood = kwargs.get('likelihood', 'nse')
+        useRunCache = kwargs.get('useRunCache', True)
+        warmStart = kwargs.get('warmStart', False)
+        verbose = kwargs.get('verbose', False)
+        
+        self.checkMetadata()
+        
+        criteria = None
+        if behavioralCriteria:
+            if observed is None:
+                raise RunException("Observed data are needed to score runs against behavioral criteria")
+            if not 'b' in outputFlags:
+                raise RunException("Basin output is needed to score runs against behavioral criteria")
+            try:
+                criteria = [Criterion(c) for c in behavioralCriteria]
+            except ValueError as e:
+                raise RunException(str(e))
+        
+        rhessysDir = self.metadata['rhessys_dir']
+        self.paths = RHESSysPaths(self.context.projectDir, rhessysDir)
+        
+        rhessysBinPathRel = self.metadata['rhessys_bin']
+        rhessysBinPath = os.path.join(self.context.projectDir, rhessysBinPathRel)
+        if not os.path.isfile(rhessysBinPath) or not os.access(rhessysBinPath, os.X_OK):
+            raise RunException("Putative RHESSys executable '%s' is not an executable file" % (rhessysBinPath,) )
+        
+        if outputPrefix.count(os.sep) > 1:
+            raise RunException("Output prefix cannot contain a path separator ('%s')" % (outputPrefix,) )
+        if not os.access(self.paths.RHESSYS_OUT, os.W_OK):
+            raise RunException("RHESSys output directory '%s' is not writable" % (self.paths.RHESSYS_OUT,) )
+        ensembleDir = os.path.join(self.paths.RHESSYS_OUT, outputPrefix)
+        
+        worldfile = self._projectFile(self.paths.RHESSYS_WORLD, kwargs['worldfile'], 'Worldfile')
+        tecfile = self._projectFile(self.paths.RHESSYS_TEC, kwargs['tecfile'], 'TEC file')
+        subsurfaceFlow = surfaceFlow = None
+        if flowtables:
+            subsurfaceFlow = self._projectFile(self.paths.RHESSYS_FLOW, flowtables[0], 'Flowtable')
+            if len(flowtables) > 1:
+                surfaceFlow = self._projectFile(self.paths.RHESSYS_FLOW, flowtables[1], 'Surface flowtable')
+        relpath = lambda p: p and self.paths.relpath(p)
+        
+        if warmStart:
+            flowtablesRel = ' '.join([relpath(p) for p in (subsurfaceFlow, surfaceFlow) if p]) or None
+            checkpoint = findCheckpoint(self.context, relpath(worldfile), flowtablesRel, startDate)
+            if checkpoint:
+                self.outfp.write("Starting runs from checkpoint {0} of {1}\n".format(checkpoint.worldfile,
+                                                                                   checkpoint.date))
+                worldfile = os.path.join(self.context.projectDir, checkpoint.worldfile)
+                startDate = checkpoint.date
+            else:
+                self.outfp.write("No checkpoint found on or before start date, starting runs from worldfile {0}\n".format(relpath(worldfile)))
+        
+        runCache = inputDigests = None
+        if useRunCache:
+            runCache = RunCache(self.paths)
+            try:
+                inputs = findInputs(self.paths, rhessysBinPath, worldfile, tecfile,
+                                    [p for p in (subsurfaceFlow, surfaceFlow) if p])
+            except IOError as e:
+                raise RunException(str(e))
+            # Inputs are shared by all runs, so only hash them once
+            inputDigests = runCache.hashInputs(inputs)
+        
+        runs = []
+        for (name, parameters) in parameterSets:
+            run = EnsembleRun(name, parameters, os.path.join(ensembleDir, name))
+            # Build command string for running (i.e. with absolute paths), and
+            # with relative paths for metadata
+            run.command = generateCommandString(rhessysBinPath, run.outputPrefix, startDate, endDate,
+                                                tecfile, worldfile, subsurfaceFlow, surfaceFlow,
+                                                outputFlags, **parameters)
+            run.commandRel = generateCommandString(rhessysBinPathRel, relpath(run.outputPrefix),
+                                                   startDate, endDate,
+                                                   relpath(tecfile), relpath(worldfile),
+                                                   relpath(subsurfaceFlow), relpath(surfaceFlow),
+                                                   outputFlags, **parameters)
+            if extraArgs:
+                run.command += ' ' + ' '.join(extraArgs)
+                run.commandRel += ' ' + ' '.join(extraArgs)
+            if runCache:
+                run.key = runCache.key(run.commandRel, relpath(run.outputPrefix), inputDigests)
+            runs.append(run)
+        
+        pending = [run for run in runs if not run.isComplete()]
+        if len(pending) < len(runs):
+            self.outfp.write("Skipping {0} of {1} runs that have already completed\n".format(len(runs) - len(pending),
+                                                                                            len(runs)))
+        if not os.path.isdir(ensembleDir):
+            os.makedirs(ensembleDir)
+        
+        behavioralFilter = None
+        if criteria:
+            # Only score runs over the simulation period
+            (obsDates, obsValues) = observed
+            period = [i for (i, d) in enumerate(obsDates) \
+                      if d.date() >= startDate.date() and d.date() <= endDate.date()]
+            try:
+                behavioralFilter = BehavioralFilter(BehavioralStore(os.path.join(ensembleDir, BEHAVIORAL_DIR)),
+                                                    [obsDates[i] for i in period],
+                                                    [obsValues[i] for i in period],
+                                                    criteria, variable=behavioralVariable,
+                                                    nonBehavioral=nonBehavioral,
+                                                    compressMethod=compressOutput or GZIP)
+            except ValueError as e:
+                raise RunException(str(e))
+        
+        def runModel(run):
+            # Remove output of an earlier attempt that did not complete
+            if os.path.isdir(run.outputDir):
+                shutil.rmtree(run.outputDir)
+            cachedDir = runCache and runCache.lookup(run.key)
+            if cachedDir:
+                RunCache.linkOutput(cachedDir, run.outputDir)
+                run.cached = True
+                run.returncode = 0
+            else:
+                os.makedirs(run.outputDir)
+                if verbose:
+                    self.outfp.write("Running {0}: {1}\n".format(run.name, run.command))
+                    self.outfp.flush()
+                with open(os.path.join(run.outputDir, 'rhessys.out'), 'w') as rhessysOut:
+                    startTime = time.time()
+                    process = Popen(run.command.split(), cwd=self.paths.RHESSYS_DIR,
+                                    stdout=rhessysOut, stderr=STDOUT)
+                    run.usage = resources.wait(process, startTime)
+                    run.returncode = process.returncode
+            if run.returncode == 0 and compressOutput:
+                for outputFile in glob.glob(run.outputPrefix + '_*'):
+                    if os.path.isfile(outputFile) and not detectCompression(outputFile):
+                        compressFile(outputFile, compressOutput)
+            if run.usage:
+                run.usage.outputSize = resources.outputSize([run.outputDir])
+            return run
+        
+        # Runs are recorded in metadata by this thread, as each finishes
+        failures = []
+        if pending:
+            pool = ThreadPool( max(1, min(jobs, len(pending))) )
+            try:
+                for run in pool.imap_unordered(runModel, pending):
+                    if run.returncode != 0:
+                        failures.append(run)
+                        self.outfp.write("RHESSys failed for {0}, returning {1}\n".format(run.name, run.returncode))
+                        continue
+                    # Output of runs that are not behavioral may be deleted
+                    cacheable = runCache and not run.cached
+                    if behavioralFilter:
+                        try:
+                            (scores, behavioral) = behavioralFilter.process(run)
+                        except Exception as e:
+                            failures.append(run)
+                            self.outfp.write("Unable to score {0}: {1}\n".format(run.name, e))
+                            continue
+                        self.outfp.write("{0} is {1}behavioral: {2}\n".format(run.name, '' if behavioral else 'not ',
+                                                                             ', '.join(["{0}={1:.4g}".format(m, scores[m]) \
+                                                                                        for m in behavioralFilter.store.metrics])))
+                        if not behavioral and behavioralFilter.nonBehavioral == DELETE:
+                            cacheable = False
+                    modelRun = ModelRun()
+                    modelRun.description = "{0} ({1})".format(description, run.name)
+                    modelRun.date = datetime.datetime.utcnow()
+                    modelRun.command = run.commandRel
+                    modelRun.output = self.paths.relpath(run.outputDir)
+                    modelRun.resources = run.usage
+                    modelRun.writeToMetadata(self.context)
+                    run.markComplete()
+                    if cacheable:
+                        runCache.record(run.key, run.outputDir)
+                    self.outfp.write("Completed {0}{1}\n".format(run.name, " (output of identical run linked)" if run.cached else ''))
+                    self.outfp.flush()
+            finally:
+                pool.close()
+                pool.join()
+        
+        if behavioralFilter:
+            store = behavioralFilter.store
+            store.writeCSV(os.path.join(store.path, BEHAVIORAL_CSV), likelihood=likelihood)
+            scores = store.scores()
+            self.outfp.write("{0} of {1} runs are behavioral\n".format(int(scores[BehavioralStore.BEHAVIORAL].sum()),
+                                                                       len(scores)))
+        
+        # Write processing history
+        RHESSysMetadata.appendProcessingHistoryItem(self.context, RHESSysMetadata.getCommandLine())
+        
+        if failures:
+            raise RunException("RHESSys failed for {0} of {1} runs: {2}".format(len(failures), len(runs),
+                                                                              ', '.join([r.name for r in failures])))
+        return runs
@@ -35,14 +35,19 @@ OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 import os
 import sys
+import threading
+import time
 from subprocess import *
 
 from rhessysworkflows.command.base import GrassCommand
+from rhessysworkflows.command.session import mapWorkerMapsets
 from rhessysworkflows.command.exceptions import MetadataException
 from rhessysworkflows.command.exceptions import RunException
 
 from rhessysworkflows.rhessys import RHESSysPaths
 from rhessysworkflows.metadata import RHESSysMetadata
+from rhessysworkflows import resources
+from rhessysworkflows.resources import ProcessRecord
 
 class FlowtableMultiple(GrassCommand):
     
@@ -106,12 +111,15 @@ class FlowtableMultiple(GrassCommand):
         ignoreBurnedDEM -- boolean    If true, use the base DEM when running createflowpaths. 
                                       If false, use the stream-burned DEM (if present).  Default: False.
         force -- boolean        Whether to force createflowpaths to run if DEM X resolution != Y resolution. Default: False.
+        jobs -- int    Number of sub-basins for which to run createflowpaths at once,
+                       each in a temporary GRASS mapset of its own. Default: 1.
         verbose -- boolean    Produce verbose output. Default: False.
         """
         routeRoads = kwargs.get('routeRoads', False)
         routeRoofs = kwargs.get('routeRoofs', False)
         force = kwargs.get('force', False)
         ignoreBurnedDEM = kwargs.get('ignoreBurnedDEM', False)
+        jobs = kwargs.get('jobs', 1)
         verbose = kwargs.get('verbose', False)
         
         self.checkMetadata(routeRoads=routeRoads, 
@@ -134,11 +142,11 @@ class FlowtableMultiple(GrassCommand):
             demRast = self.grassMetadata['stream_burned_dem_rast']
         self.outfp.write("Using raster named '%s' to calculate flow direction map\n" % (demRast,) )
         
+        session = self.grassSession
+        
         # Make sure region is properly set
         demRast = self.grassMetadata['dem_rast']
-        result = self.grassLib.script.run_command('g.region', rast=demRast)
-        if result != 0:
-            raise RunException("g.region failed to set region to DEM, returning {0}".format(result))
+        session.run('g.region', rast=demRast)
         
         # Get paths for CF binary and template
         cfPath = os.path.join(self.context.projectDir, self.metadata['cf_bin'])
@@ -147,10 +155,11 @@ class FlowtableMultiple(GrassCommand):
             self.outfp.write(self.templatePath)
             self.outfp.write('\n')
         
-        # Make output file paths and file name templates
+        # Make output file name templates; only file names are formatted, as
+        # paths may contain braces
         flowTableNameBase = "world_{mask}"
         flowOutpath = os.path.join(self.paths.RHESSYS_FLOW, flowTableNameBase)
-        cfOutpath = os.path.join(self.paths.RHESSYS_FLOW, "cf_{mask}.out")
+        cfOutName = "cf_{mask}.out"
         
         roads = None
         if routeRoads:
@@ -170,60 +179,84 @@ class FlowtableMultiple(GrassCommand):
         else:
             surfaceFlowtableTemplate = subsurfaceFlowtableTemplate = "world_{mask}.flow"
         
+        def cfCommand(out):
+            return "%s out=%s template=%s dem=%s slope=%s stream=%s road=%s roof=%s impervious=%s cellsize=%s" % \
+                (cfPath, out, templatePath, demRast, self.grassMetadata['slope_rast'],
+                 self.grassMetadata['streams_rast'], roads, roofs, impervious, demResX)
+        cfCmd = cfCommand(flowOutpath)
+        
         # Make flowtable for each masked region
         if verbose:
             self.outfp.write('Running createflowpaths (this may take a few minutes)...')
             self.outfp.flush()
         
-        surfaceFlowtables = []
-        subsurfaceFlowtables = []
-        masks = self.metadata['subbasin_masks'].split(RHESSysMetadata.VALUE_DELIM)
-        for mask in masks:
-            result = self.grassLib.script.run_command('r.mask', flags='o', input=mask, maskcats='1',
-                                                      quiet=True)
-            if result != 0:
-                raise RunException("r.mask failed to set mask to sub-basin {0}, returning {1}".format(mask,
-                                                                                                      result))
+        # createflowpaths processes still running, so that they can be
+        # stopped as soon as one fails
+        running = set()
+        failures = []
+        lock = threading.Lock()
+        
+        def makeFlowtable(session, mask):
+            maskFlowOutpath = os.path.join(self.paths.RHESSYS_FLOW, flowTableNameBase.format(mask=mask))
+            session.run('r.mask', flags='o', input=mask, maskcats='1', quiet=True)
             # Run CF
-            p = self.grassLib.script.pipe_command(cfPath, out=flowOutpath.format(mask=mask), 
-                                                  template=templatePath, dem=demRast, 
-                                                  slope=self.grassMetadata['slope_rast'],
-                                                  stream=self.grassMetadata['streams_rast'],
-                                                  road=roads, roof=roofs, impervious=impervious,
-                                                  cellsize=demResX)
-            (pStdout, pStderr) = p.communicate()
+            startTime = time.time()
+            p = session.pipe(cfPath, out=maskFlowOutpath, 
+                             template=templatePath, dem=demRast, 
+                             slope=self.grassMetadata['slope_rast'],
+                             stream=self.grassMetadata['streams_rast'],
+                             road=roads, roof=roofs, impervious=impervious,
+                             cellsize=demResX)
+            with lock:
+                if failures:
+                    p.kill()
+                running.add(p)
+            (pStdout, pStderr, usage) = resources.communicate(p, startTime)
+            with lock:
+                running.discard(p)
             
             if verbose:
-                self.outfp.write("CF output:\n")
+                self.outfp.write("CF output for {0}:\n".format(mask))
                 self.outfp.write(pStdout)
                 if pStderr:
                     self.outfp.write(pStderr)
             
-            if p.returncode != 0:
-                raise RunException("createflowpaths failed, returning %s" % ( str(p.returncode),))
-            
             # Write cf output to project directory
-            cfOut = open(cfOutpath.format(mask=mask), 'w')
+            cfOut = open(os.path.join(self.paths.RHESSYS_FLOW, cfOutName.format(mask=mask)), 'w')
             cfOut.write(pStdout)
             if pStderr:
                 cfOut.write("\n\nStandard error output:\n\n")
                 cfOut.write(pStderr)
             cfOut.close()
             
+            if p.returncode != 0:
+                with lock:
+                    if not failures:
+                        failures.append(RunException("createflowpaths failed for {0}, returning {1}".format(mask,
+                                                                                                           p.returncode)))
+                        for other in running:
+                            other.kill()
+                raise failures[0]
+            
+            # Remove mask
+            session.run('r.mask', flags='r', quiet=True)
+            
             surfFlow = os.path.join(self.paths.RHESSYS_FLOW, surfaceFlowtableTemplate.format(mask=mask))
-            surfaceFlowtables.append(surfFlow)
             subsurfFlow = os.path.join(self.paths.RHESSYS_FLOW, subsurfaceFlowtableTemplate.format(mask=mask))
-            subsurfaceFlowtables.append(subsurfFlow)
+            usage.outputSize = resources.outputSize(set([surfFlow, subsurfFlow]))
+            record = ProcessRecord('createflowpaths', "Flow table for {0}".format(mask),
+                                   cfCommand(maskFlowOutpath), self.paths.relpath(subsurfFlow), usage)
+            return (surfFlow, subsurfFlow, record)
         
-        # Remove mask
-        result = self.grassLib.script.run_command('r.mask', flags='r', quiet=True)
-        if result != 0:
-            raise RunException("r.mask failed to remove mask") 
+        # Run createflowpaths for each sub-basin, jobs sub-basins at a time
+        masks = self.metadata['subbasin_masks'].split(RHESSysMetadata.VALUE_DELIM)
+        flowtables = mapWorkerMapsets(session, makeFlowtable, masks,
+                                      jobs=jobs, prefix='flowtable')
+        surfaceFlowtables = [f[0] for f in flowtables]
+        subsurfaceFlowtables = [f[1] for f in flowtables]
+        ProcessRecord.writeToMetadata(self.context, [f[2] for f in flowtables])
             
         # Write metadata
-        cfCmd = "%s out=%s template=%s dem=%s slope=%s stream=%s road=%s roof=%s impervious=%s cellsize=%s" % \
-        (cfPath, flowOutpath, templatePath, demRast, self.grassMetadata['slope_rast'],
-         self.grassMetadata['streams_rast'], roads, roofs, impervious, demResX)
         RHESSysMetadata.writeRHESSysEntry(self.context, 'flowtable_cmd', cfCmd)
         RHESSysMetadata.writeRHESSysEntry(self.context, 'surface_flowtables', 
                                           RHESSysMetadata.VALUE_DELIM.join([self.paths.relpath(s) for s in surfaceFlowtables]) )
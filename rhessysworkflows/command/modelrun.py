@@ -38,8 +38,11 @@ import sys
 from subprocess import *
 import datetime
 import shutil
+import time
+from multiprocessing.pool import ThreadPool
 
 from rhessysworkflows.command.base import GrassCommand
+from rhessysworkflows.command.session import mapWorkerMapsets
 from rhessysworkflows.command.exceptions import MetadataException
 from rhessysworkflows.command.exceptions import RunException
 
@@ -49,6 +52,8 @@ from rhessysworkflows.rhessys import datetimeToString
 from rhessysworkflows.rhessys import generateCommandString
 from rhessysworkflows.worldfileio import getClimateBaseStationFilenames
 from rhessysworkflows.climateio import getStartAndEndDateForClimateStation
+from rhessysworkflows import resources
+from rhessysworkflows.resources import ProcessRecord
 
 class LAIReadMultiple(GrassCommand):
     def __init__(self, projectDir, configFile=None, outfp=sys.stdout):
@@ -101,14 +106,21 @@ class LAIReadMultiple(GrassCommand):
                 raise MetadataException("Metadata in project directory %s does not contain a subsurface flowtables" % (self.context.projectDir,))
         
     def run(self, *args, **kwargs):
-        """ Run lairead for multiple worldfiles 
+        """ Run lairead for multiple worldfiles.  Runs in two stages: lairead is
+            run for each worldfile (using GRASS), then RHESSys is run to redefine
+            each worldfile (without using GRASS).  The RHESSys run for a worldfile
+            starts as soon as lairead has finished for that worldfile.
         
         Arguments:
         topmodel -- boolean   Whether to run RHESSys in TOPMODEL model. Default: False.
+        jobs -- int    Number of worldfiles for which to run lairead at once, each in a
+                       temporary GRASS mapset of its own, and number of RHESSys runs
+                       to run at once. Default: 1.
         verbose -- boolean    Produce verbose output. Default: False.
         """
         verbose = kwargs.get('verbose', False)
         topmodel = kwargs.get('topmodel', False)
+        jobs = kwargs.get('jobs', 1)
         
         self.checkMetadata(topmodel=topmodel)
         
@@ -116,15 +128,13 @@ class LAIReadMultiple(GrassCommand):
         self.paths = RHESSysPaths(self.context.projectDir, rhessysDir)
         rhessysBinPath = os.path.join(self.context.projectDir, self.metadata['rhessys_bin'])
         
+        session = self.grassSession
+        
         # Make sure region is properly set
         demRast = self.grassMetadata['dem_rast']
-        result = self.grassLib.script.run_command('g.region', rast=demRast)
-        if result != 0:
-            raise RunException("g.region failed to set region to DEM, returning {0}".format(result))
+        session.run('g.region', rast=demRast)
         
         # Run lairead for each worldfile
-        lairead_tecfiles = []
-        final_worldfiles = []
         worldfiles = self.metadata['worldfiles_init'].split(RHESSysMetadata.VALUE_DELIM)
         masks = self.metadata['subbasin_masks'].split(RHESSysMetadata.VALUE_DELIM)
         
@@ -133,22 +143,19 @@ class LAIReadMultiple(GrassCommand):
             surfaceFlowtables = self.metadata['surface_flowtables'].split(RHESSysMetadata.VALUE_DELIM)
             subsurfaceFlowtables = self.metadata['subsurface_flowtables'].split(RHESSysMetadata.VALUE_DELIM)
         
-        for (i, worldfile) in enumerate(worldfiles):
-            worldfilePath = os.path.join(self.context.projectDir, worldfile)
-            worldfileDir = os.path.dirname(worldfilePath)
+        def lairead(session, i):
+            """ Stage one: run lairead and write TEC file for worldfile i, then
+                queue RHESSys run for stage two
+            """
+            # Don't start lairead for a worldfile if a RHESSys run has already failed
+            for pending in redefines:
+                if pending.ready() and not pending.successful():
+                    pending.get()
             
-            surfaceFlowtable = subsurfaceFlowtable = None
-            if not topmodel:
-                surfaceFlowtable = surfaceFlowtables[i] # Assumption: worldfiles and flowtables lists are in the same order
-                subsurfaceFlowtable = subsurfaceFlowtables[i] # Assumption: worldfiles and flowtables lists are in the same order
-                
+            worldfile = worldfiles[i]
             # Mask to correct mask
             mask = masks[i] # Assumption: worldfiles and masks lists are in the same order
-            result = self.grassLib.script.run_command('r.mask', flags='o', input=mask, maskcats='1',
-                                                      quiet=True)
-            if result != 0:
-                raise RunException("r.mask failed to set mask to sub-basin {0}, returning {1}".format(mask,
-                                                                                                      result))
+            session.run('r.mask', flags='o', input=mask, maskcats='1', quiet=True)
             ## 1. Determine legal simulation start and date from climate data 
             # Read first climate station from worldfile
             header = "{0}.hdr".format(worldfile)
@@ -182,18 +189,22 @@ class LAIReadMultiple(GrassCommand):
             if verbose:
                 self.outfp.write("\nRunning lairead for subbasin {0}...".format(mask))
                 
-            p = self.grassLib.script.pipe_command(laireadPath, old=oldWorldPath, redef=redefWorldPath,
-                                                  allom=allomPath, lai=self.grassMetadata['lai_rast'],
-                                                  vegid=self.grassMetadata['stratum_rast'],
-                                                  zone=self.grassMetadata['zone_rast'],
-                                                  hill=self.grassMetadata['hillslope_rast'],
-                                                  patch=self.grassMetadata['patch_rast'],
-                                                  mask=mask)
-            (stdoutStr, stderrStr) = p.communicate() 
+            startTime = time.time()
+            p = session.pipe(laireadPath, old=oldWorldPath, redef=redefWorldPath,
+                             allom=allomPath, lai=self.grassMetadata['lai_rast'],
+                             vegid=self.grassMetadata['stratum_rast'],
+                             zone=self.grassMetadata['zone_rast'],
+                             hill=self.grassMetadata['hillslope_rast'],
+                             patch=self.grassMetadata['patch_rast'],
+                             mask=mask)
+            (stdoutStr, stderrStr, usage) = resources.communicate(p, startTime)
             result = p.returncode
             if result != 0:
                 self.outfp.write(stdoutStr)
-                raise RunException("\nlairead failed, returning %s" % (result,))
+                raise RunException("\nlairead failed for subbasin %s, returning %s" % (mask, result))
+            
+            # Remove mask
+            session.run('r.mask', flags='r', quiet=True)
             
             if verbose:
                 self.outfp.write('done\n')
@@ -212,34 +223,51 @@ class LAIReadMultiple(GrassCommand):
             f.write("%s output_current_state%s" %
                     (datetimeToString(tecOutput), os.linesep) )
             f.close()
-            lairead_tecfiles.append(tecPath)
+            
+            usage.outputSize = resources.outputSize([redefWorldPath])
+            record = ProcessRecord('lairead', "Redefine worldfile for subbasin {0}".format(mask),
+                                   "{0} old={1} redef={2} mask={3}".format(laireadPath, oldWorldPath, redefWorldPath, mask),
+                                   self.paths.relpath(redefWorldPath), usage)
+            
+            pending = rhessysPool.apply_async(redefine, (i, startDate, tecPath, tecOutput, headerPath))
+            redefines.append(pending)
+            return (tecPath, pending, record)
+        
+        def redefine(i, startDate, tecPath, tecOutput, headerPath):
+            """ Stage two: run RHESSys to redefine worldfile i
+            """
+            worldfile = worldfiles[i]
+            mask = masks[i]
+            oldWorldPath = os.path.join(self.context.projectDir, worldfile)
             
             ## 4. Run RHESSys for the first 4 legal days with redefine TEC
             rhessysStart = startDate
             rhessysDur = datetime.timedelta(days=3)
             rhessysEnd = startDate + rhessysDur
-            surfaceFlowtablePath = subSurfaceFlowtablePath = None
+            surfaceFlowtablePath = subsurfaceFlowtablePath = None
             if not topmodel:
-                surfaceFlowtablePath = os.path.join(self.context.projectDir, surfaceFlowtable)
-                subsurfaceFlowtablePath = os.path.join(self.context.projectDir, subsurfaceFlowtable)
+                # Assumption: worldfiles and flowtables lists are in the same order
+                surfaceFlowtablePath = os.path.join(self.context.projectDir, surfaceFlowtables[i])
+                subsurfaceFlowtablePath = os.path.join(self.context.projectDir, subsurfaceFlowtables[i])
             
             rhessysCmd = generateCommandString(rhessysBinPath, None,
                                                rhessysStart, rhessysEnd,
                                                tecPath, oldWorldPath,
-                                               surfaceFlowtablePath, subsurfaceFlowtablePath)
+                                               subsurfaceFlowtablePath, surfaceFlowtablePath)
             if verbose:
                 self.outfp.write('\nRunning RHESSys to redefine worldfile with vegetation carbon stores...\n')
                 self.outfp.write(rhessysCmd)
                 self.outfp.write('\n')
             
             cmdArgs = rhessysCmd.split()
+            startTime = time.time()
             process = Popen(cmdArgs, cwd=self.paths.RHESSYS_DIR, stdout=PIPE, stderr=PIPE)
-            (process_stdout, process_stderr) = process.communicate()
+            (process_stdout, process_stderr, usage) = resources.communicate(process, startTime)
             if verbose:
                 self.outfp.write(process_stdout)
                 self.outfp.write(process_stderr)
             if process.returncode != 0:
-                raise RunException("\n\nRHESSys failed, returning %s" % (process.returncode,) )
+                raise RunException("\n\nRHESSys failed for subbasin %s, returning %s" % (mask, process.returncode) )
             
             if verbose:    
                 sys.stdout.write('done\n')
@@ -259,17 +287,40 @@ class LAIReadMultiple(GrassCommand):
             if not os.path.exists(newWorldPath):
                 raise RunException("Failed to copy redefined worldfile %s to %s" % (outputWorldPath, newWorldPath) )
             
-            final_worldfiles.append(newWorldPath)
-            
             # Copy world file header from init worldfile to final world file
             newHeader = "%s.hdr" % (newWorldName,)
             newHeaderPath = os.path.join(self.paths.RHESSYS_WORLD, newHeader)
             shutil.copyfile(headerPath, newHeaderPath)
             
+            usage.outputSize = resources.outputSize([newWorldPath])
+            record = ProcessRecord(RHESSysMetadata.MODEL_NAME, "Redefine worldfile for subbasin {0}".format(mask),
+                                   rhessysCmd, self.paths.relpath(newWorldPath), usage)
+            return (newWorldPath, record)
+        
+        redefines = []
+        rhessysPool = ThreadPool(max(jobs, 1))
+        try:
+            laireads = mapWorkerMapsets(session, lairead, range(len(worldfiles)),
+                                        jobs=jobs, prefix='lairead')
+            lairead_tecfiles = [tecPath for (tecPath, pending, record) in laireads]
+            # Wait for RHESSys runs to finish
+            redefined = [pending.get() for (tecPath, pending, record) in laireads]
+            final_worldfiles = [worldfile for (worldfile, record) in redefined]
+        except:
+            # Don't start RHESSys runs still waiting to run
+            rhessysPool.terminate()
+            raise
+        else:
+            rhessysPool.close()
+        finally:
+            rhessysPool.join()
+            
         if verbose:    
             sys.stdout.write('\n\nSuccessfully used lairead to initialize vegetation carbon stores.\n')
         
         # Write metadata    
+        ProcessRecord.writeToMetadata(self.context, [record for (tecPath, pending, record) in laireads] + \
+                                                    [record for (worldfile, record) in redefined])
         RHESSysMetadata.writeRHESSysEntry(self.context, 'worldfiles',
                                           RHESSysMetadata.VALUE_DELIM.join([self.paths.relpath(w) for w in final_worldfiles]))
         RHESSysMetadata.writeRHESSysEntry(self.context, 'lairead_tecfiles', 
@@ -0,0 +1,321 @@
+"""@package rhessysworkflows.command.session
+    
+@brief Persistent session for running GRASS modules from RHESSysWorkflows commands
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT 
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+A session runs GRASS modules in one GRASS environment, prepared once when the
+session is created, rather than having each caller build its own.  r.mapcalc
+expressions are queued and run in batches, one r.mapcalc invocation per batch
+(r.mapcalc evaluates each line of its standard input as a separate
+expression), so that the start up cost of r.mapcalc is paid once per batch
+rather than once per expression.  A batch is run before any other module
+is run (e.g. r.mask, which changes how r.mapcalc computes its results), and
+before an expression that reads or replaces a map computed by a queued
+expression, so batching never changes the order in which results are
+computed.
+
+Usage:
+@code
+session = GrassSession(grassLib)
+with session:
+    for subbasin in subbasins:
+        session.mapcalc("subbasin_{0}=subbasins == {0}".format(subbasin))
+session.run('r.mask', flags='o', input='subbasin_1', maskcats='1')
+@endcode
+
+Because the region and mask are properties of a mapset, modules that depend
+on them cannot be run concurrently in one mapset.  mapWorkerMapsets runs such
+work concurrently, giving each worker its own TemporaryMapset in which maps in
+the mapset of the session (and in PERMANENT) can be read, but in which the
+region and mask are private to the worker.
+"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+from subprocess import PIPE
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from rhessysworkflows.command.exceptions import RunException
+
+# Result and right hand side of an r.mapcalc expression
+ASSIGNMENT_RE = re.compile(r"""\s*["']?([^=\s"']+)["']?\s*=(?!=)(.*)""", re.DOTALL)
+# Names of maps (or functions) referred to by an r.mapcalc expression
+MAP_NAME_RE = re.compile(r"[A-Za-z_][\w.]*(?:@[\w.]+)?")
+
+
+class GrassSession(object):
+
+    def __init__(self, grassLib, env=None):
+        """ @param grassLib ecohydrolib.grasslib.GRASSLib
+            @param env dict representing the environment in which GRASS modules
+            are to be run; if None, a copy of the current environment (which
+            GRASSLib has set up for GRASS) is used.
+        """
+        self.grassLib = grassLib
+        self.script = grassLib.script
+        if env is None:
+            env = dict(os.environ)
+        self.env = env
+        self._pending = []
+        self._pendingMaps = set()
+        self.numInvocations = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+
+    def gisenv(self):
+        """ Read the GRASS variables (e.g. GISDBASE, LOCATION_NAME, MAPSET) of
+            the session from its GISRC file
+
+            @return dict mapping variable names to values
+        """
+        gisenv = {}
+        with open(self.env['GISRC'], 'r') as f:
+            for line in f:
+                (name, sep, value) = line.partition(':')
+                if sep:
+                    gisenv[name.strip()] = value.strip()
+        return gisenv
+
+    def mapcalc(self, expression):
+        """ Queue an r.mapcalc expression, to be run with the next batch
+
+            @param expression String of the form "result = expression"
+
+            @raise ValueError if expression does not assign a result
+            @raise RunException if a batch had to be run first, and failed
+        """
+        m = ASSIGNMENT_RE.match(expression)
+        if m is None:
+            raise ValueError("r.mapcalc expression {0} does not assign a result".format(expression))
+        (result, rhs) = m.groups()
+        mapsRead = set(MAP_NAME_RE.findall(rhs))
+        if result in self._pendingMaps or mapsRead & self._pendingMaps:
+            self.flush()
+        self._pending.append(expression.strip())
+        self._pendingMaps.add(result)
+
+    def flush(self):
+        """ Run queued r.mapcalc expressions in a single r.mapcalc invocation
+
+            @raise RunException if r.mapcalc fails
+        """
+        if not self._pending:
+            return
+        expressions = self._pending
+        self.discard()
+        stdin = "\n".join(expressions) + "\n"
+        result = self.script.write_command('r.mapcalc', stdin=stdin,
+                                           stdout=PIPE, stderr=PIPE,
+                                           env=self.env)
+        self.numInvocations += 1
+        if result != 0:
+            raise RunException("r.mapcalc failed, returning {0}, input: {1}".format(result, stdin))
+
+    def discard(self):
+        """ Discard queued r.mapcalc expressions without running them """
+        self._pending = []
+        self._pendingMaps = set()
+
+    def run(self, module, **kwargs):
+        """ Run a GRASS module, after running queued r.mapcalc expressions
+
+            @param module String representing the name of the module
+            @param kwargs Flags and options to pass to the module
+
+            @raise RunException if the module fails
+        """
+        self.flush()
+        result = self.script.run_command(module, env=self.env, **kwargs)
+        self.numInvocations += 1
+        if result != 0:
+            raise RunException("{0} failed, returning {1}".format(module, result))
+
+    def read(self, module, **kwargs):
+        """ Run a GRASS module, after running queued r.mapcalc expressions, and
+            return its standard output
+
+            @param module String representing the name of the module
+            @param kwargs Flags and options to pass to the module
+
+            @return String representing the standard output of the module
+        """
+        self.flush()
+        self.numInvocations += 1
+        return self.script.read_command(module, env=self.env, **kwargs)
+
+    def pipe(self, module, **kwargs):
+        """ Start a GRASS module (or a program that uses GRASS, e.g.
+            createflowpaths), after running queued r.mapcalc expressions, with its
+            standard output connected to a pipe
+
+            @param module String representing the name or path of the module
+            @param kwargs Flags and options to pass to the module
+
+            @return subprocess.Popen
+        """
+        self.flush()
+        self.numInvocations += 1
+        return self.script.pipe_command(module, env=self.env, **kwargs)
+
+
+class TemporaryMapset(object):
+
+    def __init__(self, session, name):
+        """ Create a mapset in the location of a session.  The mapset starts with
+            the region of the mapset of the session, and its search path includes
+            the mapset of the session and PERMANENT, so that their maps can be
+            read without qualifying map names with a mapset.  Use the session
+            attribute to run GRASS modules in the new mapset.
+
+            @param session GrassSession
+            @param name String representing the name of the mapset to create
+
+            @raise OSError if the mapset already exists
+        """
+        gisenv = session.gisenv()
+        location = os.path.join(gisenv['GISDBASE'], gisenv['LOCATION_NAME'])
+        parentMapset = gisenv['MAPSET']
+        self.name = name
+        self.path = os.path.join(location, name)
+        os.mkdir(self.path)
+        try:
+            wind = os.path.join(location, parentMapset, 'WIND')
+            if not os.path.isfile(wind):
+                wind = os.path.join(location, 'PERMANENT', 'DEFAULT_WIND')
+            shutil.copyfile(wind, os.path.join(self.path, 'WIND'))
+            searchPath = [name]
+            for mapset in [parentMapset, 'PERMANENT']:
+                if not mapset in searchPath:
+                    searchPath.append(mapset)
+            with open(os.path.join(self.path, 'SEARCH_PATH'), 'w') as f:
+                f.write("\n".join(searchPath) + "\n")
+
+            (fd, self.gisrc) = tempfile.mkstemp(prefix="gisrc_{0}_".format(name))
+            with os.fdopen(fd, 'w') as f:
+                for (variable, value) in gisenv.items():
+                    if variable == 'MAPSET':
+                        value = name
+                    f.write("{0}: {1}\n".format(variable, value))
+        except:
+            shutil.rmtree(self.path)
+            raise
+        env = dict(session.env)
+        env['GISRC'] = self.gisrc
+        self.session = GrassSession(session.grassLib, env)
+
+    def remove(self):
+        """ Remove the mapset and all maps in it """
+        self.session.discard()
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        if os.path.exists(self.gisrc):
+            os.unlink(self.gisrc)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.remove()
+
+
+def mapWorkerMapsets(session, function, items, jobs=1, prefix='worker'):
+    """ Call function(workerSession, item) for each item, running up to jobs
+        calls at once, each in a TemporaryMapset of its own.  Mapsets are
+        created before the first call and removed after the last, each
+        being reused for the calls made by one worker.  If jobs is 1, calls are
+        made one after another using session itself.
+
+        If a call raises an exception, calls that have not yet started are
+        not made, and the exception is raised once calls already running
+        have finished.
+
+        @param session GrassSession in whose location mapsets are to be created
+        @param function Callable taking a GrassSession and an item
+        @param items Sequence of items
+        @param jobs Integer representing the number of calls to run at once
+        @param prefix String used to name mapsets
+
+        @return List of the results of the calls, in the order of items
+    """
+    items = list(items)
+    if jobs <= 1 or len(items) <= 1:
+        return [function(session, item) for item in items]
+
+    jobs = min(jobs, len(items))
+    parentMapset = session.gisenv()['MAPSET']
+    mapsets = []
+    available = queue.Queue()
+    cancelled = threading.Event()
+
+    def call(item):
+        if cancelled.is_set():
+            return None
+        workerSession = available.get()
+        try:
+            return function(workerSession, item)
+        except:
+            cancelled.set()
+            raise
+        finally:
+            available.put(workerSession)
+
+    try:
+        for i in range(jobs):
+            name = "{0}_{1}{2}_{3}".format(parentMapset, prefix, i, os.getpid())
+            mapset = TemporaryMapset(session, name)
+            mapsets.append(mapset)
+            available.put(mapset.session)
+        pool = ThreadPool(jobs)
+        try:
+            results = pool.map(call, items, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        for mapset in mapsets:
+            mapset.remove()
+    return results
@@ -35,14 +35,18 @@ OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 import os
 import sys
+import time
 from subprocess import *
 
 from rhessysworkflows.command.base import GrassCommand
+from rhessysworkflows.command.session import mapWorkerMapsets
 from rhessysworkflows.command.exceptions import MetadataException
 from rhessysworkflows.command.exceptions import RunException
 
 from rhessysworkflows.rhessys import RHESSysPaths
 from rhessysworkflows.metadata import RHESSysMetadata
+from rhessysworkflows import resources
+from rhessysworkflows.resources import ProcessRecord
 
 class WorldfileMultiple(GrassCommand):
     
@@ -89,8 +93,11 @@ class WorldfileMultiple(GrassCommand):
         """ Multiple worldfiles, one worldfile for each subbasin delineated. 
         
         Arguments:
+        jobs -- int    Number of sub-basins for which to run grass2world at once,
+                       each in a temporary GRASS mapset of its own. Default: 1.
         verbose -- boolean    Produce verbose output. Default: False.
         """
+        jobs = kwargs.get('jobs', 1)
         verbose = kwargs.get('verbose', False)
         
         self.checkMetadata()
@@ -103,94 +110,88 @@ class WorldfileMultiple(GrassCommand):
         
         g2wPath = os.path.join(self.context.projectDir, self.metadata['g2w_bin'])
         
-        # Make sure g2w can find rat
-        g2wEnv = dict(os.environ)
-        g2wEnv['PATH'] = self.paths.RHESSYS_BIN + os.pathsep + g2wEnv['PATH']
+        session = self.grassSession
         
         # Make sure region is properly set
         demRast = self.grassMetadata['dem_rast']
-        result = self.grassLib.script.run_command('g.region', rast=demRast)
-        if result != 0:
-            raise RunException("g.region failed to set region to DEM, returning {0}".format(result))
+        session.run('g.region', rast=demRast)
         
         # Mask subbasin to basin
         basin_rast = self.grassMetadata['basin_rast']
-        result = self.grassLib.script.run_command('r.mask', flags='o', input=basin_rast, maskcats='1',
-                                                  quiet=True)
-        if result != 0:
-            sys.exit("r.mask failed to set mask to basin, returning %s" % (result,))
+        session.run('r.mask', flags='o', input=basin_rast, maskcats='1', quiet=True)
         subbasin_raster = self.grassMetadata['subbasins_rast']
         subbasin_mask = "{0}_mask".format(subbasin_raster)
         mapcalc_input = "{subbasin_mask}={subbasins}".format(subbasin_mask=subbasin_mask,
                                                              subbasins=subbasin_raster)
-        result = self.grassLib.script.write_command('r.mapcalc',
-                                                    stdin=mapcalc_input,
-                                                    stdout=PIPE,
-                                                    stderr=PIPE)
-        if result != 0:
-            raise RunException("r.mapcalc failed to generate masked subbasin map {0}, input: {1}".format(subbasin_raster,
-                                                                                                         mapcalc_input))
+        session.mapcalc(mapcalc_input)
         
         # Get list of subbasins
-        result = self.grassLib.script.read_command('r.stats', flags='n', input=subbasin_raster, quiet=True)
+        result = session.read('r.stats', flags='n', input=subbasin_raster, quiet=True)
         if result is None or result == '':
             raise RunException("Error reading subbasin map {0}".format(subbasin_raster))
-             
         subbasins = result.split()
+        
+        # Remove mask
+        session.run('r.mask', flags='r', quiet=True)
+        
+        # Make a mask layer for each sub-basin, using one r.mapcalc invocation
+        # for all sub-basins
         subbasin_masks = []
-        worldfiles = []
-        for subbasin in subbasins:
-            # Remove mask
-            result = self.grassLib.script.run_command('r.mask', flags='r', quiet=True)
-            if result != 0:
-                raise RunException("r.mask failed to remove mask")
-            
-            # Make a mask layer for the sub-basin
-            mask_name = "subbasin_{0}".format(subbasin)
-            subbasin_masks.append(mask_name)
-            result = self.grassLib.script.write_command('r.mapcalc',
-                                                        stdin="{mask_name}={subbasins} == {subbasin_number}".format(mask_name=mask_name,
-                                                                                                                    subbasins=subbasin_mask,
-                                                                                                                    subbasin_number=subbasin),
-                                                        stdout=PIPE,
-                                                        stderr=PIPE)
-            if result != 0:
-                raise RunException("r.mapcalc failed to generate mask for subbasin {0}".format(subbasin))
+        with session:
+            for subbasin in subbasins:
+                mask_name = "subbasin_{0}".format(subbasin)
+                subbasin_masks.append(mask_name)
+                session.mapcalc("{mask_name}={subbasins} == {subbasin_number}".format(mask_name=mask_name,
+                                                                                    subbasins=subbasin_mask,
+                                                                                    subbasin_number=subbasin))
         
+        def makeWorldfile(session, subbasinMask):
+            (subbasin, mask_name) = subbasinMask
             # Mask to the sub-basin
-            result = self.grassLib.script.run_command('r.mask', flags='o', input=mask_name, maskcats='1',
-                                                      quiet=True)
-            if result != 0:
-                raise RunException("r.mask failed to set mask to sub-basin {0}, returning {1}".format(mask_name,
-                                                                                                      result))
+            session.run('r.mask', flags='o', input=mask_name, maskcats='1', quiet=True)
          
             worldfileName = "world_subbasin_{0}_init".format(subbasin)
             worldfilePath = os.path.join(self.paths.RHESSYS_WORLD, worldfileName)
-            worldfiles.append(worldfilePath)
             g2wCommand = "{g2w} -t {template} -w {worldfile}".format(g2w=g2wPath, 
                                                                      template=templateFilepath, 
                                                                      worldfile=worldfilePath)
             
+            # Make sure g2w can find rat, and uses the mapset of the session
+            g2wEnv = dict(session.env)
+            g2wEnv['PATH'] = self.paths.RHESSYS_BIN + os.pathsep + g2wEnv['PATH']
+            
             if verbose:
                 self.outfp.write("{0}\n".format(g2wCommand))
                 self.outfp.write("\nRunning grass2world from {0}...".format(self.paths.RHESSYS_BIN))
                 self.outfp.flush()
 
             cmdArgs = g2wCommand.split()
+            startTime = time.time()
             process = Popen(cmdArgs, cwd=self.paths.RHESSYS_BIN, env=g2wEnv, 
                             stdout=PIPE, stderr=PIPE)
-            (process_stdout, process_stderr) = process.communicate()
+            (process_stdout, process_stderr, usage) = resources.communicate(process, startTime)
             if process.returncode != 0:
-                raise RunException("grass2world failed, returning {0}".format(process.returncode))
+                raise RunException("grass2world failed for sub-basin {0}, returning {1}".format(subbasin,
+                                                                                               process.returncode))
      
             if verbose:
                 self.outfp.write(process_stdout)
                 self.outfp.write(process_stderr)
          
-        # Remove mask
-        result = self.grassLib.script.run_command('r.mask', flags='r', quiet=True)
-        if result != 0:
-            raise RunException("r.mask failed to remove mask") 
+            # Remove mask
+            session.run('r.mask', flags='r', quiet=True)
+            
+            usage.outputSize = resources.outputSize([worldfilePath])
+            record = ProcessRecord('grass2world', "Worldfile for sub-basin {0}".format(subbasin),
+                                   g2wCommand, self.paths.relpath(worldfilePath), usage)
+            return (worldfilePath, record)
+        
+        # Run grass2world for each sub-basin, jobs sub-basins at a time
+        results = mapWorkerMapsets(session, makeWorldfile,
+                                   zip(subbasins, subbasin_masks),
+                                   jobs=jobs, prefix='worldfile')
+        worldfiles = [r[0] for r in results]
+        ProcessRecord.writeToMetadata(self.context, [r[1] for r in results])
          
         # Write metadata
         RHESSysMetadata.writeRHESSysEntry(self.context, 'worldfiles_init', 
@@ -0,0 +1,383 @@
+"""@package rhessysworkflows.compression
+
+@brief Transparent reading and writing of compressed RHESSys output files
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+Compressed files are recognized by their leading (magic) bytes rather than by
+their names.  gzip and bzip2 are supported using the Python standard library.
+xz and zstd are supported using the lzma (or backports.lzma) and zstandard
+modules if they are installed, and otherwise using the xz and zstd command line
+tools.  Decompression is done in a background thread (or, when a command line
+tool is used, in a separate process) so that it overlaps with parsing of the
+decompressed text.
+"""
+import os, errno
+import shutil
+import contextlib
+import threading
+import subprocess
+import gzip
+import bz2
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+GZIP = 'gzip'
+BZIP2 = 'bz2'
+XZ = 'xz'
+ZSTD = 'zstd'
+
+METHODS = [GZIP, BZIP2, XZ, ZSTD]
+
+MAGIC = [(GZIP, b'\x1f\x8b'),
+         (BZIP2, b'BZh'),
+         (XZ, b'\xfd7zXZ\x00'),
+         (ZSTD, b'\x28\xb5\x2f\xfd')]
+
+EXTENSION = {GZIP: '.gz',
+             BZIP2: '.bz2',
+             XZ: '.xz',
+             ZSTD: '.zst'}
+
+_COMMAND = {XZ: 'xz',
+            ZSTD: 'zstd'}
+
+# Number of bytes of decompressed output to read at a time
+CHUNK_SIZE = 1024 * 1024
+# Number of chunks the background thread may decompress ahead of the reader
+READ_AHEAD = 4
+
+
+def detectCompression(path):
+    """ Determine the compression method of a file from its leading bytes
+
+        @param path String representing the path of the file
+
+        @return String representing the compression method (one of METHODS), or
+        None if the file is not compressed
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    for (method, prefix) in MAGIC:
+        if magic.startswith(prefix):
+            return method
+    return None
+
+
+def _runCommand(args, stdin=None, stdout=subprocess.PIPE):
+    """ Start a command line compression tool
+
+        @raise IOError(errno.ENOENT) if the tool is not installed
+    """
+    try:
+        return subprocess.Popen(args, stdin=stdin, stdout=stdout)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            raise IOError(errno.ENOENT,
+                          "Python module or %s command needed to handle %s files" % \
+                          (args[0], args[0]) )
+        raise
+
+
+def _openDecompressed(path, method):
+    """ Open a binary stream of the decompressed content of a file
+
+        @return Tuple (file object, subprocess.Popen or None)
+    """
+    if method == GZIP:
+        return (gzip.open(path, 'rb'), None)
+    if method == BZIP2:
+        return (bz2.BZ2File(path, 'rb'), None)
+    if method == XZ and lzma is not None:
+        return (lzma.LZMAFile(path, 'rb'), None)
+    if method == ZSTD and zstandard is not None:
+        return (zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')), None)
+    process = _runCommand([_COMMAND[method], '-dc', path])
+    return (process.stdout, process)
+
+
+def _decompress(source, process, method, chunks, stop):
+    """ Decompress source in chunks, handing them to a reader through the bounded
+        queue chunks, until the end of source is reached or stop is set.  The end
+        of source is signaled by None, an error by the exception raised.  Runs in
+        a background thread.
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if not isinstance(chunk, str):
+                chunk = chunk.decode('latin-1')
+            if not put(chunk):
+                return
+        if process is not None and process.wait() != 0:
+            raise IOError("%s failed, returning %s" % (_COMMAND[method], process.returncode) )
+    except Exception as e:
+        put(e)
+        return
+    put(None)
+
+
+class DecompressingReader(object):
+    """ Read-only text file object over the decompressed content of a compressed
+        file.  Supports the subset of the file protocol used by the readers in
+        rhessysworkflows.rhessys, pandas.read_csv, and numpy.genfromtxt, i.e.
+        read, readline, and iteration over lines.
+    """
+    def __init__(self, path, method=None):
+        """ @param path String representing the path of the compressed file
+            @param method String representing the compression method; if None
+            the method will be detected from the content of the file
+
+            @raise ValueError if the file is not compressed
+        """
+        self.name = path
+        self.compression = method or detectCompression(path)
+        if self.compression is None:
+            raise ValueError("File %s is not compressed" % (path,) )
+        self.closed = False
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._stop = threading.Event()
+        self._chunks = queue.Queue(READ_AHEAD)
+        (self._source, self._process) = _openDecompressed(path, self.compression)
+        # The thread must not refer to self, so that a reader abandoned before
+        # reaching the end of the file can be garbage collected (which stops
+        # the thread)
+        self._thread = threading.Thread(target=_decompress,
+                                        args=(self._source, self._process, self.compression,
+                                              self._chunks, self._stop))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __del__(self):
+        # __init__ may have failed before the thread was started
+        if hasattr(self, '_thread'):
+            self.close()
+
+    def _fill(self):
+        """ Append the next decompressed chunk to the buffer
+
+            @return False if there is no more content
+        """
+        if self._eof:
+            return False
+        chunk = self._chunks.get()
+        if chunk is None or isinstance(chunk, Exception):
+            self._eof = True
+            if chunk is not None:
+                raise chunk
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while self._fill():
+                pass
+            size = len(self._buffer) - self._pos
+        while len(self._buffer) - self._pos < size and self._fill():
+            pass
+        data = self._buffer[self._pos:self._pos+size]
+        self._pos += len(data)
+        return data
+
+    def readline(self, size=-1):
+        end = self._buffer.find('\n', self._pos)
+        while end < 0:
+            searched = len(self._buffer) - self._pos
+            if not self._fill():
+                end = len(self._buffer) - 1
+                break
+            end = self._buffer.find('\n', searched)
+        line = self._buffer[self._pos:end+1]
+        self._pos = end + 1
+        return line
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    next = __next__
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._stop.set()
+        self._thread.join()
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+        self._source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def openOutputFile(path):
+    """ Open a RHESSys output file for reading as text, decompressing it if it
+        is compressed
+
+        @param path String representing the path of the file
+
+        @return File object
+    """
+    if detectCompression(path):
+        return DecompressingReader(path)
+    return open(path, 'r')
+
+
+def decompressed(f):
+    """ Get a text file object over the decompressed content of an open file
+
+        @param f File object open for reading
+
+        @return f if f is not associated with a compressed file on disk,
+        otherwise a DecompressingReader for the file
+    """
+    if getattr(f, 'compression', None) is not None:
+        return f
+    name = getattr(f, 'name', None)
+    if name is None or isinstance(name, int) or not os.path.isfile(name):
+        return f
+    method = detectCompression(name)
+    if method is None:
+        return f
+    return DecompressingReader(name, method)
+
+
+@contextlib.contextmanager
+def decompressing(f):
+    """ Context manager giving a text file object over the decompressed content
+        of an open file (see decompressed).  A DecompressingReader created for f
+        is closed on exit; f itself is left open.
+
+        @param f File object open for reading
+    """
+    reader = decompressed(f)
+    try:
+        yield reader
+    finally:
+        if reader is not f:
+            reader.close()
+
+
+def isCompressed(f):
+    """ @return True if f is a DecompressingReader """
+    return getattr(f, 'compression', None) is not None
+
+
+def compressFile(path, method=GZIP, remove=True):
+    """ Compress a file, writing the compressed file alongside it with the
+        extension for the compression method appended to its name
+
+        @param path String representing the path of the file to compress
+        @param method String representing the compression method (one of METHODS)
+        @param remove Boolean  If True, remove the uncompressed file once compressed
+
+        @return String representing the path of the compressed file
+
+        @raise ValueError if method is not a supported compression method
+    """
+    if not method in EXTENSION:
+        raise ValueError("Unknown compression method %s" % (method,) )
+    outPath = path + EXTENSION[method]
+    tmpPath = "%s.tmp%d" % (outPath, os.getpid())
+    with open(path, 'rb') as src:
+        if method == GZIP:
+            with gzip.open(tmpPath, 'wb') as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        elif method == BZIP2:
+            dst = bz2.BZ2File(tmpPath, 'wb')
+            try:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            finally:
+                dst.close()
+        elif method == XZ and lzma is not None:
+            dst = lzma.LZMAFile(tmpPath, 'wb')
+            try:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            finally:
+                dst.close()
+        elif method == ZSTD and zstandard is not None:
+            with open(tmpPath, 'wb') as dst:
+                zstandard.ZstdCompressor().copy_stream(src, dst)
+        else:
+            with open(tmpPath, 'wb') as dst:
+                process = _runCommand([_COMMAND[method], '-c'], stdin=src, stdout=dst)
+                if process.wait() != 0:
+                    os.unlink(tmpPath)
+                    raise IOError("%s failed, returning %s" % \
+                                  (_COMMAND[method], process.returncode) )
+    os.rename(tmpPath, outPath)
+    if remove:
+        os.unlink(path)
+    return outPath
@@ -0,0 +1,199 @@
+"""@package rhessysworkflows.expression
+
+@brief Safe evaluation of arithmetic expressions of RHESSys output variables
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+Expressions such as "trans_sat + trans_unsat" are parsed once into an abstract
+syntax tree, which is checked against a small set of allowed operations and
+then compiled into a tree of functions that apply NumPy operations to whole
+arrays.  Names that are neither variables nor allowed functions, attribute
+access other than dotted variable names (e.g. "cs.leafc"), subscripts,
+comprehensions, and the like are rejected, so expressions cannot run arbitrary
+code.
+
+Usage:
+@code
+expr = VariableExpression('trans_sat + trans_unsat')
+expr.validate(headers)
+values = expr.evaluate(data)
+@endcode
+"""
+import ast
+import numbers
+import operator
+
+import numpy as np
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+_BINARY_OPS = {ast.Add: np.add,
+               ast.Sub: np.subtract,
+               ast.Mult: np.multiply,
+               ast.Div: np.true_divide,
+               ast.FloorDiv: np.floor_divide,
+               ast.Mod: np.mod,
+               ast.Pow: np.power}
+
+_UNARY_OPS = {ast.UAdd: operator.pos,
+              ast.USub: np.negative}
+
+_FUNCTIONS = {'abs': np.abs,
+              'sqrt': np.sqrt,
+              'exp': np.exp,
+              'log': np.log,
+              'log10': np.log10,
+              'minimum': np.minimum,
+              'maximum': np.maximum}
+
+# Numeric literals are ast.Num before Python 3.8, ast.Constant after
+_NUMBER_NODES = tuple( [getattr(ast, n) for n in ('Num', 'Constant') if hasattr(ast, n)] )
+
+
+class VariableExpression(object):
+    
+    FUNCTIONS = sorted(_FUNCTIONS.keys())
+    
+    def __init__(self, expression):
+        """ Parse and compile an expression
+        
+            @param expression String representing an arithmetic expression of 
+            variable names, numbers, the operators + - * / // % **, parentheses, 
+            and the functions in VariableExpression.FUNCTIONS
+            
+            @raise ExpressionError if the expression is not valid
+        """
+        self.expression = expression
+        self.variables = []
+        try:
+            tree = ast.parse(expression.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ExpressionError("Invalid expression '%s': %s" % (expression, e) )
+        self._evaluator = self._compile(tree.body)
+        if not len(self.variables):
+            raise ExpressionError("Expression '%s' does not contain any variables" % (expression,) )
+    
+    def __str__(self):
+        return self.expression
+    
+    def _variableName(self, node):
+        """ @return String representing name of variable referred to by a Name 
+            node or chain of Attribute nodes, or None if node is neither
+        """
+        if isinstance(node, ast.Name):
+            return node.id
+        if isinstance(node, ast.Attribute):
+            base = self._variableName(node.value)
+            if base is not None:
+                return "%s.%s" % (base, node.attr)
+        return None
+    
+    def _compile(self, node):
+        """ Compile a node of the syntax tree into a function taking a mapping
+            of variable names to values
+        """
+        name = self._variableName(node)
+        if name is not None:
+            if not name in self.variables:
+                self.variables.append(name)
+            return lambda data: data[name]
+        
+        if isinstance(node, _NUMBER_NODES):
+            value = getattr(node, 'n', getattr(node, 'value', None))
+            if isinstance(value, bool) or not isinstance(value, numbers.Real):
+                raise ExpressionError("Unsupported constant %r in expression '%s'" % \
+                                      (value, self.expression) )
+            return lambda data: value
+        
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+            op = _BINARY_OPS[type(node.op)]
+            left = self._compile(node.left)
+            right = self._compile(node.right)
+            return lambda data: op(left(data), right(data))
+        
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+            op = _UNARY_OPS[type(node.op)]
+            operand = self._compile(node.operand)
+            return lambda data: op(operand(data))
+        
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and \
+           node.func.id in _FUNCTIONS and not node.keywords and \
+           not getattr(node, 'starargs', None) and not getattr(node, 'kwargs', None):
+            func = _FUNCTIONS[node.func.id]
+            args = [self._compile(arg) for arg in node.args]
+            return lambda data: func(*[arg(data) for arg in args])
+        
+        raise ExpressionError("Unsupported syntax '%s' in expression '%s'" % \
+                              (type(node).__name__, self.expression) )
+    
+    def validate(self, headers):
+        """ Check that all variables in the expression are present
+        
+            @param headers Collection of names of variables available, e.g.
+            column headers of a RHESSys output file
+            
+            @raise ExpressionError if any variable is not in headers
+        """
+        missing = [var for var in self.variables if not var in headers]
+        if len(missing):
+            raise ExpressionError("Variable(s) %s in expression '%s' not found" % \
+                                  (', '.join(missing), self.expression) )
+    
+    def evaluate(self, data, rows=None):
+        """ Evaluate the expression
+        
+            @param data Mapping of variable names to numpy.ndarray (e.g. dict,
+            numpy structured array, or the cube returned by 
+            RHESSysOutput.readPatchDailyCube).  All arrays must have the same shape.
+            @param rows If not None, a slice or index selecting a chunk of the 
+            first axis of each array (e.g. a range of days of a cube) to evaluate
+            
+            @return numpy.ndarray of floating point values
+            
+            @raise KeyError if a variable is not in data
+        """
+        if rows is not None:
+            data = _RowView(data, rows)
+        return np.asarray(self._evaluator(data), dtype=float)
+
+
+class _RowView(object):
+    """ Mapping that selects rows of arrays of another mapping on access """
+    def __init__(self, data, rows):
+        self.data = data
+        self.rows = rows
+    
+    def __getitem__(self, name):
+        return self.data[name][self.rows]
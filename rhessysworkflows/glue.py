@@ -0,0 +1,371 @@
+"""@package rhessysworkflows.glue
+
+@brief GLUE-style filtering of behavioral ensemble runs
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+Each run of an ensemble is scored against observed data as soon as it
+completes (see BehavioralFilter).  Runs whose scores meet all behavioral
+criteria (e.g. "nse>=0.5") have their simulated timeseries, aligned to the
+observed timeseries, added to a BehavioralStore; the output of other runs is
+deleted or compressed so that disk use stays bounded however many runs the
+ensemble has.
+
+A BehavioralStore is a directory containing:
+- dates.npy: dates of the observed timeseries
+- observed.npy: observed timeseries
+- simulated.f32: simulated timeseries of behavioral runs, as rows of float32
+  values, one row per run, appended as runs complete
+- scores.csv: scores of every run, behavioral or not, one row per run,
+  appended as runs complete
+"""
+import os
+import re
+import csv
+import glob
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from rhessysworkflows import metrics
+from rhessysworkflows.rhessys import RHESSysOutput
+from rhessysworkflows.compression import openOutputFile
+from rhessysworkflows.compression import detectCompression
+from rhessysworkflows.compression import compressFile
+from rhessysworkflows.compression import GZIP
+
+DELETE = 'delete'
+COMPRESS = 'compress'
+KEEP = 'keep'
+NON_BEHAVIORAL_ACTIONS = [DELETE, COMPRESS, KEEP]
+
+CRITERION_RE = re.compile(r"^\s*(\|?)(\w+)\1\s*(>=|<=|>|<)\s*(\S+)\s*$")
+_COMPARE = {'>=': np.greater_equal,
+            '<=': np.less_equal,
+            '>': np.greater,
+            '<': np.less}
+
+
+class Criterion(object):
+    """ Behavioral criterion, i.e. a threshold for a metric """
+    
+    def __init__(self, text):
+        """ @param text String of the form METRIC OP THRESHOLD, e.g. "nse>=0.5",
+            where METRIC is one of rhessysworkflows.metrics.METRICS and OP is
+            one of >=, <=, >, <.  The metric may be written between vertical bars
+            (e.g. "|bias|<=10") to compare its absolute value.
+            
+            @raise ValueError if text is not a valid criterion
+        """
+        m = CRITERION_RE.match(text)
+        if not m:
+            raise ValueError("Invalid behavioral criterion '%s'" % (text,) )
+        (bars, self.metric, self.op, threshold) = m.groups()
+        self.metric = self.metric.lower()
+        if not self.metric in metrics.METRICS:
+            raise ValueError("Unknown metric %s in behavioral criterion '%s'" % (self.metric, text) )
+        try:
+            self.threshold = float(threshold)
+        except ValueError:
+            raise ValueError("Invalid threshold %s in behavioral criterion '%s'" % (threshold, text) )
+        self.absolute = bool(bars)
+        self.text = text.strip()
+    
+    def isMet(self, scores):
+        """ @param scores dict mapping metrics to their values
+            @return True if the criterion is met (never True for a NaN score)
+        """
+        value = scores[self.metric]
+        if self.absolute:
+            value = abs(value)
+        return bool(_COMPARE[self.op](value, self.threshold))
+    
+    def __str__(self):
+        return self.text
+
+
+def weightedQuantiles(simulated, weights, quantiles):
+    """ Compute likelihood weighted quantiles of simulated values at each time
+        step, as in GLUE prediction bounds
+        
+        @param simulated 2-D numpy.ndarray of shape (runs, time steps)
+        @param weights 1-D numpy.ndarray of non-negative weights, one per run
+        @param quantiles List of quantiles to compute, each between 0 and 1
+        
+        @return 2-D numpy.ndarray of shape (len(quantiles), time steps)
+    """
+    simulated = np.asarray(simulated, dtype=float)
+    order = np.argsort(simulated, axis=0)
+    values = np.take_along_axis(simulated, order, axis=0)
+    cdf = np.cumsum(np.asarray(weights, dtype=float)[order], axis=0)
+    cdf /= cdf[-1]
+    result = np.empty( (len(quantiles), simulated.shape[1]) )
+    for (i, q) in enumerate(quantiles):
+        idx = np.argmax(cdf >= q - 1e-12, axis=0)
+        result[i] = values[idx, np.arange(simulated.shape[1])]
+    return result
+
+
+class BehavioralStore(object):
+    """ Columnar store of the scores of ensemble runs, and of the simulated
+        timeseries of behavioral runs
+    """
+    
+    DATES = 'dates.npy'
+    OBSERVED = 'observed.npy'
+    SIMULATED = 'simulated.f32'
+    SCORES = 'scores.csv'
+    NAME = 'name'
+    BEHAVIORAL = 'behavioral'
+    ROW = 'row'
+    
+    def __init__(self, path):
+        """ Open a store, which need not exist (see create)
+        
+            @param path String representing the path of the store directory
+        """
+        self.path = path
+        self.dates = None
+        self.observed = None
+        self.metrics = None
+        self._rows = 0
+        self._names = set()
+        if os.path.isfile(self._path(BehavioralStore.SCORES)):
+            self._open()
+    
+    def _path(self, filename):
+        return os.path.join(self.path, filename)
+    
+    def exists(self):
+        return self.dates is not None
+    
+    def _open(self):
+        self.dates = np.load(self._path(BehavioralStore.DATES))
+        self.observed = np.load(self._path(BehavioralStore.OBSERVED))
+        with open(self._path(BehavioralStore.SCORES), 'r') as f:
+            header = next(csv.reader(f))
+        self.metrics = header[3:]
+        scores = self.scores()
+        self._names = set(scores.index)
+        behavioral = scores[BehavioralStore.ROW] >= 0
+        self._rows = int(scores[BehavioralStore.ROW].max()) + 1 if behavioral.any() else 0
+        # Discard a row left partially written by an interrupted run
+        rowBytes = len(self.dates) * np.dtype(np.float32).itemsize
+        simulatedPath = self._path(BehavioralStore.SIMULATED)
+        if os.path.getsize(simulatedPath) != self._rows * rowBytes:
+            with open(simulatedPath, 'r+b') as f:
+                f.truncate(self._rows * rowBytes)
+    
+    def create(self, dates, observed, metricNames=metrics.METRICS):
+        """ Create the store, or check that an existing store has the same
+            observed timeseries
+            
+            @param dates numpy.ndarray of datetime64 dates of observed values
+            @param observed numpy.ndarray of observed values
+            @param metricNames List of metrics (see rhessysworkflows.metrics.METRICS) to record for each run
+            
+            @raise ValueError if the store exists and has different observed data or metrics
+        """
+        dates = np.asarray(dates, dtype='datetime64[s]')
+        observed = np.asarray(observed, dtype=float)
+        if self.exists():
+            same = dates.shape == self.dates.shape and (dates == self.dates).all() and \
+                ((observed == self.observed) | (np.isnan(observed) & np.isnan(self.observed))).all()
+            if not same:
+                raise ValueError("Behavioral store %s was created with different observed data" % (self.path,) )
+            if list(metricNames) != self.metrics:
+                raise ValueError("Behavioral store %s was created with different metrics" % (self.path,) )
+            return
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        np.save(self._path(BehavioralStore.DATES), dates)
+        np.save(self._path(BehavioralStore.OBSERVED), observed)
+        open(self._path(BehavioralStore.SIMULATED), 'wb').close()
+        with open(self._path(BehavioralStore.SCORES), 'w') as f:
+            csv.writer(f).writerow([BehavioralStore.NAME, BehavioralStore.BEHAVIORAL, BehavioralStore.ROW] + \
+                                   list(metricNames))
+        self.dates = dates
+        self.observed = observed
+        self.metrics = list(metricNames)
+        self._rows = 0
+        self._names = set()
+    
+    def add(self, name, scores, simulated=None):
+        """ Record a run.  A run that is already recorded (e.g. one scored
+            before an interrupted ensemble was resumed, but not marked complete)
+            is not recorded again.
+        
+            @param name String representing the name of the run
+            @param scores dict mapping metrics to the run's scores
+            @param simulated numpy.ndarray of the run's simulated values, aligned
+            to the observed values, if the run is behavioral; None otherwise
+        """
+        if name in self._names:
+            return
+        row = -1
+        if simulated is not None:
+            simulated = np.asarray(simulated, dtype=np.float32)
+            assert(simulated.shape == self.observed.shape)
+            with open(self._path(BehavioralStore.SIMULATED), 'ab') as f:
+                f.write(simulated.tobytes())
+            row = self._rows
+            self._rows += 1
+        with open(self._path(BehavioralStore.SCORES), 'a') as f:
+            csv.writer(f).writerow([name, int(row >= 0), row] + \
+                                   [repr(float(scores[m])) for m in self.metrics])
+        self._names.add(name)
+    
+    def scores(self):
+        """ @return pandas.DataFrame of scores, indexed by run name, with a
+            boolean behavioral column and a column for each metric
+        """
+        df = pd.read_csv(self._path(BehavioralStore.SCORES), index_col=0)
+        df = df[~df.index.duplicated(keep='last')]
+        df[BehavioralStore.BEHAVIORAL] = df[BehavioralStore.BEHAVIORAL].astype(bool)
+        return df
+    
+    def simulated(self):
+        """ @return pandas.DataFrame of simulated timeseries of behavioral runs,
+            indexed by date, with one column per run
+        """
+        scores = self.scores()
+        scores = scores[scores[BehavioralStore.BEHAVIORAL]]
+        data = np.empty( (0, len(self.dates)), dtype=np.float32)
+        if self._rows:
+            data = np.memmap(self._path(BehavioralStore.SIMULATED), dtype=np.float32, mode='r',
+                             shape=(self._rows, len(self.dates)))
+        rows = scores[BehavioralStore.ROW].values.astype(int)
+        return pd.DataFrame(np.asarray(data[rows]).T, index=pd.DatetimeIndex(self.dates, name='datetime'),
+                            columns=scores.index)
+    
+    def writeCSV(self, path, likelihood=None, bounds=(0.05, 0.95)):
+        """ Write simulated timeseries of behavioral runs to a CSV file, suitable
+            for use as behavioral data for RHESSysPlot
+        
+            @param path String representing the path of the CSV file
+            @param likelihood String representing metric to use as the likelihood
+            of each behavioral run.  If not None, columns lower, median, and upper,
+            the likelihood weighted prediction bounds, are added.
+            @param bounds Tuple of the quantiles of the lower and upper prediction bounds
+        """
+        df = self.simulated()
+        if likelihood and len(df.columns):
+            weights = self.scores()[likelihood][df.columns].values.clip(min=0)
+            if weights.sum() == 0:
+                weights = np.ones(len(weights))
+            (lower, median, upper) = weightedQuantiles(df.values.T, weights,
+                                                       [bounds[0], 0.5, bounds[1]])
+            df['lower'] = lower
+            df['median'] = median
+            df['upper'] = upper
+        df.to_csv(path)
+
+
+class BehavioralFilter(object):
+    """ Score ensemble runs as they complete, keeping the simulated timeseries
+        of behavioral runs in a BehavioralStore
+    """
+    
+    BASIN_DAILY = '_basin.daily'
+    
+    def __init__(self, store, dates, observed, criteria, variable='streamflow',
+                 nonBehavioral=DELETE, compressMethod=GZIP):
+        """ @param store BehavioralStore in which to record runs
+            @param dates List of datetime.datetime of observed values
+            @param observed List of observed values
+            @param criteria List of Criterion; runs meeting all of them are behavioral
+            @param variable String representing the column of the basin daily output to score
+            @param nonBehavioral String representing what to do with the output of
+            runs that are not behavioral (one of NON_BEHAVIORAL_ACTIONS)
+            @param compressMethod String representing the compression method used when
+            nonBehavioral is COMPRESS
+            
+            @raise ValueError if nonBehavioral is not a valid action, or if the
+            store exists and has different observed data
+        """
+        if not nonBehavioral in NON_BEHAVIORAL_ACTIONS:
+            raise ValueError("Unknown action %s for non-behavioral runs" % (nonBehavioral,) )
+        self.store = store
+        self.criteria = criteria
+        self.variable = variable
+        self.nonBehavioral = nonBehavioral
+        self.compressMethod = compressMethod
+        self.store.create(dates, observed)
+        # Model output is aligned to observed data by day
+        self._days = self.store.dates.astype('datetime64[D]')
+        self._observed = self.store.observed
+    
+    def align(self, outputPath):
+        """ Read simulated values from a basin daily output file, aligned to
+            observed values; days without output are NaN
+        
+            @return numpy.ndarray
+        """
+        with openOutputFile(outputPath) as f:
+            df = RHESSysOutput.readColumnsFromFile(f, [self.variable], readHour=False)
+        days = df.index.values.astype('datetime64[D]')
+        idx = np.searchsorted(days, self._days)
+        idx[idx == len(days)] = 0
+        simulated = df[self.variable].values.astype(float)[idx]
+        simulated[days[idx] != self._days] = np.nan
+        return simulated
+    
+    def process(self, run):
+        """ Score a completed run, recording it in the store, and delete or
+            compress its output if it is not behavioral
+        
+            @param run EnsembleRun whose output is to be scored
+            
+            @return Tuple (dict mapping metrics to scores, boolean behavioral)
+            
+            @raise IOError if the run has no basin daily output
+        """
+        outputPaths = [p for p in glob.glob(run.outputPrefix + BehavioralFilter.BASIN_DAILY + '*') \
+                       if os.path.isfile(p)]
+        if not outputPaths:
+            raise IOError("No basin daily output found for run %s" % (run.name,) )
+        simulated = self.align(outputPaths[0])
+        scores = metrics.score(self._observed, simulated, self.store.metrics)
+        behavioral = all([c.isMet(scores) for c in self.criteria])
+        self.store.add(run.name, scores, simulated if behavioral else None)
+        if not behavioral:
+            for outputFile in glob.glob(run.outputPrefix + '_*'):
+                if os.path.isdir(outputFile):
+                    # Output cache
+                    if self.nonBehavioral != KEEP:
+                        shutil.rmtree(outputFile)
+                elif self.nonBehavioral == DELETE:
+                    os.unlink(outputFile)
+                elif self.nonBehavioral == COMPRESS and detectCompression(outputFile) is None:
+                    compressFile(outputFile, self.compressMethod)
+        return (scores, behavioral)
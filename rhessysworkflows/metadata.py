@@ -70,6 +70,8 @@ class RHESSysMetadata(GenericMetadata):
     RHESSYS_SECTION = MODEL_NAME
     # Patch list of valid sections
     GenericMetadata.SECTIONS.append(RHESSYS_SECTION)
+    RESOURCES_SECTION = 'resources'
+    GenericMetadata.SECTIONS.append(RESOURCES_SECTION)
    
     RULES_DIR = 'rules' 
     KNOWN_LC_TYPES = ecohydrolib.command.landcover.KNOWN_LC_TYPES
@@ -173,10 +175,70 @@ class RHESSysMetadata(GenericMetadata):
         """
         return GenericMetadata._readEntriesForSection(context.projectDir, RHESSysMetadata.RHESSYS_SECTION)
     
+    
+    @staticmethod
+    def writeResourceEntries(context, keys, values):
+        """ Write resource usage entries to the metadata store for a given project.
+            
+            @note Will overwrite the values of keys that already exist
+        
+            @param context Context object containing projectDir, the path of the project whose 
+            metadata store is to be written to
+            @param keys The keys to be written to the resources section of the project metadata
+            @param values The values to be written for keys stored in the resources section of the project metadata
+            
+            @exception IOError(errno.EACCES) if the metadata store for the project is not writable
+        """
+        GenericMetadata._writeEntriesToSection(context.projectDir, RHESSysMetadata.RESOURCES_SECTION, keys, values,
+                                               RHESSysMetadata._writeWorkflowVersionToMetadata)
+    
+    
+    @staticmethod
+    def readResourceEntries(context):
+        """ Read all resource usage entries from the metadata store for a given project
+        
+            @param context Context object containing projectDir, the path of the project whose 
+            metadata store is to be read from
+            
+            @return A dictionary of key/value pairs from the resources section of the project metadata
+        """
+        return GenericMetadata._readEntriesForSection(context.projectDir, RHESSysMetadata.RESOURCES_SECTION)
+    
 
 class ModelRun(metadata.ModelRun):
     # Register model name with EcohydroLib metadata
     GenericMetadata.MODEL_TYPES.append(RHESSysMetadata.MODEL_NAME)
     
     def __init__(self):
-        super(ModelRun, self).__init__(RHESSysMetadata.MODEL_NAME)
\ No newline at end of file
+        super(ModelRun, self).__init__(RHESSysMetadata.MODEL_NAME)
+        # rhessysworkflows.resources.ResourceUsage of the model run, if measured
+        self.resources = None
+    
+    def writeToMetadata(self, context):
+        """ Write ModelRun data, and resource usage of the model run, if any,
+            to model run section of metadata for a given project directory
+        """
+        super(ModelRun, self).writeToMetadata(context)
+        if self.resources is not None:
+            keyProto = self.modelType + GenericMetadata.KEY_SEP + str(self.runNumber) + GenericMetadata.KEY_SEP
+            (keys, values) = self.resources.toEntries(keyProto)
+            GenericMetadata.writeModelRunEntries(context, keys, values)
+    
+    @classmethod
+    def readFromMetadata(cls, context, fqId):
+        """ Read ModelRun data, and resource usage of the model run, if any,
+            from model run section of metadata for a given project directory
+        
+            @param fqId String representing the fully qualified ID of the model run: <model_type>_<run_number>
+        
+            @return A new ModelRun instance with data populated from metadata
+        """
+        from rhessysworkflows.resources import ResourceUsage
+        
+        run = metadata.ModelRun.readFromMetadata(context, fqId)
+        newInstance = cls()
+        for attr in ['modelType', 'runNumber', 'description', 'date', 'command', 'output']:
+            setattr(newInstance, attr, getattr(run, attr))
+        newInstance.resources = ResourceUsage.fromEntries(GenericMetadata.readModelRunEntries(context),
+                                                          fqId + GenericMetadata.KEY_SEP)
+        return newInstance
\ No newline at end of file
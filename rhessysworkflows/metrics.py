@@ -0,0 +1,175 @@
+"""@package rhessysworkflows.metrics
+
+@brief Goodness of fit of simulated to observed timeseries
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+Each metric compares a simulated timeseries with an observed timeseries of
+the same length (i.e. already aligned by date).  Simulations may also be
+given as a 2-D array with one row per simulation (e.g. ensemble member), in
+which case one value is returned per row.  Time steps where either the
+observed or the simulated value is NaN are ignored.
+"""
+import numpy as np
+
+NSE = 'nse'
+LOG_NSE = 'lognse'
+KGE = 'kge'
+BIAS = 'bias'
+RMSE = 'rmse'
+METRICS = [NSE, LOG_NSE, KGE, BIAS, RMSE]
+# Metrics for which larger values are better, and which can be used as likelihoods
+LIKELIHOODS = [NSE, LOG_NSE, KGE]
+
+
+def _valid(obs, sim):
+    """ Broadcast observed and simulated values against each other, replacing
+        time steps with a missing value by zero
+
+        @return Tuple (obs, sim, valid, n) where valid is a boolean array of
+        time steps with both values, and n is the number of such time steps
+    """
+    (obs, sim) = np.broadcast_arrays(np.asarray(obs, dtype=float),
+                                     np.asarray(sim, dtype=float))
+    valid = ~(np.isnan(obs) | np.isnan(sim))
+    n = valid.sum(axis=-1)
+    return (np.where(valid, obs, 0.0), np.where(valid, sim, 0.0), valid, n)
+
+
+def _mean(x, n):
+    return x.sum(axis=-1) / n
+
+
+def nse(obs, sim):
+    """ Nash-Sutcliffe efficiency: 1 - sum((sim - obs)^2) / sum((obs - mean(obs))^2)
+
+        @param obs numpy.ndarray of observed values
+        @param sim numpy.ndarray of simulated values, with the same length as obs,
+        or one row per simulation
+
+        @return float, or numpy.ndarray with one value per simulation
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        (o, s, valid, n) = _valid(obs, sim)
+        anomaly = np.where(valid, o - _mean(o, n)[...,np.newaxis], 0.0)
+        return 1.0 - ((s - o) ** 2).sum(axis=-1) / (anomaly ** 2).sum(axis=-1)
+
+
+def logNSE(obs, sim, epsilon=None):
+    """ Nash-Sutcliffe efficiency of the logarithms of values, which weights low
+        flows more heavily than nse does.  epsilon is added to values before
+        taking logarithms so that zero values can be compared.
+
+        @param obs numpy.ndarray of observed values
+        @param sim numpy.ndarray of simulated values
+        @param epsilon float added to values; if None, 1/100 of the mean of the
+        observed values is used
+
+        @return float, or numpy.ndarray with one value per simulation
+    """
+    obs = np.asarray(obs, dtype=float)
+    if epsilon is None:
+        epsilon = np.nanmean(obs) / 100.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return nse(np.log(obs + epsilon), np.log(np.asarray(sim, dtype=float) + epsilon))
+
+
+def kge(obs, sim):
+    """ Kling-Gupta efficiency (Gupta et al. 2009):
+        1 - sqrt((r - 1)^2 + (alpha - 1)^2 + (beta - 1)^2), where r is the
+        correlation of simulated and observed values, alpha the ratio of their
+        standard deviations, and beta the ratio of their means
+
+        @param obs numpy.ndarray of observed values
+        @param sim numpy.ndarray of simulated values
+
+        @return float, or numpy.ndarray with one value per simulation
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        (o, s, valid, n) = _valid(obs, sim)
+        obsMean = _mean(o, n)
+        simMean = _mean(s, n)
+        obsAnomaly = np.where(valid, o - obsMean[...,np.newaxis], 0.0)
+        simAnomaly = np.where(valid, s - simMean[...,np.newaxis], 0.0)
+        obsStd = np.sqrt(_mean(obsAnomaly ** 2, n))
+        simStd = np.sqrt(_mean(simAnomaly ** 2, n))
+        r = _mean(obsAnomaly * simAnomaly, n) / (obsStd * simStd)
+        alpha = simStd / obsStd
+        beta = simMean / obsMean
+        return 1.0 - np.sqrt((r - 1) ** 2 + (alpha - 1) ** 2 + (beta - 1) ** 2)
+
+
+def bias(obs, sim):
+    """ Percent bias: 100 * sum(sim - obs) / sum(obs); positive values indicate
+        overestimation
+
+        @param obs numpy.ndarray of observed values
+        @param sim numpy.ndarray of simulated values
+
+        @return float, or numpy.ndarray with one value per simulation
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        (o, s, valid, n) = _valid(obs, sim)
+        return 100.0 * (s - o).sum(axis=-1) / o.sum(axis=-1)
+
+
+def rmse(obs, sim):
+    """ Root mean square error
+
+        @param obs numpy.ndarray of observed values
+        @param sim numpy.ndarray of simulated values
+
+        @return float, or numpy.ndarray with one value per simulation
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        (o, s, valid, n) = _valid(obs, sim)
+        return np.sqrt(_mean((s - o) ** 2, n))
+
+
+_FUNCTIONS = {NSE: nse, LOG_NSE: logNSE, KGE: kge, BIAS: bias, RMSE: rmse}
+
+
+def score(obs, sim, metrics=METRICS):
+    """ Compute several metrics at once
+
+        @param obs numpy.ndarray of observed values
+        @param sim numpy.ndarray of simulated values
+        @param metrics List of metrics to compute (see METRICS)
+
+        @return dict mapping each metric to its value(s)
+
+        @raise ValueError if a metric is not one of METRICS
+    """
+    for metric in metrics:
+        if not metric in _FUNCTIONS:
+            raise ValueError("Unknown metric %s" % (metric,) )
+    return dict( [(metric, _FUNCTIONS[metric](obs, sim)) for metric in metrics] )
@@ -0,0 +1,312 @@
+"""@package rhessysworkflows.movie
+
+@brief Render movies of patch-scale RHESSys output
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+Frames are composed using matplotlib (map of patch values, overlays, legends,
+title, and date), optionally in a pool of processes, and are written in order
+as raw RGB images to the standard input of ffmpeg, so that no intermediate
+images are written to disk.
+
+Usage:
+@code
+renderer = FrameRenderer(PatchRasterMap.fromGRASS('patch'), 'Transpiration (mm)')
+frames = ( (str(date), patchIDs, values) for (date, patchIDs, values) in days )
+writeMovie(renderer, frames, 'trans.mp4', jobs=4)
+@endcode
+"""
+import errno
+import subprocess
+import multiprocessing
+from collections import deque
+
+import numpy as np
+
+
+DEFAULT_COLORMAP = 'rainbow'
+DEFAULT_CODEC = 'mpeg4'
+
+
+def grassColorMap(rules, name='grass'):
+    """ Build a matplotlib color map from a GRASS color table
+
+        @param rules String representing the color table of a raster as output
+        by r.colors.out, with one "value red:green:blue" rule per line
+        @param name String representing the name of the color map
+
+        @return Tuple (matplotlib.colors.Colormap, float, float), where the second
+        and third elements are the values of the first and last rules
+    """
+    from matplotlib.colors import LinearSegmentedColormap, ListedColormap
+    values = []
+    colors = []
+    for line in rules.splitlines():
+        tokens = line.split()
+        if len(tokens) != 2 or tokens[0] in ('nv', 'default'):
+            continue
+        values.append( float(tokens[0]) )
+        colors.append( tuple([int(c) / 255.0 for c in tokens[1].split(':')]) )
+    if not len(values):
+        raise ValueError("No color rules found")
+    (vmin, vmax) = (values[0], values[-1])
+    if vmin == vmax:
+        return (ListedColormap(colors[:1], name=name), vmin, vmax)
+    positions = [(v - vmin) / (vmax - vmin) for v in values]
+    return (LinearSegmentedColormap.from_list(name, list(zip(positions, colors))), vmin, vmax)
+
+
+class Overlay(object):
+
+    def __init__(self, name, raster, cmap=None, vmin=None, vmax=None):
+        """ @param name String representing the name of the overlay
+            @param raster 2-D numpy.ndarray with the shape of the patch raster; NaN
+            cells are transparent
+            @param cmap matplotlib color map or the name of one
+            @param vmin Value mapped to the low end of the color map
+            @param vmax Value mapped to the high end of the color map
+        """
+        self.name = name
+        self.raster = raster
+        self.cmap = cmap
+        self.vmin = vmin
+        self.vmax = vmax
+
+    @classmethod
+    def fromGRASS(cls, mapName):
+        """ Read an overlay, with its color table, from the current GRASS mapset.
+            GRASS must be initialized (e.g. using ecohydrolib.grasslib.GRASSLib)
+            before calling.
+
+            @param mapName String representing the name of the raster
+        """
+        import grass.script as grass
+        from grass.script import array as garray
+        raster = garray.array()
+        raster.read(mapName)
+        (cmap, vmin, vmax) = grassColorMap(grass.read_command('r.colors.out', map=mapName),
+                                           mapName)
+        return cls(mapName, np.array(raster), cmap, vmin, vmax)
+
+
+class FrameRenderer(object):
+
+    def __init__(self, patchRasterMap, title, cmap=DEFAULT_COLORMAP, valueRange=None,
+                 legendLabels=None, overlays=None, overlayLegend=False,
+                 width=960, height=720, dpi=80):
+        """ @param patchRasterMap rhessysworkflows.patchmap.PatchRasterMap
+            @param title String representing the title of the movie
+            @param cmap String representing the name of the matplotlib color map
+            used to color patch values
+            @param valueRange Tuple (min, max) of values mapped to the ends of the
+            color map; if None, the range of values of each frame is used
+            @param legendLabels Tuple (low, high) of strings labeling the ends of the
+            legend in place of values
+            @param overlays List of Overlay objects drawn, in order, over the map
+            @param overlayLegend Boolean  If True, draw a legend for the first overlay
+            @param width Integer representing width of frames in pixels
+            @param height Integer representing height of frames in pixels
+            @param dpi Integer representing resolution, in dots per inch, at which
+            text is drawn
+        """
+        self.patchRasterMap = patchRasterMap
+        self.title = title
+        self.cmap = cmap
+        self.valueRange = valueRange
+        self.legendLabels = legendLabels
+        self.overlays = overlays or []
+        self.overlayLegend = overlayLegend
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        self._figure = None
+
+    def __getstate__(self):
+        # The figure is built in each process the renderer is used in
+        state = self.__dict__.copy()
+        state['_figure'] = None
+        return state
+
+    def _buildFigure(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        figure = Figure(figsize=(float(self.width) / self.dpi, float(self.height) / self.dpi),
+                        dpi=self.dpi, facecolor='white')
+        canvas = FigureCanvasAgg(figure)
+        ax = figure.add_axes([0.0, 0.0, 1.0, 0.92])
+        ax.set_axis_off()
+        empty = np.ma.masked_all(self.patchRasterMap.shape)
+        image = ax.imshow(empty, cmap=self.cmap, interpolation='nearest')
+        overlayImages = [ax.imshow(np.ma.masked_invalid(overlay.raster), cmap=overlay.cmap,
+                                   vmin=overlay.vmin, vmax=overlay.vmax,
+                                   interpolation='nearest') for overlay in self.overlays]
+        if self.overlayLegend and self.overlays:
+            figure.colorbar(overlayImages[0], cax=figure.add_axes([0.10, 0.15, 0.025, 0.35]))
+            figure.text(0.12, 0.12, self.overlays[0].name, ha='center', va='center',
+                        fontsize=10)
+        colorbar = figure.colorbar(image, cax=figure.add_axes([0.80, 0.63, 0.025, 0.25]))
+        figure.text(0.73, 0.96, self.title, ha='center', va='center', fontsize=16)
+        date = figure.text(0.12, 0.96, '', ha='center', va='center', fontsize=16)
+        self._figure = (canvas, image, colorbar, date)
+
+    def render(self, dateStr, patchIDs, values):
+        """ Render a frame
+
+            @param dateStr String representing the date of the frame
+            @param patchIDs Sequence of patch IDs
+            @param values Sequence of values, one for each patch in patchIDs; NaN
+            values are not drawn
+
+            @return String of bytes of an RGB image, with 3 bytes per pixel, row by row
+            from the top of the image
+        """
+        if self._figure is None:
+            self._buildFigure()
+        (canvas, image, colorbar, date) = self._figure
+
+        raster = np.ma.masked_invalid( self.patchRasterMap.render(patchIDs, values) )
+        if self.valueRange is not None:
+            (vmin, vmax) = self.valueRange
+        elif raster.count():
+            (vmin, vmax) = (raster.min(), raster.max())
+        else:
+            (vmin, vmax) = (0.0, 1.0)
+        image.set_data(raster)
+        image.set_clim(vmin, vmax)
+        colorbar.set_ticks([vmin, vmax])
+        if self.legendLabels is not None:
+            colorbar.set_ticklabels(self.legendLabels)
+        date.set_text(dateStr)
+
+        canvas.draw()
+        (width, height) = canvas.get_width_height()
+        rgba = np.frombuffer(canvas.buffer_rgba(), dtype=np.uint8).reshape(height, width, 4)
+        return rgba[:,:,:3].tobytes()
+
+    @property
+    def size(self):
+        """ Tuple (width, height) of frames in pixels """
+        if self._figure is None:
+            self._buildFigure()
+        return self._figure[0].get_width_height()
+
+
+_renderer = None
+
+def _initWorker(renderer):
+    global _renderer
+    _renderer = renderer
+
+def _renderFrame(args):
+    """ Render a frame using the renderer of a worker process """
+    return _renderer.render(*args)
+
+
+def iterFrames(renderer, frames, jobs=1):
+    """ Render frames, in order
+
+        @param renderer FrameRenderer
+        @param frames Iterable of tuples (date string, patch IDs, values), one per
+        frame (see FrameRenderer.render)
+        @param jobs Number of processes to render frames with.  At most 2 * jobs
+        frames are rendered ahead of the consumer.
+
+        @return Generator of frames rendered by FrameRenderer.render
+    """
+    if jobs <= 1:
+        for frame in frames:
+            yield renderer.render(*frame)
+        return
+
+    pool = multiprocessing.Pool(jobs, _initWorker, (renderer,))
+    try:
+        pending = deque()
+        for frame in frames:
+            pending.append( pool.apply_async(_renderFrame, (frame,)) )
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def writeMovie(renderer, frames, outputPath, ffmpegPath='ffmpeg', fps=15, codec=DEFAULT_CODEC,
+               jobs=1):
+    """ Render frames, writing them to a movie using ffmpeg
+
+        @param renderer FrameRenderer
+        @param frames Iterable of tuples (date string, patch IDs, values), one per
+        frame (see FrameRenderer.render)
+        @param outputPath String representing the path of the movie to write; if
+        the file exists it will be overwritten
+        @param ffmpegPath String representing the path of the ffmpeg executable
+        @param fps Integer representing frames per second of the movie
+        @param codec String representing the name of the ffmpeg video codec to use
+        @param jobs Number of processes to render frames with
+
+        @return Number of frames written; if there are no frames, ffmpeg is not
+        run and no movie is written
+
+        @raise IOError if ffmpeg fails
+    """
+    (width, height) = renderer.size
+    cmd = [ffmpegPath, '-y', '-loglevel', 'error',
+           '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', "%dx%d" % (width, height),
+           '-r', str(fps), '-i', '-',
+           '-vcodec', codec, '-pix_fmt', 'yuv420p', outputPath]
+    # ffmpeg is started once the first frame has been rendered
+    process = None
+    numFrames = 0
+    try:
+        for frame in iterFrames(renderer, frames, jobs):
+            if process is None:
+                process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+            process.stdin.write(frame)
+            numFrames += 1
+    except IOError as e:
+        # ffmpeg exited early, its return code is reported below
+        if e.errno != errno.EPIPE:
+            raise
+    finally:
+        if process is not None:
+            try:
+                process.stdin.close()
+            except IOError:
+                pass
+            process.wait()
+    if process is not None and process.returncode != 0:
+        raise IOError("Error %d encountered when creating movie using ffmpeg.  Command line was:\n%s\n" % \
+                      (process.returncode, ' '.join(cmd)) )
+    return numFrames
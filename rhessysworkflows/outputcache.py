@@ -0,0 +1,273 @@
+"""@package rhessysworkflows.outputcache
+
+@brief Column-oriented binary cache for RHESSys text output files
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+A cache is stored in a directory alongside the output file it was made from
+(e.g. rhessys_patch.daily.cache for rhessys_patch.daily).  The directory
+contains a manifest, describing the source file the cache was built from, and
+one .npy file per column.  Date columns (year, month, day, hour) are stored
+as 1-D arrays, one element per time step.  For patch-scale output a sorted
+patchID axis is stored as well, and each variable is stored as a 2-D array of
+shape (time steps, patches); for output without a patchID column each variable
+is stored as a 1-D array with one element per line of the source file.
+
+A cache is used in place of its source file for as long as the size and
+modification time of the source file, and a digest of its first and last
+blocks, are those recorded in the manifest.  A digest of the whole source file
+is recorded as well, but is only checked on request (see isCurrent), as
+computing it requires reading the whole file.
+"""
+import os, errno
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+
+class OutputCache(object):
+
+    CACHE_SUFFIX = '.cache'
+    MANIFEST = 'manifest.json'
+    PRESENT = '_present'
+    PATCH_ID = 'patchID'
+    DATE_COLUMNS = ['year', 'month', 'day', 'hour']
+    _BLOCK_SIZE = 1024 * 1024
+    # Number of bytes at each end of the source file included in its partial digest
+    _PARTIAL_SIZE = 64 * 1024
+
+    def __init__(self, outputPath):
+        """ Construct a cache for a RHESSys output file.  The cache itself need
+            not exist.
+
+            @param outputPath String representing the path of the RHESSys output file
+        """
+        self.outputPath = os.path.abspath(outputPath)
+        self.cachePath = self.outputPath + OutputCache.CACHE_SUFFIX
+        self._manifest = None
+
+    @classmethod
+    def forFile(cls, f):
+        """ Get the cache for an open file object
+
+            @param f File object open for reading
+
+            @return OutputCache instance, or None if f is not associated with
+            a file on disk
+        """
+        name = getattr(f, 'name', None)
+        if name is None or isinstance(name, int) or not os.path.isfile(name):
+            return None
+        return cls(name)
+
+    def _hashSource(self):
+        """ Compute SHA-1 digest of the content of the source file
+
+            @return String representing hexadecimal digest
+        """
+        sha1 = hashlib.sha1()
+        with open(self.outputPath, 'rb') as f:
+            block = f.read(OutputCache._BLOCK_SIZE)
+            while block:
+                sha1.update(block)
+                block = f.read(OutputCache._BLOCK_SIZE)
+        return sha1.hexdigest()
+
+    def _partialHashSource(self):
+        """ Compute SHA-1 digest of the size, and the first and last blocks, of
+            the source file
+
+            @return String representing hexadecimal digest
+        """
+        sha1 = hashlib.sha1()
+        with open(self.outputPath, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            sha1.update(str(size).encode('ascii'))
+            f.seek(0)
+            sha1.update(f.read(OutputCache._PARTIAL_SIZE))
+            if size > OutputCache._PARTIAL_SIZE:
+                f.seek(max(OutputCache._PARTIAL_SIZE, size - OutputCache._PARTIAL_SIZE))
+                sha1.update(f.read())
+        return sha1.hexdigest()
+
+    def _readManifest(self):
+        if self._manifest is None:
+            manifestPath = os.path.join(self.cachePath, OutputCache.MANIFEST)
+            if not os.path.isfile(manifestPath):
+                return None
+            with open(manifestPath, 'r') as f:
+                self._manifest = json.load(f)
+        return self._manifest
+
+    def isCurrent(self, verify=False):
+        """ Determine whether the cache exists and was built from the current
+            content of the source file.  Size, modification time, and a digest of
+            the first and last blocks of the source file are checked.
+
+            @param verify Boolean  If True, also check a digest of the entire
+            content of the source file (which requires reading the whole file)
+
+            @return True if the cache can be used in place of the source file
+        """
+        try:
+            manifest = self._readManifest()
+        except ValueError:
+            # Corrupt manifest
+            return False
+        if manifest is None:
+            return False
+        stat = os.stat(self.outputPath)
+        if stat.st_size != manifest['size'] or stat.st_mtime != manifest['mtime']:
+            return False
+        # Caches built before partial digests were recorded lack one
+        partial = manifest.get('partial_sha1')
+        if partial is not None and partial != self._partialHashSource():
+            return False
+        if verify:
+            return self._hashSource() == manifest['sha1']
+        return True
+
+    @property
+    def headers(self):
+        """ List of column headers of the source file """
+        return self._readManifest()['headers']
+
+    @property
+    def numTimeSteps(self):
+        """ Number of time steps (patch-scale output) or lines (other output) in the source file """
+        return self._readManifest()['time_steps']
+
+    @property
+    def isPatchCube(self):
+        """ True if the cache stores variables as (time steps x patches) arrays """
+        return self._readManifest()['patch_cube']
+
+    def hasColumns(self, column_names):
+        """ @return True if all columns in column_names are stored in the cache """
+        columns = self._readManifest()['columns']
+        for col in column_names:
+            if not col in columns:
+                return False
+        return True
+
+    def _columnPath(self, column_name):
+        return os.path.join(self.cachePath, "%s.npy" % (column_name,) )
+
+    def readColumn(self, column_name):
+        """ Read a column from the cache.  The array is memory mapped so only
+            the portions of the column used by the caller are read from disk.
+
+            @param column_name String representing the name of the column to read
+
+            @return numpy.ndarray
+
+            @raise KeyError if column is not stored in the cache
+        """
+        if not column_name in self._readManifest()['columns']:
+            raise KeyError("Column %s not found in cache %s" % (column_name, self.cachePath) )
+        return np.load(self._columnPath(column_name), mmap_mode='r')
+
+    def readDateColumns(self):
+        """ @return dict<string, numpy.ndarray> of date columns (i.e. year,
+            month, day, hour) present in the source file
+        """
+        return dict( [(col, self.readColumn(col)) for col in OutputCache.DATE_COLUMNS \
+                      if col in self._readManifest()['columns']] )
+
+    def readPresent(self):
+        """ @return 2-D boolean numpy.ndarray indicating which patches had output for
+            each time step, or None if every patch had output for every time step
+        """
+        if self._readManifest()['sparse']:
+            return np.load(self._columnPath(OutputCache.PRESENT), mmap_mode='r')
+        return None
+
+    def write(self, headers, columns, present=None, sep=' '):
+        """ Write the cache, replacing any existing cache for the source file.
+
+            @param headers List of column headers of the source file
+            @param columns dict<string, numpy.ndarray> of columns to store
+            @param present 2-D boolean numpy.ndarray indicating which patches
+            had output for each time step; None if all patches had output for all
+            time steps or if output is not patch-scale
+            @param sep String representing field separator of the source file
+
+            @raise IOError(errno.EACCES) if the cache directory cannot be written
+        """
+        parentDir = os.path.dirname(self.cachePath)
+        if not os.access(parentDir, os.W_OK):
+            raise IOError(errno.EACCES, "Unable to write cache to directory %s" % (parentDir,) )
+
+        # Capture state of source before writing so that a source modified
+        # while we are writing will be detected as stale
+        stat = os.stat(self.outputPath)
+        timeSteps = 0
+        for (name, column) in columns.items():
+            if name != OutputCache.PATCH_ID:
+                timeSteps = len(column)
+                break
+        manifest = {'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'sha1': self._hashSource(),
+                    'partial_sha1': self._partialHashSource(),
+                    'sep': sep,
+                    'headers': list(headers),
+                    'columns': list(columns.keys()),
+                    'patch_cube': OutputCache.PATCH_ID in columns,
+                    'sparse': present is not None,
+                    'time_steps': timeSteps}
+
+        # Write to a temporary directory, then move into place
+        tmpPath = "%s.tmp%d" % (self.cachePath, os.getpid())
+        if os.path.exists(tmpPath):
+            shutil.rmtree(tmpPath)
+        os.mkdir(tmpPath)
+        for (name, column) in columns.items():
+            np.save(os.path.join(tmpPath, "%s.npy" % (name,) ), np.ascontiguousarray(column))
+        if present is not None:
+            np.save(os.path.join(tmpPath, "%s.npy" % (OutputCache.PRESENT,) ), present)
+        with open(os.path.join(tmpPath, OutputCache.MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+
+        if os.path.exists(self.cachePath):
+            shutil.rmtree(self.cachePath)
+        os.rename(tmpPath, self.cachePath)
+        self._manifest = manifest
+
+    def remove(self):
+        """ Remove the cache (if it exists) """
+        if os.path.exists(self.cachePath):
+            shutil.rmtree(self.cachePath)
+        self._manifest = None
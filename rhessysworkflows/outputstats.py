@@ -0,0 +1,334 @@
+"""@package rhessysworkflows.outputstats
+
+@brief Streaming summary statistics of RHESSys output variables
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+Minimum, maximum, mean, and quantiles of an output variable (or expression)
+are computed in a single pass over the output, one day at a time.  Quantiles
+are estimated using a mergeable sketch that stores counts of values in
+logarithmically sized buckets, so that each estimate is within a fixed relative
+error of a value of the variable (see Masson et al. 2019, DDSketch).
+Statistics for patch daily output are cached in a file alongside the output
+file (e.g. rhessys_patch.daily.stats for rhessys_patch.daily), so that
+renderers can use a fixed color ramp without reading the output twice.
+
+Usage:
+@code
+stats = patchDailyStatistics('rhessys_patch.daily', VariableExpression('trans_sat + trans_unsat'))
+(low, high) = (stats.quantile(0.02), stats.quantile(0.98))
+@endcode
+"""
+import os
+import math
+import json
+
+import numpy as np
+
+from rhessysworkflows.rhessys import RHESSysOutput
+
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+
+class QuantileSketch(object):
+
+    def __init__(self, relativeAccuracy=DEFAULT_RELATIVE_ACCURACY):
+        """ @param relativeAccuracy Float representing the maximum relative error
+            of quantile estimates
+        """
+        if not 0 < relativeAccuracy < 1:
+            raise ValueError("Relative accuracy must be between 0 and 1")
+        self.relativeAccuracy = relativeAccuracy
+        self._gamma = (1 + relativeAccuracy) / (1 - relativeAccuracy)
+        self._logGamma = math.log(self._gamma)
+        # Count of values in each bucket, keyed by bucket index, for values
+        # greater than and less than zero
+        self._positive = {}
+        self._negative = {}
+        self._zeros = 0
+        self.count = 0
+
+    def _addToStore(self, store, magnitudes):
+        keys = np.ceil(np.log(magnitudes) / self._logGamma).astype(np.int64)
+        (keys, counts) = np.unique(keys, return_counts=True)
+        for (key, count) in zip(keys.tolist(), counts.tolist()):
+            store[key] = store.get(key, 0) + count
+
+    def update(self, values):
+        """ Add values to the sketch; NaN values are ignored
+
+            @param values Sequence of numbers
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        positive = values[values > 0]
+        negative = values[values < 0]
+        if len(positive):
+            self._addToStore(self._positive, positive)
+        if len(negative):
+            self._addToStore(self._negative, -negative)
+        self._zeros += len(values) - len(positive) - len(negative)
+        self.count += len(values)
+
+    def merge(self, other):
+        """ Add the values of another sketch to this sketch
+
+            @param other QuantileSketch with the same relative accuracy
+
+            @raise ValueError if other has a different relative accuracy
+        """
+        if other.relativeAccuracy != self.relativeAccuracy:
+            raise ValueError("Unable to merge sketches with different relative accuracies")
+        for (store, otherStore) in [(self._positive, other._positive),
+                                    (self._negative, other._negative)]:
+            for (key, count) in otherStore.items():
+                store[key] = store.get(key, 0) + count
+        self._zeros += other._zeros
+        self.count += other.count
+
+    def _value(self, key):
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def quantile(self, q):
+        """ Estimate a quantile of the values added to the sketch
+
+            @param q Float in [0, 1]
+
+            @return Float, or NaN if the sketch is empty
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("Quantile must be between 0 and 1")
+        if not self.count:
+            return float('nan')
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self._zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self._positive))
+
+    def toDict(self):
+        return {'relative_accuracy': self.relativeAccuracy,
+                'positive': dict( [(str(k), v) for (k, v) in self._positive.items()] ),
+                'negative': dict( [(str(k), v) for (k, v) in self._negative.items()] ),
+                'zeros': self._zeros,
+                'count': self.count}
+
+    @classmethod
+    def fromDict(cls, d):
+        sketch = cls(d['relative_accuracy'])
+        sketch._positive = dict( [(int(k), v) for (k, v) in d['positive'].items()] )
+        sketch._negative = dict( [(int(k), v) for (k, v) in d['negative'].items()] )
+        sketch._zeros = d['zeros']
+        sketch.count = d['count']
+        return sketch
+
+
+class OutputStatistics(object):
+
+    def __init__(self, relativeAccuracy=DEFAULT_RELATIVE_ACCURACY):
+        """ @param relativeAccuracy Float representing the maximum relative error
+            of quantile estimates
+        """
+        self.count = 0
+        self.min = float('nan')
+        self.max = float('nan')
+        self.sum = 0.0
+        self.sketch = QuantileSketch(relativeAccuracy)
+
+    def update(self, values):
+        """ Add values; NaN values are ignored
+
+            @param values Sequence of numbers
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.min = float( np.fmin(self.min, values.min()) )
+        self.max = float( np.fmax(self.max, values.max()) )
+        self.sum += float( values.sum() )
+        self.count += len(values)
+        self.sketch.update(values)
+
+    def merge(self, other):
+        """ Add the values of another OutputStatistics to this one """
+        if not other.count:
+            return
+        self.min = float( np.fmin(self.min, other.min) )
+        self.max = float( np.fmax(self.max, other.max) )
+        self.sum += other.sum
+        self.count += other.count
+        self.sketch.merge(other.sketch)
+
+    @property
+    def mean(self):
+        if not self.count:
+            return float('nan')
+        return self.sum / self.count
+
+    def quantile(self, q):
+        """ Estimate a quantile of the values.  Quantiles 0 and 1 are the exact minimum
+            and maximum; other estimates are clamped to the range of the values.
+
+            @param q Float in [0, 1]
+
+            @return Float, or NaN if there are no values
+        """
+        if q == 0:
+            return self.min
+        if q == 1:
+            return self.max
+        return min(max(self.sketch.quantile(q), self.min), self.max)
+
+    def toDict(self):
+        return {'count': self.count,
+                'min': self.min,
+                'max': self.max,
+                'sum': self.sum,
+                'sketch': self.sketch.toDict()}
+
+    @classmethod
+    def fromDict(cls, d):
+        stats = cls()
+        stats.count = d['count']
+        stats.min = d['min']
+        stats.max = d['max']
+        stats.sum = d['sum']
+        stats.sketch = QuantileSketch.fromDict(d['sketch'])
+        return stats
+
+
+class StatisticsCache(object):
+
+    SUFFIX = '.stats'
+
+    def __init__(self, outputPath):
+        """ Construct a cache of statistics for a RHESSys output file.  The cache
+            itself need not exist.  The cache is current for as long as the size and
+            modification time of the output file are unchanged.
+
+            @param outputPath String representing the path of the RHESSys output file
+        """
+        self.outputPath = os.path.abspath(outputPath)
+        self.cachePath = self.outputPath + StatisticsCache.SUFFIX
+
+    def _source(self):
+        stat = os.stat(self.outputPath)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def _read(self):
+        """ @return dict of statistics, keyed by name, if the cache is current,
+            otherwise an empty dict
+        """
+        if not os.path.isfile(self.cachePath):
+            return {}
+        try:
+            with open(self.cachePath, 'r') as f:
+                cache = json.load(f)
+        except ValueError:
+            # Corrupt cache
+            return {}
+        if cache.get('source') != self._source():
+            return {}
+        return cache['statistics']
+
+    def get(self, key):
+        """ @param key String representing the name of the statistics (e.g. an
+            output variable expression)
+
+            @return OutputStatistics, or None if the cache is not current or does
+            not contain statistics for key
+        """
+        statistics = self._read()
+        if not key in statistics:
+            return None
+        return OutputStatistics.fromDict(statistics[key])
+
+    def put(self, key, stats):
+        """ Store statistics, replacing any stored under the same key
+
+            @param key String representing the name of the statistics
+            @param stats OutputStatistics
+
+            @raise IOError if the cache cannot be written
+        """
+        statistics = self._read()
+        statistics[key] = stats.toDict()
+        tmpPath = "%s.tmp%d" % (self.cachePath, os.getpid())
+        with open(tmpPath, 'w') as f:
+            json.dump({'source': self._source(), 'statistics': statistics}, f)
+        os.rename(tmpPath, self.cachePath)
+
+
+def patchDailyStatistics(filepath, expr, jobs=1, force=False):
+    """ Compute statistics of an output variable expression over all patches and
+        days of a RHESSys patch daily output file, in one pass over the file.
+        Statistics are read from the cache of the file if current, and are stored
+        in the cache otherwise, if the cache can be written.
+
+        @param filepath String representing path of patch daily output file
+        @param expr rhessysworkflows.expression.VariableExpression
+        @param jobs Number of processes to use to parse the file
+        @param force Boolean  If True, recompute statistics even if cached
+
+        @return OutputStatistics
+    """
+    cache = StatisticsCache(filepath)
+    key = str(expr)
+    if not force:
+        stats = cache.get(key)
+        if stats is not None:
+            return stats
+
+    stats = OutputStatistics()
+    with open(filepath, 'r') as f:
+        for (date, patchIDs, data) in RHESSysOutput.iterPatchDailyFile(f, expr.variables,
+                                                                        jobs=jobs):
+            stats.update( expr.evaluate(data) )
+    try:
+        cache.put(key, stats)
+    except (IOError, OSError):
+        # Statistics are still usable if they cannot be cached
+        pass
+    return stats
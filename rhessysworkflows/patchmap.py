@@ -0,0 +1,156 @@
+"""@package rhessysworkflows.patchmap
+
+@brief Render patch-scale values to rasters using an in-memory patch raster
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+The patch raster is read once, after which the raster for any set of patch
+values is produced by indexing an array of values with the dense index of the
+patch of each cell, rather than by writing reclass rules and running r.recode.
+Rasters are moved to and from GRASS in bulk using grass.script.array, which
+uses the current region (and mask) of the GRASS mapset.
+
+Usage:
+@code
+patchMap = PatchRasterMap.fromGRASS('patch_5m')
+raster = patchMap.render(patchIDs, values)
+patchMap.writeToGRASS(raster, 'lai_2008')
+@endcode
+"""
+import numpy as np
+
+
+class PatchRasterMap(object):
+
+    def __init__(self, patchRaster):
+        """ @param patchRaster 2-D numpy.ndarray of the patch ID of each cell; null
+            cells are NaN
+        """
+        patchRaster = np.asarray(patchRaster)
+        self.shape = patchRaster.shape
+        valid = ~np.isnan(patchRaster) if patchRaster.dtype.kind == 'f' \
+            else np.ones(self.shape, dtype=bool)
+        cellIDs = patchRaster[valid].astype(np.int64)
+        # Sorted IDs of patches in the raster; the dense index of a patch is its
+        # position in this array
+        self.patchIDs = np.unique(cellIDs)
+        # Dense index of the patch of each cell; null cells refer to an extra
+        # element past the last patch holding the fill value
+        self.index = np.empty(self.shape, dtype=np.intp)
+        self.index.fill(len(self.patchIDs))
+        self.index[valid] = np.searchsorted(self.patchIDs, cellIDs)
+
+    @classmethod
+    def fromGRASS(cls, patchMap):
+        """ Read a patch raster from the current GRASS mapset.  GRASS must be
+            initialized (e.g. using ecohydrolib.grasslib.GRASSLib) before calling.
+
+            @param patchMap String representing the name of the patch raster
+
+            @return PatchRasterMap
+        """
+        from grass.script import array as garray
+        raster = garray.array()
+        raster.read(patchMap)
+        return cls( np.array(raster) )
+
+    def denseIndex(self, patchIDs):
+        """ Get the dense index of each of a list of patches
+
+            @param patchIDs Sequence of patch IDs
+
+            @return Tuple (numpy.ndarray<int>, numpy.ndarray<bool>), where the first
+            element is the dense index of each patch and the second element is True
+            for patches found in the patch raster
+        """
+        patchIDs = np.asarray(patchIDs).astype(np.int64)
+        idx = np.searchsorted(self.patchIDs, patchIDs)
+        found = idx < len(self.patchIDs)
+        found[found] = self.patchIDs[idx[found]] == patchIDs[found]
+        return (idx, found)
+
+    def lookup(self, patchIDs, values, fill=np.nan):
+        """ Arrange values for patches by dense index, such that indexing the
+            result with index gives the value of each cell
+
+            @param patchIDs Sequence of patch IDs
+            @param values Sequence of values, one for each patch in patchIDs
+            @param fill Value of patches lacking a value, and of null cells
+
+            @return 1-D numpy.ndarray<float> with one element for each patch in
+            the raster, followed by an element for null cells
+        """
+        (idx, found) = self.denseIndex(patchIDs)
+        lookup = np.empty(len(self.patchIDs) + 1)
+        lookup.fill(fill)
+        lookup[idx[found]] = np.asarray(values, dtype=float)[found]
+        return lookup
+
+    def render(self, patchIDs, values, fill=np.nan):
+        """ Produce a raster of values for patches
+
+            @param patchIDs Sequence of patch IDs
+            @param values Sequence of values, one for each patch in patchIDs
+            @param fill Value of cells of patches lacking a value, and of null cells
+
+            @return 2-D numpy.ndarray<float> with the shape of the patch raster
+        """
+        return self.lookup(patchIDs, values, fill)[self.index]
+
+    def writeToGRASS(self, raster, mapName, overwrite=True):
+        """ Write a raster, e.g. as returned by render, to the current GRASS mapset.
+            NaN cells are written as null.
+
+            @param raster 2-D numpy.ndarray with the shape of the patch raster
+            @param mapName String representing the name of the raster to write
+            @param overwrite Boolean  If True, replace existing raster of the same name
+        """
+        from grass.script import array as garray
+        out = garray.array()
+        out[...] = raster
+        out.write(mapName, overwrite=overwrite)
+
+    def writeImage(self, raster, path, cmap=None, vmin=None, vmax=None):
+        """ Write a raster, e.g. as returned by render, to an image file (e.g.
+            PNG), one pixel per cell.  NaN cells are transparent.
+
+            @param raster 2-D numpy.ndarray with the shape of the patch raster
+            @param path String representing the path of the image file; the format
+            is determined by the extension
+            @param cmap String representing the name of a matplotlib color map
+            @param vmin Value mapped to the low end of the color map; defaults to
+            the minimum of raster
+            @param vmax Value mapped to the high end of the color map; defaults to
+            the maximum of raster
+        """
+        import matplotlib.pyplot as plt
+        plt.imsave(path, np.ma.masked_invalid(raster), cmap=cmap, vmin=vmin, vmax=vmax)
@@ -0,0 +1,305 @@
+"""@package rhessysworkflows.progress
+
+@brief Track progress of a RHESSys model run while it is running
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+The date RHESSys has simulated up to is taken from the last complete line of
+the daily output files of the model run (e.g. rhessys_basin.daily), whose
+first three columns are day, month, and year, and from dates printed by
+RHESSys on standard output.  A background thread polls these every few
+seconds, compares the date with the start and end dates of the model run,
+and writes the progress of the run, its throughput in simulated days per
+second, and an estimate of the time remaining to a status file (JSON) that
+other tools can poll.  The thread that copies standard output of RHESSys
+only records the last line it copied (see ProgressTracker.update), so
+tracking progress does not slow down the copy.
+"""
+import os
+import re
+import glob
+import json
+import time
+import datetime
+import threading
+
+STATUS_FILE = 'rhessys.status'
+
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+FMT_DATE = '%Y-%m-%d %H:%M:%S'
+
+# Number of bytes read from the end of a daily output file to find its last line
+_TAIL_SIZE = 8192
+# Year month day [hour], as printed by RHESSys on standard output
+_STDOUT_DATE = re.compile(r'(\d{4})\s+(\d{1,2})\s+(\d{1,2})(?:\s+(\d{1,2}))?\s*$')
+
+
+def _toDate(year, month, day):
+    try:
+        return datetime.datetime(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def dateFromDailyLine(line):
+    """ Parse the date of a line of RHESSys daily output
+
+        @param line String representing a line of daily output, whose first three
+        columns are day, month, and year
+
+        @return datetime.datetime, or None if the line is not a line of daily output
+    """
+    fields = line.split()
+    if len(fields) < 3:
+        return None
+    try:
+        (day, month, year) = [int(f) for f in fields[:3]]
+    except ValueError:
+        # e.g. the header line
+        return None
+    return _toDate(year, month, day)
+
+
+def dateFromStdoutLine(line):
+    """ Parse a date of the form "YYYY M D [H]" at the end of a line of RHESSys standard output
+
+        @return datetime.datetime, or None if the line does not end with a date
+    """
+    match = _STDOUT_DATE.search(line)
+    if not match:
+        return None
+    return _toDate(*match.groups()[:3])
+
+
+def lastDailyDate(path):
+    """ Find the date of the last complete line of a RHESSys daily output file,
+        without reading the entire file
+
+        @param path String representing the path of the daily output file
+
+        @return datetime.datetime, or None if the file does not exist or has no
+        complete lines of output
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - _TAIL_SIZE))
+            data = f.read().decode('latin-1')
+    except (IOError, OSError):
+        return None
+    # The last line may not have been completely written
+    lines = data.split('\n')[:-1]
+    for line in reversed(lines):
+        date = dateFromDailyLine(line)
+        if date is not None:
+            return date
+    return None
+
+
+def readStatus(path):
+    """ Read a status file written by ProgressTracker
+
+        @param path String representing the path of the status file
+
+        @return dict of status, or None if the status file does not exist
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError):
+        return None
+
+
+class ProgressTracker(object):
+    """ Track progress of a RHESSys model run, periodically writing its status
+        to a status file
+    """
+    def __init__(self, startDate, endDate, outputPrefix, statusPath, interval=5.0, outfp=None):
+        """ @param startDate datetime.datetime representing the start date of the model run
+            @param endDate datetime.datetime representing the end date of the model run
+            @param outputPrefix String representing the output prefix of the model run (i.e. the
+            path of output files, less '_basin.daily' etc.)
+            @param statusPath String representing the path of the status file to write
+            @param interval float representing the number of seconds between updates of the status file
+            @param outfp File object to which a line of progress is to be written at each update, or None
+        """
+        self.startDate = datetime.datetime(startDate.year, startDate.month, startDate.day)
+        self.endDate = datetime.datetime(endDate.year, endDate.month, endDate.day)
+        self.outputPrefix = outputPrefix
+        self.statusPath = statusPath
+        self.interval = interval
+        self.outfp = outfp
+        self.startTime = None
+        self.lastLine = None
+        self.date = None
+        # First date observed and the time it was observed, from which throughput is measured
+        self._first = None
+        self._dailyFiles = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def update(self, line):
+        """ Record a line of RHESSys standard output.  Only the line is
+            recorded; it is parsed by the polling thread.
+        """
+        self.lastLine = line
+
+    def _simulatedDate(self):
+        dates = []
+        if self.lastLine:
+            dates.append(dateFromStdoutLine(self.lastLine))
+        if not self._dailyFiles:
+            self._dailyFiles = sorted(glob.glob(self.outputPrefix + '_*.daily'))
+        for path in self._dailyFiles:
+            dates.append(lastDailyDate(path))
+        dates = [d for d in dates if d is not None and d >= self.startDate and d <= self.endDate]
+        if not dates:
+            return self.date
+        return max(dates)
+
+    def poll(self, now=None):
+        """ Determine the progress of the model run, and write it to the status file
+
+            @param now float representing the current time (as returned by time.time)
+
+            @return dict of status
+        """
+        if now is None:
+            now = time.time()
+        if self.startTime is None:
+            self.startTime = now
+        self.date = self._simulatedDate()
+        if self.date is not None and self._first is None:
+            self._first = (self.date, now)
+        return self.writeStatus(RUNNING, now)
+
+    def writeStatus(self, state, now=None, returncode=None):
+        """ Write the status of the model run to the status file
+
+            @param state String representing the state of the model run (one of RUNNING,
+            COMPLETED, FAILED)
+            @param now float representing the current time (as returned by time.time)
+            @param returncode int representing the return code of RHESSys, if it has exited
+
+            @return dict of status
+        """
+        if now is None:
+            now = time.time()
+        totalDays = (self.endDate - self.startDate).days
+        status = {'state': state,
+                  'pid': os.getpid(),
+                  'start_date': self.startDate.strftime(FMT_DATE),
+                  'end_date': self.endDate.strftime(FMT_DATE),
+                  'simulated_date': None,
+                  'simulated_days': 0,
+                  'total_days': totalDays,
+                  'fraction': 0.0,
+                  'days_per_second': None,
+                  'eta_seconds': None,
+                  'eta': None,
+                  'elapsed_seconds': now - (self.startTime or now),
+                  'updated': datetime.datetime.fromtimestamp(now).strftime(FMT_DATE),
+                  'returncode': returncode}
+        if state == COMPLETED:
+            self.date = self.endDate
+        if self.date is not None:
+            days = (self.date - self.startDate).days
+            status['simulated_date'] = self.date.strftime(FMT_DATE)
+            status['simulated_days'] = days
+            status['fraction'] = float(days) / totalDays if totalDays else 1.0
+            if self._first is not None and now > self._first[1]:
+                rate = (self.date - self._first[0]).days / (now - self._first[1])
+                if rate > 0:
+                    status['days_per_second'] = rate
+                    if state == RUNNING:
+                        status['eta_seconds'] = (totalDays - days) / rate
+                        status['eta'] = datetime.datetime.fromtimestamp(now + status['eta_seconds']).strftime(FMT_DATE)
+
+        # Write to a temporary file, then move into place, so readers never see a partial status
+        tmpPath = "%s.tmp%d" % (self.statusPath, os.getpid())
+        with open(tmpPath, 'w') as f:
+            json.dump(status, f, sort_keys=True)
+        os.rename(tmpPath, self.statusPath)
+
+        if self.outfp is not None and state == RUNNING:
+            self.outfp.write("\r%s" % (formatStatus(status),) )
+            self.outfp.flush()
+        return status
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except (IOError, OSError):
+                # Don't stop tracking if the status file can't be written once
+                pass
+
+    def start(self):
+        """ Start polling progress of the model run in a background thread """
+        self.startTime = time.time()
+        self.writeStatus(RUNNING, self.startTime)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, returncode):
+        """ Stop polling progress, and write the final status of the model run
+
+            @param returncode int representing the return code of RHESSys
+
+            @return dict of status
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if returncode == 0:
+            return self.writeStatus(COMPLETED, returncode=returncode)
+        self.date = self._simulatedDate()
+        return self.writeStatus(FAILED, returncode=returncode)
+
+
+def formatStatus(status):
+    """ @return String describing status written by ProgressTracker, e.g.
+        "2004-06-01 (45.2%), 12.3 simulated days/s, 0:05:10 remaining"
+    """
+    if status['simulated_date'] is None:
+        return "Starting"
+    text = "%s (%.1f%%)" % (status['simulated_date'].split()[0], 100.0 * status['fraction'])
+    if status['days_per_second'] is not None:
+        text += ", %.1f simulated days/s" % (status['days_per_second'],)
+    if status['eta_seconds'] is not None:
+        text += ", %s remaining" % (datetime.timedelta(seconds=int(status['eta_seconds'])),)
+    return text
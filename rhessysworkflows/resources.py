@@ -0,0 +1,321 @@
+"""@package rhessysworkflows.resources
+
+@brief Resource usage of RHESSys and related subprocesses
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+Resource usage (wall time, user and system CPU time, peak resident set size,
+bytes written, and size of output files) of a subprocess is measured by
+reaping the subprocess with os.wait4, rather than Popen.wait, see wait and
+communicate.  Usage of RHESSys model runs is recorded with the model run in
+the model run section of project metadata (see
+rhessysworkflows.metadata.ModelRun); usage of other subprocesses (e.g.
+lairead, grass2world, createflowpaths) is recorded as a ProcessRecord in the
+resources section of project metadata.
+"""
+import os, errno
+import sys
+import time
+import datetime
+import threading
+
+from rhessysworkflows.metadata import RHESSysMetadata
+from rhessysworkflows.metadata import ModelRun
+
+# Units of ru_maxrss: bytes on OS X, kilobytes elsewhere
+_MAXRSS_UNITS = 1 if sys.platform == 'darwin' else 1024
+# Units of ru_oublock
+_BLOCK_SIZE = 512
+
+
+class ResourceUsage(object):
+    """ Resource usage of a subprocess """
+
+    FIELDS = ['wall_time', 'user_time', 'system_time', 'max_rss', 'bytes_written', 'output_size']
+
+    def __init__(self, wallTime=None, userTime=None, systemTime=None, maxRSS=None,
+                 bytesWritten=None, outputSize=None):
+        """ @param wallTime float representing elapsed time, in seconds
+            @param userTime float representing user CPU time, in seconds
+            @param systemTime float representing system CPU time, in seconds
+            @param maxRSS int representing peak resident set size, in bytes
+            @param bytesWritten int representing bytes written to disk
+            @param outputSize int representing total size of output files, in bytes
+        """
+        self.wallTime = wallTime
+        self.userTime = userTime
+        self.systemTime = systemTime
+        self.maxRSS = maxRSS
+        self.bytesWritten = bytesWritten
+        self.outputSize = outputSize
+
+    @classmethod
+    def fromRusage(cls, rusage, wallTime):
+        return cls(wallTime=wallTime, userTime=rusage.ru_utime, systemTime=rusage.ru_stime,
+                   maxRSS=rusage.ru_maxrss * _MAXRSS_UNITS,
+                   bytesWritten=rusage.ru_oublock * _BLOCK_SIZE)
+
+    @property
+    def cpuTime(self):
+        """ User plus system CPU time, in seconds; None if CPU time was not measured """
+        if self.userTime is None and self.systemTime is None:
+            return None
+        return (self.userTime or 0.0) + (self.systemTime or 0.0)
+
+    def _values(self):
+        return [self.wallTime, self.userTime, self.systemTime, self.maxRSS, self.bytesWritten, self.outputSize]
+
+    def toEntries(self, keyProto):
+        """ @param keyProto String prefixed to each key
+            @return Tuple (list of keys, list of values) for writing to metadata
+        """
+        keys = []
+        values = []
+        for (field, value) in zip(ResourceUsage.FIELDS, self._values()):
+            if value is not None:
+                keys.append(keyProto + field)
+                values.append(repr(value) if isinstance(value, float) else str(value))
+        return (keys, values)
+
+    @classmethod
+    def fromEntries(cls, entries, keyProto):
+        """ @param entries dict of metadata entries
+            @param keyProto String prefixed to each key
+            @return ResourceUsage, or None if entries contain no usage for keyProto
+        """
+        values = []
+        for field in ResourceUsage.FIELDS:
+            value = entries.get(keyProto + field)
+            if value is not None:
+                value = float(value) if field.endswith('_time') else int(value)
+            values.append(value)
+        if all([v is None for v in values]):
+            return None
+        return cls(*values)
+
+
+# Measures of cost by which usage can be ranked, see rankByCost
+WALL = 'wall'
+CPU = 'cpu'
+RSS = 'rss'
+WRITTEN = 'written'
+OUTPUT = 'output'
+COSTS = [WALL, CPU, RSS, WRITTEN, OUTPUT]
+
+_COST_ATTR = {WALL: 'wallTime',
+              CPU: 'cpuTime',
+              RSS: 'maxRSS',
+              WRITTEN: 'bytesWritten',
+              OUTPUT: 'outputSize'}
+
+
+def rankByCost(items, cost=WALL):
+    """ Rank items by the cost of their resource usage, most costly first.
+        Items without usage, or without a measure of the cost, are ranked last.
+
+        @param items List of tuples, the last element of which is a ResourceUsage (or None)
+        @param cost String representing the measure of cost (one of COSTS)
+
+        @return New list of items, ranked by cost
+
+        @raise ValueError if cost is not a known measure of cost
+    """
+    if not cost in _COST_ATTR:
+        raise ValueError("Unknown measure of cost %s" % (cost,) )
+    attr = _COST_ATTR[cost]
+    def key(item):
+        usage = item[-1]
+        value = getattr(usage, attr) if usage is not None else None
+        return (value is not None, value or 0)
+    return sorted(items, key=key, reverse=True)
+
+
+def _reap(pid):
+    """ Wait for a child process, retrying if interrupted
+
+        @return Tuple (status, resource.struct_rusage)
+    """
+    while True:
+        try:
+            (pid, status, rusage) = os.wait4(pid, 0)
+            return (status, rusage)
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+
+
+def wait(process, startTime):
+    """ Wait for a subprocess to terminate, measuring its resource usage.
+        Use in place of Popen.wait.
+
+        @param process subprocess.Popen
+        @param startTime float representing the time (as returned by time.time)
+        the subprocess was started
+
+        @return ResourceUsage; the return code is set in process.returncode
+    """
+    (status, rusage) = _reap(process.pid)
+    usage = ResourceUsage.fromRusage(rusage, time.time() - startTime)
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    return usage
+
+
+def communicate(process, startTime):
+    """ Read standard output and standard error of a subprocess until it
+        terminates, measuring its resource usage.  Use in place of
+        Popen.communicate.
+
+        @param process subprocess.Popen
+        @param startTime float representing the time (as returned by time.time)
+        the subprocess was started
+
+        @return Tuple (stdout data, stderr data, ResourceUsage); the return
+        code is set in process.returncode
+    """
+    output = {}
+    def read(name, stream):
+        output[name] = stream.read()
+        stream.close()
+    # Read both streams at once so that the subprocess can't block writing
+    # to one while we read the other
+    readers = []
+    for (name, stream) in [('stdout', process.stdout), ('stderr', process.stderr)]:
+        if stream is not None:
+            reader = threading.Thread(target=read, args=(name, stream))
+            reader.daemon = True
+            reader.start()
+            readers.append(reader)
+    usage = wait(process, startTime)
+    for reader in readers:
+        reader.join()
+    return (output.get('stdout'), output.get('stderr'), usage)
+
+
+def outputSize(paths):
+    """ Compute total size of output files, and of the files in output directories
+
+        @param paths List of paths of files or directories; paths that do not exist are ignored
+
+        @return int representing size in bytes
+    """
+    size = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for (dirpath, dirnames, filenames) in os.walk(path):
+                for filename in filenames:
+                    size += os.path.getsize(os.path.join(dirpath, filename))
+        elif os.path.isfile(path):
+            size += os.path.getsize(path)
+    return size
+
+
+class ProcessRecord(object):
+    """ Resource usage of a subprocess other than a RHESSys model run,
+        recorded in the resources section of project metadata
+    """
+
+    PROCESSES = 'processes'
+    PREFIX = 'process'
+    FMT_DATE = ModelRun.FMT_DATE
+
+    def __init__(self, name=None, description=None, command=None, output=None, usage=None):
+        """ @param name String representing the name of the program (e.g. lairead)
+            @param description String describing what the subprocess did
+            @param command String representing the command line of the subprocess
+            @param output String representing the path, relative to the project directory,
+            of the output of the subprocess
+            @param usage ResourceUsage of the subprocess
+        """
+        self.id = None
+        self.name = name
+        self.description = description
+        self.command = command
+        self.output = output
+        self.usage = usage
+        self.date = datetime.datetime.utcnow()
+
+    @classmethod
+    def writeToMetadata(cls, context, records):
+        """ Record subprocesses in metadata, setting the ID of each
+
+            @param context Context object containing projectDir, the path of the project whose
+            metadata store is to be written to
+            @param records List of ProcessRecord
+        """
+        if not records:
+            return
+        entries = RHESSysMetadata.readResourceEntries(context)
+        ids = [i for i in entries.get(ProcessRecord.PROCESSES, '').split(RHESSysMetadata.VALUE_DELIM) if i]
+        number = len(ids)
+        keys = []
+        values = []
+        for record in records:
+            number += 1
+            record.id = "%s_%d" % (ProcessRecord.PREFIX, number)
+            keyProto = record.id + RHESSysMetadata.KEY_SEP
+            for (key, value) in [('name', record.name), ('description', record.description),
+                                 ('command', record.command), ('output', record.output),
+                                 ('date_utc', record.date.strftime(ProcessRecord.FMT_DATE))]:
+                if value is not None:
+                    keys.append(keyProto + key)
+                    values.append(value)
+            if record.usage:
+                (usageKeys, usageValues) = record.usage.toEntries(keyProto)
+                keys += usageKeys
+                values += usageValues
+            ids.append(record.id)
+        keys.append(ProcessRecord.PROCESSES)
+        values.append(RHESSysMetadata.VALUE_DELIM.join(ids))
+        RHESSysMetadata.writeResourceEntries(context, keys, values)
+
+    @classmethod
+    def readFromMetadata(cls, context):
+        """ @return List of ProcessRecord recorded in metadata, in the order they were recorded """
+        entries = RHESSysMetadata.readResourceEntries(context)
+        records = []
+        for i in entries.get(ProcessRecord.PROCESSES, '').split(RHESSysMetadata.VALUE_DELIM):
+            if not i:
+                continue
+            keyProto = i + RHESSysMetadata.KEY_SEP
+            record = cls(name=entries.get(keyProto + 'name'),
+                         description=entries.get(keyProto + 'description'),
+                         command=entries.get(keyProto + 'command'),
+                         output=entries.get(keyProto + 'output'),
+                         usage=ResourceUsage.fromEntries(entries, keyProto))
+            record.id = i
+            if keyProto + 'date_utc' in entries:
+                record.date = datetime.datetime.strptime(entries[keyProto + 'date_utc'], ProcessRecord.FMT_DATE)
+            records.append(record)
+        return records
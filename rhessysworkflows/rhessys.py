@@ -38,14 +38,201 @@ OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import os, errno
 import string
 from datetime import datetime
-from datetime import timedelta
-from collections import OrderedDict
+from collections import OrderedDict, deque
+import multiprocessing
 
+import numpy as np
 import pandas as pd
 
 from rhessysworkflows.metadata import RHESSysMetadata
+from rhessysworkflows.outputcache import OutputCache
+from rhessysworkflows.compression import openOutputFile, decompressing, isCompressed
 
 
+def _datetimeFromComponents(hour, day, month, year, startHour=1):
+    """ Construct a datetime from the date fields of a line of RHESSys output.
+        Fields absent from the output should be passed as None.
+    """
+    if hour and day and month and year:
+        return datetime(year, month, day, hour)
+    elif day and month and year:
+        return datetime(year, month, day, startHour)
+    elif month and year:
+        return datetime(year, month, 1)
+    elif year:
+        return datetime(year, 12, 31)
+    return None
+
+
+def _datetime64FromComponents(dates, startHour=1):
+    """ Construct dates from date columns of RHESSys output.  Follows the same 
+        conventions as _datetimeFromComponents: daily output is dated startHour, 
+        monthly output the first of the month, and yearly output December 31.
+        
+        @param dates dict<string, numpy.ndarray> of year, month, day, and (optionally)
+        hour columns
+        @param startHour Hour to use for daily output
+        
+        @return numpy.ndarray<datetime64[h]>
+    """
+    year = np.asarray(dates['year'], dtype=np.int64)
+    if 'month' in dates:
+        month = np.asarray(dates['month'], dtype=np.int64) - 1
+        day = np.asarray(dates['day'], dtype=np.int64) - 1 if 'day' in dates else 0
+    else:
+        (month, day) = (11, 30)
+    if 'hour' in dates:
+        hour = np.asarray(dates['hour'], dtype=np.int64)
+        hour = np.where(hour > 0, hour, startHour)
+    elif 'day' in dates:
+        hour = startHour
+    else:
+        hour = 0
+    
+    result = (year - 1970).astype('datetime64[Y]').astype('datetime64[M]')
+    result = (result + np.asarray(month).astype('timedelta64[M]')).astype('datetime64[D]')
+    result = (result + np.asarray(day).astype('timedelta64[D]')).astype('datetime64[h]')
+    return result + np.asarray(hour).astype('timedelta64[h]')
+
+
+def _splitHeader(header, sep):
+    """ Split the header line of RHESSys output into column names """
+    if ' ' == sep:
+        return header.split()
+    return [h.strip() for h in header.split(sep)]
+
+
+def _pandasSeparator(sep):
+    """ Translate a field separator into one suitable for pandas.read_csv, which
+        treats a single space literally rather than as a run of whitespace.
+    """
+    if ' ' == sep:
+        return r'\s+'
+    return sep
+
+
+def _tokenize(text, numCols, sep=' ', source=None):
+    """ Tokenize lines of numeric RHESSys output into a 2-D array with one row per line """
+    if ' ' != sep:
+        text = text.replace(sep, ' ')
+    values = np.fromstring(text, sep=' ')
+    # fromstring stops at the first field that is not a number, so check that
+    # every field of every line was read
+    numLines = text.count('\n')
+    if text and not text.endswith('\n'):
+        numLines += 1
+    if len(values) != numLines * numCols:
+        # Allow for blank lines
+        numLines = len([line for line in text.split('\n') if line.strip()])
+        if len(values) != numLines * numCols:
+            raise ValueError("Number of numeric fields in %s does not match header" % (source,) )
+    return values.reshape(-1, numCols)
+
+
+def _iterRowBlocks(f, numCols, sep=' ', blockSize=4*1024*1024, dateCols=(),
+                   startDate=None, dateOfRow=None):
+    """ Read and tokenize blocks of complete lines from a file.  The size of each
+        block grows so that it spans about two days of output, as determined by
+        the columns indexed by dateCols.  If startDate is not None, blocks whose 
+        last line is dated (by dateOfRow) before startDate are not tokenized, and 
+        None is yielded in their place.
+    """
+    source = getattr(f, 'name', None)
+    remainder = ''
+    while True:
+        block = f.read(blockSize)
+        if not block:
+            if not remainder.strip():
+                break
+            # Final line lacks a newline
+            block = '\n'
+        block = remainder + block
+        end = block.rfind('\n') + 1
+        if end == 0:
+            # Block does not contain a complete line, read more
+            remainder = block
+            continue
+        (text, remainder) = (block[:end], block[end:])
+        
+        if startDate is not None:
+            # Skip the block if its last line is before the start date
+            lastLine = _tokenize(text[text.rfind('\n', 0, end - 1) + 1:], numCols, sep, source)
+            if len(lastLine) and dateOfRow(lastLine[0]) < startDate:
+                yield None
+                continue
+        
+        rows = _tokenize(text, numCols, sep, source)
+        yield rows
+        
+        # Grow blocks to span about two days of output
+        if len(rows) and len(dateCols):
+            day = (rows[:,dateCols] == rows[-1,dateCols]).all(axis=1).sum()
+            blockSize = max(blockSize, 2 * len(text) * day // len(rows))
+
+
+def _parallelJobs(f, cache, jobs):
+    """ Number of processes that may be used to parse f; the lines of f can only be
+        divided among processes if f is an uncompressed file on disk
+    """
+    if not cache or isCompressed(f):
+        return 1
+    return jobs
+
+def _parseRowRange(args):
+    """ Tokenize the lines of a file lying in a range of bytes.  Run in worker 
+        processes by _iterRowBlocksParallel.
+        
+        @param args Tuple (path, start, stop, numCols, sep, patchCol, patchIDs)
+        
+        @return 2-D numpy.ndarray with one row per line
+    """
+    (path, start, stop, numCols, sep, patchCol, patchIDs) = args
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(stop - start)
+    if not isinstance(text, str):
+        text = text.decode('ascii')
+    rows = _tokenize(text, numCols, sep, path)
+    if patchIDs is not None:
+        rows = rows[ np.in1d(rows[:,patchCol], patchIDs) ]
+    return rows
+
+
+def _iterRowBlocksParallel(path, numCols, sep=' ', blockSize=4*1024*1024, jobs=2,
+                           patchCol=None, patchIDs=None):
+    """ Tokenize the lines of a file following the header in a pool of jobs
+        processes.  The file is divided into ranges of about blockSize bytes,
+        aligned to line boundaries.  Blocks are yielded in file order; at most
+        2 * jobs blocks are parsed ahead of the consumer.
+    """
+    size = os.path.getsize(path)
+    def ranges():
+        with open(path, 'rb') as f:
+            f.readline()
+            start = f.tell()
+            while start < size:
+                f.seek(min(start + blockSize, size))
+                f.readline()
+                stop = f.tell()
+                yield (path, start, stop, numCols, sep, patchCol, patchIDs)
+                start = stop
+    
+    pool = multiprocessing.Pool(jobs)
+    try:
+        pending = deque()
+        for task in ranges():
+            pending.append( pool.apply_async(_parseRowRange, (task,)) )
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+# Readers accept output files compressed with gzip, bzip2, xz, or zstd
+# (see rhessysworkflows.compression)
 class RHESSysOutput(object):
     
     TIME_STEP_HOURLY = 1
@@ -57,6 +244,25 @@ class RHESSysOutput(object):
     MONTH_HEADER = 'month'
     YEAR_HEADER = 'year'
     
+    PATCH_DAILY_BLOCK_SIZE = 4 * 1024 * 1024
+    
+    # Maximum number of files whose columns are cached by readColumnsFromFiles
+    COLUMN_CACHE_SIZE = 64
+    _columnCache = OrderedDict()
+    
+    @classmethod
+    def readHeader(cls, filepath, sep=" "):
+        """ Read the column headers of a RHESSys output file
+        
+            Arguments:
+            filepath -- string  The path of the RHESSys output file
+            sep -- The field separator (defaults to " ")
+            
+            Returns list<string> of column headers
+        """
+        with openOutputFile(filepath) as f:
+            return _splitHeader(f.readline().strip(), sep)
+    
     @classmethod
     def readObservedDataFromFile(cls, f, header=True, timeStep=TIME_STEP_DAILY, logger=None,
                                  readHour=True):
@@ -79,40 +285,35 @@ class RHESSysOutput(object):
             Returns tuple (list<datetime.datetime>, list<float>)
             Returns tuple (empty list, list<float>) if header is false  
             Returns tuple of empty lists if there were no data.
+            
+            Raises ValueError if a line does not hold a single number
         """
         assert(timeStep in RHESSysOutput.TIME_STEPS)
+        with decompressing(f) as f:
+            date_list = []
+            startDate = None
         
-        date_list = []
-        obs_data = []
-        tmpDate = None
-        delta = None
-        
-        if header:
-            headerData = f.readline().split()
-            if readHour:
-                tmpDate = datetime(int(headerData[0]), int(headerData[1]), 
-                                   int(headerData[2]), int(headerData[3]) )
-            else:
-                tmpDate = datetime(int(headerData[0]), int(headerData[1]), 
-                                   int(headerData[2]) )
-                
-            if timeStep == RHESSysOutput.TIME_STEP_HOURLY:
-                delta = timedelta(hours=1)
-            else:
-                delta = timedelta(days=1)
-            if logger:
-                logger.debug("Observed timeseries begin date: %s" % (str(tmpDate),) )
-           
-        data = f.readline()
-        while data:
-            obs_data.append(float(data))
             if header:
-                date_list.append(tmpDate)
-                tmpDate = tmpDate + delta
-            
-            data = f.readline()
+                headerData = f.readline().split()
+                if readHour:
+                    startDate = datetime(int(headerData[0]), int(headerData[1]), 
+                                         int(headerData[2]), int(headerData[3]) )
+                else:
+                    startDate = datetime(int(headerData[0]), int(headerData[1]), 
+                                         int(headerData[2]) )
+                if logger:
+                    logger.debug("Observed timeseries begin date: %s" % (str(startDate),) )
+        
+            obs_data = _tokenize(f.read(), 1, source=getattr(f, 'name', None))[:,0]
+            if header:
+                if timeStep == RHESSysOutput.TIME_STEP_HOURLY:
+                    delta = np.timedelta64(1, 'h')
+                else:
+                    delta = np.timedelta64(24, 'h')
+                dates = np.datetime64(startDate, 'h') + np.arange(len(obs_data)) * delta
+                date_list = dates.astype(object).tolist()
 
-        return (date_list, obs_data)
+            return (date_list, obs_data.tolist())
 
     @classmethod
     def readColumnsFromFile(cls, f, column_names, sep=' ', logger=None,
@@ -137,36 +338,26 @@ class RHESSysOutput(object):
         cols = cols + [RHESSysOutput.DAY_HEADER, 
                  RHESSysOutput.MONTH_HEADER, 
                  RHESSysOutput.YEAR_HEADER]
-        df = pd.read_csv(f, sep=' ', usecols=cols)
-        # Build index
-        time_stamps = None
-        try:
-            time_stamps = df[RHESSysOutput.YEAR_HEADER].apply(str)
-            df = df.drop(RHESSysOutput.YEAR_HEADER, 1)
-        except KeyError:
-            raise Exception('Data file lacks year column')
-        try:
-            time_stamps += '/' + df[RHESSysOutput.MONTH_HEADER].apply(str)
-            df = df.drop(RHESSysOutput.MONTH_HEADER, 1)
-        except KeyError:
-            raise Exception('Data file lacks month column')
-        try:
-            time_stamps += '/' + df[RHESSysOutput.DAY_HEADER].apply(str)
-            df = df.drop(RHESSysOutput.DAY_HEADER, 1)
-        except KeyError:
-            raise Exception('Data file lacks day column')
-        try:
-            time_stamps += ' ' + df[RHESSysOutput.HOUR_HEADER].apply(str) + '00:00'
-            df = df.drop(RHESSysOutput.HOUR_HEADER, 1)
-        except KeyError:
-            pass
-        
-        dates = [pd.to_datetime(date) for date in time_stamps]
-        datesDf = pd.DataFrame(dates, columns=['datetime'])
+        with decompressing(f) as f:
+            cache = OutputCache.forFile(f)
+            if cache and cache.isCurrent() and cache.hasColumns(cols):
+                df = pd.DataFrame( cls._readRowsFromCache(cache, cols) )
+            else:
+                df = pd.read_csv(f, sep=' ', usecols=cols)
+            # Build index
+            dates = {}
+            for col in [RHESSysOutput.YEAR_HEADER, RHESSysOutput.MONTH_HEADER, 
+                        RHESSysOutput.DAY_HEADER]:
+                if not col in df:
+                    raise Exception("Data file lacks %s column" % (col,) )
+                dates[col] = df[col].values
+            if RHESSysOutput.HOUR_HEADER in df:
+                dates[RHESSysOutput.HOUR_HEADER] = df[RHESSysOutput.HOUR_HEADER].values
+            df = df.drop([col for col in dates], axis=1)
         
-        df = datesDf.join(df, how='inner')
-        df = df.set_index('datetime')
-        return df
+            df.index = pd.DatetimeIndex(_datetime64FromComponents(dates, startHour=0), 
+                                        name='datetime')
+            return df
    
 
     @classmethod
@@ -188,64 +379,151 @@ class RHESSysOutput(object):
         date_list = []
         col_data = []
 
-        # Read the header line
-        header = f.readline()
-        headers = string.split(header, sep)
-        col_idx = -1
-        hour_idx = -1
-        day_idx = -1
-        month_idx = -1
-        year_idx = -1
-        col_found = False
-        # Find column_name in headers
-        for (counter, col) in enumerate(headers):
-            if col == column_name:
-                col_idx = counter
-                col_found = True
-            elif col == RHESSysOutput.HOUR_HEADER:
-                hour_idx = counter
-            elif col == RHESSysOutput.DAY_HEADER:
-                day_idx = counter
-            elif col == RHESSysOutput.MONTH_HEADER:
-                month_idx = counter
-            elif col == RHESSysOutput.YEAR_HEADER:
-                year_idx = counter
-            
-        # We found column_name, read the data
-        if col_found:
-            data = f.readline()
-            while data:
-                hour = day = month = year = None
-                cols = string.split(data, sep)
-                # Get data
-                col_data.append(float(cols[col_idx]))
-                # Get datetime
-                if hour_idx >= 0:
-                    hour = int(cols[hour_idx])
-                if day_idx >= 0:
-                    day = int(cols[day_idx])
-                if month_idx >= 0:
-                    month = int(cols[month_idx])
-                if year_idx >= 0:
-                    year = int(cols[year_idx])
-                # Construct date object
-                tmpDate = None
-                if hour and day and month and year:
-                    tmpDate = datetime(year, month, day, hour)
-                elif day and month and year:
-                    tmpDate = datetime(year, month, day, startHour)
-                elif month and year:
-                    tmpDate = datetime(year, month, 1)
-                elif year:
-                    tmpDate = datetime(year, 12, 31)
-                date_list.append(tmpDate)
-                
-                data = f.readline()
-
-        return (date_list, col_data)
+        with decompressing(f) as f:
+            cache = OutputCache.forFile(f)
+            if cache and cache.isCurrent():
+                if not column_name in cache.headers:
+                    return (date_list, col_data)
+                dateCols = [c for c in OutputCache.DATE_COLUMNS if c in cache.headers]
+                rows = cls._readRowsFromCache(cache, [column_name] + dateCols)
+            else:
+                # Read the header line
+                headers = _splitHeader(f.readline().strip(), sep)
+                if not column_name in headers:
+                    return (date_list, col_data)
+                dateCols = [c for c in OutputCache.DATE_COLUMNS if c in headers]
+                df = pd.read_csv(f, sep=_pandasSeparator(sep), header=None, names=headers,
+                                 usecols=[column_name] + dateCols)
+                rows = dict( [(col, df[col].values) for col in [column_name] + dateCols] )
+        
+            col_data = np.asarray(rows[column_name], dtype=float).tolist()
+            if RHESSysOutput.YEAR_HEADER in rows:
+                dates = _datetime64FromComponents(rows, startHour)
+                date_list = dates.astype(object).tolist()
+            else:
+                date_list = [None] * len(col_data)
+            return (date_list, col_data)
 
     @classmethod
-    def readColumnsFromPatchDailyFile(cls, f, column_names, sep=" "):
+    def readColumnsFromFiles(cls, filepaths, column_names, sep=" ", startHour=1,
+                             align=True):
+        """ Reads the specified columns from each of a list of text files, parsing 
+            each file at most once.  Files must have a header.  Reads dates/datetime 
+            from each file by searching for headers with names of 'hour', 'day', 
+            'month', 'year'.  Columns of each file are cached in memory, keyed by the
+            path and modification time of the file, so that reading columns again
+            from an unchanged file does not require the file to be parsed again (see 
+            COLUMN_CACHE_SIZE).
+            
+            Arguments:
+            filepaths -- List of strings representing paths of the files to read
+            column_names -- List of the names of the columns to return
+            sep -- The field separator (defaults to " ")
+            startHour -- Hour to use for daily data
+            align -- If True, align the files to the dates common to all of them
+            
+            Returns tuple (numpy.ndarray<datetime64>, list<dict<string, numpy.ndarray>>),
+            where the first element is the dates common to all files, and the second
+            element has, for each file, a dict mapping each column name found in the 
+            file to an array of values for those dates.  Arrays are read-only.
+            If align is False, the first element is instead a list with the dates
+            of each file, and the values of each file are for all of its dates.
+            
+            Raises ValueError if a file lacks a year column
+        """
+        fileData = [cls._readColumnsFromFileCached(path, column_names, sep, startHour) \
+                    for path in filepaths]
+        if not align:
+            return ([fileDates for (fileDates, columns) in fileData],
+                    [dict( [(col, columns[col]) for col in column_names if col in columns] ) \
+                     for (fileDates, columns) in fileData])
+        if not len(fileData):
+            return (np.array([], dtype='datetime64[h]'), [])
+        
+        # Align files to dates common to all
+        dates = fileData[0][0]
+        for (fileDates, columns) in fileData[1:]:
+            dates = np.intersect1d(dates, fileDates)
+        
+        data = []
+        for (fileDates, columns) in fileData:
+            if len(fileDates) == len(dates) and np.array_equal(fileDates, dates):
+                data.append( dict( [(col, columns[col]) for col in column_names if col in columns] ) )
+                continue
+            idx = np.searchsorted(fileDates, dates)
+            aligned = {}
+            for col in column_names:
+                if col in columns:
+                    aligned[col] = columns[col][idx]
+                    aligned[col].flags.writeable = False
+            data.append(aligned)
+        return (dates, data)
+    
+    @classmethod
+    def _readColumnsFromFileCached(cls, filepath, column_names, sep=" ", startHour=1):
+        """ Read columns from a file, via the in-memory column cache
+        
+            Returns tuple (numpy.ndarray<datetime64>, dict<string, numpy.ndarray>) where
+            dates are sorted
+        """
+        filepath = os.path.abspath(filepath)
+        stat = os.stat(filepath)
+        key = (filepath, stat.st_mtime, stat.st_size, sep, startHour)
+        
+        entry = cls._columnCache.pop(key, None)
+        if entry is None or not set(column_names).issubset(entry[2]):
+            # Read all columns requested previously along with those requested now
+            requested = set(column_names)
+            if entry is not None:
+                requested |= entry[2]
+            (dates, columns) = cls._readColumnsFromFileUncached(filepath, list(requested), 
+                                                                sep, startHour)
+            entry = (dates, columns, requested)
+        
+        # Most recently used entries are last
+        cls._columnCache[key] = entry
+        while len(cls._columnCache) > cls.COLUMN_CACHE_SIZE:
+            cls._columnCache.popitem(last=False)
+        return entry[:2]
+    
+    @classmethod
+    def _readColumnsFromFileUncached(cls, filepath, column_names, sep=" ", startHour=1):
+        """ Read columns from a file, using the binary cache of the file if a current
+            one exists
+            
+            Returns tuple (numpy.ndarray<datetime64>, dict<string, numpy.ndarray>) where
+            dates are sorted
+        """
+        cache = OutputCache(filepath)
+        if cache.isCurrent():
+            headers = cache.headers
+            found = [col for col in column_names if col in headers]
+            dateCols = [col for col in OutputCache.DATE_COLUMNS if col in headers]
+            rows = cls._readRowsFromCache(cache, found + dateCols)
+        else:
+            with openOutputFile(filepath) as f:
+                headers = _splitHeader(f.readline().strip(), sep)
+                found = [col for col in column_names if col in headers]
+                dateCols = [col for col in OutputCache.DATE_COLUMNS if col in headers]
+                df = pd.read_csv(f, sep=_pandasSeparator(sep), header=None, names=headers,
+                                 usecols=found + dateCols)
+            rows = dict( [(col, df[col].values) for col in found + dateCols] )
+        
+        if not RHESSysOutput.YEAR_HEADER in rows:
+            raise ValueError("Data file %s lacks year column" % (filepath,) )
+        dates = _datetime64FromComponents(rows, startHour)
+        order = np.argsort(dates, kind='mergesort')
+        columns = {}
+        for col in found:
+            columns[col] = np.asarray(rows[col], dtype=float)[order]
+            columns[col].flags.writeable = False
+        dates = dates[order]
+        dates.flags.writeable = False
+        return (dates, columns)
+    
+    @classmethod
+    def readColumnsFromPatchDailyFile(cls, f, column_names, sep=" ", startDate=None,
+                                      endDate=None, patchIDs=None, jobs=1):
         """ Reads the specified columns of data from a RHESSys patch daily output 
             file.  The file must have a header.  Reads dates/datetime from file by searching
             for headers with names of 'hour', 'day', 'month', 'year'
@@ -254,89 +532,541 @@ class RHESSysOutput(object):
             f -- file object  The text file to read from
             column_names -- List of the names of the columns to return
             sep -- The field separator (defaults to " ")
+            startDate -- datetime.datetime  If not None, skip lines before this date
+            endDate -- datetime.datetime  If not None, stop reading after this date
+            patchIDs -- Collection of patch IDs  If not None, skip lines for other patches
+            jobs -- Number of processes to use to parse the file (see iterPatchDailyFile)
 
             Returns collection.OrderedDict<datetime.datetime, dict<string, list<float>>, 
             where the value dict for each datetime key uses column_name as its key.  
             Returns An empty dict if data for the specified columns were not found.
+            
+            If a current binary cache of the file exists (see cacheOutputFile), data
+            will be read from the cache rather than parsed from the file.
         """
         returnDict = OrderedDict()
 
-        col_idx = {}
-        found = False
+        with decompressing(f) as f:
+            cache = OutputCache.forFile(f)
+            if cache and cache.isCurrent() and cache.isPatchCube:
+                return cls._readPatchDictFromCache(cache, column_names, startDate, endDate, patchIDs)
+            if _parallelJobs(f, cache, jobs) > 1:
+                return cls._readPatchDictParallel(f, column_names, sep, startDate, endDate,
+                                                  patchIDs, jobs)
 
-        # Read the header line
-        header = f.readline().strip()
-        if ' ' == sep:
-            headers = string.split(header)
-        else:
-            headers = string.split(header, sep)
-        hour_idx = -1
-        day_idx = -1
-        month_idx = -1
-        year_idx = -1
-        # Find column_name in headers
-        for (counter, col) in enumerate(headers):
-            if col in column_names:
-                col_idx[col] = counter
-                found = True
-            elif col == RHESSysOutput.HOUR_HEADER:
-                hour_idx = counter
-            elif col == RHESSysOutput.DAY_HEADER:
-                day_idx = counter
-            elif col == RHESSysOutput.MONTH_HEADER:
-                month_idx = counter
-            elif col == RHESSysOutput.YEAR_HEADER:
-                year_idx = counter
+            col_idx = {}
+            found = False
+
+            # Read the header line
+            header = f.readline().strip()
+            if ' ' == sep:
+                headers = string.split(header)
+            else:
+                headers = string.split(header, sep)
+            hour_idx = -1
+            day_idx = -1
+            month_idx = -1
+            year_idx = -1
+            patch_idx = -1
+            if patchIDs is not None:
+                patchIDs = set( [int(p) for p in patchIDs] )
+            # Find column_name in headers
+            for (counter, col) in enumerate(headers):
+                if col == OutputCache.PATCH_ID:
+                    patch_idx = counter
+                if col in column_names:
+                    col_idx[col] = counter
+                    found = True
+                elif col == RHESSysOutput.HOUR_HEADER:
+                    hour_idx = counter
+                elif col == RHESSysOutput.DAY_HEADER:
+                    day_idx = counter
+                elif col == RHESSysOutput.MONTH_HEADER:
+                    month_idx = counter
+                elif col == RHESSysOutput.YEAR_HEADER:
+                    year_idx = counter
             
-        # We found column_name, read the data
-        if found:
-            data = f.readline().strip()
-            while data and data != '':
-                hour = day = month = year = None
-                if ' ' == sep:
-                    cols = string.split(data)
-                else:
-                    cols = string.split(data, sep)
-                if not len(cols): break;
-                # Get datetime
-                if hour_idx >= 0:
-                    hour = int(cols[hour_idx])
-                if day_idx >= 0:
-                    day = int(cols[day_idx])
-                if month_idx >= 0:
-                    month = int(cols[month_idx])
-                if year_idx >= 0:
-                    year = int(cols[year_idx])
-                # Construct date object
-                tmpDate = None
-                if hour and day and month and year:
-                    tmpDate = datetime(year, month, day, hour)
-                elif day and month and year:
-                    tmpDate = datetime(year, month, day, 1)
-                elif month and year:
-                    tmpDate = datetime(year, month, 1)
-                elif year:
-                    tmpDate = datetime(year, 12, 31)
+            # We found column_name, read the data
+            if found:
+                data = f.readline().strip()
+                while data and data != '':
+                    hour = day = month = year = None
+                    if ' ' == sep:
+                        cols = string.split(data)
+                    else:
+                        cols = string.split(data, sep)
+                    if not len(cols): break;
+                    # Get datetime
+                    if hour_idx >= 0:
+                        hour = int(cols[hour_idx])
+                    if day_idx >= 0:
+                        day = int(cols[day_idx])
+                    if month_idx >= 0:
+                        month = int(cols[month_idx])
+                    if year_idx >= 0:
+                        year = int(cols[year_idx])
+                    # Construct date object
+                    tmpDate = _datetimeFromComponents(hour, day, month, year)
+                    if endDate and tmpDate > endDate:
+                        break
+                    if (startDate and tmpDate < startDate) or \
+                       (patchIDs is not None and int(cols[patch_idx]) not in patchIDs):
+                        data = f.readline()
+                        continue
                     
-                try:
-                    dataForDate = returnDict[tmpDate]
-                except KeyError:
-                    dataForDate = {}
-                    returnDict[tmpDate] = dataForDate
-                 
-                # Get data
-                for key in col_idx:
                     try:
-                        tmpData = dataForDate[key]
+                        dataForDate = returnDict[tmpDate]
                     except KeyError:
-                        tmpData = []
-                        dataForDate[key] = tmpData
-                    # TODO: intelligently handle different types    
-                    tmpData.append( float(cols[ col_idx[key] ]) )
+                        dataForDate = {}
+                        returnDict[tmpDate] = dataForDate
+                 
+                    # Get data
+                    for key in col_idx:
+                        try:
+                            tmpData = dataForDate[key]
+                        except KeyError:
+                            tmpData = []
+                            dataForDate[key] = tmpData
+                        # TODO: intelligently handle different types    
+                        tmpData.append( float(cols[ col_idx[key] ]) )
                 
-                data = f.readline()
+                    data = f.readline()
+
+            return (returnDict)
 
-        return (returnDict)
+    @classmethod
+    def cacheOutputFile(cls, filepath, sep=" ", force=False):
+        """ Convert a RHESSys output file into a column-oriented binary cache stored
+            alongside the file (see rhessysworkflows.outputcache).  Once a cache
+            exists, readers in this class will use it in place of parsing the
+            text file, for as long as the text file is unchanged.
+            
+            Arguments:
+            filepath -- string  The path of the RHESSys output file to cache
+            sep -- The field separator (defaults to " ")
+            force -- boolean  Rebuild the cache even if it is current
+            
+            Returns rhessysworkflows.outputcache.OutputCache
+            
+            Raises ValueError if a patch appears more than once for a time step
+            Raises IOError if the cache cannot be written
+        """
+        cache = OutputCache(filepath)
+        if not force and cache.isCurrent():
+            return cache
+        
+        with openOutputFile(filepath) as f:
+            df = pd.read_csv(f, sep=_pandasSeparator(sep))
+        headers = list(df.columns)
+        
+        if not OutputCache.PATCH_ID in df:
+            columns = dict( [(col, df[col].values) for col in headers] )
+            cache.write(headers, columns, sep=sep)
+            return cache
+        
+        (columns, present) = cls._tableToCube(df, headers, filepath)
+        cache.write(headers, columns, present=present, sep=sep)
+        return cache
+    
+    @classmethod
+    def _tableToCube(cls, df, column_names, source=None):
+        """ Arrange the lines of patch-scale output into one (time steps x patches)
+            array per column.  Date columns are returned as 1-D arrays with one
+            element per time step, patchID as a sorted 1-D array with one element
+            per patch.  Elements for patches that lack output for a time step are 
+            set to NaN.
+            
+            Arguments:
+            df -- pandas.DataFrame  Lines of patch-scale output, including 
+                                    patchID and date columns
+            column_names -- List of the names of the columns to arrange
+            source -- Name of the source of the output, used in error messages
+            
+            Returns tuple (dict<string, numpy.ndarray>, numpy.ndarray<bool>), where the
+            second element indicates which patches had output for each time step, or 
+            is None if all patches had output for all time steps.
+            
+            Raises ValueError if a patch appears more than once for a time step
+        """
+        columns = {}
+        present = None
+        
+        # Index each line by time step and patch
+        dateKey = np.zeros(len(df), dtype=np.int64)
+        for (i, col) in enumerate(reversed(OutputCache.DATE_COLUMNS)):
+            if col in df:
+                dateKey += df[col].values.astype(np.int64) * (100 ** i)
+        (dateKeys, firstRow, dateIdx) = np.unique(dateKey, return_index=True, return_inverse=True)
+        (patchIDs, patchIdx) = np.unique(df[OutputCache.PATCH_ID].values.astype(np.int64), 
+                                         return_inverse=True)
+        shape = (len(dateKeys), len(patchIDs))
+        
+        cell = dateIdx * shape[1] + patchIdx
+        if len(np.unique(cell)) != len(cell):
+            raise ValueError("Patch IDs are not unique within each time step of %s" % (source,) )
+        if len(cell) != shape[0] * shape[1]:
+            present = np.zeros(shape, dtype=bool)
+            present[dateIdx, patchIdx] = True
+        
+        for col in OutputCache.DATE_COLUMNS:
+            if col in df:
+                columns[col] = df[col].values[firstRow]
+        columns[OutputCache.PATCH_ID] = patchIDs
+        for col in column_names:
+            if col in columns:
+                continue
+            cube = np.empty(shape)
+            cube.fill(np.nan)
+            cube[dateIdx, patchIdx] = df[col].values
+            columns[col] = cube
+        
+        return (columns, present)
+    
+    @classmethod
+    def readPatchDailyCube(cls, f, column_names, sep=" ", startDate=None, endDate=None,
+                           patchIDs=None, jobs=1):
+        """ Reads the specified columns of data from a RHESSys patch daily output 
+            file into dense arrays.  The file must have a header.  Reads dates from
+            file by searching for headers with names of 'hour', 'day', 'month', 'year'.
+            Uses the binary cache of the file if a current one exists (see cacheOutputFile).
+        
+            Arguments:
+            f -- file object  The text file to read from
+            column_names -- List of the names of the columns to return; 'patchID'
+                            and date columns are ignored as they form the axes of
+                            the arrays returned
+            sep -- The field separator (defaults to " ")
+            startDate -- datetime.datetime  If not None, skip days before this date
+            endDate -- datetime.datetime  If not None, stop reading after this date
+            patchIDs -- Collection of patch IDs  If not None, only return output for
+                        these patches
+            jobs -- Number of processes to use to parse the file (see iterPatchDailyFile)
+
+            Returns tuple (numpy.ndarray<datetime64>, numpy.ndarray<int>, dict<string, numpy.ndarray>),
+            where the first element is the date of each time step, the second 
+            element is the sorted ID of each patch, and the third element maps each 
+            column name found in the file to a 2-D array of shape (time steps, patches).
+            Elements for patches lacking output for a time step are NaN.  Arrays may be
+            read-only memory maps of the cache.  When reading from the text file with
+            patchIDs specified, days with no output for any of these patches are omitted.
+        """
+        variables = [col for col in column_names if col != OutputCache.PATCH_ID \
+                     and not col in OutputCache.DATE_COLUMNS]
+        
+        with decompressing(f) as f:
+            cache = OutputCache.forFile(f)
+            if cache and cache.isCurrent() and cache.isPatchCube:
+                found = [col for col in variables if col in cache.headers]
+                if startDate is None and endDate is None and patchIDs is None:
+                    dates = _datetime64FromComponents(cache.readDateColumns())
+                    ids = np.asarray(cache.readColumn(OutputCache.PATCH_ID))
+                    cube = dict( [(col, cache.readColumn(col)) for col in found] )
+                else:
+                    (dates, dateSlice, ids, patchIdx) = \
+                        cls._selectFromCache(cache, startDate, endDate, patchIDs)
+                    cube = dict( [(col, cache.readColumn(col)[dateSlice][:,patchIdx]) \
+                                  for col in found] )
+                return (dates, ids, cube)
+        
+            headers = _splitHeader(f.readline().strip(), sep)
+            found = [col for col in variables if col in headers]
+            jobs = _parallelJobs(f, cache, jobs)
+            if startDate is None and endDate is None and patchIDs is None and jobs <= 1:
+                usecols = [col for col in headers if col in found or col == OutputCache.PATCH_ID \
+                           or col in OutputCache.DATE_COLUMNS]
+                df = pd.read_csv(f, sep=_pandasSeparator(sep), header=None, names=headers,
+                                 usecols=usecols)
+            else:
+                days = [rows for (date, rows) in cls._iterPatchDailyRows(f, headers, sep,
+                                                                          startDate=startDate,
+                                                                          endDate=endDate,
+                                                                          patchIDs=patchIDs,
+                                                                          jobs=jobs)]
+                rows = np.empty( (0, len(headers)) )
+                if len(days):
+                    rows = np.vstack(days)
+                df = pd.DataFrame(rows, columns=headers)
+            (columns, present) = cls._tableToCube(df, found, getattr(f, 'name', None))
+            dates = dict( [(col, columns[col]) for col in OutputCache.DATE_COLUMNS \
+                           if col in columns] )
+            cube = dict( [(col, columns[col]) for col in found] )
+        
+            return (_datetime64FromComponents(dates), columns[OutputCache.PATCH_ID], cube)
+    
+    @classmethod
+    def iterPatchDailyFile(cls, f, column_names, sep=" ", blockSize=PATCH_DAILY_BLOCK_SIZE,
+                           startDate=None, endDate=None, patchIDs=None, jobs=1):
+        """ Iterate over the days of a RHESSys patch daily output file, one day
+            at a time.  The file must have a header.  The file is read in blocks,
+            with the size of each block growing to span about two days of output, so
+            that memory use stays proportional to the output of a single day rather
+            than to the length of the file.  Uses the binary cache of the file if a 
+            current one exists (see cacheOutputFile).
+            
+            Lines for a given day must be contiguous in the file, and days must 
+            be in chronological order, as they are in output written by RHESSys.
+        
+            Arguments:
+            f -- file object  The text file to read from
+            column_names -- List of the names of the columns to return; 'patchID'
+                            and date columns are ignored as they are returned 
+                            separately
+            sep -- The field separator (defaults to " ")
+            blockSize -- Initial number of bytes to read at a time
+            startDate -- datetime.datetime  If not None, skip days before this date
+            endDate -- datetime.datetime  If not None, stop reading after this date
+            patchIDs -- Collection of patch IDs  If not None, only return output for
+                        these patches; days with no output for any of these patches
+                        are skipped
+            jobs -- Number of processes to use to parse the file.  If greater than 1,
+                    the file is divided into blocks of about blockSize bytes, aligned
+                    to line boundaries, which are parsed in parallel by a pool of 
+                    processes.  Ignored if f is not associated with an uncompressed
+                    file on disk.
+
+            Yields tuple (numpy.datetime64, numpy.ndarray<int>, dict<string, numpy.ndarray>),
+            where the first element is the date, the second element is the sorted ID of
+            each patch with output for that date, and the third element maps each column 
+            name found in the file to a 1-D array of values, one per patch.
+            
+            Raises ValueError if a line does not have the same number of fields as the header
+        """
+        variables = [col for col in column_names if col != OutputCache.PATCH_ID \
+                     and not col in OutputCache.DATE_COLUMNS]
+        
+        with decompressing(f) as f:
+            cache = OutputCache.forFile(f)
+            if cache and cache.isCurrent() and cache.isPatchCube:
+                found = [col for col in variables if col in cache.headers]
+                (dates, dateSlice, selectedIDs, patchIdx) = \
+                    cls._selectFromCache(cache, startDate, endDate, patchIDs)
+                present = cache.readPresent()
+                data = dict( [(col, cache.readColumn(col)) for col in found] )
+                for (i, date) in zip(range(dateSlice.start, dateSlice.stop), dates):
+                    sel = slice(None)
+                    if present is not None:
+                        sel = np.asarray(present[i])[patchIdx]
+                    idx = patchIdx[sel]
+                    if not len(idx):
+                        continue
+                    yield (date, selectedIDs[sel], 
+                           dict( [(col, np.array(data[col][i][idx])) for col in found] ))
+                return
+        
+            headers = _splitHeader(f.readline().strip(), sep)
+            found = [col for col in variables if col in headers]
+            patchCol = headers.index(OutputCache.PATCH_ID)
+        
+            jobs = _parallelJobs(f, cache, jobs)
+            for (date, rows) in cls._iterPatchDailyRows(f, headers, sep, blockSize,
+                                                        startDate, endDate, patchIDs, jobs):
+                rows = rows[ np.argsort(rows[:,patchCol], kind='mergesort') ]
+                yield (date, rows[:,patchCol].astype(np.int64),
+                       dict( [(col, rows[:,headers.index(col)]) for col in found] ))
+    
+    @classmethod
+    def _iterPatchDailyRows(cls, f, headers, sep=" ", blockSize=PATCH_DAILY_BLOCK_SIZE,
+                            startDate=None, endDate=None, patchIDs=None, jobs=1):
+        """ Tokenize the lines of a RHESSys patch daily output file following the
+            header, one day at a time.  Blocks lying wholly before startDate are 
+            skipped without being tokenized, lines for patches not in patchIDs are
+            dropped as soon as they are tokenized, and reading stops at the first 
+            day after endDate.
+            
+            Arguments:
+            f -- file object  The text file to read from, positioned after the header
+            headers -- List of column headers of the file
+            jobs -- Number of processes to use to tokenize blocks; if greater than 1, 
+                    f must be associated with an uncompressed file on disk
+            
+            See iterPatchDailyFile for other arguments.
+            
+            Yields tuple (numpy.datetime64, numpy.ndarray), where the second element
+            is a 2-D array with one row per line and one column per header.
+        """
+        numCols = len(headers)
+        dateIdx = [(col, headers.index(col)) for col in OutputCache.DATE_COLUMNS if col in headers]
+        patchCol = headers.index(OutputCache.PATCH_ID)
+        if startDate is not None:
+            startDate = np.datetime64(startDate, 'us')
+        if endDate is not None:
+            endDate = np.datetime64(endDate, 'us')
+        if patchIDs is not None:
+            patchIDs = np.asarray(list(patchIDs))
+        
+        def dateOfRow(row):
+            dates = dict( [(col, row[i:i+1]) for (col, i) in dateIdx] )
+            return _datetime64FromComponents(dates)[0]
+        
+        if jobs > 1:
+            blocks = _iterRowBlocksParallel(f.name, numCols, sep, blockSize, jobs, 
+                                            patchCol, patchIDs)
+        else:
+            blocks = _iterRowBlocks(f, numCols, sep, blockSize, [i for (col, i) in dateIdx],
+                                    startDate=startDate, dateOfRow=dateOfRow)
+        
+        carry = np.empty( (0, numCols) )
+        try:
+            for rows in blocks:
+                if rows is None:
+                    # Block was skipped, discard partial day
+                    carry = np.empty( (0, numCols) )
+                    continue
+                rows = np.vstack( (carry, rows) )
+                if not len(rows):
+                    continue
+                
+                # Day boundaries occur where any date column changes
+                changed = np.zeros(len(rows) - 1, dtype=bool)
+                for (col, i) in dateIdx:
+                    changed |= rows[1:,i] != rows[:-1,i]
+                starts = np.concatenate( ([0], np.nonzero(changed)[0] + 1) )
+                # The last day may continue in the next block
+                carry = rows[starts[-1]:]
+                for (first, stop) in zip(starts[:-1], starts[1:]):
+                    date = dateOfRow(rows[first])
+                    if endDate is not None and date > endDate:
+                        return
+                    if startDate is not None and date < startDate:
+                        continue
+                    day = rows[first:stop]
+                    if patchIDs is not None:
+                        day = day[ np.in1d(day[:,patchCol], patchIDs) ]
+                    if len(day):
+                        yield (date, day)
+        finally:
+            blocks.close()
+        
+        if len(carry):
+            date = dateOfRow(carry[0])
+            if (endDate is None or date <= endDate) and (startDate is None or date >= startDate):
+                if patchIDs is not None:
+                    carry = carry[ np.in1d(carry[:,patchCol], patchIDs) ]
+                if len(carry):
+                    yield (date, carry)
+    
+    @classmethod
+    def _readPatchDictParallel(cls, f, column_names, sep=" ", startDate=None, endDate=None,
+                               patchIDs=None, jobs=2):
+        """ Read columns from a patch daily output file into the structure returned by
+            readColumnsFromPatchDailyFile, parsing the file in a pool of jobs processes
+        """
+        returnDict = OrderedDict()
+        headers = _splitHeader(f.readline().strip(), sep)
+        found = [col for col in column_names if col in headers]
+        if not len(found):
+            return returnDict
+        
+        for (date, rows) in cls._iterPatchDailyRows(f, headers, sep, startDate=startDate,
+                                                    endDate=endDate, patchIDs=patchIDs,
+                                                    jobs=jobs):
+            returnDict[date.astype(object)] = \
+                dict( [(col, rows[:,headers.index(col)].tolist()) for col in found] )
+        return returnDict
+    
+    @classmethod
+    def _selectFromCache(cls, cache, startDate=None, endDate=None, patchIDs=None):
+        """ Select time steps and patches from a patch-scale cache
+        
+            Arguments:
+            cache -- rhessysworkflows.outputcache.OutputCache
+            startDate -- datetime.datetime  If not None, select time steps on or after this date
+            endDate -- datetime.datetime  If not None, select time steps on or before this date
+            patchIDs -- Collection of patch IDs  If not None, select only these patches
+        
+            Returns tuple (numpy.ndarray<datetime64>, slice, numpy.ndarray<int>, numpy.ndarray<int>),
+            where the first element is the date of each selected time step, the second 
+            element selects these time steps along the first axis of cached arrays, the 
+            third element is the sorted ID of each selected patch, and the fourth element
+            is the index of each selected patch along the second axis of cached arrays.
+        """
+        dates = _datetime64FromComponents(cache.readDateColumns())
+        (first, stop) = (0, len(dates))
+        if startDate is not None:
+            first = np.searchsorted(dates, np.datetime64(startDate, 'us'), side='left')
+        if endDate is not None:
+            stop = np.searchsorted(dates, np.datetime64(endDate, 'us'), side='right')
+        stop = max(first, stop)
+        allPatchIDs = np.asarray(cache.readColumn(OutputCache.PATCH_ID))
+        patchIdx = np.arange(len(allPatchIDs))
+        if patchIDs is not None:
+            patchIdx = np.nonzero( np.in1d(allPatchIDs, list(patchIDs)) )[0]
+        return (dates[first:stop], slice(first, stop), allPatchIDs[patchIdx], patchIdx)
+    
+    @classmethod
+    def _readRowsFromCache(cls, cache, column_names):
+        """ Read columns from a cache, one element per line of the source file
+            (within a time step, patch-scale output is ordered by patchID).
+            
+            Returns dict<string, numpy.ndarray> 
+        """
+        if not cache.isPatchCube:
+            return dict( [(col, np.asarray(cache.readColumn(col))) for col in column_names] )
+        
+        patchIDs = cache.readColumn(OutputCache.PATCH_ID)
+        dates = cache.readDateColumns()
+        present = cache.readPresent()
+        numDates = cache.numTimeSteps
+        if present is None:
+            dateIdx = np.repeat(np.arange(numDates), len(patchIDs))
+            patchIdx = np.tile(np.arange(len(patchIDs)), numDates)
+        else:
+            (dateIdx, patchIdx) = np.nonzero(present)
+        
+        rows = {}
+        for col in column_names:
+            if col == OutputCache.PATCH_ID:
+                rows[col] = patchIDs[patchIdx]
+            elif col in dates:
+                rows[col] = dates[col][dateIdx]
+            else:
+                rows[col] = cache.readColumn(col)[dateIdx, patchIdx]
+        return rows
+    
+    @classmethod
+    def _readPatchDictFromCache(cls, cache, column_names, startDate=None, endDate=None,
+                                patchIDs=None):
+        """ Read columns from a patch-scale cache into the structure returned by
+            readColumnsFromPatchDailyFile
+        """
+        returnDict = OrderedDict()
+        found = [col for col in column_names if col in cache.headers]
+        if not len(found):
+            return returnDict
+        
+        (dates64, dateSlice, selectedIDs, patchIdx) = \
+            cls._selectFromCache(cache, startDate, endDate, patchIDs)
+        selectedIDs = selectedIDs.astype(float)
+        dates = cache.readDateColumns()
+        present = cache.readPresent()
+        data = dict( [(col, cache.readColumn(col)) for col in found \
+                      if col != OutputCache.PATCH_ID] )
+        components = [dates.get(c) for c in [RHESSysOutput.HOUR_HEADER, RHESSysOutput.DAY_HEADER,
+                                              RHESSysOutput.MONTH_HEADER, RHESSysOutput.YEAR_HEADER]]
+        for i in range(dateSlice.start, dateSlice.stop):
+            sel = slice(None)
+            if present is not None:
+                sel = np.asarray(present[i])[patchIdx]
+            idx = patchIdx[sel]
+            if not len(idx):
+                continue
+            
+            (hour, day, month, year) = [int(c[i]) if c is not None else None for c in components]
+            tmpDate = _datetimeFromComponents(hour, day, month, year)
+            try:
+                dataForDate = returnDict[tmpDate]
+            except KeyError:
+                dataForDate = {}
+                returnDict[tmpDate] = dataForDate
+            
+            for col in found:
+                if col == OutputCache.PATCH_ID:
+                    values = selectedIDs[sel]
+                else:
+                    values = data[col][i][idx]
+                dataForDate.setdefault(col, []).extend( values.tolist() )
+        
+        return returnDict
 
 def generateCommandString(binPath, outputPrefix, startDate, endDate, tecPath,
                           worldPath, subsurfaceFlowPath=None, surfaceFlowPath=None,
@@ -351,7 +1081,9 @@ def generateCommandString(binPath, outputPrefix, startDate, endDate, tecPath,
         @param worldPath String representing world file to be used
         @param subsurfaceFlowPath String representing subsurface flowtable to be used
         @param surfaceFlowPath String representing surface flowtable to be used
-        @params flags String representing flags to include (e.g. b for -b or basin output)
+        @param outputPrefix String representing prefix of output files, or None
+        @params flags String representing flags to include (e.g. b for -b or basin output,
+        bp for -b -p for basin and patch output)
         @params **kwargs Mapping type describing calibration options, with key
         representing the parameter name and value a tuple of arguments to pass to the
         calibration option
@@ -369,15 +1101,12 @@ def generateCommandString(binPath, outputPrefix, startDate, endDate, tecPath,
     if outputPrefix:
         cmd = "%s -pre %s" % (cmd, outputPrefix)
     # Add flags
-    flagsStr = ''
     if len(flags) > 0:
-        flagsStr = "-%s" % (flags[0],)
-        for c in flags[1:]:
-            flagSstr = "%s -%s" % (c,)
+        flagsStr = ' '.join(["-%s" % (c,) for c in flags])
         cmd = "%s %s" % (cmd, flagsStr,)
-    # Add calibration parameters
-    for opt, val in kwargs.iteritems():
-        valStr = ' '.join(map(str, val))
+    # Add calibration parameters (in a stable order)
+    for opt in sorted(kwargs.keys()):
+        valStr = ' '.join(map(str, kwargs[opt]))
         cmd = "%s -%s %s" % (cmd, opt, valStr)
     return cmd
     
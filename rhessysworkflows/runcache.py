@@ -0,0 +1,237 @@
+"""@package rhessysworkflows.runcache
+
+@brief Content-addressed cache of RHESSys model runs
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+A model run is identified by a key: the SHA-1 digest of its command line
+(with paths relative to the project directory, and with the output prefix
+left out) and of the content of every input the run reads: the RHESSys
+binary, worldfile, worldfile header, default files and climate base stations
+named in the header, the climate time series of each base station, flow
+tables, and TEC file.  When a model run completes, its key is recorded in the
+run cache, a directory in the RHESSys output directory, along with the output
+directory of the run and the files in it.  A later run with the same key can
+then hard link the recorded output into its own output directory rather than
+running RHESSys again.  Entries whose output files have since been removed or
+replaced are ignored.
+"""
+import os, errno
+import json
+import glob
+import shutil
+import hashlib
+
+from rhessysworkflows.rhessys import readParameterFile
+
+CACHE_DIR = '.runcache'
+HEADER_SUFFIX = '.hdr'
+FILENAME_SUFFIX = '_filename'
+BASE_STATION_FILENAME = 'base_station_filename'
+CLIMATE_PREFIXES = ['daily_climate_prefix', 'hourly_climate_prefix',
+                    'monthly_climate_prefix', 'yearly_climate_prefix']
+_BLOCK_SIZE = 1024 * 1024
+
+
+def hashFile(path):
+    """ Compute SHA-1 digest of the content of a file
+
+        @param path String representing the path of the file
+
+        @return String representing hexadecimal digest
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        block = f.read(_BLOCK_SIZE)
+        while block:
+            sha1.update(block)
+            block = f.read(_BLOCK_SIZE)
+    return sha1.hexdigest()
+
+
+def findInputs(paths, binPath, worldfile, tecfile, flowtables=None):
+    """ Find the files a model run reads
+
+        @param paths rhessysworkflows.rhessys.RHESSysPaths
+        @param binPath String representing the path of the RHESSys binary
+        @param worldfile String representing the path of the worldfile
+        @param tecfile String representing the path of the TEC file
+        @param flowtables List of paths of flow tables, or None
+
+        @return List of paths of input files, without duplicates
+
+        @raise IOError if the worldfile header, or a file it names, cannot be read
+    """
+    inputs = [binPath, worldfile, tecfile] + list(flowtables or [])
+    header = worldfile + HEADER_SUFFIX
+    if os.path.isfile(header):
+        inputs.append(header)
+        with open(header, 'r') as f:
+            for line in f:
+                tokens = line.split()
+                if len(tokens) < 2 or not tokens[1].endswith(FILENAME_SUFFIX):
+                    continue
+                # Files named in the header are relative to the RHESSys directory
+                path = os.path.join(paths.RHESSYS_DIR, tokens[0])
+                if not os.path.isfile(path):
+                    raise IOError(errno.ENOENT, "File %s named in worldfile header %s not found" % (path, header) )
+                inputs.append(path)
+                if tokens[1] == BASE_STATION_FILENAME:
+                    station = readParameterFile(path)
+                    for key in CLIMATE_PREFIXES:
+                        if key in station:
+                            prefix = os.path.join(paths.RHESSYS_DIR, station[key])
+                            inputs.extend(sorted([p for p in glob.glob(prefix + '.*') if os.path.isfile(p)]))
+    unique = []
+    for path in inputs:
+        path = os.path.abspath(path)
+        if not path in unique:
+            unique.append(path)
+    return unique
+
+
+class RunCache(object):
+
+    OUTPUT = 'output'
+    FILES = 'files'
+
+    def __init__(self, paths):
+        """ @param paths rhessysworkflows.rhessys.RHESSysPaths of the project """
+        self.paths = paths
+        self.cachePath = os.path.join(paths.RHESSYS_OUT, CACHE_DIR)
+
+    def hashInputs(self, inputs):
+        """ Compute digests of input files, e.g. once for all runs of an ensemble
+
+            @param inputs List of paths of input files (see findInputs)
+
+            @return List of tuple (path relative to the project directory, hexadecimal digest)
+        """
+        return [(self.paths.relpath(p), hashFile(p)) for p in inputs]
+
+    def key(self, commandRel, outputPrefixRel, inputDigests):
+        """ Compute the key of a model run
+
+            @param commandRel String representing the RHESSys command line, with
+            paths relative to the project directory
+            @param outputPrefixRel String representing the output prefix in commandRel
+            @param inputDigests List of tuple (path, digest), as returned by hashInputs
+
+            @return String representing hexadecimal key
+        """
+        tokens = [t for t in commandRel.split() if t != outputPrefixRel]
+        sha1 = hashlib.sha1()
+        sha1.update(' '.join(tokens).encode('utf-8'))
+        for (path, digest) in inputDigests:
+            sha1.update(("\n%s %s" % (path, digest)).encode('utf-8'))
+        return sha1.hexdigest()
+
+    def _entryPath(self, key):
+        return os.path.join(self.cachePath, key)
+
+    @staticmethod
+    def _listFiles(outputDir):
+        """ List the files RHESSys wrote to an output directory, ignoring
+            directories (e.g. output caches) added to it since
+        """
+        files = []
+        for filename in os.listdir(outputDir):
+            path = os.path.join(outputDir, filename)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                files.append( [filename, stat.st_size, stat.st_mtime] )
+        return sorted(files)
+
+    def lookup(self, key):
+        """ Find the output of an earlier run with the same key
+
+            @param key String representing the key of the run
+
+            @return String representing the path of the output directory of the
+            earlier run, or None if there is no such run, or its output has
+            since changed
+        """
+        try:
+            with open(self._entryPath(key), 'r') as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+        outputDir = os.path.join(self.paths.basedir, entry[RunCache.OUTPUT])
+        if not os.path.isdir(outputDir):
+            return None
+        try:
+            if RunCache._listFiles(outputDir) != entry[RunCache.FILES]:
+                return None
+        except OSError:
+            return None
+        return outputDir
+
+    def record(self, key, outputDir):
+        """ Record the output of a completed run
+
+            @param key String representing the key of the run
+            @param outputDir String representing the path of the run's output directory
+        """
+        if not os.path.isdir(self.cachePath):
+            try:
+                os.makedirs(self.cachePath)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        entry = {RunCache.OUTPUT: self.paths.relpath(outputDir),
+                 RunCache.FILES: RunCache._listFiles(outputDir)}
+        entryPath = self._entryPath(key)
+        tmpPath = "%s.tmp%d" % (entryPath, os.getpid())
+        with open(tmpPath, 'w') as f:
+            json.dump(entry, f)
+        os.rename(tmpPath, entryPath)
+
+    @staticmethod
+    def linkOutput(cachedDir, outputDir):
+        """ Hard link the files of a cached output directory into a new output
+            directory, copying files that cannot be linked (e.g. because the
+            directories are on different file systems)
+
+            @param cachedDir String representing the path of the cached output directory
+            @param outputDir String representing the path of the new output directory,
+            which must not exist
+        """
+        for (dirpath, dirnames, filenames) in os.walk(cachedDir):
+            dstDir = os.path.join(outputDir, os.path.relpath(dirpath, cachedDir))
+            os.makedirs(dstDir)
+            for filename in filenames:
+                src = os.path.join(dirpath, filename)
+                dst = os.path.join(dstDir, filename)
+                try:
+                    os.link(src, dst)
+                except (OSError, AttributeError):
+                    shutil.copy2(src, dst)
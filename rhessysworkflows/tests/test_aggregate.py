@@ -0,0 +1,102 @@
+"""@package rhessysworkflows.tests.test_aggregate
+
+    @brief Test methods for rhessysworkflows.aggregate
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_aggregate
+    @endcode
+
+"""
+from unittest import TestCase
+from datetime import datetime
+
+import numpy as np
+
+from rhessysworkflows.aggregate import TemporalAggregator
+
+
+def makeDays():
+    """ Daily output for two patches from 2000-09-29 through 2000-10-02; patch 2
+        lacks output for 2000-10-02
+    """
+    days = []
+    for (i, day) in enumerate([datetime(2000, 9, 29), datetime(2000, 9, 30),
+                               datetime(2000, 10, 1), datetime(2000, 10, 2)]):
+        patchIDs = np.array([1, 2])
+        lai = np.array([1.0, 2.0]) * (i + 1)
+        if i == 3:
+            patchIDs = np.array([1])
+            lai = np.array([4.0])
+        days.append( (np.datetime64(day), patchIDs, {'lai': lai}) )
+    return days
+
+
+class TestTemporalAggregator(TestCase):
+
+    def test_periods(self):
+        self.assertEqual(TemporalAggregator(TemporalAggregator.WATER_YEAR).periodOf(datetime(2000, 10, 1)),
+                         (2001,))
+        self.assertEqual(TemporalAggregator(TemporalAggregator.WATER_YEAR).periodOf(datetime(2000, 9, 30)),
+                         (2000,))
+        winter = TemporalAggregator(TemporalAggregator.SEASON, months=[12, 1, 2])
+        self.assertEqual(winter.periodOf(datetime(2000, 12, 1)), (2001,))
+        self.assertEqual(winter.periodOf(datetime(2001, 2, 28)), (2001,))
+        self.assertEqual(winter.periodOf(datetime(2001, 3, 1)), None)
+        self.assertEqual(winter.dateRange(2001), (datetime(2000, 12, 1), datetime(2001, 11, 30, 23)))
+        self.assertRaises(ValueError, TemporalAggregator, TemporalAggregator.SEASON)
+
+    def test_aggregate(self):
+        result = list(TemporalAggregator(TemporalAggregator.WATER_YEAR, 
+                                         TemporalAggregator.SUM).aggregate(makeDays()))
+        self.assertEqual([r[0] for r in result], [(2000,), (2001,)])
+        self.assertEqual(result[0][2]['lai'].tolist(), [3.0, 6.0])
+        self.assertEqual(result[1][1].tolist(), [1, 2])
+        self.assertEqual(result[1][2]['lai'].tolist(), [7.0, 6.0])
+        
+        result = list(TemporalAggregator(TemporalAggregator.YEARLY, 
+                                         TemporalAggregator.MEAN).aggregate(makeDays()))
+        self.assertEqual(result[0][2]['lai'].tolist(), [2.5, 4.0])
+        
+        result = list(TemporalAggregator(TemporalAggregator.MONTHLY, 
+                                         TemporalAggregator.MAX).aggregate(makeDays()))
+        self.assertEqual([r[0] for r in result], [(2000, 9), (2000, 10)])
+        self.assertEqual(result[1][2]['lai'].tolist(), [4.0, 6.0])
+
+    def test_aggregate_to_array(self):
+        aggregator = TemporalAggregator(TemporalAggregator.MONTHLY, TemporalAggregator.MIN)
+        table = aggregator.aggregateToArray(makeDays(), ['lai'])
+        self.assertEqual(table.dtype.names, ('year', 'month', 'patchID', 'lai'))
+        self.assertEqual(table['month'].tolist(), [9, 9, 10, 10])
+        self.assertEqual(table['lai'].tolist(), [1.0, 2.0, 3.0, 6.0])
@@ -0,0 +1,113 @@
+"""@package rhessysworkflows.tests.test_checkpoint
+
+    @brief Test methods for rhessysworkflows.checkpoint
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_checkpoint
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import datetime
+
+from rhessysworkflows.context import Context
+from rhessysworkflows.rhessys import RHESSysPaths
+from rhessysworkflows.checkpoint import checkpointDates, readTECFile, writeCheckpointTECFile
+from rhessysworkflows.checkpoint import stateWorldfilePath, collectCheckpoints, findCheckpoint
+from rhessysworkflows.checkpoint import Checkpoint, OUTPUT_CURRENT_STATE
+
+TEC = """2000 1 2 1 redefine_world
+2000 3 1 1 print_daily_on
+"""
+
+class TestCheckpoint(TestCase):
+
+    def setUp(self):
+        self.projectDir = tempfile.mkdtemp()
+        self.context = Context(self.projectDir, None)
+        # Creates RHESSys directory structure
+        self.paths = RHESSysPaths(self.projectDir, 'rhessys')
+        self.worldfile = os.path.join(self.paths.RHESSYS_WORLD, 'world')
+        for path in [self.worldfile, self.worldfile + '.hdr']:
+            open(path, 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.projectDir)
+
+    def test_tec_file(self):
+        dates = checkpointDates(datetime.datetime(2000, 1, 1, 1), datetime.datetime(2000, 4, 1, 1),
+                                datetime.timedelta(days=30))
+        self.assertEqual(dates, [datetime.datetime(2000, 1, 31, 1), datetime.datetime(2000, 3, 1, 1),
+                                 datetime.datetime(2000, 3, 31, 1)])
+        tecPath = os.path.join(self.paths.RHESSYS_TEC, 'tec')
+        with open(tecPath, 'w') as f:
+            f.write(TEC)
+        outPath = os.path.join(self.paths.RHESSYS_TEC_ACTIVE, 'tec.checkpoint')
+        writeCheckpointTECFile(tecPath, outPath, dates)
+        self.assertEqual([(d.month, d.day, e) for (d, e) in readTECFile(outPath)],
+                         [(1, 2, 'redefine_world'), (1, 31, OUTPUT_CURRENT_STATE),
+                          (3, 1, 'print_daily_on'), (3, 1, OUTPUT_CURRENT_STATE),
+                          (3, 31, OUTPUT_CURRENT_STATE)])
+
+    def test_collect_and_find(self):
+        dates = [datetime.datetime(2000, 1, 31, 1), datetime.datetime(2000, 3, 1, 1)]
+        for date in dates:
+            open(stateWorldfilePath(self.worldfile, date), 'w').close()
+        outputDir = os.path.join(self.paths.RHESSYS_OUT, 'spinup')
+        # The last checkpoint was not reached (e.g. the run ended early)
+        checkpoints = collectCheckpoints(self.context, self.paths, self.worldfile, 'rhessys/worldfiles/world',
+                                         'rhessys/flow/world.flow', dates + [datetime.datetime(2000, 4, 1, 1)],
+                                         outputDir)
+        self.assertEqual(len(checkpoints), 2)
+        for checkpoint in checkpoints:
+            statePath = os.path.join(self.projectDir, checkpoint.worldfile)
+            self.assertTrue(os.path.isfile(statePath))
+            self.assertTrue(os.path.isfile(statePath + '.hdr'))
+        self.assertFalse(os.path.exists(stateWorldfilePath(self.worldfile, dates[0])))
+
+        recorded = Checkpoint.readFromMetadata(self.context)
+        self.assertEqual([c.date for c in recorded], dates)
+        self.assertEqual(recorded[1].output, 'rhessys/output/spinup')
+
+        find = lambda flow, date: findCheckpoint(self.context, 'rhessys/worldfiles/world', flow, date)
+        self.assertEqual(find('rhessys/flow/world.flow', datetime.datetime(2000, 3, 15, 1)).date, dates[1])
+        self.assertEqual(find('rhessys/flow/world.flow', datetime.datetime(2000, 3, 1, 1)).date, dates[1])
+        self.assertEqual(find('rhessys/flow/world.flow', datetime.datetime(2000, 2, 1, 1)).date, dates[0])
+        self.assertEqual(find('rhessys/flow/world.flow', datetime.datetime(2000, 1, 1, 1)), None)
+        # Checkpoints of runs using other flow tables are not used
+        self.assertEqual(find(None, datetime.datetime(2000, 3, 15, 1)), None)
@@ -0,0 +1,113 @@
+"""@package rhessysworkflows.tests.test_climateio
+
+    @brief Test methods for rhessysworkflows.climateio
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_climateio
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import datetime
+
+from rhessysworkflows.context import Context
+from rhessysworkflows.rhessys import RHESSysPaths
+from rhessysworkflows.metadata import RHESSysMetadata
+from rhessysworkflows import climateio
+from rhessysworkflows.climateio import countLines, getStartAndEndDateForClimateStation
+from rhessysworkflows.climateio import getStartAndEndDatesForClimateStations, EXTENT_CACHE
+
+STATION = """101 base_station_id
+1.0 x_coordinate
+1.0 y_coordinate
+100.0 z_coordinate
+3.0 effective_lai
+2.0 screen_height
+clim/%s daily_climate_prefix
+"""
+
+class TestClimateIO(TestCase):
+
+    def setUp(self):
+        self.projectDir = tempfile.mkdtemp()
+        self.context = Context(self.projectDir, None)
+        # Creates RHESSys directory structure
+        self.paths = RHESSysPaths(self.projectDir, 'rhessys')
+        self.writeStation('station1', "2000 1 1 1\n" + "0.1\n" * 366)
+        # Last line not terminated by a newline
+        self.writeStation('station2', "1990 10 1 1\n" + "0.1\n" * 9 + "0.1")
+        RHESSysMetadata.writeRHESSysEntry(self.context, 'climate_stations', 'station1,station2')
+
+    def tearDown(self):
+        shutil.rmtree(self.projectDir)
+
+    def writeStation(self, name, rain):
+        with open(os.path.join(self.paths.RHESSYS_CLIM, name + '.base'), 'w') as f:
+            f.write(STATION % (name,))
+        with open(os.path.join(self.paths.RHESSYS_CLIM, name + '.rain'), 'w') as f:
+            f.write(rain)
+
+    def test_count_lines(self):
+        rainPath = os.path.join(self.paths.RHESSYS_CLIM, 'station2.rain')
+        self.assertEqual(countLines(rainPath), 11)
+        with open(rainPath, 'w') as f:
+            pass
+        self.assertEqual(countLines(rainPath), 0)
+
+    def test_extents(self):
+        stationPath = os.path.join(self.paths.RHESSYS_CLIM, 'station1.base')
+        extent = (datetime.datetime(2000, 1, 1, 1), datetime.datetime(2001, 1, 1, 1))
+        self.assertEqual(getStartAndEndDateForClimateStation(stationPath, self.paths, useCache=False), extent)
+        self.assertFalse(os.path.exists(os.path.join(self.paths.RHESSYS_CLIM, EXTENT_CACHE)))
+
+        extents = getStartAndEndDatesForClimateStations(self.context, self.paths)
+        self.assertEqual(extents, {'station1': extent,
+                                   'station2': (datetime.datetime(1990, 10, 1, 1), datetime.datetime(1990, 10, 11, 1))})
+        self.assertTrue(os.path.isfile(os.path.join(self.paths.RHESSYS_CLIM, EXTENT_CACHE)))
+
+        # Extents are read from the extent cache
+        climateio._extents.clear()
+        self.assertEqual(getStartAndEndDatesForClimateStations(self.context, self.paths), extents)
+
+        # Extents of a modified time-series are not used
+        self.writeStation('station1', "2000 1 1 1\n" + "0.1\n" * 10)
+        rainPath = os.path.join(self.paths.RHESSYS_CLIM, 'station1.rain')
+        mtime = os.stat(rainPath).st_mtime
+        os.utime(rainPath, (mtime + 10, mtime + 10))
+        self.assertEqual(getStartAndEndDateForClimateStation(stationPath, self.paths),
+                         (datetime.datetime(2000, 1, 1, 1), datetime.datetime(2000, 1, 11, 1)))
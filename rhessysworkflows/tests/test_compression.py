@@ -0,0 +1,162 @@
+"""@package rhessysworkflows.tests.test_compression
+
+    @brief Test methods for rhessysworkflows.compression
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_compression
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from rhessysworkflows.rhessys import RHESSysOutput
+from rhessysworkflows import compression
+from rhessysworkflows.compression import openOutputFile, compressFile, detectCompression
+
+PATCH_DAILY = """day month year basinID hillID zoneID patchID rain_thru trans_sat trans_unsat
+1 10 2000 1 1 1 12 1.5 0.25 0.5
+1 10 2000 1 1 1 11 2.5 0.125 0.75
+2 10 2000 1 1 1 12 3.5 0.5 1.0
+2 10 2000 1 1 1 11 4.5 0.0625 1.25
+3 10 2000 1 1 1 11 5.5 0.25 1.5
+"""
+
+class TestCompression(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.patchDailyPath = os.path.join(self.tmpDir, 'rhessys_patch.daily')
+        with open(self.patchDailyPath, 'w') as f:
+            f.write(PATCH_DAILY)
+        self.methods = [compression.GZIP, compression.BZIP2]
+        if compression.lzma is not None:
+            self.methods.append(compression.XZ)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def compressed(self, method):
+        path = os.path.join(self.tmpDir, "compressed_%s" % (method,) )
+        shutil.copy(self.patchDailyPath, path)
+        return compressFile(path, method)
+
+    def test_round_trip(self):
+        self.assertEqual(detectCompression(self.patchDailyPath), None)
+        for method in self.methods:
+            path = self.compressed(method)
+            self.assertTrue(path.endswith(compression.EXTENSION[method]))
+            self.assertEqual(detectCompression(path), method)
+            with openOutputFile(path) as f:
+                self.assertEqual(f.readline(), PATCH_DAILY.splitlines(True)[0])
+                self.assertEqual(f.read(), ''.join(PATCH_DAILY.splitlines(True)[1:]))
+                self.assertEqual(f.readline(), '')
+
+    def test_small_chunks(self):
+        chunkSize = compression.CHUNK_SIZE
+        compression.CHUNK_SIZE = 7
+        try:
+            path = self.compressed(compression.GZIP)
+            with openOutputFile(path) as f:
+                self.assertEqual(list(f), PATCH_DAILY.splitlines(True))
+        finally:
+            compression.CHUNK_SIZE = chunkSize
+
+    def test_readers(self):
+        with open(self.patchDailyPath) as f:
+            expected = RHESSysOutput.readColumnsFromPatchDailyFile(f, ['patchID', 'trans_sat'])
+        (expDates, expColumns) = RHESSysOutput.readColumnsFromFiles([self.patchDailyPath],
+                                                                    ['trans_sat'])
+        expData = np.genfromtxt(self.patchDailyPath, names=True)
+        for method in self.methods:
+            path = self.compressed(method)
+            self.assertEqual(RHESSysOutput.readHeader(path),
+                             RHESSysOutput.readHeader(self.patchDailyPath))
+            # Readers detect compression of plain file objects
+            with open(path) as f:
+                self.assertEqual(RHESSysOutput.readColumnsFromPatchDailyFile(f, ['patchID', 'trans_sat']),
+                                 expected)
+            with open(path) as f:
+                self.assertEqual(RHESSysOutput.readColumnsFromPatchDailyFile(f, ['patchID', 'trans_sat'],
+                                                                             jobs=2),
+                                 expected)
+            with open(path) as f:
+                days = list(RHESSysOutput.iterPatchDailyFile(f, ['trans_sat'], jobs=2))
+            self.assertEqual([d[0].astype(object) for d in days], list(expected.keys()))
+            (dates, columns) = RHESSysOutput.readColumnsFromFiles([path], ['trans_sat'])
+            self.assertTrue(np.array_equal(dates, expDates))
+            self.assertTrue(np.array_equal(columns[0]['trans_sat'], expColumns[0]['trans_sat']))
+            with openOutputFile(path) as f:
+                data = np.genfromtxt(f, names=True)
+            self.assertTrue(np.array_equal(data, expData))
+
+    def test_readers_close(self):
+        path = self.compressed(compression.GZIP)
+        opened = []
+        init = compression.DecompressingReader.__init__
+        def trackingInit(reader, *args, **kwargs):
+            init(reader, *args, **kwargs)
+            opened.append(reader)
+        compression.DecompressingReader.__init__ = trackingInit
+        try:
+            with open(path) as f:
+                RHESSysOutput.readColumnsFromPatchDailyFile(f, ['patchID', 'trans_sat'])
+            with open(path) as f:
+                RHESSysOutput.readColumnFromFile(f, 'trans_sat')
+            with open(path) as f:
+                RHESSysOutput.readPatchDailyCube(f, ['trans_sat'])
+            # Abandon the iterator after the first day
+            with open(path) as f:
+                days = RHESSysOutput.iterPatchDailyFile(f, ['trans_sat'])
+                next(days)
+                days.close()
+        finally:
+            compression.DecompressingReader.__init__ = init
+        self.assertEqual(len(opened), 4)
+        self.assertTrue(all([reader.closed for reader in opened]))
+
+    def test_cache_of_compressed_file(self):
+        path = self.compressed(compression.GZIP)
+        with open(path) as f:
+            expected = RHESSysOutput.readColumnsFromPatchDailyFile(f, ['patchID', 'trans_sat'])
+        cache = RHESSysOutput.cacheOutputFile(path)
+        self.assertTrue(cache.isCurrent())
+        with open(path) as f:
+            cached = RHESSysOutput.readColumnsFromPatchDailyFile(f, ['patchID', 'trans_sat'])
+        self.assertEqual(list(expected.keys()), list(cached.keys()))
@@ -0,0 +1,230 @@
+"""@package rhessysworkflows.tests.test_ensemble
+
+    @brief Test methods for rhessysworkflows.command.ensemble
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_ensemble
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import stat
+import shutil
+import tempfile
+import datetime
+
+from rhessysworkflows.context import Context
+from rhessysworkflows.metadata import RHESSysMetadata
+from rhessysworkflows.rhessys import RHESSysPaths, generateCommandString
+from rhessysworkflows.command.exceptions import RunException
+from rhessysworkflows.command.ensemble import ModelEnsemble, EnsembleRun, readParameterSets
+from rhessysworkflows.command.ensemble import BEHAVIORAL_DIR, BEHAVIORAL_CSV
+from rhessysworkflows.glue import BehavioralStore
+from rhessysworkflows.checkpoint import Checkpoint
+
+PARAMETER_SETS = """name,s,-sv,gw
+calib_a,0.5 10 1,0.5 10,0.1 0.2
+,1.5 20 1,,0.2 0.4
+"""
+
+# Stands in for RHESSys: writes basin output using the output prefix, and
+# fails when run with -gw 9
+RHESSYS = """#!/bin/sh
+for arg in "$@"; do
+    if [ "$prev" = "-pre" ]; then pre="$arg"; fi
+    if [ "$prev" = "-gw" ] && [ "$arg" = "9" ]; then exit 1; fi
+    prev="$arg"
+done
+echo "day month year streamflow" > "${pre}_basin.daily"
+echo "$@" >> "${pre}_basin.daily"
+"""
+
+# Stands in for RHESSys: writes basin streamflow equal to the day of month
+# multiplied by the value of -gw
+RHESSYS_STREAMFLOW = """#!/bin/sh
+for arg in "$@"; do
+    if [ "$prev" = "-pre" ]; then pre="$arg"; fi
+    if [ "$prev" = "-gw" ]; then gw="$arg"; fi
+    prev="$arg"
+done
+echo "day month year streamflow" > "${pre}_basin.daily"
+for day in 1 2 3 4; do
+    echo "$day 1 2000 $((day * gw))" >> "${pre}_basin.daily"
+done
+"""
+
+class TestReadParameterSets(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def writeTable(self, content):
+        path = os.path.join(self.tmpDir, 'params.csv')
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_read(self):
+        parameterSets = readParameterSets(self.writeTable(PARAMETER_SETS))
+        self.assertEqual([name for (name, parameters) in parameterSets], ['calib_a', 'run2'])
+        self.assertEqual(parameterSets[0][1], {'s': ['0.5', '10', '1'], 'sv': ['0.5', '10'], 'gw': ['0.1', '0.2']})
+        # Empty cells omit the option
+        self.assertEqual(parameterSets[1][1], {'s': ['1.5', '20', '1'], 'gw': ['0.2', '0.4']})
+
+    def test_invalid(self):
+        for table in ["s,gw\n", "st,gw\n1,2\n", "s,gw\n1,x\n", "s,gw\n1\n",
+                      "name,s\na,1\na,2\n"]:
+            self.assertRaises(ValueError, readParameterSets, self.writeTable(table))
+
+class TestGenerateCommandString(TestCase):
+
+    def test_flags_and_parameters(self):
+        cmd = generateCommandString('rhessys', 'out/rhessys', datetime.datetime(2000, 1, 1, 1),
+                                    datetime.datetime(2001, 1, 1, 1), 'tec', 'world', 'sub.flow', 'surf.flow',
+                                    flags='bp', sv=('0.5', '10'), gw=(0.1, 0.2))
+        self.assertEqual(cmd, "rhessys -st 2000 1 1 1 -ed 2001 1 1 1 -t tec -w world -r sub.flow surf.flow "
+                              "-pre out/rhessys -b -p -gw 0.1 0.2 -sv 0.5 10")
+
+class TestModelEnsemble(TestCase):
+
+    def setUp(self):
+        self.projectDir = tempfile.mkdtemp()
+        context = Context(self.projectDir, None)
+        rhessysDir = 'rhessys'
+        # Creates RHESSys directory structure
+        self.paths = RHESSysPaths(self.projectDir, rhessysDir)
+        self.rhessysBin = rhessysBin = os.path.join(self.paths.RHESSYS_BIN, 'rhessys')
+        with open(rhessysBin, 'w') as f:
+            f.write(RHESSYS)
+        os.chmod(rhessysBin, stat.S_IRWXU)
+        for path in [os.path.join(self.paths.RHESSYS_WORLD, 'world'),
+                     os.path.join(self.paths.RHESSYS_TEC, 'tec')]:
+            open(path, 'w').close()
+        RHESSysMetadata.writeRHESSysEntry(context, 'rhessys_dir', rhessysDir)
+        RHESSysMetadata.writeRHESSysEntry(context, 'rhessys_bin', self.paths.relpath(rhessysBin))
+
+    def tearDown(self):
+        shutil.rmtree(self.projectDir)
+
+    def runEnsemble(self, parameterSets, outputPrefix='ensemble', **kwargs):
+        command = ModelEnsemble(self.projectDir, None, outfp=open(os.devnull, 'w'))
+        return command.run(description='Test', outputPrefix=outputPrefix,
+                           startDate=datetime.datetime(2000, 1, 1, 1),
+                           endDate=datetime.datetime(2000, 2, 1, 1),
+                           worldfile='world', tecfile='tec',
+                           parameterSets=parameterSets, jobs=2, **kwargs)
+
+    def modelRuns(self):
+        context = Context(self.projectDir, None)
+        return RHESSysMetadata.readModelRunEntries(context)
+
+    def test_run_and_resume(self):
+        parameterSets = [('a', {'gw': ['0.1', '0.2']}),
+                         ('b', {'gw': ['9', '0.2']}),
+                         ('c', {'s': ['1', '2', '3']})]
+        self.assertRaises(RunException, self.runEnsemble, parameterSets)
+        ensembleDir = os.path.join(self.paths.RHESSYS_OUT, 'ensemble')
+        for name in ['a', 'c']:
+            with open(os.path.join(ensembleDir, name, 'rhessys_basin.daily')) as f:
+                self.assertTrue(f.read().find("-pre {0}".format(os.path.join(ensembleDir, name, 'rhessys'))) != -1)
+            self.assertTrue(os.path.isfile(os.path.join(ensembleDir, name, EnsembleRun.RUN_COMPLETE)))
+        self.assertFalse(os.path.isfile(os.path.join(ensembleDir, 'b', EnsembleRun.RUN_COMPLETE)))
+        self.assertEqual(len(self.modelRuns()['runs'].split(RHESSysMetadata.VALUE_DELIM)), 2)
+
+        # Resuming runs only the run that failed
+        parameterSets[1] = ('b', {'gw': ['0.3', '0.2']})
+        runs = self.runEnsemble(parameterSets)
+        self.assertEqual([run.name for run in runs], ['a', 'b', 'c'])
+        self.assertEqual([run.returncode for run in runs], [None, 0, None])
+        self.assertEqual(len(self.modelRuns()['runs'].split(RHESSysMetadata.VALUE_DELIM)), 3)
+
+    def test_behavioral(self):
+        with open(self.rhessysBin, 'w') as f:
+            f.write(RHESSYS_STREAMFLOW)
+        observed = ([datetime.datetime(2000, 1, d, 1) for d in range(1, 5)], [1.0, 2.0, 3.0, 4.0])
+        parameterSets = [('a', {'gw': ['1']}),
+                         ('b', {'gw': ['2']})]
+        self.runEnsemble(parameterSets, observed=observed, behavioralCriteria=['nse>=0.9', '|bias|<=10'])
+        ensembleDir = os.path.join(self.paths.RHESSYS_OUT, 'ensemble')
+        self.assertTrue(os.path.isfile(os.path.join(ensembleDir, 'a', 'rhessys_basin.daily')))
+        # Output of runs that are not behavioral is deleted, but the run is recorded
+        self.assertFalse(os.path.exists(os.path.join(ensembleDir, 'b', 'rhessys_basin.daily')))
+        self.assertEqual(len(self.modelRuns()['runs'].split(RHESSysMetadata.VALUE_DELIM)), 2)
+        store = BehavioralStore(os.path.join(ensembleDir, BEHAVIORAL_DIR))
+        # Runs are scored in the order they complete
+        behavioral = store.scores()['behavioral']
+        self.assertEqual((behavioral['a'], behavioral['b']), (True, False))
+        with open(os.path.join(store.path, BEHAVIORAL_CSV)) as f:
+            self.assertEqual(f.readline().strip(), 'datetime,a,lower,median,upper')
+
+        self.assertRaises(RunException, self.runEnsemble, parameterSets, behavioralCriteria=['nse>=0.9'])
+
+    def test_run_cache(self):
+        parameterSets = [('a', {'gw': ['0.1', '0.2']})]
+        self.runEnsemble(parameterSets)
+        # Same command and inputs, different output prefix
+        runs = self.runEnsemble(parameterSets, outputPrefix='ensemble2')
+        self.assertTrue(runs[0].cached)
+        firstOutput = os.path.join(self.paths.RHESSYS_OUT, 'ensemble', 'a', 'rhessys_basin.daily')
+        self.assertTrue(os.path.samefile(os.path.join(self.paths.RHESSYS_OUT, 'ensemble2', 'a', 'rhessys_basin.daily'),
+                                         firstOutput))
+        self.assertEqual(len(self.modelRuns()['runs'].split(RHESSysMetadata.VALUE_DELIM)), 2)
+
+        # Changing an input invalidates the cache
+        with open(os.path.join(self.paths.RHESSYS_TEC, 'tec'), 'w') as f:
+            f.write('changed')
+        runs = self.runEnsemble(parameterSets, outputPrefix='ensemble3')
+        self.assertFalse(runs[0].cached)
+        runs = self.runEnsemble(parameterSets, outputPrefix='ensemble4', useRunCache=False)
+        self.assertFalse(runs[0].cached)
+
+    def test_warm_start(self):
+        checkpoint = Checkpoint()
+        checkpoint.date = datetime.datetime(1999, 12, 1, 1)
+        checkpoint.worldfile = self.paths.relpath(os.path.join(self.paths.RHESSYS_WORLD, 'world.Y1999M12D1H1.state'))
+        checkpoint.source = self.paths.relpath(os.path.join(self.paths.RHESSYS_WORLD, 'world'))
+        checkpoint.output = 'rhessys/output/spinup'
+        checkpoint.writeToMetadata(Context(self.projectDir, None))
+        open(os.path.join(self.projectDir, checkpoint.worldfile), 'w').close()
+
+        self.runEnsemble([('a', {'gw': ['0.1', '0.2']})], warmStart=True)
+        with open(os.path.join(self.paths.RHESSYS_OUT, 'ensemble', 'a', 'rhessys_basin.daily')) as f:
+            command = f.read()
+        self.assertTrue(command.find("-st 1999 12 1 1") != -1)
+        self.assertTrue(command.find("-w {0}".format(os.path.join(self.projectDir, checkpoint.worldfile))) != -1)
@@ -0,0 +1,81 @@
+"""@package rhessysworkflows.tests.test_expression
+
+    @brief Test methods for rhessysworkflows.expression
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_expression
+    @endcode
+
+"""
+from unittest import TestCase
+
+import numpy as np
+
+from rhessysworkflows.expression import VariableExpression, ExpressionError
+
+
+class TestVariableExpression(TestCase):
+
+    def setUp(self):
+        self.data = {'trans_sat': np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]),
+                     'trans_unsat': np.array([[0.5, 0.5], [1.0, 1.0], [1.5, 1.5]]),
+                     'cs.leafc': np.ones( (3, 2) )}
+
+    def test_evaluate(self):
+        expr = VariableExpression('trans_sat + trans_unsat')
+        self.assertEqual(expr.variables, ['trans_sat', 'trans_unsat'])
+        self.assertTrue(np.array_equal(expr.evaluate(self.data),
+                                       self.data['trans_sat'] + self.data['trans_unsat']))
+        
+        expr = VariableExpression('-(trans_sat / 2) + 10 * sqrt(cs.leafc)')
+        self.assertEqual(expr.variables, ['trans_sat', 'cs.leafc'])
+        self.assertTrue(np.array_equal(expr.evaluate(self.data),
+                                       -(self.data['trans_sat'] / 2) + 10))
+
+    def test_evaluate_chunk(self):
+        expr = VariableExpression('trans_sat * trans_unsat')
+        chunk = expr.evaluate(self.data, rows=slice(1, 3))
+        self.assertEqual(chunk.tolist(), [[3.0, 4.0], [7.5, 9.0]])
+
+    def test_validate(self):
+        expr = VariableExpression('trans_sat + evap')
+        expr.validate(['trans_sat', 'evap'])
+        self.assertRaises(ExpressionError, expr.validate, ['trans_sat'])
+
+    def test_unsafe(self):
+        for expression in ['__import__("os").system("ls")', 'trans_sat.__class__()',
+                           'trans_sat[0]', '[x for x in trans_sat]', 'lambda: trans_sat',
+                           'trans_sat; evap', '1 + 2', 'open("f")']:
+            self.assertRaises(ExpressionError, VariableExpression, expression)
@@ -0,0 +1,161 @@
+"""@package rhessysworkflows.tests.test_flowtable
+
+    @brief Test methods for rhessysworkflows.command.flowtable
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_flowtable
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import stat
+import shutil
+import tempfile
+import time
+from subprocess import Popen, PIPE
+
+from rhessysworkflows.context import Context
+from rhessysworkflows.metadata import RHESSysMetadata
+from rhessysworkflows.rhessys import RHESSysPaths
+from rhessysworkflows.command.exceptions import RunException
+from rhessysworkflows.command.session import GrassSession
+from rhessysworkflows.command.flowtable import FlowtableMultiple
+
+# Stands in for createflowpaths: writes a flow table for out=, fails for
+# mask "bad" (after a moment, so that other workers have started), and
+# runs until killed for mask "slow"
+CF = """#!/bin/sh
+for arg in "$@"; do
+    case "$arg" in
+        out=*) out="${arg#out=}";;
+    esac
+done
+echo "started $out"
+case "$out" in
+    *world_bad) sleep 1; exit 1;;
+    *world_slow) exec sleep 60;;
+esac
+echo "flow table" > "${out}.flow"
+echo "finished $out"
+"""
+
+class ProcessScript(object):
+    """ Stands in for grass.script: GRASS modules succeed without doing
+        anything, programs are run as subprocesses
+    """
+    def run_command(self, module, **kwargs):
+        return 0
+
+    def pipe_command(self, module, env=None, **kwargs):
+        args = [module] + ["{0}={1}".format(k, v) for (k, v) in sorted(kwargs.items())]
+        return Popen(args, stdout=PIPE, stderr=PIPE)
+
+class ProcessGRASSLib(object):
+    def __init__(self):
+        self.script = ProcessScript()
+
+class StubFlowtableMultiple(FlowtableMultiple):
+    """ FlowtableMultiple run in a fake GRASS location """
+    def setupGrassEnv(self):
+        gisrc = os.path.join(self.context.projectDir, 'gisrc')
+        self.grassSession = GrassSession(ProcessGRASSLib(), env={'GISRC': gisrc})
+
+class TestFlowtable(TestCase):
+
+    def setUp(self):
+        # Paths containing braces must not be mistaken for format fields
+        self.projectDir = tempfile.mkdtemp(suffix='{0}')
+        self.context = Context(self.projectDir, None)
+        self.paths = RHESSysPaths(self.projectDir, 'rhessys')
+        cfBin = os.path.join(self.paths.RHESSYS_BIN, 'createflowpaths')
+        with open(cfBin, 'w') as f:
+            f.write(CF)
+        os.chmod(cfBin, stat.S_IRWXU)
+        template = os.path.join(self.paths.RHESSYS_TEMPLATES, 'template')
+        open(template, 'w').close()
+
+        mapsetPath = os.path.join(self.projectDir, 'GRASSData', 'default', 'PERMANENT')
+        os.makedirs(mapsetPath)
+        with open(os.path.join(mapsetPath, 'WIND'), 'w') as f:
+            f.write("north: 10\n")
+        with open(os.path.join(self.projectDir, 'gisrc'), 'w') as f:
+            f.write("GISDBASE: {0}\nLOCATION_NAME: default\nMAPSET: PERMANENT\n".format(os.path.join(self.projectDir, 'GRASSData')))
+
+        for (key, value) in [('rhessys_dir', 'rhessys'), ('cf_bin', self.paths.relpath(cfBin)),
+                             ('template', self.paths.relpath(template)),
+                             ('grass_dbase', 'GRASSData'), ('grass_location', 'default'),
+                             ('grass_mapset', 'PERMANENT')]:
+            RHESSysMetadata.writeRHESSysEntry(self.context, key, value)
+        for key in ['dem_rast', 'slope_rast', 'streams_rast', 'zero_rast', 'impervious_rast']:
+            RHESSysMetadata.writeGRASSEntry(self.context, key, key.replace('_rast', ''))
+        for key in ['dem_res_x', 'dem_res_y']:
+            RHESSysMetadata.writeStudyAreaEntry(self.context, key, '30.0')
+
+    def tearDown(self):
+        shutil.rmtree(self.projectDir)
+
+    def runFlowtable(self, masks, jobs):
+        RHESSysMetadata.writeRHESSysEntry(self.context, 'subbasin_masks', RHESSysMetadata.VALUE_DELIM.join(masks))
+        with open(os.devnull, 'w') as outfp:
+            command = StubFlowtableMultiple(self.projectDir, outfp=outfp)
+            command.run(jobs=jobs)
+
+    def readLog(self, mask):
+        with open(os.path.join(self.paths.RHESSYS_FLOW, "cf_{0}.out".format(mask))) as f:
+            return f.read()
+
+    def test_flowtables(self):
+        self.runFlowtable(['a', 'b', 'c'], jobs=2)
+        metadata = RHESSysMetadata.readRHESSysEntries(self.context)
+        self.assertEqual(metadata['subsurface_flowtables'],
+                         'rhessys/flow/world_a.flow,rhessys/flow/world_b.flow,rhessys/flow/world_c.flow')
+        self.assertTrue(metadata['flowtable_cmd'].find("out={0}".format(os.path.join(self.paths.RHESSYS_FLOW, 'world_{mask}'))) != -1)
+        for mask in ['a', 'b', 'c']:
+            self.assertTrue(os.path.isfile(os.path.join(self.paths.RHESSYS_FLOW, "world_{0}.flow".format(mask))))
+            self.assertTrue(self.readLog(mask).find("finished {0}".format(os.path.join(self.paths.RHESSYS_FLOW, 'world_' + mask))) != -1)
+        # Temporary mapsets are removed
+        self.assertEqual(os.listdir(os.path.join(self.projectDir, 'GRASSData', 'default')), ['PERMANENT'])
+
+    def test_failure_kills_workers(self):
+        startTime = time.time()
+        self.assertRaises(RunException, self.runFlowtable, ['slow', 'bad', 'c'], jobs=2)
+        # createflowpaths for "slow" was killed rather than waited for
+        self.assertTrue(time.time() - startTime < 30)
+        self.assertTrue(self.readLog('slow').startswith('started'))
+        self.assertTrue(self.readLog('bad').startswith('started'))
+        # createflowpaths is not started for masks after one fails
+        self.assertFalse(os.path.exists(os.path.join(self.paths.RHESSYS_FLOW, 'cf_c.out')))
+        self.assertFalse('subsurface_flowtables' in RHESSysMetadata.readRHESSysEntries(self.context))
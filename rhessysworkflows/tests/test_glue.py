@@ -0,0 +1,176 @@
+"""@package rhessysworkflows.tests.test_glue
+
+    @brief Test methods for rhessysworkflows.metrics and rhessysworkflows.glue
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_glue
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import datetime
+
+import numpy as np
+
+from rhessysworkflows import metrics
+from rhessysworkflows.glue import Criterion, BehavioralStore, BehavioralFilter, weightedQuantiles
+from rhessysworkflows.glue import DELETE, COMPRESS, KEEP
+from rhessysworkflows.compression import detectCompression
+from rhessysworkflows.command.ensemble import EnsembleRun
+
+OBSERVED = [1.0, 2.0, 3.0, 4.0]
+
+class TestMetrics(TestCase):
+
+    def test_perfect(self):
+        scores = metrics.score(OBSERVED, OBSERVED)
+        for m in [metrics.NSE, metrics.LOG_NSE, metrics.KGE]:
+            self.assertAlmostEqual(scores[m], 1.0)
+        self.assertAlmostEqual(scores[metrics.BIAS], 0.0)
+        self.assertAlmostEqual(scores[metrics.RMSE], 0.0)
+
+    def test_values(self):
+        sim = [2.0, 2.0, 4.0, 4.0]
+        # Sum of squared errors is 2, of squared anomalies 5
+        self.assertAlmostEqual(metrics.nse(OBSERVED, sim), 1.0 - 2.0 / 5.0)
+        self.assertAlmostEqual(metrics.bias(OBSERVED, sim), 20.0)
+        self.assertAlmostEqual(metrics.rmse(OBSERVED, sim), np.sqrt(0.5))
+        r = np.corrcoef(OBSERVED, sim)[0, 1]
+        alpha = np.std(sim) / np.std(OBSERVED)
+        beta = 3.0 / 2.5
+        self.assertAlmostEqual(metrics.kge(OBSERVED, sim),
+                               1.0 - np.sqrt((r - 1) ** 2 + (alpha - 1) ** 2 + (beta - 1) ** 2))
+
+    def test_ensemble_and_missing(self):
+        sims = np.array([[2.0, 2.0, 4.0, 4.0],
+                         [1.0, np.nan, 3.0, 5.0]])
+        nse = metrics.nse(OBSERVED, sims)
+        self.assertEqual(nse.shape, (2,))
+        self.assertAlmostEqual(nse[0], metrics.nse(OBSERVED, sims[0]))
+        # Missing time steps are ignored
+        self.assertAlmostEqual(nse[1], metrics.nse([1.0, 3.0, 4.0], [1.0, 3.0, 5.0]))
+
+    def test_weighted_quantiles(self):
+        sims = np.array([[1.0, 6.0], [2.0, 5.0], [3.0, 4.0]])
+        q = weightedQuantiles(sims, [1.0, 1.0, 2.0], [0.25, 0.5, 1.0])
+        self.assertEqual(q.tolist(), [[1.0, 4.0], [2.0, 4.0], [3.0, 6.0]])
+
+class TestCriterion(TestCase):
+
+    def test_criterion(self):
+        self.assertTrue(Criterion('nse>=0.5').isMet({'nse': 0.5}))
+        self.assertFalse(Criterion('nse > 0.5').isMet({'nse': 0.5}))
+        self.assertFalse(Criterion('nse>=0.5').isMet({'nse': np.nan}))
+        self.assertTrue(Criterion('|bias|<=10').isMet({'bias': -5.0}))
+        self.assertFalse(Criterion('|bias|<=10').isMet({'bias': -15.0}))
+        for text in ['nse', 'nse=0.5', 'foo>1', 'nse>=x', '|nse>=1']:
+            self.assertRaises(ValueError, Criterion, text)
+
+class TestBehavioralFilter(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.storePath = os.path.join(self.tmpDir, 'behavioral')
+        self.dates = [datetime.datetime(2000, 1, d, 1) for d in range(1, 5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def makeRun(self, name, streamflow):
+        run = EnsembleRun(name, {}, os.path.join(self.tmpDir, name))
+        os.makedirs(run.outputDir)
+        with open(run.outputPrefix + '_basin.daily', 'w') as f:
+            f.write("day month year streamflow\n")
+            # Output begins a day before observed data
+            for (day, value) in enumerate([0.0] + streamflow):
+                f.write("{0} 12 1999 {1}\n".format(31, value) if day == 0 else \
+                        "{0} 1 2000 {1}\n".format(day, value))
+        return run
+
+    def makeFilter(self, nonBehavioral=DELETE):
+        return BehavioralFilter(BehavioralStore(self.storePath), self.dates, OBSERVED,
+                                [Criterion('nse>=0.5')], nonBehavioral=nonBehavioral)
+
+    def test_filter(self):
+        behavioralFilter = self.makeFilter()
+        good = self.makeRun('good', [2.0, 2.0, 4.0, 4.0])
+        bad = self.makeRun('bad', [4.0, 3.0, 2.0, 1.0])
+        (scores, behavioral) = behavioralFilter.process(good)
+        self.assertTrue(behavioral)
+        self.assertAlmostEqual(scores['nse'], 0.6)
+        (scores, behavioral) = behavioralFilter.process(bad)
+        self.assertFalse(behavioral)
+        self.assertTrue(os.path.isfile(good.outputPrefix + '_basin.daily'))
+        self.assertFalse(os.path.exists(bad.outputPrefix + '_basin.daily'))
+
+        # Reopening the store sees runs recorded so far
+        store = BehavioralStore(self.storePath)
+        scores = store.scores()
+        self.assertEqual(list(scores.index), ['good', 'bad'])
+        self.assertEqual(list(scores['behavioral']), [True, False])
+        simulated = store.simulated()
+        self.assertEqual(list(simulated.columns), ['good'])
+        self.assertEqual(simulated['good'].tolist(), [2.0, 2.0, 4.0, 4.0])
+        self.assertEqual(simulated.index[0], self.dates[0])
+
+        csvPath = os.path.join(self.tmpDir, 'behavioral.csv')
+        store.writeCSV(csvPath, likelihood='nse')
+        with open(csvPath) as f:
+            self.assertEqual(f.readline().strip(), 'datetime,good,lower,median,upper')
+
+    def test_resumed_run_recorded_once(self):
+        behavioralFilter = self.makeFilter(nonBehavioral=KEEP)
+        good = self.makeRun('good', [2.0, 2.0, 4.0, 4.0])
+        behavioralFilter.process(good)
+        # Ensemble interrupted before the run was marked complete, then resumed
+        behavioralFilter = self.makeFilter(nonBehavioral=KEEP)
+        behavioralFilter.process(good)
+        store = BehavioralStore(self.storePath)
+        self.assertEqual(list(store.scores().index), ['good'])
+        with open(os.path.join(self.storePath, BehavioralStore.SCORES)) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        self.assertEqual(os.path.getsize(os.path.join(self.storePath, BehavioralStore.SIMULATED)),
+                         len(self.dates) * 4)
+
+    def test_compress_and_mismatch(self):
+        behavioralFilter = self.makeFilter(nonBehavioral=COMPRESS)
+        bad = self.makeRun('bad', [4.0, 3.0, 2.0, 1.0])
+        behavioralFilter.process(bad)
+        self.assertEqual(detectCompression(bad.outputPrefix + '_basin.daily.gz'), 'gzip')
+        self.assertRaises(ValueError, BehavioralFilter, BehavioralStore(self.storePath), self.dates,
+                          [1.0, 2.0, 3.0, 5.0], [Criterion('nse>=0.5')])
@@ -0,0 +1,185 @@
+"""@package rhessysworkflows.tests.test_modelrun
+
+    @brief Test methods for rhessysworkflows.command.modelrun
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_modelrun
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import stat
+import shutil
+import tempfile
+
+from rhessysworkflows.context import Context
+from rhessysworkflows.metadata import RHESSysMetadata
+from rhessysworkflows.rhessys import RHESSysPaths
+from rhessysworkflows.command.exceptions import RunException
+from rhessysworkflows.command.session import GrassSession
+from rhessysworkflows.command.modelrun import LAIReadMultiple
+from rhessysworkflows.tests.test_flowtable import ProcessGRASSLib
+
+# Stands in for lairead: writes the redefine worldfile, and fails for mask "bad"
+LAIREAD = """#!/bin/sh
+for arg in "$@"; do
+    case "$arg" in
+        redef=*) redef="${arg#redef=}";;
+        mask=*) mask="${arg#mask=}";;
+    esac
+done
+echo "lairead $mask" >> "$(dirname "$0")/stages.log"
+if [ "$mask" = "bad" ]; then exit 1; fi
+echo "redefine" > "$redef"
+"""
+
+# Stands in for RHESSys: writes the state of the worldfile on the date of
+# output_current_state in the TEC file, containing the command line
+RHESSYS = """#!/bin/sh
+args="$*"
+for arg in "$@"; do
+    if [ "$prev" = "-w" ]; then world="$arg"; fi
+    if [ "$prev" = "-t" ]; then tec="$arg"; fi
+    prev="$arg"
+done
+echo "rhessys $(basename "$world")" >> "$(dirname "$0")/stages.log"
+set -- $(grep output_current_state "$tec")
+echo "$args" > "${world}.Y${1}M${2}D${3}H${4}.state"
+"""
+
+HEADER = """1 num_base_stations
+clim/station.base base_station_filename
+"""
+
+BASE_STATION = """101 base_station_id
+clim/station daily_climate_prefix
+"""
+
+class StubLAIReadMultiple(LAIReadMultiple):
+    """ LAIReadMultiple run in a fake GRASS location """
+    def setupGrassEnv(self):
+        gisrc = os.path.join(self.context.projectDir, 'gisrc')
+        self.grassSession = GrassSession(ProcessGRASSLib(), env={'GISRC': gisrc})
+
+class TestModelRun(TestCase):
+
+    def setUp(self):
+        self.projectDir = tempfile.mkdtemp()
+        self.context = Context(self.projectDir, None)
+        self.paths = RHESSysPaths(self.projectDir, 'rhessys')
+        for (name, script) in [('lairead', LAIREAD), ('rhessys', RHESSYS)]:
+            path = os.path.join(self.paths.RHESSYS_BIN, name)
+            with open(path, 'w') as f:
+                f.write(script)
+            os.chmod(path, stat.S_IRWXU)
+            RHESSysMetadata.writeRHESSysEntry(self.context, name + '_bin', self.paths.relpath(path))
+        with open(os.path.join(self.paths.RHESSYS_CLIM, 'station.base'), 'w') as f:
+            f.write(BASE_STATION)
+        with open(os.path.join(self.paths.RHESSYS_CLIM, 'station.rain'), 'w') as f:
+            f.write("2000 1 1 1\n" + "0.1\n" * 10)
+        allometric = os.path.join(self.paths.RHESSYS_DEF, 'allometric.txt')
+        open(allometric, 'w').close()
+
+        mapsetPath = os.path.join(self.projectDir, 'GRASSData', 'default', 'PERMANENT')
+        os.makedirs(mapsetPath)
+        with open(os.path.join(mapsetPath, 'WIND'), 'w') as f:
+            f.write("north: 10\n")
+        with open(os.path.join(self.projectDir, 'gisrc'), 'w') as f:
+            f.write("GISDBASE: {0}\nLOCATION_NAME: default\nMAPSET: PERMANENT\n".format(os.path.join(self.projectDir, 'GRASSData')))
+
+        for (key, value) in [('rhessys_dir', 'rhessys'), ('allometric_table', self.paths.relpath(allometric)),
+                             ('grass_dbase', 'GRASSData'), ('grass_location', 'default'),
+                             ('grass_mapset', 'PERMANENT')]:
+            RHESSysMetadata.writeRHESSysEntry(self.context, key, value)
+        for key in ['dem_rast', 'hillslope_rast', 'zone_rast', 'patch_rast', 'stratum_rast', 'lai_rast']:
+            RHESSysMetadata.writeGRASSEntry(self.context, key, key.replace('_rast', ''))
+
+    def tearDown(self):
+        shutil.rmtree(self.projectDir)
+
+    def runLAIRead(self, masks, jobs):
+        worldfiles = []
+        for mask in masks:
+            worldfile = os.path.join(self.paths.RHESSYS_WORLD, "world_{0}_init".format(mask))
+            open(worldfile, 'w').close()
+            with open(worldfile + '.hdr', 'w') as f:
+                f.write(HEADER)
+            worldfiles.append(self.paths.relpath(worldfile))
+        flowtables = lambda kind: RHESSysMetadata.VALUE_DELIM.join(["rhessys/flow/world_{0}_{1}.flow".format(m, kind) for m in masks])
+        for (key, value) in [('subbasin_masks', RHESSysMetadata.VALUE_DELIM.join(masks)),
+                             ('worldfiles_init', RHESSysMetadata.VALUE_DELIM.join(worldfiles)),
+                             ('surface_flowtables', flowtables('surface')),
+                             ('subsurface_flowtables', flowtables('subsurface'))]:
+            RHESSysMetadata.writeRHESSysEntry(self.context, key, value)
+        with open(os.devnull, 'w') as outfp:
+            command = StubLAIReadMultiple(self.projectDir, outfp=outfp)
+            command.run(jobs=jobs)
+
+    def stages(self):
+        with open(os.path.join(self.paths.RHESSYS_BIN, 'stages.log')) as f:
+            return sorted(f.read().splitlines())
+
+    def test_pipeline(self):
+        self.runLAIRead(['a', 'b', 'c'], jobs=2)
+        self.assertEqual(self.stages(), ['lairead a', 'lairead b', 'lairead c',
+                                         'rhessys world_a_init', 'rhessys world_b_init', 'rhessys world_c_init'])
+        metadata = RHESSysMetadata.readRHESSysEntries(self.context)
+        self.assertEqual(metadata['worldfiles'],
+                         'rhessys/worldfiles/world_a,rhessys/worldfiles/world_b,rhessys/worldfiles/world_c')
+        self.assertEqual(metadata['lairead_tecfiles'],
+                         'rhessys/tecfiles/tec.lairead_a,rhessys/tecfiles/tec.lairead_b,rhessys/tecfiles/tec.lairead_c')
+        for mask in ['a', 'b', 'c']:
+            worldfile = os.path.join(self.paths.RHESSYS_WORLD, "world_{0}".format(mask))
+            self.assertTrue(os.path.isfile(worldfile + '.hdr'))
+            # Subsurface flow table comes before surface flow table
+            with open(worldfile) as f:
+                self.assertTrue(f.read().find("-r {0} {1}".format(
+                    os.path.join(self.paths.RHESSYS_FLOW, "world_{0}_subsurface.flow".format(mask)),
+                    os.path.join(self.paths.RHESSYS_FLOW, "world_{0}_surface.flow".format(mask)))) != -1)
+
+    def test_lairead_failure(self):
+        self.assertRaises(RunException, self.runLAIRead, ['bad', 'a', 'b'], jobs=1)
+        # Neither lairead for later worldfiles nor RHESSys is run
+        self.assertEqual(self.stages(), ['lairead bad'])
+        self.assertFalse('worldfiles' in RHESSysMetadata.readRHESSysEntries(self.context))
+
+        # RHESSys is not run for a worldfile whose lairead failed, nor lairead for later worldfiles
+        os.unlink(os.path.join(self.paths.RHESSYS_BIN, 'stages.log'))
+        self.assertRaises(RunException, self.runLAIRead, ['a', 'bad', 'b'], jobs=1)
+        self.assertFalse('lairead b' in self.stages())
+        self.assertFalse('rhessys world_bad_init' in self.stages())
+        self.assertFalse('rhessys world_b_init' in self.stages())
+        self.assertFalse('worldfiles' in RHESSysMetadata.readRHESSysEntries(self.context))
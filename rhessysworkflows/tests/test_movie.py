@@ -0,0 +1,96 @@
+"""@package rhessysworkflows.tests.test_movie
+
+    @brief Test methods for rhessysworkflows.movie
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_movie
+    @endcode
+
+"""
+from unittest import TestCase
+
+import numpy as np
+
+from rhessysworkflows.patchmap import PatchRasterMap
+from rhessysworkflows.movie import FrameRenderer, Overlay, grassColorMap, iterFrames, writeMovie
+
+COLOR_RULES = """0 255:0:0
+5 0:255:0
+10 0:0:255
+nv 255:255:255
+default 255:255:255
+"""
+
+class TestMovie(TestCase):
+
+    def setUp(self):
+        patchRaster = np.repeat(np.arange(1, 9), 10).reshape(8, 10).astype(float)
+        patchRaster[0,0] = np.nan
+        self.patchMap = PatchRasterMap(patchRaster)
+        self.patchIDs = np.arange(1, 9)
+        self.frames = [("10/%d/2000" % (i,), self.patchIDs, self.patchIDs * float(i)) \
+                       for i in range(1, 5)]
+
+    def test_grass_color_map(self):
+        (cmap, vmin, vmax) = grassColorMap(COLOR_RULES)
+        self.assertEqual( (vmin, vmax), (0.0, 10.0) )
+        # Colors are interpolated from a lookup table
+        self.assertTrue(np.allclose(cmap(0.0), (1.0, 0.0, 0.0, 1.0), atol=0.01))
+        self.assertTrue(np.allclose(cmap(0.5), (0.0, 1.0, 0.0, 1.0), atol=0.01))
+        self.assertTrue(np.allclose(cmap(1.0), (0.0, 0.0, 1.0, 1.0), atol=0.01))
+        self.assertRaises(ValueError, grassColorMap, "nv 255:255:255\n")
+
+    def test_render(self):
+        (cmap, vmin, vmax) = grassColorMap(COLOR_RULES)
+        overlay = Overlay('overlay', np.where(np.eye(8, 10) > 0, 5.0, np.nan), cmap, vmin, vmax)
+        renderer = FrameRenderer(self.patchMap, 'Title', overlays=[overlay], overlayLegend=True,
+                                 width=160, height=120)
+        self.assertEqual(renderer.size, (160, 120))
+        frame = renderer.render(*self.frames[0])
+        self.assertEqual(len(frame), 160 * 120 * 3)
+        # Frames differ only where values differ
+        self.assertNotEqual(frame, renderer.render("10/1/2000", self.patchIDs, self.patchIDs[::-1]))
+
+    def test_parallel_frames_in_order(self):
+        renderer = FrameRenderer(self.patchMap, 'Title', valueRange=(0, 40),
+                                 legendLabels=('Low', 'High'), width=160, height=120)
+        serial = list(iterFrames(renderer, self.frames))
+        parallel = list(iterFrames(renderer, self.frames, jobs=2))
+        self.assertEqual(len(serial), len(self.frames))
+        self.assertEqual(serial, parallel)
+
+    def test_no_frames(self):
+        renderer = FrameRenderer(self.patchMap, 'Title', width=160, height=120)
+        self.assertEqual(writeMovie(renderer, [], 'unused.mp4', ffmpegPath='/nonexistent/ffmpeg'), 0)
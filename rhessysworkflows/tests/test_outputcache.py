@@ -0,0 +1,114 @@
+"""@package rhessysworkflows.tests.test_outputcache
+
+    @brief Test methods for rhessysworkflows.outputcache
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_outputcache
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+from rhessysworkflows.rhessys import RHESSysOutput
+from rhessysworkflows.outputcache import OutputCache
+
+PATCH_DAILY = """day month year basinID hillID zoneID patchID rain_thru trans_sat trans_unsat
+1 10 2000 1 1 1 12 1.5 0.25 0.5
+1 10 2000 1 1 1 11 2.5 0.125 0.75
+2 10 2000 1 1 1 12 3.5 0.5 1.0
+2 10 2000 1 1 1 11 4.5 0.0625 1.25
+3 10 2000 1 1 1 11 5.5 0.25 1.5
+"""
+
+class TestOutputCache(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.patchDailyPath = os.path.join(self.tmpDir, 'rhessys_patch.daily')
+        with open(self.patchDailyPath, 'w') as f:
+            f.write(PATCH_DAILY)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def readPatchDaily(self):
+        with open(self.patchDailyPath) as f:
+            return RHESSysOutput.readColumnsFromPatchDailyFile(f, ['patchID', 'trans_sat', 'trans_unsat'])
+
+    def test_cache_matches_parse(self):
+        parsed = self.readPatchDaily()
+        cache = RHESSysOutput.cacheOutputFile(self.patchDailyPath)
+        self.assertTrue(cache.isCurrent())
+        self.assertTrue(cache.isPatchCube)
+        cached = self.readPatchDaily()
+
+        self.assertEqual(list(parsed.keys()), list(cached.keys()))
+        for date in parsed:
+            # Cached patches are ordered by patch ID
+            order = sorted(range(len(parsed[date]['patchID'])),
+                           key=lambda i: parsed[date]['patchID'][i])
+            for col in ['patchID', 'trans_sat', 'trans_unsat']:
+                self.assertEqual([parsed[date][col][i] for i in order], cached[date][col])
+
+    def test_stale_cache(self):
+        cache = RHESSysOutput.cacheOutputFile(self.patchDailyPath)
+        with open(self.patchDailyPath, 'a') as f:
+            f.write("3 10 2000 1 1 1 12 6.5 0.5 1.75\n")
+        self.assertFalse(OutputCache(self.patchDailyPath).isCurrent())
+        data = self.readPatchDaily()
+        self.assertEqual(len(list(data.values())[-1]['patchID']), 2)
+
+    def test_partial_digest(self):
+        def modify(offset):
+            with open(self.patchDailyPath, 'r+b') as f:
+                f.seek(offset)
+                f.write(b'9')
+            os.utime(self.patchDailyPath, (1000000000, 1000000000))
+            return OutputCache(self.patchDailyPath)
+        # Content outside the first and last blocks is only checked on request
+        OutputCache._PARTIAL_SIZE = 16
+        try:
+            # Whole seconds, so that the modification time can be restored exactly
+            os.utime(self.patchDailyPath, (1000000000, 1000000000))
+            RHESSysOutput.cacheOutputFile(self.patchDailyPath)
+            cache = modify(len(PATCH_DAILY) // 2)
+            self.assertTrue(cache.isCurrent())
+            self.assertFalse(cache.isCurrent(verify=True))
+            self.assertFalse(modify(len(PATCH_DAILY) - 2).isCurrent())
+        finally:
+            OutputCache._PARTIAL_SIZE = 64 * 1024
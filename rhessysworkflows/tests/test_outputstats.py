@@ -0,0 +1,138 @@
+"""@package rhessysworkflows.tests.test_outputstats
+
+    @brief Test methods for rhessysworkflows.outputstats
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_outputstats
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from rhessysworkflows.expression import VariableExpression
+from rhessysworkflows.outputstats import QuantileSketch, OutputStatistics, StatisticsCache, \
+    patchDailyStatistics
+
+PATCH_DAILY = """day month year basinID hillID zoneID patchID rain_thru trans_sat trans_unsat
+1 10 2000 1 1 1 12 1.5 0.25 0.5
+1 10 2000 1 1 1 11 2.5 0.125 0.75
+2 10 2000 1 1 1 12 3.5 0.5 1.0
+2 10 2000 1 1 1 11 4.5 0.0625 1.25
+3 10 2000 1 1 1 11 5.5 0.25 1.5
+"""
+
+class TestQuantileSketch(TestCase):
+
+    def setUp(self):
+        self.values = np.random.RandomState(42).lognormal(size=10000) - 1.0
+
+    def assertWithinRelativeError(self, estimate, value, relativeError):
+        self.assertTrue(abs(estimate - value) <= relativeError * abs(value) + 1e-12,
+                        "%f not within %f of %f" % (estimate, relativeError, value) )
+
+    def test_quantiles(self):
+        sketch = QuantileSketch(0.01)
+        sketch.update(self.values)
+        self.assertEqual(sketch.count, len(self.values))
+        ordered = np.sort(self.values)
+        for q in [0.0, 0.01, 0.25, 0.5, 0.75, 0.99, 1.0]:
+            exact = ordered[int(q * (len(ordered) - 1))]
+            self.assertWithinRelativeError(sketch.quantile(q), exact, 0.01)
+
+    def test_merge(self):
+        whole = QuantileSketch()
+        whole.update(self.values)
+        merged = QuantileSketch()
+        for part in np.array_split(self.values, 7):
+            sketch = QuantileSketch()
+            sketch.update(part)
+            merged.merge(sketch)
+        for q in [0.1, 0.5, 0.9]:
+            self.assertEqual(merged.quantile(q), whole.quantile(q))
+        self.assertRaises(ValueError, merged.merge, QuantileSketch(0.05))
+
+    def test_zeros_and_nan(self):
+        sketch = QuantileSketch()
+        sketch.update([0.0, 0.0, float('nan'), -1.0, 1.0])
+        self.assertEqual(sketch.count, 4)
+        self.assertEqual(sketch.quantile(0.5), 0.0)
+        self.assertTrue(np.isnan(QuantileSketch().quantile(0.5)))
+
+
+class TestOutputStatistics(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.patchDailyPath = os.path.join(self.tmpDir, 'rhessys_patch.daily')
+        with open(self.patchDailyPath, 'w') as f:
+            f.write(PATCH_DAILY)
+        self.expr = VariableExpression('trans_sat + trans_unsat')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def test_statistics(self):
+        stats = OutputStatistics()
+        stats.update([3.0, 1.0])
+        other = OutputStatistics()
+        other.update([2.0, float('nan')])
+        stats.merge(other)
+        self.assertEqual( (stats.count, stats.min, stats.max, stats.mean), (3, 1.0, 3.0, 2.0) )
+        self.assertEqual(stats.quantile(0), 1.0)
+        self.assertEqual(stats.quantile(1), 3.0)
+        copy = OutputStatistics.fromDict(stats.toDict())
+        self.assertEqual(copy.quantile(0.5), stats.quantile(0.5))
+
+    def test_patch_daily_statistics(self):
+        stats = patchDailyStatistics(self.patchDailyPath, self.expr)
+        self.assertEqual(stats.count, 5)
+        self.assertEqual(stats.min, 0.75)
+        self.assertEqual(stats.max, 1.75)
+        self.assertTrue(os.path.isfile(self.patchDailyPath + StatisticsCache.SUFFIX))
+        cached = StatisticsCache(self.patchDailyPath).get(str(self.expr))
+        self.assertEqual(cached.toDict(), stats.toDict())
+
+    def test_stale_cache(self):
+        patchDailyStatistics(self.patchDailyPath, self.expr)
+        with open(self.patchDailyPath, 'a') as f:
+            f.write("3 10 2000 1 1 1 12 6.5 4.0 1.75\n")
+        self.assertEqual(StatisticsCache(self.patchDailyPath).get(str(self.expr)), None)
+        stats = patchDailyStatistics(self.patchDailyPath, self.expr)
+        self.assertEqual(stats.max, 5.75)
@@ -0,0 +1,84 @@
+"""@package rhessysworkflows.tests.test_patchmap
+
+    @brief Test methods for rhessysworkflows.patchmap
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_patchmap
+    @endcode
+
+"""
+from unittest import TestCase
+
+import numpy as np
+
+from rhessysworkflows.patchmap import PatchRasterMap
+
+NAN = float('nan')
+
+PATCH_RASTER = [[12, 12, 11],
+                [11, 30, NAN],
+                [NAN, 30, 12]]
+
+class TestPatchRasterMap(TestCase):
+
+    def setUp(self):
+        self.patchMap = PatchRasterMap(np.array(PATCH_RASTER))
+
+    def test_index(self):
+        self.assertEqual(self.patchMap.patchIDs.tolist(), [11, 12, 30])
+        (idx, found) = self.patchMap.denseIndex([30, 5, 11, 99])
+        self.assertEqual(found.tolist(), [True, False, True, False])
+        self.assertEqual(idx[found].tolist(), [2, 0])
+
+    def test_render(self):
+        raster = self.patchMap.render([30, 12, 11], [3.0, 2.0, 1.0])
+        expected = np.array([[2.0, 2.0, 1.0],
+                             [1.0, 3.0, NAN],
+                             [NAN, 3.0, 2.0]])
+        self.assertTrue(np.array_equal(np.isnan(raster), np.isnan(expected)))
+        self.assertTrue(np.allclose(raster[~np.isnan(raster)], expected[~np.isnan(expected)]))
+
+    def test_render_missing_patches(self):
+        # Patches without values, and values for patches not in the raster
+        raster = self.patchMap.render([12, 99], [2.0, 9.0], fill=-1.0)
+        expected = [[2.0, 2.0, -1.0],
+                    [-1.0, -1.0, -1.0],
+                    [-1.0, -1.0, 2.0]]
+        self.assertEqual(raster.tolist(), expected)
+
+    def test_integer_raster(self):
+        patchMap = PatchRasterMap(np.array([[1, 2], [2, 1]]))
+        raster = patchMap.render([1, 2], [0.5, 1.5])
+        self.assertEqual(raster.tolist(), [[0.5, 1.5], [1.5, 0.5]])
@@ -0,0 +1,118 @@
+"""@package rhessysworkflows.tests.test_progress
+
+    @brief Test methods for rhessysworkflows.progress
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_progress
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import datetime
+
+from rhessysworkflows.progress import ProgressTracker, lastDailyDate, dateFromStdoutLine, readStatus, formatStatus
+from rhessysworkflows.progress import RUNNING, COMPLETED, FAILED
+
+BASIN_DAILY = """day month year basinID pot_surface_infil snow_thr sat_def_z
+1 1 2000 1 0.0 0.0 100.0
+2 1 2000 1 0.0 0.0 100.0
+3 1 2000 1 0.0 0.0 100.0
+"""
+
+class TestProgress(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.outputPrefix = os.path.join(self.tmpDir, 'rhessys')
+        self.dailyPath = self.outputPrefix + '_basin.daily'
+        self.statusPath = os.path.join(self.tmpDir, 'rhessys.status')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def test_last_daily_date(self):
+        self.assertEqual(lastDailyDate(self.dailyPath), None)
+        with open(self.dailyPath, 'w') as f:
+            f.write(BASIN_DAILY.splitlines()[0] + '\n')
+        self.assertEqual(lastDailyDate(self.dailyPath), None)
+        with open(self.dailyPath, 'w') as f:
+            # The last line is still being written
+            f.write(BASIN_DAILY + '4 1 20')
+        self.assertEqual(lastDailyDate(self.dailyPath), datetime.datetime(2000, 1, 3))
+
+        self.assertEqual(dateFromStdoutLine("   2000 1 31 1\n"), datetime.datetime(2000, 1, 31))
+        self.assertEqual(dateFromStdoutLine("Reading worldfile\n"), None)
+
+    def test_tracker(self):
+        tracker = ProgressTracker(datetime.datetime(2000, 1, 1, 1), datetime.datetime(2000, 1, 11, 1),
+                                  self.outputPrefix, self.statusPath)
+        status = tracker.poll(now=100.0)
+        self.assertEqual(status['simulated_date'], None)
+        self.assertEqual(formatStatus(status), 'Starting')
+
+        with open(self.dailyPath, 'w') as f:
+            f.write(BASIN_DAILY)
+        tracker.poll(now=101.0)
+        with open(self.dailyPath, 'a') as f:
+            f.write("4 1 2000 1 0.0 0.0 100.0\n5 1 2000 1 0.0 0.0 100.0\n")
+        tracker.update("   2000 1 6 1\n")
+        tracker.poll(now=102.0)
+        status = readStatus(self.statusPath)
+        self.assertEqual(status['state'], RUNNING)
+        self.assertEqual(status['simulated_date'], '2000-01-06 00:00:00')
+        self.assertEqual(status['simulated_days'], 5)
+        self.assertEqual(status['total_days'], 10)
+        self.assertAlmostEqual(status['fraction'], 0.5)
+        self.assertAlmostEqual(status['days_per_second'], 3.0)
+        self.assertAlmostEqual(status['eta_seconds'], 5.0 / 3.0)
+
+        status = tracker.stop(0)
+        self.assertEqual(status['state'], COMPLETED)
+        self.assertEqual(status['fraction'], 1.0)
+        self.assertEqual(readStatus(self.statusPath)['returncode'], 0)
+
+    def test_failed(self):
+        tracker = ProgressTracker(datetime.datetime(2000, 1, 1, 1), datetime.datetime(2000, 1, 11, 1),
+                                  self.outputPrefix, self.statusPath, interval=0.01)
+        tracker.start()
+        with open(self.dailyPath, 'w') as f:
+            f.write(BASIN_DAILY)
+        status = tracker.stop(1)
+        self.assertEqual(status['state'], FAILED)
+        self.assertEqual(status['simulated_date'], '2000-01-03 00:00:00')
+        self.assertEqual(status['returncode'], 1)
@@ -0,0 +1,126 @@
+"""@package rhessysworkflows.tests.test_resources
+
+    @brief Test methods for rhessysworkflows.resources
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_resources
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import subprocess
+import time
+import datetime
+
+from rhessysworkflows.context import Context
+from rhessysworkflows.metadata import ModelRun
+from rhessysworkflows import resources
+from rhessysworkflows.resources import ResourceUsage, ProcessRecord, rankByCost
+
+class TestResources(TestCase):
+
+    def setUp(self):
+        self.projectDir = tempfile.mkdtemp()
+        self.context = Context(self.projectDir, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.projectDir)
+
+    def test_communicate(self):
+        startTime = time.time()
+        process = subprocess.Popen(['sh', '-c', 'echo out; echo err 1>&2; exit 3'],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (stdout, stderr, usage) = resources.communicate(process, startTime)
+        self.assertEqual(process.returncode, 3)
+        self.assertEqual(stdout.strip(), b'out')
+        self.assertEqual(stderr.strip(), b'err')
+        self.assertTrue(usage.wallTime >= 0.0)
+        self.assertTrue(usage.maxRSS > 0)
+
+        process = subprocess.Popen(['sh', '-c', 'exit 0'])
+        usage = resources.wait(process, time.time())
+        self.assertEqual(process.returncode, 0)
+        self.assertTrue(usage.cpuTime >= 0.0)
+
+    def test_output_size(self):
+        outputDir = os.path.join(self.projectDir, 'out')
+        os.mkdir(outputDir)
+        with open(os.path.join(outputDir, 'rhessys_basin.daily'), 'w') as f:
+            f.write('x' * 100)
+        with open(os.path.join(self.projectDir, 'world'), 'w') as f:
+            f.write('x' * 10)
+        self.assertEqual(resources.outputSize([outputDir, os.path.join(self.projectDir, 'world'),
+                                               os.path.join(self.projectDir, 'missing')]), 110)
+
+    def test_model_run_metadata(self):
+        run = ModelRun()
+        run.date = datetime.datetime.utcnow()
+        run.description = 'Test run'
+        run.command = 'rhessys -st 2000 1 1 1'
+        run.output = 'rhessys/output/test'
+        run.resources = ResourceUsage(wallTime=12.5, userTime=10.25, systemTime=0.5,
+                                      maxRSS=4096, bytesWritten=1024, outputSize=2048)
+        run.writeToMetadata(self.context)
+
+        read = ModelRun.readFromMetadata(self.context, 'rhessys_1')
+        self.assertEqual(read.output, 'rhessys/output/test')
+        self.assertEqual(read.resources.wallTime, 12.5)
+        self.assertEqual(read.resources.cpuTime, 10.75)
+        self.assertEqual(read.resources.maxRSS, 4096)
+        self.assertEqual(read.resources.outputSize, 2048)
+
+    def test_process_records(self):
+        records = [ProcessRecord('lairead', 'Redefine worldfile', 'lairead -old world', 'rhessys/worldfiles/world.redef',
+                                 ResourceUsage(wallTime=1.0, maxRSS=100)),
+                   ProcessRecord('grass2world', 'Worldfile', 'g2w -w world', 'rhessys/worldfiles/world',
+                                 ResourceUsage(wallTime=3.0, maxRSS=50))]
+        ProcessRecord.writeToMetadata(self.context, records)
+        ProcessRecord.writeToMetadata(self.context, [ProcessRecord('createflowpaths', 'Flow table')])
+
+        read = ProcessRecord.readFromMetadata(self.context)
+        self.assertEqual([r.id for r in read], ['process_1', 'process_2', 'process_3'])
+        self.assertEqual([r.name for r in read], ['lairead', 'grass2world', 'createflowpaths'])
+        self.assertEqual(read[1].usage.wallTime, 3.0)
+        self.assertEqual(read[1].usage.bytesWritten, None)
+        self.assertEqual(read[2].usage, None)
+
+        ranked = rankByCost([(r.name, r.usage) for r in read], resources.WALL)
+        self.assertEqual([r[0] for r in ranked], ['grass2world', 'lairead', 'createflowpaths'])
+        ranked = rankByCost([(r.name, r.usage) for r in read], resources.RSS)
+        self.assertEqual([r[0] for r in ranked], ['lairead', 'grass2world', 'createflowpaths'])
+        self.assertRaises(ValueError, rankByCost, [], 'memory')
@@ -0,0 +1,266 @@
+"""@package rhessysworkflows.tests.test_rhessys
+
+    @brief Test methods for rhessysworkflows.rhessys
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_rhessys
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import datetime
+
+import numpy as np
+
+from rhessysworkflows.rhessys import RHESSysOutput, generateCommandString
+
+PATCH_DAILY = """day month year basinID hillID zoneID patchID rain_thru trans_sat trans_unsat
+1 10 2000 1 1 1 12 1.5 0.25 0.5
+1 10 2000 1 1 1 11 2.5 0.125 0.75
+2 10 2000 1 1 1 12 3.5 0.5 1.0
+2 10 2000 1 1 1 11 4.5 0.0625 1.25
+3 10 2000 1 1 1 11 5.5 0.25 1.5
+"""
+
+class TestPatchDailyReaders(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.patchDailyPath = os.path.join(self.tmpDir, 'rhessys_patch.daily')
+        with open(self.patchDailyPath, 'w') as f:
+            f.write(PATCH_DAILY)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def readCube(self, column_names):
+        with open(self.patchDailyPath) as f:
+            return RHESSysOutput.readPatchDailyCube(f, column_names)
+
+    def test_cube(self):
+        (dates, patchIDs, cube) = self.readCube(['patchID', 'trans_sat', 'trans_unsat', 'missing'])
+        self.assertEqual([d.astype(datetime.datetime) for d in dates],
+                         [datetime.datetime(2000, 10, day, 1) for day in (1, 2, 3)])
+        self.assertEqual(patchIDs.tolist(), [11, 12])
+        self.assertEqual(sorted(cube.keys()), ['trans_sat', 'trans_unsat'])
+        self.assertEqual(cube['trans_sat'].shape, (3, 2))
+        self.assertEqual(cube['trans_unsat'][1].tolist(), [1.25, 1.0])
+        # Patch 12 has no output for the last day
+        self.assertTrue(np.isnan(cube['trans_sat'][2, 1]))
+
+    def test_cube_from_cache(self):
+        (dates, patchIDs, cube) = self.readCube(['trans_sat'])
+        RHESSysOutput.cacheOutputFile(self.patchDailyPath)
+        (cachedDates, cachedPatchIDs, cachedCube) = self.readCube(['trans_sat'])
+        self.assertTrue(np.array_equal(dates, cachedDates))
+        self.assertTrue(np.array_equal(patchIDs, cachedPatchIDs))
+        self.assertTrue(np.allclose(cube['trans_sat'], cachedCube['trans_sat'], equal_nan=True))
+
+    def test_iter_matches_cube(self):
+        (dates, patchIDs, cube) = self.readCube(['trans_sat'])
+        # Use a small block size so that days span blocks
+        for blockSize in [16, 4096]:
+            with open(self.patchDailyPath) as f:
+                days = list(RHESSysOutput.iterPatchDailyFile(f, ['trans_sat'], blockSize=blockSize))
+            self.assertEqual([d[0] for d in days], list(dates))
+            for (i, (date, dayPatchIDs, data)) in enumerate(days):
+                idx = np.searchsorted(patchIDs, dayPatchIDs)
+                self.assertEqual(data['trans_sat'].tolist(), cube['trans_sat'][i, idx].tolist())
+        self.assertEqual(days[-1][1].tolist(), [11])
+
+    def test_iter_without_final_newline(self):
+        with open(self.patchDailyPath, 'w') as f:
+            f.write(PATCH_DAILY.rstrip())
+        with open(self.patchDailyPath) as f:
+            days = list(RHESSysOutput.iterPatchDailyFile(f, ['rain_thru'], blockSize=16))
+        self.assertEqual(len(days), 3)
+        self.assertEqual(days[-1][2]['rain_thru'].tolist(), [5.5])
+
+    def test_malformed_line(self):
+        lines = PATCH_DAILY.splitlines(True)
+        # Blank lines are ignored
+        with open(self.patchDailyPath, 'w') as f:
+            f.write(''.join(lines[:3] + ['\n'] + lines[3:]))
+        with open(self.patchDailyPath) as f:
+            days = list(RHESSysOutput.iterPatchDailyFile(f, ['rain_thru']))
+        self.assertEqual(len(days), 3)
+        # A line starting with a field that is not a number must not end the file
+        lines[3] = lines[3].replace('2', 'two', 1)
+        with open(self.patchDailyPath, 'w') as f:
+            f.write(''.join(lines))
+        with open(self.patchDailyPath) as f:
+            self.assertRaises(ValueError, list, RHESSysOutput.iterPatchDailyFile(f, ['rain_thru']))
+
+    def test_predicates(self):
+        startDate = datetime.datetime(2000, 10, 2)
+        endDate = datetime.datetime(2000, 10, 2, 23)
+        with open(self.patchDailyPath) as f:
+            data = RHESSysOutput.readColumnsFromPatchDailyFile(f, ['patchID', 'trans_sat'],
+                                                               startDate=startDate, endDate=endDate,
+                                                               patchIDs=[11])
+        self.assertEqual(list(data.keys()), [datetime.datetime(2000, 10, 2, 1)])
+        self.assertEqual(data[datetime.datetime(2000, 10, 2, 1)]['trans_sat'], [0.0625])
+        with open(self.patchDailyPath) as f:
+            days = list(RHESSysOutput.iterPatchDailyFile(f, ['trans_sat'], blockSize=16,
+                                                         startDate=startDate, patchIDs=[12]))
+        self.assertEqual(len(days), 1)
+        self.assertEqual(days[0][1].tolist(), [12])
+        self.assertEqual(days[0][2]['trans_sat'].tolist(), [0.5])
+        
+        for cached in [False, True]:
+            if cached:
+                RHESSysOutput.cacheOutputFile(self.patchDailyPath)
+            with open(self.patchDailyPath) as f:
+                (dates, patchIDs, cube) = RHESSysOutput.readPatchDailyCube(f, ['trans_unsat'],
+                                                                           startDate=startDate,
+                                                                           patchIDs=[11, 13])
+            self.assertEqual(len(dates), 2)
+            self.assertEqual(patchIDs.tolist(), [11])
+            self.assertEqual(cube['trans_unsat'][:,0].tolist(), [1.25, 1.5])
+
+    def test_parallel_matches_serial(self):
+        with open(self.patchDailyPath) as f:
+            serial = RHESSysOutput.readColumnsFromPatchDailyFile(f, ['patchID', 'trans_sat'])
+        with open(self.patchDailyPath) as f:
+            parallel = RHESSysOutput.readColumnsFromPatchDailyFile(f, ['patchID', 'trans_sat'], jobs=2)
+        self.assertEqual(serial, parallel)
+        
+        (dates, patchIDs, cube) = self.readCube(['trans_sat'])
+        with open(self.patchDailyPath) as f:
+            days = list(RHESSysOutput.iterPatchDailyFile(f, ['trans_sat'], blockSize=16, jobs=2))
+        self.assertEqual([d[0] for d in days], list(dates))
+        with open(self.patchDailyPath) as f:
+            (pDates, pPatchIDs, pCube) = RHESSysOutput.readPatchDailyCube(f, ['trans_sat'], jobs=2)
+        self.assertTrue(np.array_equal(dates, pDates))
+        self.assertTrue(np.array_equal(patchIDs, pPatchIDs))
+        self.assertTrue(np.allclose(cube['trans_sat'], pCube['trans_sat'], equal_nan=True))
+
+
+BASIN_DAILY = """day month year basinID streamflow evap
+30 9 2000 1 0.5 1.25
+1 10 2000 1 0.75 1.5
+"""
+
+OBSERVED = """2000 9 30 1
+0.25
+0.5
+"""
+
+class TestTimeseriesReaders(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.basinDailyPath = os.path.join(self.tmpDir, 'rhessys_basin.daily')
+        with open(self.basinDailyPath, 'w') as f:
+            f.write(BASIN_DAILY)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def test_read_columns(self):
+        with open(self.basinDailyPath) as f:
+            df = RHESSysOutput.readColumnsFromFile(f, ['streamflow', 'evap'], readHour=False)
+        self.assertEqual(list(df.columns), ['streamflow', 'evap'])
+        self.assertEqual(list(df.index.to_pydatetime()),
+                         [datetime.datetime(2000, 9, 30), datetime.datetime(2000, 10, 1)])
+        self.assertEqual(df['evap'].tolist(), [1.25, 1.5])
+
+    def test_read_column(self):
+        with open(self.basinDailyPath) as f:
+            (dates, data) = RHESSysOutput.readColumnFromFile(f, 'evap', startHour=0)
+        self.assertEqual(dates, [datetime.datetime(2000, 9, 30), datetime.datetime(2000, 10, 1)])
+        self.assertEqual(data, [1.25, 1.5])
+        with open(self.basinDailyPath) as f:
+            self.assertEqual(RHESSysOutput.readColumnFromFile(f, 'missing'), ([], []))
+
+    def test_read_observed(self):
+        observedPath = os.path.join(self.tmpDir, 'obs.txt')
+        with open(observedPath, 'w') as f:
+            f.write(OBSERVED)
+        with open(observedPath) as f:
+            (dates, data) = RHESSysOutput.readObservedDataFromFile(f, readHour=False)
+        self.assertEqual(dates, [datetime.datetime(2000, 9, 30), datetime.datetime(2000, 10, 1)])
+        self.assertEqual(data, [0.25, 0.5])
+        with open(observedPath) as f:
+            (dates, data) = RHESSysOutput.readObservedDataFromFile(f, 
+                                timeStep=RHESSysOutput.TIME_STEP_HOURLY)
+        self.assertEqual(dates[-1], datetime.datetime(2000, 9, 30, 2))
+
+    def test_read_columns_from_files(self):
+        otherPath = os.path.join(self.tmpDir, 'other_basin.daily')
+        with open(otherPath, 'w') as f:
+            f.write(BASIN_DAILY + "2 10 2000 1 1.0 1.75\n")
+        (dates, data) = RHESSysOutput.readColumnsFromFiles([self.basinDailyPath, otherPath],
+                                                           ['streamflow', 'evap', 'missing'],
+                                                           startHour=0)
+        self.assertEqual(dates.astype(object).tolist(),
+                         [datetime.datetime(2000, 9, 30), datetime.datetime(2000, 10, 1)])
+        self.assertEqual(len(data), 2)
+        self.assertEqual(sorted(data[1].keys()), ['evap', 'streamflow'])
+        self.assertEqual(data[1]['streamflow'].tolist(), [0.5, 0.75])
+        
+        # Without alignment each file keeps all of its dates
+        (dates, data) = RHESSysOutput.readColumnsFromFiles([self.basinDailyPath, otherPath],
+                                                           ['streamflow'], startHour=0,
+                                                           align=False)
+        self.assertEqual([len(d) for d in dates], [2, 3])
+        self.assertEqual(dates[1][-1].astype(object), datetime.datetime(2000, 10, 2))
+        self.assertEqual(data[1]['streamflow'].tolist(), [0.5, 0.75, 1.0])
+        
+        # Modified files are read again
+        (dates, data) = RHESSysOutput.readColumnsFromFiles([otherPath], ['evap'], startHour=0)
+        with open(otherPath, 'w') as f:
+            f.write(BASIN_DAILY)
+        os.utime(otherPath, (0, 0))
+        (dates, data) = RHESSysOutput.readColumnsFromFiles([otherPath], ['evap'], startHour=0)
+        self.assertEqual(data[0]['evap'].tolist(), [1.25, 1.5])
+
+
+class TestGenerateCommandString(TestCase):
+
+    def test_command(self):
+        start = datetime.datetime(2000, 1, 1, 1)
+        end = datetime.datetime(2001, 1, 1, 1)
+        cmd = generateCommandString('bin/rhessys', 'out/rhessys', start, end, 'tec', 'world',
+                                    'subsurface', 'surface', flags='bp',
+                                    sv=(1.0, 2.0), gw=(0.1, 0.2), s=(0.5, 3.0, 4.0))
+        self.assertEqual(cmd, 'bin/rhessys -st 2000 1 1 1 -ed 2001 1 1 1 -t tec -w world '
+                              '-r subsurface surface -pre out/rhessys -b -p '
+                              '-gw 0.1 0.2 -s 0.5 3.0 4.0 -sv 1.0 2.0')
+        cmd = generateCommandString('bin/rhessys', None, start, end, 'tec', 'world', flags='b')
+        self.assertEqual(cmd, 'bin/rhessys -st 2000 1 1 1 -ed 2001 1 1 1 -t tec -w world -b')
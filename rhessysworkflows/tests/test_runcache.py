@@ -0,0 +1,121 @@
+"""@package rhessysworkflows.tests.test_runcache
+
+    @brief Test methods for rhessysworkflows.runcache
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_runcache
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+from rhessysworkflows.rhessys import RHESSysPaths
+from rhessysworkflows.runcache import RunCache, findInputs
+
+HEADER = """1 num_basin_default_files
+defs/basin.def basin_default_filename
+1 num_base_stations
+clim/station.base base_station_filename
+"""
+
+BASE_STATION = """101 base_station_id
+clim/station daily_climate_prefix
+"""
+
+class TestRunCache(TestCase):
+
+    def setUp(self):
+        self.projectDir = tempfile.mkdtemp()
+        # Creates RHESSys directory structure
+        self.paths = RHESSysPaths(self.projectDir, 'rhessys')
+        self.write(os.path.join(self.paths.RHESSYS_BIN, 'rhessys'), 'binary')
+        self.worldfile = self.write(os.path.join(self.paths.RHESSYS_WORLD, 'world'), 'world')
+        self.write(self.worldfile + '.hdr', HEADER)
+        self.tecfile = self.write(os.path.join(self.paths.RHESSYS_TEC, 'tec'), 'tec')
+        self.write(os.path.join(self.paths.RHESSYS_DEF, 'basin.def'), 'def')
+        self.write(os.path.join(self.paths.RHESSYS_CLIM, 'station.base'), BASE_STATION)
+        self.rain = self.write(os.path.join(self.paths.RHESSYS_CLIM, 'station.rain'), '2000 1 1 1\n0.1\n')
+        self.write(os.path.join(self.paths.RHESSYS_CLIM, 'station.tmax'), '2000 1 1 1\n10\n')
+        self.runCache = RunCache(self.paths)
+
+    def tearDown(self):
+        shutil.rmtree(self.projectDir)
+
+    def write(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def key(self, outputPrefix):
+        inputs = findInputs(self.paths, os.path.join(self.paths.RHESSYS_BIN, 'rhessys'),
+                            self.worldfile, self.tecfile)
+        return self.runCache.key("bin/rhessys -w worldfiles/world -pre " + outputPrefix,
+                                 outputPrefix, self.runCache.hashInputs(inputs))
+
+    def test_inputs(self):
+        inputs = findInputs(self.paths, os.path.join(self.paths.RHESSYS_BIN, 'rhessys'),
+                            self.worldfile, self.tecfile)
+        self.assertEqual(sorted([self.paths.relpath(p) for p in inputs]),
+                         ['rhessys/bin/rhessys', 'rhessys/clim/station.base', 'rhessys/clim/station.rain',
+                          'rhessys/clim/station.tmax', 'rhessys/defs/basin.def', 'rhessys/tecfiles/tec',
+                          'rhessys/worldfiles/world', 'rhessys/worldfiles/world.hdr'])
+
+    def test_key(self):
+        key = self.key('output/a/rhessys')
+        # The output prefix is not part of the key, the content of inputs is
+        self.assertEqual(key, self.key('output/b/rhessys'))
+        self.write(self.rain, '2000 1 1 1\n0.2\n')
+        self.assertNotEqual(key, self.key('output/a/rhessys'))
+
+    def test_record_and_link(self):
+        key = self.key('output/a/rhessys')
+        self.assertEqual(self.runCache.lookup(key), None)
+        outputDir = os.path.join(self.paths.RHESSYS_OUT, 'a')
+        os.makedirs(outputDir)
+        self.write(os.path.join(outputDir, 'rhessys_basin.daily'), 'output')
+        self.runCache.record(key, outputDir)
+        self.assertEqual(self.runCache.lookup(key), outputDir)
+
+        newOutputDir = os.path.join(self.paths.RHESSYS_OUT, 'b')
+        RunCache.linkOutput(outputDir, newOutputDir)
+        newOutput = os.path.join(newOutputDir, 'rhessys_basin.daily')
+        self.assertTrue(os.path.samefile(newOutput, os.path.join(outputDir, 'rhessys_basin.daily')))
+
+        # Entries whose output has changed are ignored
+        os.unlink(os.path.join(outputDir, 'rhessys_basin.daily'))
+        self.assertEqual(self.runCache.lookup(key), None)
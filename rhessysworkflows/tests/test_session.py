@@ -0,0 +1,185 @@
+"""@package rhessysworkflows.tests.test_session
+
+    @brief Test methods for rhessysworkflows.command.session
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_session
+    @endcode
+
+"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from rhessysworkflows.command.exceptions import RunException
+from rhessysworkflows.command.session import GrassSession
+from rhessysworkflows.command.session import TemporaryMapset
+from rhessysworkflows.command.session import mapWorkerMapsets
+
+class RecordingScript(object):
+    """ Stands in for grass.script, recording the modules run """
+    def __init__(self):
+        self.calls = []
+        self.result = 0
+
+    def write_command(self, module, stdin=None, **kwargs):
+        self.calls.append( (module, stdin, kwargs) )
+        return self.result
+
+    def run_command(self, module, **kwargs):
+        self.calls.append( (module, None, kwargs) )
+        return self.result
+
+    def read_command(self, module, **kwargs):
+        self.calls.append( (module, None, kwargs) )
+        return '1\n2\n'
+
+class RecordingGRASSLib(object):
+    def __init__(self):
+        self.script = RecordingScript()
+
+class TestGrassSession(TestCase):
+
+    def setUp(self):
+        self.grassLib = RecordingGRASSLib()
+        self.session = GrassSession(self.grassLib, env={'GISRC': '/tmp/gisrc'})
+
+    def test_batch_independent_expressions(self):
+        with self.session:
+            for subbasin in [1, 2, 3]:
+                self.session.mapcalc("subbasin_{0}=subbasins == {0}".format(subbasin))
+        calls = self.grassLib.script.calls
+        self.assertEqual(len(calls), 1)
+        (module, stdin, kwargs) = calls[0]
+        self.assertEqual(module, 'r.mapcalc')
+        self.assertEqual(stdin.splitlines(), ['subbasin_1=subbasins == 1',
+                                              'subbasin_2=subbasins == 2',
+                                              'subbasin_3=subbasins == 3'])
+        self.assertEqual(kwargs['env'], {'GISRC': '/tmp/gisrc'})
+
+    def test_dependent_expressions(self):
+        self.session.mapcalc("a = b + 1")
+        self.session.mapcalc("c = b * 2")
+        # Reads a map computed by a queued expression
+        self.session.mapcalc("d = a@PERMANENT + c")
+        # Replaces a map computed by a queued expression
+        self.session.mapcalc("d = 1")
+        self.session.flush()
+        stdins = [call[1] for call in self.grassLib.script.calls]
+        self.assertEqual(stdins, ["a = b + 1\nc = b * 2\n", "d = a@PERMANENT + c\n", "d = 1\n"])
+
+    def test_run_flushes(self):
+        self.session.mapcalc("mask_1 = subbasins == 1")
+        self.session.run('r.mask', flags='o', input='mask_1')
+        self.assertEqual(self.session.read('r.stats', flags='n', input='subbasins'), '1\n2\n')
+        modules = [call[0] for call in self.grassLib.script.calls]
+        self.assertEqual(modules, ['r.mapcalc', 'r.mask', 'r.stats'])
+        self.assertEqual(self.session.numInvocations, 3)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, self.session.mapcalc, "subbasins == 1")
+        self.grassLib.script.result = 1
+        self.assertRaises(RunException, self.session.run, 'g.region', rast='dem')
+        try:
+            with self.session:
+                self.session.mapcalc("a = 1")
+                raise KeyError()
+        except KeyError:
+            pass
+        # Expressions queued when an error occurred are discarded
+        self.session.flush()
+        self.assertEqual([call[0] for call in self.grassLib.script.calls], ['g.region'])
+
+
+class TestWorkerMapsets(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.mapsetPath = os.path.join(self.tmpDir, 'location', 'project')
+        os.makedirs(self.mapsetPath)
+        with open(os.path.join(self.mapsetPath, 'WIND'), 'w') as f:
+            f.write("north: 10\n")
+        self.gisrc = os.path.join(self.tmpDir, 'gisrc')
+        with open(self.gisrc, 'w') as f:
+            f.write("GISDBASE: {0}\nLOCATION_NAME: location\nMAPSET: project\n".format(self.tmpDir))
+        self.session = GrassSession(RecordingGRASSLib(), env={'GISRC': self.gisrc})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def test_temporary_mapset(self):
+        with TemporaryMapset(self.session, 'project_worker0') as mapset:
+            self.assertEqual(mapset.session.gisenv()['MAPSET'], 'project_worker0')
+            self.assertEqual(mapset.session.gisenv()['GISDBASE'], self.tmpDir)
+            with open(os.path.join(mapset.path, 'SEARCH_PATH')) as f:
+                self.assertEqual(f.read().split(), ['project_worker0', 'project', 'PERMANENT'])
+            with open(os.path.join(mapset.path, 'WIND')) as f:
+                self.assertEqual(f.read(), "north: 10\n")
+            path = mapset.path
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(mapset.gisrc))
+
+    def test_map(self):
+        mapsets = set()
+        lock = threading.Lock()
+        def function(session, item):
+            with lock:
+                mapsets.add(session.gisenv()['MAPSET'])
+            return item * 2
+        results = mapWorkerMapsets(self.session, function, range(10), jobs=3)
+        self.assertEqual(results, [i * 2 for i in range(10)])
+        self.assertTrue(len(mapsets) <= 3)
+        self.assertFalse('project' in mapsets)
+        # Temporary mapsets are removed
+        self.assertEqual(os.listdir(os.path.join(self.tmpDir, 'location')), ['project'])
+        # One job runs in the session itself
+        mapsets.clear()
+        mapWorkerMapsets(self.session, function, range(3), jobs=1)
+        self.assertEqual(mapsets, set(['project']))
+
+    def test_cancel(self):
+        called = []
+        def function(session, item):
+            called.append(item)
+            if item == 0:
+                raise RunException("failed")
+            time.sleep(0.01)
+            return item
+        self.assertRaises(RunException, mapWorkerMapsets, self.session, function, range(20), jobs=2)
+        self.assertTrue(len(called) < 20)
+        self.assertEqual(os.listdir(os.path.join(self.tmpDir, 'location')), ['project'])
@@ -0,0 +1,114 @@
+"""@package rhessysworkflows.tests.test_zonalstats
+
+    @brief Test methods for rhessysworkflows.zonalstats
+
+    This software is provided free of charge under the New BSD License. Please see
+    the following license information:
+
+    Copyright (c) 2016, University of North Carolina at Chapel Hill
+    All rights reserved.
+
+    Redistribution and use in source and binary forms, with or without
+    modification, are permitted provided that the following conditions are met:
+        * Redistributions of source code must retain the above copyright
+          notice, this list of conditions and the following disclaimer.
+        * Redistributions in binary form must reproduce the above copyright
+          notice, this list of conditions and the following disclaimer in the
+          documentation and/or other materials provided with the distribution.
+        * Neither the name of the University of North Carolina at Chapel Hill nor the
+          names of its contributors may be used to endorse or promote products
+          derived from this software without specific prior written permission.
+
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+    ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+    WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+    BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+    CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+    GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+    HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+    LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+    OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+    @author Brian Miles <brian_miles@unc.edu>
+
+    Usage:
+    @code
+    python -m unittest test_zonalstats
+    @endcode
+
+"""
+from unittest import TestCase
+
+import numpy as np
+
+from rhessysworkflows.patchmap import PatchRasterMap
+from rhessysworkflows.zonalstats import ZonalStatistics
+
+NAN = float('nan')
+
+ZONE_RASTER = [[1, 1, 2, 2],
+               [1, 1, 2, 2],
+               [3, 3, NAN, 2]]
+
+PATCH_RASTER = [[10, 11, 12, 12],
+                [13, 13, 14, 15],
+                [16, 16, 17, 15]]
+
+class TestZonalStatistics(TestCase):
+
+    def setUp(self):
+        self.zonalStats = ZonalStatistics(np.array(ZONE_RASTER))
+        self.cellValues = self.zonalStats.cellValues(np.array([[1.0, 2.0, 4.0, 4.0],
+                                                                 [4.0, 4.0, 1.0, 7.0],
+                                                                 [5.0, NAN, 9.0, 2.0]]))
+
+    def test_zones(self):
+        self.assertEqual(self.zonalStats.zoneIDs.tolist(), [1, 2, 3])
+        self.assertEqual(sorted(self.cellValues[:4].tolist()), [1.0, 2.0, 4.0, 4.0])
+
+    def test_moments(self):
+        stats = self.zonalStats.compute(self.cellValues)
+        # Zone 1: 1, 2, 4, 4; zone 2: 4, 4, 1, 7, 2; zone 3: 5 (null cell ignored)
+        self.assertTrue(np.allclose(stats['average'], [2.75, 3.6, 5.0]))
+        self.assertTrue(np.allclose(stats['sum'], [11.0, 18.0, 5.0]))
+        self.assertTrue(np.allclose(stats['min'], [1.0, 1.0, 5.0]))
+        self.assertTrue(np.allclose(stats['max'], [4.0, 7.0, 5.0]))
+        self.assertTrue(np.allclose(stats['variance'][:2], [2.25, 5.3]))
+        self.assertTrue(np.allclose(stats['stddev'][:2], np.sqrt([2.25, 5.3])))
+        self.assertTrue(np.isnan(stats['variance'][2]))
+        self.assertTrue(np.allclose(stats['avedev'], [1.25, 1.68, 0.0]))
+        dev = np.array([1.0, 2.0, 4.0, 4.0]) - 2.75
+        m2 = (dev ** 2).mean()
+        self.assertAlmostEqual(stats['skewness'][0], (dev ** 3).mean() / m2 ** 1.5)
+        self.assertAlmostEqual(stats['kurtosis'][0], (dev ** 4).mean() / m2 ** 2 - 3)
+
+    def test_order_statistics(self):
+        stats = self.zonalStats.compute(self.cellValues, ['median', 'mode'])
+        self.assertEqual(sorted(stats.keys()), ['median', 'mode'])
+        self.assertEqual(stats['median'].tolist(), [3.0, 4.0, 5.0])
+        self.assertEqual(stats['mode'].tolist(), [4.0, 4.0, 5.0])
+        # Ties are broken in favor of the least value
+        stats = self.zonalStats.compute(self.zonalStats.cellValues(np.array(PATCH_RASTER)), ['mode'])
+        self.assertEqual(stats['mode'].tolist(), [13.0, 12.0, 16.0])
+
+    def test_patch_values(self):
+        patchMap = PatchRasterMap(np.array(PATCH_RASTER))
+        values = [self.zonalStats.patchValues(patchMap, [10, 11, 13], [1.0, 2.0, 3.0]),
+                  self.zonalStats.patchValues(patchMap, [12, 16], [4.0, 5.0])]
+        stats = self.zonalStats.compute(values, ['average', 'sum'])
+        self.assertEqual(stats['average'].shape, (2, 3))
+        self.assertTrue(np.allclose(stats['average'][0,:1], [2.25]))
+        self.assertTrue(np.isnan(stats['average'][0,1:]).all())
+        self.assertTrue(np.allclose(stats['sum'][1,1:], [8.0, 10.0]))
+        self.assertTrue(np.isnan(stats['sum'][1,0]))
+
+    def test_render(self):
+        raster = self.zonalStats.render([1.0, 2.0, 3.0], fill=-1.0)
+        self.assertEqual(raster.tolist(), [[1.0, 1.0, 2.0, 2.0],
+                                           [1.0, 1.0, 2.0, 2.0],
+                                           [3.0, 3.0, -1.0, 2.0]])
+
+    def test_unknown_method(self):
+        self.assertRaises(ValueError, self.zonalStats.compute, self.cellValues, ['range'])
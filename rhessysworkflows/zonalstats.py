@@ -0,0 +1,235 @@
+"""@package rhessysworkflows.zonalstats
+
+@brief Zonal statistics of raster values computed in memory
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2016, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+@author Brian Miles <brian_miles@unc.edu>
+
+Cells of a zone raster are grouped by zone once, after which statistics of
+any number of rasters of values (e.g. one for each model scenario) are
+computed for all zones at once using grouped reductions over the cells of
+each zone.  Values are floating point; null (NaN) values are ignored.
+
+Usage:
+@code
+patchMap = PatchRasterMap.fromGRASS('patch')
+zonalStats = ZonalStatistics.fromGRASS('landcover')
+values = [zonalStats.patchValues(patchMap, patchIDs, var) for var in scenarios]
+stats = zonalStats.compute(values, ['average', 'median'])
+@endcode
+"""
+import numpy as np
+
+
+class ZonalStatistics(object):
+
+    AVERAGE = 'average'
+    MODE = 'mode'
+    MEDIAN = 'median'
+    AVEDEV = 'avedev'
+    STDDEV = 'stddev'
+    VARIANCE = 'variance'
+    SKEWNESS = 'skewness'
+    KURTOSIS = 'kurtosis'
+    MIN = 'min'
+    MAX = 'max'
+    SUM = 'sum'
+    METHODS = [AVERAGE, MODE, MEDIAN, AVEDEV, STDDEV, VARIANCE,
+               SKEWNESS, KURTOSIS, MIN, MAX, SUM]
+
+    def __init__(self, zoneRaster):
+        """ @param zoneRaster 2-D numpy.ndarray of the zone of each cell; null cells
+            are NaN
+        """
+        zoneRaster = np.asarray(zoneRaster)
+        self.shape = zoneRaster.shape
+        zones = zoneRaster.ravel()
+        if zones.dtype.kind == 'f':
+            cells = np.flatnonzero(~np.isnan(zones))
+        else:
+            cells = np.arange(len(zones))
+        # Sorted IDs of zones in the raster; the index of a zone is its position
+        # in this array
+        (self.zoneIDs, zoneIdx) = np.unique(zones[cells], return_inverse=True)
+        # Flat index of cells in zones, grouped by zone
+        order = np.argsort(zoneIdx, kind='mergesort')
+        self.cells = cells[order]
+        self._zoneIdx = zoneIdx[order]
+        self._starts = np.searchsorted(self._zoneIdx, np.arange(len(self.zoneIDs)))
+
+    @classmethod
+    def fromGRASS(cls, zoneMap):
+        """ Read a zone raster from the current GRASS mapset.  GRASS must be
+            initialized (e.g. using ecohydrolib.grasslib.GRASSLib) before calling.
+
+            @param zoneMap String representing the name of the zone raster
+
+            @return ZonalStatistics
+        """
+        from grass.script import array as garray
+        raster = garray.array()
+        raster.read(zoneMap)
+        return cls( np.array(raster) )
+
+    def cellValues(self, raster):
+        """ @param raster 2-D numpy.ndarray with the shape of the zone raster
+
+            @return 1-D numpy.ndarray<float> of the values of cells in zones
+        """
+        return np.asarray(raster, dtype=float).ravel()[self.cells]
+
+    def patchValues(self, patchRasterMap, patchIDs, values):
+        """ Get the value of the patch of each cell in a zone
+
+            @param patchRasterMap rhessysworkflows.patchmap.PatchRasterMap with
+            the shape of the zone raster
+            @param patchIDs Sequence of patch IDs
+            @param values Sequence of values, one for each patch in patchIDs
+
+            @return 1-D numpy.ndarray<float> of the values of cells in zones; cells
+            of patches lacking a value are NaN
+        """
+        lookup = patchRasterMap.lookup(patchIDs, values)
+        return lookup[patchRasterMap.index.ravel()[self.cells]]
+
+    def compute(self, values, methods=METHODS):
+        """ Compute statistics of values for each zone.  Variance and standard
+            deviation are those of a sample (i.e. divided by n - 1); skewness and
+            kurtosis are computed from moments about the mean, with kurtosis being
+            excess kurtosis (i.e. 0 for a normal distribution).  The mode is the most
+            frequent value, the least such value in case of ties.
+
+            @param values numpy.ndarray of cell values as returned by cellValues or
+            patchValues, or a 2-D numpy.ndarray with one row of cell values for each
+            of several sets of values (e.g. scenarios)
+            @param methods List of statistics to compute (see METHODS)
+
+            @return dict mapping each method to a numpy.ndarray with one element for
+            each zone (in the order of zoneIDs), or one row for each row of values;
+            elements for zones with no values are NaN
+
+            @raise ValueError if a method is not one of METHODS
+        """
+        for method in methods:
+            if not method in ZonalStatistics.METHODS:
+                raise ValueError("Unknown zonal statistic %s" % (method,) )
+        values = np.asarray(values, dtype=float)
+        oneDimensional = values.ndim == 1
+        values = np.atleast_2d(values)
+
+        valid = ~np.isnan(values)
+        reduceat = lambda ufunc, x: ufunc.reduceat(x, self._starts, axis=1)
+        n = reduceat(np.add, valid.astype(float))
+        result = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            total = reduceat(np.add, np.where(valid, values, 0.0))
+            mean = total / n
+            dev = np.where(valid, values - mean[:,self._zoneIdx], 0.0)
+            m2 = reduceat(np.add, dev ** 2) / n
+            if ZonalStatistics.SUM in methods:
+                result[ZonalStatistics.SUM] = np.where(n > 0, total, np.nan)
+            if ZonalStatistics.AVERAGE in methods:
+                result[ZonalStatistics.AVERAGE] = mean
+            if ZonalStatistics.AVEDEV in methods:
+                result[ZonalStatistics.AVEDEV] = reduceat(np.add, np.abs(dev)) / n
+            if ZonalStatistics.VARIANCE in methods or ZonalStatistics.STDDEV in methods:
+                variance = np.where(n > 1, m2 * n / (n - 1), np.nan)
+                result[ZonalStatistics.VARIANCE] = variance
+                result[ZonalStatistics.STDDEV] = np.sqrt(variance)
+            if ZonalStatistics.SKEWNESS in methods:
+                result[ZonalStatistics.SKEWNESS] = (reduceat(np.add, dev ** 3) / n) / m2 ** 1.5
+            if ZonalStatistics.KURTOSIS in methods:
+                result[ZonalStatistics.KURTOSIS] = (reduceat(np.add, dev ** 4) / n) / m2 ** 2 - 3
+            if ZonalStatistics.MIN in methods:
+                result[ZonalStatistics.MIN] = np.where(n > 0,
+                    reduceat(np.minimum, np.where(valid, values, np.inf)), np.nan)
+            if ZonalStatistics.MAX in methods:
+                result[ZonalStatistics.MAX] = np.where(n > 0,
+                    reduceat(np.maximum, np.where(valid, values, -np.inf)), np.nan)
+        if ZonalStatistics.MEDIAN in methods or ZonalStatistics.MODE in methods:
+            orderStats = [self._orderStatistics(row, rowValid) \
+                          for (row, rowValid) in zip(values, valid)]
+            result[ZonalStatistics.MEDIAN] = np.array([s[0] for s in orderStats])
+            result[ZonalStatistics.MODE] = np.array([s[1] for s in orderStats])
+
+        result = dict( [(method, result[method]) for method in methods] )
+        if oneDimensional:
+            result = dict( [(method, stat[0]) for (method, stat) in result.items()] )
+        return result
+
+    def _orderStatistics(self, values, valid):
+        """ Compute the median and mode of each zone for one set of values
+
+            @return Tuple (numpy.ndarray, numpy.ndarray) of median and mode of each zone
+        """
+        numZones = len(self.zoneIDs)
+        median = np.empty(numZones)
+        median.fill(np.nan)
+        mode = median.copy()
+
+        zoneIdx = self._zoneIdx[valid]
+        values = values[valid]
+        if not len(values):
+            return (median, mode)
+        order = np.lexsort( (values, zoneIdx) )
+        (zoneIdx, values) = (zoneIdx[order], values[order])
+        starts = np.searchsorted(zoneIdx, np.arange(numZones))
+        counts = np.diff( np.append(starts, len(values)) )
+        present = counts > 0
+        lower = (starts + (counts - 1) // 2)[present]
+        upper = (starts + counts // 2)[present]
+        median[present] = (values[lower] + values[upper]) / 2.0
+
+        # Runs of equal values within each zone
+        change = (values[1:] != values[:-1]) | (zoneIdx[1:] != zoneIdx[:-1])
+        runStarts = np.flatnonzero( np.append(True, change) )
+        runLengths = np.diff( np.append(runStarts, len(values)) )
+        runZones = zoneIdx[runStarts]
+        # Longest run of each zone; runs of equal length remain ordered by value
+        longest = np.lexsort( (-runLengths, runZones) )
+        first = np.append(True, runZones[longest][1:] != runZones[longest][:-1])
+        best = longest[first]
+        mode[runZones[best]] = values[runStarts[best]]
+        return (median, mode)
+
+    def render(self, zoneValues, fill=np.nan):
+        """ Produce a raster of values for zones
+
+            @param zoneValues Sequence of values, one for each zone (in the order of
+            zoneIDs), e.g. as returned by compute
+            @param fill Value of cells not in a zone
+
+            @return 2-D numpy.ndarray<float> with the shape of the zone raster
+        """
+        raster = np.empty(self.shape[0] * self.shape[1])
+        raster.fill(fill)
+        raster[self.cells] = np.asarray(zoneValues, dtype=float)[self._zoneIdx]
+        return raster.reshape(self.shape)
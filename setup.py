@@ -27,7 +27,7 @@ setup(name='rhessysworkflows',
                 ],
       install_requires=[
         'ecohydrolib>=1.27',
-        'numpy>=1.7',
+        'numpy>=1.15',
         'matplotlib>=1.1',
         'pandas',
         'scipy',
@@ -59,11 +59,13 @@ setup(name='rhessysworkflows',
                'bin/PatchZonalStatsNormalize.py',
                'bin/RegisterCustomSoilReclassRules.py',
                'bin/RegisterLandcoverReclassRules.py',
+               'bin/ReportResourceUsage.py',
                'bin/RHESSysPlot.py',
                'bin/RHESSysPlotMassbalance.py',
                'bin/RunLAIRead.py',
                'bin/RunLAIReadMultiple.py',
-               'bin/RunModel.py'
+               'bin/RunModel.py',
+               'bin/RunModelEnsemble.py'
       ],
       data_files=[('rhessysworkflows/etc/NLCD2006', ['etc/NLCD2006/impervious.rule',
                            'etc/NLCD2006/lai-recode.rule',